@@ -0,0 +1,214 @@
+#!/usr/bin/env python
+"""
+Parallel conversion of the uvh5 scans of observing runs into measurement
+sets, flagged at full resolution (aoflagger) and averaged (casa
+mstransform), as done by copy_compress_new_p002.py one scan at a time.
+
+Each LO of each scan folder (uvh5*/Lo?*/*.uvh5) is converted by one of a
+bounded pool of worker processes. A finished conversion leaves a
+<scan>_<lo>.done file (with its timing) in the <scan>_measure_sets folder,
+so that scans converted by an earlier, interrupted run are skipped.
+A per scan timing report (read, write, flag, compress) is printed at the end
+"""
+
+import argparse
+import concurrent.futures
+import glob
+import json
+import os
+import shutil
+import subprocess
+import time
+
+from pyuvdata import UVData
+
+DEFAULT_NWORKERS = 4
+DEFAULT_FLAGCMD = 'aoflagger'
+DEFAULT_CASAPATH = '/home/sonata/src/casa-6.4.0-16/bin/casa'
+
+STAGES = ['read', 'write', 'flag', 'compress']
+# files of the scan folder kept with the measurement sets
+METADATA_PATTERNS = ['*.txt', '*.toml']
+
+
+def find_scans(run_dir):
+    """
+    List of (scan folder, LO, uvh5 files) of the uvh5* scan folders of run_dir
+    """
+    scans = []
+    for folder in sorted(glob.glob(os.path.join(run_dir, 'uvh5*'))):
+        if not os.path.isdir(folder) or folder.endswith('_measure_sets'):
+            continue
+        los = sorted(set([os.path.basename(lodir)[:3]
+            for lodir in glob.glob(os.path.join(folder, 'Lo*')) if os.path.isdir(lodir)]))
+        for lo in los:
+            files = sorted(glob.glob(os.path.join(folder, lo + '*', '*.uvh5')))
+            if files:
+                scans.append((folder, lo, files))
+    return scans
+
+
+def ms_outdir(folder):
+    return folder + '_measure_sets'
+
+
+def ms_basename(folder, lo):
+    # LoB -> <scan>_b
+    return os.path.basename(folder) + '_' + lo[2:].lower()
+
+
+def done_marker(folder, lo):
+    return os.path.join(ms_outdir(folder), ms_basename(folder, lo) + '.done')
+
+
+def convert_scan(folder, lo, files, flagcmd=DEFAULT_FLAGCMD,
+        mstransform_script=None, casapath=DEFAULT_CASAPATH):
+    """
+    Converts the uvh5 files of one LO of a scan into <scan>_<lo>.ms, flags it
+    with flagcmd and, if mstransform_script is given, averages it into
+    <scan>_<lo>_averaged.ms with casa and removes the full resolution one.
+    Returns the time taken by each stage
+    """
+    outdir = ms_outdir(folder)
+    os.makedirs(outdir, exist_ok=True)
+    ms = os.path.join(outdir, ms_basename(folder, lo) + '.ms')
+    averaged = os.path.join(outdir, ms_basename(folder, lo) + '_averaged.ms')
+    timing = {'scan': os.path.basename(folder), 'lo': lo}
+
+    t = time.time()
+    uvd = UVData()
+    uvd.read(files, fix_old_proj=False)
+    timing['read'] = time.time() - t
+
+    # leftovers of an interrupted conversion
+    for path in [ms, averaged]:
+        shutil.rmtree(path, ignore_errors=True)
+
+    t = time.time()
+    uvd.write_ms(ms)
+    del uvd
+    timing['write'] = time.time() - t
+
+    if flagcmd:
+        t = time.time()
+        subprocess.run([flagcmd, ms], check=True,
+                stdout=subprocess.DEVNULL)
+        timing['flag'] = time.time() - t
+
+    if mstransform_script:
+        t = time.time()
+        subprocess.run([casapath, '--nologfile', '--nogui', '-c',
+            mstransform_script, ms, averaged], check=True,
+            stdout=subprocess.DEVNULL)
+        shutil.rmtree(ms)
+        timing['compress'] = time.time() - t
+
+    with open(done_marker(folder, lo), 'w') as f:
+        json.dump(timing, f)
+    return timing
+
+
+def finish_scan(folder, delete_inputs=False):
+    """
+    Copies the metadata files of the scan folder next to its measurement
+    sets, and removes the scan folder if delete_inputs
+    """
+    for pattern in METADATA_PATTERNS:
+        for fname in glob.glob(os.path.join(folder, pattern)):
+            shutil.copy2(fname, ms_outdir(folder))
+    if delete_inputs:
+        shutil.rmtree(folder)
+
+
+def print_report(results):
+    print('%-32s %-4s' %('scan', 'LO') +
+            ''.join(['%10s' %stage for stage in STAGES]) +
+            '%10s  %s' %('total', 'status'))
+    for timing in results:
+        times = [timing.get(stage) for stage in STAGES]
+        print('%-32s %-4s' %(timing['scan'], timing['lo']) +
+                ''.join(['%10s' %('-' if t is None else '%.1f s' %t) for t in times]) +
+                '%10s  %s' %('%.1f s' %sum([t for t in times if t]), timing['status']))
+
+
+def convert_run(run_dir, nworkers=DEFAULT_NWORKERS, flagcmd=DEFAULT_FLAGCMD,
+        mstransform_script=None, casapath=DEFAULT_CASAPATH, delete_inputs=False):
+    """
+    Converts all scans of run_dir not converted yet, in nworkers processes.
+    The scan folders are removed after the conversion of all their LOs if
+    delete_inputs. Returns the timing of every scan and LO, with its status
+    ('converted', 'skipped' or 'failed')
+    """
+    scans = find_scans(run_dir)
+    results = []
+    todo = []
+    for folder, lo, files in scans:
+        if os.path.exists(done_marker(folder, lo)):
+            with open(done_marker(folder, lo)) as f:
+                timing = json.load(f)
+            timing['status'] = 'skipped'
+            results.append(timing)
+        else:
+            todo.append((folder, lo, files))
+
+    failed = set()
+    if todo:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=nworkers) as executor:
+            futures = {}
+            for folder, lo, files in todo:
+                future = executor.submit(convert_scan, folder, lo, files,
+                        flagcmd, mstransform_script, casapath)
+                futures[future] = (folder, lo)
+            for future in concurrent.futures.as_completed(futures):
+                folder, lo = futures[future]
+                try:
+                    timing = future.result()
+                    timing['status'] = 'converted'
+                    print('Converted %s %s' %(os.path.basename(folder), lo))
+                except Exception as e:
+                    print('Failed %s %s: %s' %(os.path.basename(folder), lo, e))
+                    timing = {'scan': os.path.basename(folder), 'lo': lo, 'status': 'failed'}
+                    failed.add(folder)
+                results.append(timing)
+
+    for folder in sorted(set([scan[0] for scan in scans]) - failed):
+        finish_scan(folder, delete_inputs)
+
+    if results:
+        results.sort(key=lambda timing: (timing['scan'], timing['lo']))
+        print_report(results)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+            formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('runs', nargs='+', type=str,
+            help='observing run directories, containing uvh5* scan folders')
+    parser.add_argument('-w', dest='nworkers', type=int, default=DEFAULT_NWORKERS,
+            help='scans converted in parallel [%i]' %DEFAULT_NWORKERS)
+    parser.add_argument('-f', dest='flagcmd', type=str, default=DEFAULT_FLAGCMD,
+            help='flagging command, run on each full resolution ms [%s]' %DEFAULT_FLAGCMD)
+    parser.add_argument('--noflag', dest='noflag', action='store_true',
+            help='do not flag the measurement sets')
+    parser.add_argument('-m', dest='mstransform_script', type=str, default=None,
+            help='casa script averaging the ms (arguments: ms, averaged ms). '
+            'Without it, the full resolution ms are kept')
+    parser.add_argument('-c', dest='casapath', type=str, default=DEFAULT_CASAPATH,
+            help='casa executable [%s]' %DEFAULT_CASAPATH)
+    parser.add_argument('--delete', dest='delete_inputs', action='store_true',
+            help='remove the uvh5 scan folders once converted')
+    args = parser.parse_args()
+
+    flagcmd = None if args.noflag else args.flagcmd
+    nfailed = 0
+    for run in args.runs:
+        results = convert_run(run, args.nworkers, flagcmd, args.mstransform_script,
+                args.casapath, args.delete_inputs)
+        nfailed += len([timing for timing in results if timing['status'] == 'failed'])
+    if nfailed:
+        raise SystemExit('%i conversions failed' %nfailed)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+"""
+Test of the parallel uvh5 to measurement set conversion of convert_uvh5_ms
+on a synthetic observing run: a few small scans of 2 LOs, each LO split in
+several uvh5 files, are converted with stand-in flagging and casa averaging
+commands (the averaged ms is a copy of the full resolution one). The
+measurement sets are read back and compared with the uvh5 data, then the
+run is converted again to check that converted scans are skipped and that
+only an interrupted scan is converted again
+"""
+import os
+import argparse
+import tempfile
+import time
+
+import numpy as np
+from astropy.coordinates import EarthLocation
+from pyuvdata import UVData, Telescope
+
+from convert_uvh5_ms import convert_run, find_scans, done_marker, ms_outdir, ms_basename
+
+FAKE_CASA = """#!/bin/sh
+# --nologfile --nogui -c script ms averaged_ms
+cp -r "$5" "$6"
+"""
+
+
+def make_uvdata(nants, ntimes, nchans, seed, t0=2460000.5):
+    telescope = Telescope.new(name='ATA',
+            location=EarthLocation.from_geodetic(-121.47, 40.817, 1019),
+            antenna_positions={ii: np.array([ii*10., ii*3., 0.]) for ii in range(nants)},
+            antenna_names=[str(ii) for ii in range(nants)], instrument='ATA')
+    phase_center = {0: {'cat_name': '3c286', 'cat_type': 'sidereal', 'cat_lon': 3.5392,
+        'cat_lat': 0.5324, 'cat_frame': 'icrs', 'cat_epoch': 2000.0}}
+    antpairs = [(ii, jj) for ii in range(nants) for jj in range(ii + 1, nants)]
+    rng = np.random.default_rng(seed)
+    shape = (len(antpairs)*ntimes, nchans, 4)
+    data = (rng.standard_normal(shape) + 1j*rng.standard_normal(shape)).astype(np.complex64)
+    return UVData.new(freq_array=1.4e9 + 0.5e6*np.arange(nchans),
+            polarization_array=['xx', 'yy', 'xy', 'yx'],
+            times=t0 + 10.*np.arange(ntimes)/86400., telescope=telescope,
+            antpairs=antpairs, do_blt_outer=True, integration_time=10.,
+            channel_width=0.5e6, phase_center_catalog=phase_center, data_array=data)
+
+
+def make_run(run_dir, nscans, nfiles, nants, ntimes, nchans):
+    """
+    writes nscans scan folders of 2 LOs, each LO split in nfiles uvh5 files
+    """
+    for iscan in range(nscans):
+        folder = os.path.join(run_dir, 'uvh5_%i' %iscan)
+        for ilo, lo in enumerate(['LoB', 'LoC']):
+            lodir = os.path.join(folder, lo + '.C0352')
+            os.makedirs(lodir)
+            for ifile in range(nfiles):
+                uvd = make_uvdata(nants, ntimes, nchans, (iscan, ilo, ifile),
+                        t0=2460000.5 + ifile*ntimes*10./86400.)
+                uvd.write_uvh5(os.path.join(lodir, 'part%i.uvh5' %ifile))
+        with open(os.path.join(folder, 'obs.toml'), 'w') as f:
+            f.write('source = "3c286"\n')
+
+
+def check_ms(scans):
+    for folder, lo, files in scans:
+        uvd = UVData()
+        uvd.read(files, fix_old_proj=False)
+        ms = UVData()
+        ms.read(os.path.join(ms_outdir(folder), ms_basename(folder, lo) + '_averaged.ms'))
+        assert ms.Nblts == uvd.Nblts and ms.Nfreqs == uvd.Nfreqs, \
+                "%s %s shape differs" %(folder, lo)
+        uvd.reorder_blts()
+        ms.reorder_blts()
+        assert np.allclose(ms.data_array, uvd.data_array), "%s %s data differ" %(folder, lo)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('-s', dest='nscans', type=int, default=3,
+            help='scans [3]')
+    parser.add_argument('-n', dest='nfiles', type=int, default=2,
+            help='uvh5 files per LO [2]')
+    parser.add_argument('-a', dest='nants', type=int, default=6,
+            help='antennas [6]')
+    parser.add_argument('-t', dest='ntimes', type=int, default=8,
+            help='integrations per file [8]')
+    parser.add_argument('-c', dest='nchans', type=int, default=64,
+            help='channels [64]')
+    parser.add_argument('-w', dest='nworkers', type=int, default=4,
+            help='parallel conversions [4]')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        run_dir = os.path.join(tmpdir, '2023-10-01')
+        make_run(run_dir, args.nscans, args.nfiles, args.nants, args.ntimes, args.nchans)
+        fake_casa = os.path.join(tmpdir, 'casa')
+        with open(fake_casa, 'w') as f:
+            f.write(FAKE_CASA)
+        os.chmod(fake_casa, 0o755)
+        convert = lambda: convert_run(run_dir, nworkers=args.nworkers, flagcmd='true',
+                mstransform_script='mstransform.py', casapath=fake_casa)
+        scans = find_scans(run_dir)
+        assert len(scans) == 2*args.nscans
+
+        t_start = time.time()
+        results = convert()
+        print("conversion: %.1f s" %(time.time() - t_start))
+        assert [timing['status'] for timing in results] == ['converted']*len(scans)
+        check_ms(scans)
+        for folder, lo, files in scans:
+            assert not os.path.exists(os.path.join(ms_outdir(folder), ms_basename(folder, lo) + '.ms')), \
+                    "full resolution ms not removed"
+            assert os.path.exists(os.path.join(ms_outdir(folder), 'obs.toml')), "metadata not copied"
+
+        t_start = time.time()
+        results = convert()
+        print("resumed, nothing to convert: %.1f s" %(time.time() - t_start))
+        assert [timing['status'] for timing in results] == ['skipped']*len(scans)
+
+        # interrupted conversion: leftover ms without a done marker
+        folder, lo, files = scans[-1]
+        os.remove(done_marker(folder, lo))
+        results = convert()
+        assert [timing['status'] for timing in results] == ['skipped']*(len(scans) - 1) + ['converted']
+        check_ms(scans[-1:])
+
+        # a broken scan fails alone
+        folder, lo, files = scans[0]
+        os.remove(done_marker(folder, lo))
+        with open(files[0], 'wb') as f:
+            f.write(b'not a uvh5 file')
+        results = convert()
+        assert [timing['status'] for timing in results] == ['failed'] + ['skipped']*(len(scans) - 1)
+        assert not os.path.exists(done_marker(folder, lo))
+    print("conversions ok")
+
+
+if __name__ == "__main__":
+    main()
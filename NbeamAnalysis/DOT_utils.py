@@ -12,6 +12,9 @@ import argparse
 import blimpy as bl
 import logging
 import sys
+import struct
+import threading
+from collections import OrderedDict
 
 # logging function
 def setup_logging(log_filename):
@@ -82,16 +85,27 @@ def get_dats(root_dir,beam):
                 dat_files.append(os.path.join(dirpath, f))
     return dat_files,errors
 
+# column names of a standard turboSETI .dat file
+DAT_COLS = ['Top_Hit_#','Drift_Rate','SNR','Uncorrected_Frequency','Corrected_Frequency','Index',
+            'freq_start','freq_end','SEFD','SEFD_freq','Coarse_Channel_Number','Full_number_of_hits']
+
+# read the hits of a .dat file, from the columnar hit store (see hit_store.py) if one is given
+# and the file has been ingested into it, otherwise by parsing the .dat file itself
+def read_dat(dat_file,store=None):
+    if store is not None:
+        import hit_store
+        try:
+            return hit_store.load_dat(store,dat_file)
+        except FileNotFoundError:
+            logging.info(f"\t{os.path.basename(dat_file)} not in the hit store, reading the dat file.")
+    #NOTE: This assumes a standard turboSETI .dat file format with the listed headers
+    return pd.read_csv(dat_file, delim_whitespace=True, names=DAT_COLS, skiprows=9)
+
 # load the data from the input .dat file for the target beam and its corresponding .fil files 
 # for all beams formed in the same observation and make a single concatenated dataframe 
-def load_dat_df(dat_file,filtuple):
+def load_dat_df(dat_file,filtuple,store=None):
     # make a dataframe of all the data in the .dat file below the headers
-    #NOTE: This assumes a standard turboSETI .dat file format with the listed headers
-    dat_df = pd.read_csv(dat_file, 
-                delim_whitespace=True, 
-                names=['Top_Hit_#','Drift_Rate','SNR', 'Uncorrected_Frequency','Corrected_Frequency','Index',
-                        'freq_start','freq_end','SEFD','SEFD_freq','Coarse_Channel_Number','Full_number_of_hits'],
-                skiprows=9)
+    dat_df = read_dat(dat_file,store)
     # initiate the final dataframe as a subset of the relevant bits of the .dat dataframe
     full_dat_df = dat_df[['Drift_Rate','SNR', 'Index', 'Uncorrected_Frequency','Corrected_Frequency',
                             'freq_start','freq_end','Coarse_Channel_Number','Full_number_of_hits']]
@@ -106,9 +120,152 @@ def load_dat_df(dat_file,filtuple):
     full_dat_df['normalized_dr'] = full_dat_df['Drift_Rate'] / (full_dat_df[['freq_start','freq_end']].max(axis=1) / 10**3)
     return full_dat_df
 
-# use blimpy to grab the data slice from the filterbank file over the frequency range provided
+# SIGPROC header keywords and their types, used to parse .fil headers without blimpy
+_SIGPROC_STR_KEYS = ['source_name','rawdatafile']
+_SIGPROC_INT_KEYS = ['telescope_id','machine_id','data_type','barycentric','pulsarcentric',
+                     'nbits','nsamples','nchans','nifs','nbeams','ibeam']
+_SIGPROC_DOUBLE_KEYS = ['az_start','za_start','src_raj','src_dej','tstart','tsamp',
+                        'fch1','foff','refdm','period']
+
+# read a string (length followed by characters) from a SIGPROC header
+def _read_sigproc_str(f):
+    n = struct.unpack('<i', f.read(4))[0]
+    return f.read(n).decode()
+
+# parse the header of a SIGPROC filterbank file, returning the header dict and its length in bytes
+def read_fil_header(fil):
+    header = {}
+    with open(fil, 'rb') as f:
+        if _read_sigproc_str(f) != 'HEADER_START':
+            raise ValueError(f'{fil} is not a SIGPROC filterbank file')
+        while True:
+            key = _read_sigproc_str(f)
+            if key == 'HEADER_END':
+                break
+            elif key in _SIGPROC_INT_KEYS:
+                header[key] = struct.unpack('<i', f.read(4))[0]
+            elif key in _SIGPROC_DOUBLE_KEYS:
+                header[key] = struct.unpack('<d', f.read(8))[0]
+            elif key == 'signed':
+                header[key] = struct.unpack('<b', f.read(1))[0]
+            elif key in _SIGPROC_STR_KEYS:
+                header[key] = _read_sigproc_str(f)
+            else:
+                raise ValueError(f'{fil} has an unknown SIGPROC header keyword {key}')
+        header_len = f.tell()
+    return header, header_len
+
+# a filterbank file opened once: parsed header and a memory map of the data
+class MappedFil:
+    def __init__(self, fil):
+        self.header, header_len = read_fil_header(fil)
+        # same data types as blimpy
+        dtype = {32:'float32', 16:'uint16', 8:'uint8'}[self.header['nbits']]
+        nifs, nchans = self.header.get('nifs',1), self.header['nchans']
+        n_bytes = nifs * nchans * self.header['nbits'] // 8
+        self.n_ints_in_file = (os.path.getsize(fil) - header_len) // n_bytes
+        self.data = np.memmap(fil, dtype=dtype, mode='r', offset=header_len,
+                              shape=(self.n_ints_in_file, nifs, nchans))
+        # frequency edges of the file, as blimpy's container.f_start and f_stop
+        fch1, foff = self.header['fch1'], self.header['foff']
+        self.f_start = min(fch1, fch1 + nchans*foff)
+        self.f_stop = max(fch1, fch1 + nchans*foff)
+
+    # equivalent of bl.Waterfall(fil,f1,f2).grab_data(f1,f2): as blimpy's reader, f1 and f2
+    # are ordered and an edge outside of the file band is replaced by the band edge, the
+    # channel selection is rounded from fch1 (the top of the band if foff < 0), then the
+    # nearest channels to f1 and f2 are kept
+    def grab_data(self, f1, f2):
+        fch1, foff = self.header['fch1'], self.header['foff']
+        f_lo, f_hi = sorted((f1, f2))
+        if not self.f_start <= f_lo < self.f_stop:
+            f_lo = self.f_start
+        if not self.f_start < f_hi <= self.f_stop:
+            f_hi = self.f_stop
+        i_start, i_stop = sorted((int(np.round((f_lo - fch1) / foff)), int(np.round((f_hi - fch1) / foff))))
+        freqs = foff * np.arange(i_start, i_stop) + fch1
+        i0 = np.argmin(np.abs(freqs - f1))
+        i1 = np.argmin(np.abs(freqs - f2))
+        lo, hi = min(i0,i1), max(i0,i1)
+        data = np.squeeze(np.array(self.data[:, 0, i_start+lo:i_start+hi+1]))
+        return freqs[lo:hi+1], data
+
+# fallback for .h5 files, which can't be memory-mapped: header parsed once with blimpy
+class WaterfallFil:
+    def __init__(self, fil):
+        self.fil = fil
+        fil_meta = bl.Waterfall(fil,load_data=False)
+        self.header = fil_meta.header
+        self.n_ints_in_file = fil_meta.n_ints_in_file
+        self.f_start = fil_meta.container.f_start
+        self.f_stop = fil_meta.container.f_stop
+
+    def grab_data(self, f1, f2):
+        return bl.Waterfall(self.fil,f1,f2).grab_data(f1,f2)
+
+# shared filterbank reader: headers are parsed and files memory-mapped once,
+# and frequency slices are served from a bounded LRU cache
+class FilCache:
+    def __init__(self, max_bytes=256*2**20, max_files=64):
+        self.max_bytes = max_bytes
+        self.max_files = max_files
+        self._fils = OrderedDict()
+        self._slices = OrderedDict()
+        self._nbytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    # get the memory-mapped filterbank, opening it if needed
+    def open(self, fil):
+        with self._lock:
+            if fil in self._fils:
+                self._fils.move_to_end(fil)
+                return self._fils[fil]
+        if fil.endswith('.h5'):
+            mapped = WaterfallFil(fil)
+        else:
+            mapped = MappedFil(fil)
+        with self._lock:
+            self._fils[fil] = mapped
+            while len(self._fils) > self.max_files:
+                self._fils.popitem(last=False)
+        return mapped
+
+    # grab the (read-only) data slice between f1 and f2, from the cache if available
+    def grab_data(self, fil, f1, f2):
+        key = (fil, f1, f2)
+        with self._lock:
+            if key in self._slices:
+                self._slices.move_to_end(key)
+                self.hits += 1
+                return self._slices[key]
+            self.misses += 1
+        freqs, data = self.open(fil).grab_data(f1, f2)
+        freqs.flags.writeable = False
+        data.flags.writeable = False
+        with self._lock:
+            if key not in self._slices:
+                self._slices[key] = (freqs, data)
+                self._nbytes += freqs.nbytes + data.nbytes
+            while self._nbytes > self.max_bytes and len(self._slices) > 1:
+                _, (old_f, old_d) = self._slices.popitem(last=False)
+                self._nbytes -= old_f.nbytes + old_d.nbytes
+        return freqs, data
+
+    # drop all open files and cached slices
+    def clear(self):
+        with self._lock:
+            self._fils.clear()
+            self._slices.clear()
+            self._nbytes = 0
+
+# the filterbank cache shared by all hits in this process
+fil_cache = FilCache()
+
+# grab the data slice from the filterbank file over the frequency range provided
 def wf_data(fil,f1,f2):
-    return bl.Waterfall(fil,f1,f2).grab_data(f1,f2)
+    return fil_cache.grab_data(fil,f1,f2)
 
 # get the normalization factor of a 2D array
 def ACF(s1):
@@ -179,11 +336,11 @@ def comb_df(df, outdir='./', obs='UNKNOWN', resume_index=None, pickle_off=False,
         # identify the target beam .fil file 
         matching_col = row.filter(like='fil_').apply(lambda x: x == row['dat_name']).idxmax()
         target_fil = row[matching_col]
-        # get the filterbank metadata
-        fil_meta = bl.Waterfall(target_fil,load_data=False)
+        # get the filterbank metadata (parsed once per file)
+        fil_meta = fil_cache.open(target_fil)
         # determine the frequency boundaries in the .fil file
-        minimum_frequency = fil_meta.container.f_start
-        maximum_frequency = fil_meta.container.f_stop
+        minimum_frequency = fil_meta.f_start
+        maximum_frequency = fil_meta.f_stop
         # calculate the narrow signal window using the reported drift rate and metadata
         tsamp = fil_meta.header['tsamp']    # time bin length in seconds
         obs_length=fil_meta.n_ints_in_file * tsamp # total length of observation in seconds
@@ -245,8 +402,43 @@ def comb_df(df, outdir='./', obs='UNKNOWN', resume_index=None, pickle_off=False,
         os.remove(outdir+f"{obs}_comb_df.pkl") 
     return df
 
+# frequency tolerance (MHz) for two hits to be considered the same signal
+XREF_FREQ_TOL = 2e-6
+
+# flag the hits in input_df that match any hit in ref_df: frequencies match and
+# reported SNRs are similar within a factor of the expected attenuation (sf).
+# Instead of comparing every pair of hits, ref_df is sorted by frequency and only
+# the hits within the frequency tolerance are compared, so this scales as O(n log n)
+def match_hits(input_df, ref_df, sf, chunk=2**16):
+    matched = np.zeros(len(input_df), dtype=bool)
+    if len(input_df)==0 or len(ref_df)==0:
+        return matched
+    ref_df = ref_df.sort_values('Corrected_Frequency', kind='mergesort')
+    cols = ['Corrected_Frequency','freq_start','freq_end','Drift_Rate','SNR']
+    ref = {c: ref_df[c].to_numpy(dtype=float) for c in cols}
+    hit = {c: input_df[c].to_numpy(dtype=float) for c in cols}
+    # candidate window, slightly wider than the tolerance so that the exact test below decides
+    f = hit['Corrected_Frequency']
+    lo = np.searchsorted(ref['Corrected_Frequency'], f - 2*XREF_FREQ_TOL, side='left')
+    hi = np.searchsorted(ref['Corrected_Frequency'], f + 2*XREF_FREQ_TOL, side='right')
+    counts = hi - lo
+    # expand the candidate (hit, reference hit) pairs, a chunk of hits at a time
+    for first in range(0, len(f), chunk):
+        last = min(first+chunk, len(f))
+        n = counts[first:last]
+        i = np.repeat(np.arange(first, last), n)
+        j = np.arange(n.sum()) - np.repeat(np.cumsum(n) - n, n) + np.repeat(lo[first:last], n)
+        within_tolerance = (np.abs(ref['Corrected_Frequency'][j] - hit['Corrected_Frequency'][i]) < XREF_FREQ_TOL) & \
+                           (((np.abs(ref['freq_start'][j] - hit['freq_start'][i]) < XREF_FREQ_TOL) & \
+                           (np.abs(ref['freq_end'][j] - hit['freq_end'][i]) < XREF_FREQ_TOL)) | \
+                           (np.abs(ref['Drift_Rate'][j] - hit['Drift_Rate'][i]) < 1/16)) & \
+                           (np.abs(ref['SNR'][j] / hit['SNR'][i]) >= 1/sf) & \
+                           (np.abs(hit['SNR'][i] / ref['SNR'][j]) <= sf)
+        matched[i[within_tolerance]] = True
+    return matched
+
 # cross reference hits in the target beam dat with the other beams dats for identical signals
-def cross_ref(input_df,sf):
+def cross_ref(input_df,sf,store=None):
     if len(input_df)==0:
         logging.info("\tNo hits in the input dataframe to cross reference.")
         return input_df
@@ -261,31 +453,13 @@ def cross_ref(input_df,sf):
     for dat_file in dat_files:
         if dat_file == os.path.basename(input_df['dat_name'].iloc[0]):
             continue  # Skip the dat file corresponding to the dat_name column
-        dat_df = pd.read_csv(os.path.join(dat_path, dat_file), delim_whitespace=True,
-                             names=['Top_Hit_#','Drift_Rate','SNR','Uncorrected_Frequency',
-                                    'Corrected_Frequency','Index','freq_start','freq_end',
-                                    'SEFD','SEFD_freq','Coarse_Channel_Number',
-                                    'Full_number_of_hits'], skiprows=9)
+        dat_df = read_dat(os.path.join(dat_path, dat_file), store)
         dat_dfs.append(dat_df)
-    # Iterate through the rows in the input dataframe and prune matching hits
-    rows_to_drop = []
-    for idx, row in input_df.iterrows():
-        drop_row = False # don't drop it unless there's a match
-        # Check if values are within tolerance in any of the dat file dataframes
-        for dat_df in dat_dfs:
-            # check if frequencies match and if reported SNRs are similar within a factor of the expected attenuation
-            within_tolerance = ((dat_df['Corrected_Frequency'] - row['Corrected_Frequency']).abs() < 2e-6) & \
-                               ((((dat_df['freq_start'] - row['freq_start']).abs() < 2e-6) & \
-                               ((dat_df['freq_end'] - row['freq_end']).abs() < 2e-6)) | \
-                               ((dat_df['Drift_Rate'] - row['Drift_Rate']).abs() < 1/16)) & \
-                               ((dat_df['SNR'] / row['SNR']).abs() >= 1/sf) & \
-                               ((row['SNR'] / dat_df['SNR']).abs() <= sf)
-            if within_tolerance.any():
-                drop_row = True # drop it like it's hot
-                break
-        # Add the row index to the list of rows that should be dropped
-        if drop_row:
-            rows_to_drop.append(idx)
+    if len(dat_dfs)==0:
+        return input_df
+    # Find the hits that match any hit in the other dat files
+    matched = match_hits(input_df, pd.concat(dat_dfs, ignore_index=True), sf)
+    rows_to_drop = input_df.index[matched]
     # Drop the rows that were identified as within matching tolerance
     trimmed_df = input_df.drop(rows_to_drop)
     # Return the trimmed dataframe with a reset index
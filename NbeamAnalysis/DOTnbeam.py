@@ -61,6 +61,8 @@ def parse_args():
                         help='MJD before which observations should be processed')
     parser.add_argument('-after', '--after', type=str,nargs=1,default=None,
                         help='MJD after which observations should be processed')
+    parser.add_argument('-hitstore', '--hitstore', metavar='/hit_store_directory/', type=str, nargs=1, default=None,
+                        help='columnar hit store directory (see hit_store.py), dat files are ingested into it before processing')
     args = parser.parse_args()
     # Check for trailing slash in the directory path and add it if absent
     odict = vars(args)
@@ -83,6 +85,8 @@ def parse_args():
         odict["outdir"] = outdir  
     else:
         odict["outdir"] = ""
+    if odict["hitstore"]:
+        odict["hitstore"] = odict["hitstore"][0]
     # Returns the input argument as a labeled array
     return odict
 
@@ -104,6 +108,7 @@ def main():
     store = cmd_args["store"]       # optional, flag to retain pickle files
     before = cmd_args["before"]     # optional, MJD to limit observations
     after = cmd_args["after"]       # optional, MJD to limit observations
+    hitstore = cmd_args["hitstore"] # optional, columnar hit store directory
 
     # create the output directory if the specified path does not exist
     if not os.path.isdir(outdir):
@@ -141,6 +146,11 @@ def main():
     if errors:
         logging.info(f'{errors} errors when gathering dat files in the input directory. Check the log for skipped files.')
 
+    # parse any new dat files into the hit store, so the dats are read from its parquet files below
+    if hitstore:
+        import hit_store
+        hit_store.ingest(datdir,hitstore)
+
     if sf==None:
         logging.info("\nNo spatial filtering being applied since sf flag was not toggled on input command.\n")
     
@@ -186,7 +196,7 @@ def main():
             logging.info(f'\tWARNING! Could only locate 1 filterbank file in:\n\t{fildir+dat.split(datdir)[-1].split(dat.split("/")[-1])[0]}')
             logging.info(f'\tProceeding with caution...')
         # make a dataframe containing all the hits from all the .dat files in the tuple and sort them by frequency
-        df0 = DOT.load_dat_df(dat,fils)
+        df0 = DOT.load_dat_df(dat,fils,hitstore)
         df0 = df0.sort_values('Corrected_Frequency').reset_index(drop=True)
         if df0.empty:
             logging.info(f'\tWARNING! No hits found in this dat file.')
@@ -197,7 +207,7 @@ def main():
             continue
         # apply spatial filtering if turned on with sf flag (default is off)
         if sf!=None:  
-            df = DOT.cross_ref(df0,sf)
+            df = DOT.cross_ref(df0,sf,hitstore)
             exact_matches+=len(df0)-len(df)
             hits+=len(df0)
             logging.info(f"\t{len(df0)-len(df)}/{len(df0)} hits removed as exact frequency matches. ")
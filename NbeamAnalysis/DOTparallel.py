@@ -1,6 +1,9 @@
 '''
-This is the parallelized version of the DOTnbeam code. It does the same thing over multiple cores, 
-but currently lacks the ability to pickle states for resuming an interrupted process.
+This is the parallelized version of the DOTnbeam code. It does the same thing over multiple cores.
+The dat files are cross referenced in parallel and the remaining hits are then combed through 
+in chunks of hits (-chunk), handed out to the cores one at a time as they become free.
+Finished dat files and chunks are checkpointed, so rerunning an interrupted process 
+with the same arguments skips the work already done.
 
 This program uses a dot product to correlate power in target and off-target beams 
 in an attempt to quantify the localization of identified signals.
@@ -34,6 +37,9 @@ import matplotlib.ticker as ticker
 from matplotlib.ticker import ScalarFormatter
 import DOT_utils as DOT
 import logging
+import pickle
+import shutil
+import hashlib
 import psutil
 import threading
 from multiprocessing import Pool, Manager, Lock, Process
@@ -63,10 +69,16 @@ def parse_args():
                         help='number of cpu cores to use in parallel')
     parser.add_argument('-sf', type=float, nargs='?', const=4, default=None,
                         help='flag to turn on spatial filtering with optional attenuation value for filtering')
+    parser.add_argument('-chunk', type=int, nargs='?', const=64, default=64,
+                        help='number of hits per parallel work unit, default = 64')
+    parser.add_argument('-store', action='store_true',
+                        help='flag to retain checkpoint files after successful completion')
     parser.add_argument('-before', '--before', type=str,nargs=1,default=None,
                         help='MJD before which observations should be processed')
     parser.add_argument('-after', '--after', type=str,nargs=1,default=None,
                         help='MJD after which observations should be processed')
+    parser.add_argument('-hitstore', '--hitstore', metavar='/hit_store_directory/', type=str, nargs=1, default=None,
+                        help='columnar hit store directory (see hit_store.py), dat files are ingested into it before processing')
     args = parser.parse_args()
     # Check for trailing slash in the directory path and add it if absent
     odict = vars(args)
@@ -89,81 +101,138 @@ def parse_args():
         odict["outdir"] = outdir  
     else:
         odict["outdir"] = ""
+    if odict["hitstore"]:
+        odict["hitstore"] = odict["hitstore"][0]
     # Returns the input argument as a labeled array
     return odict
 
     # dat processing function for parallelization.
-# perform cross-correlation to pare down the list of hits if flagged with sf, 
-# and put the remaining hits into a dataframe.
-def dat_to_dataframe(args):
-    dat, datdir, fildir, outdir, obs, sf, count_lock, proc_count, ndats, before, after = args
+# load the hits of a dat file and perform cross-correlation to pare down the list of hits 
+# if flagged with sf. The remaining hits are combed through in chunks by comb_chunk.
+def prep_dat(args):
+    dat, datdir, fildir, outdir, obs, sf, count_lock, proc_count, ndats, before, after, hitstore = args
     start = time.time()
+    dat_name = "/".join(dat.split("/")[-2:])
+    # get the common subdirectories with trailing "/"
+    subdirectories="/".join(dat.replace(datdir,"").split("/")[:-1])+"/"
+    fil_MJD="_".join(dat.split('/')[-1].split("_")[:3])
     with count_lock:
-        dat_name = "/".join(dat.split("/")[-2:])
-        # get the common subdirectories with trailing "/"
-        subdirectories="/".join(dat.replace(datdir,"").split("/")[:-1])+"/"
-        fil_MJD="_".join(dat.split('/')[-1].split("_")[:3])
         proc_count.value += 1
-        # optionally skip if outside input MJD bounds
-        if before and float(".".join(fil_MJD[4:].split("_"))[:len(before[0])]) >= float(".".join(before[0].split("_"))):
-            logging.info(f'Skipping dat file {proc_count.value}/{ndats} occurring after input MJD ({before[0]}):\n\t{dat_name}')
-            return pd.DataFrame(),0,1,0
-        if after and float(".".join(fil_MJD[4:].split("_"))[:len(after[0])]) <= float(".".join(after[0].split("_"))):
-            logging.info(f'Skipping dat file {proc_count.value}/{ndats} occurring before input MJD ({after[0]}):\n\t{dat_name}')
-            return pd.DataFrame(),0,1,0
-        logging.info(f'\nProcessing dat file {proc_count.value}/{ndats}\n\t{dat_name}')
-        hits,skipped,exact_matches=0,0,0
-        # make a tuple with the corresponding fil/h5 files
-        # fils=sorted(glob.glob(fildir+subdirectories+fil_MJD+'*fil'))
-        fils=sorted(glob.glob(fildir+subdirectories+os.path.basename(os.path.splitext(dat)[0])[:-4]+'????*fil'))
-        if not fils:
-            fils=sorted(glob.glob(fildir+subdirectories+os.path.basename(os.path.splitext(dat)[0])[:-4]+'????*h5'))
-        if not fils:
-            logging.info(f'\tWARNING! Could not locate filterbank files in:\n\t{fildir+dat.split(datdir)[-1].split(dat.split("/")[-1])[0]}')
-            logging.info(f'\tSkipping...\n')
-            skipped+=1
-            mid, time_label = DOT.get_elapsed_time(start)
-            logging.info(f"Finished processing in %.2f {time_label}." %mid)
-            return pd.DataFrame(),hits,skipped,exact_matches
-        elif len(fils)==1:
-            logging.info(f'\tWARNING! Could only locate 1 filterbank file in:\n\t{fildir+dat.split(datdir)[-1].split(dat.split("/")[-1])[0]}')
-            logging.info(f'\tProceeding with caution...')
-        # make a dataframe containing all the hits from all the dat files in the tuple and sort them by frequency
-        df0 = DOT.load_dat_df(dat,fils)
-        df0 = df0.sort_values('Corrected_Frequency').reset_index(drop=True)
-        if df0.empty:
-            logging.info(f'\tWARNING! No hits found in this dat file.')
-            logging.info(f'\tSkipping...')
-            skipped+=1
-            mid, time_label = DOT.get_elapsed_time(start)
-            logging.info(f"Finished processing in %.2f {time_label}." %mid)
-            return pd.DataFrame(),hits,skipped,exact_matches
-        # apply spatial filtering if turned on with sf flag (default is off)
-        if sf!=None:  
-            df = DOT.cross_ref(df0,sf)
-            exact_matches+=len(df0)-len(df)
-            hits+=len(df0)
-            mid, time_label = DOT.get_elapsed_time(start)
-            logging.info(f"\t{len(df0)-len(df)}/{len(df0)} hits removed as exact frequency matches in %.2f {time_label}." %mid)
-            start = time.time()
-        else:
-            df = df0
-            hits+=len(df0)
-        # comb through the dataframe, correlate beam power for each hit and calculate attenuation with SNR-ratio
-        if df.empty:
-            logging.info(f'\tWARNING! Empty dataframe constructed after spatial filtering of dat file.')
-            logging.info(f'\tSkipping this dat file because there are no remaining hits to comb through...')
-            skipped+=1
-            mid, time_label = DOT.get_elapsed_time(start)
-            logging.info(f"Finished processing in %.2f {time_label}." %mid)
-            return pd.DataFrame(),hits,skipped,exact_matches
-        else:
-            logging.info(f"\tCombing through the remaining {len(df)} hits.")
-            temp_df = DOT.comb_df(df,outdir,obs,pickle_off=True,sf=sf)
+        count = proc_count.value
+    # optionally skip if outside input MJD bounds
+    if before and float(".".join(fil_MJD[4:].split("_"))[:len(before[0])]) >= float(".".join(before[0].split("_"))):
+        logging.info(f'Skipping dat file {count}/{ndats} occurring after input MJD ({before[0]}):\n\t{dat_name}')
+        return pd.DataFrame(),0,1,0
+    if after and float(".".join(fil_MJD[4:].split("_"))[:len(after[0])]) <= float(".".join(after[0].split("_"))):
+        logging.info(f'Skipping dat file {count}/{ndats} occurring before input MJD ({after[0]}):\n\t{dat_name}')
+        return pd.DataFrame(),0,1,0
+    logging.info(f'\nProcessing dat file {count}/{ndats}\n\t{dat_name}')
+    hits,skipped,exact_matches=0,0,0
+    # make a tuple with the corresponding fil/h5 files
+    # fils=sorted(glob.glob(fildir+subdirectories+fil_MJD+'*fil'))
+    fils=sorted(glob.glob(fildir+subdirectories+os.path.basename(os.path.splitext(dat)[0])[:-4]+'????*fil'))
+    if not fils:
+        fils=sorted(glob.glob(fildir+subdirectories+os.path.basename(os.path.splitext(dat)[0])[:-4]+'????*h5'))
+    if not fils:
+        logging.info(f'\tWARNING! Could not locate filterbank files in:\n\t{fildir+dat.split(datdir)[-1].split(dat.split("/")[-1])[0]}')
+        logging.info(f'\tSkipping...\n')
+        skipped+=1
         mid, time_label = DOT.get_elapsed_time(start)
         logging.info(f"Finished processing in %.2f {time_label}." %mid)
-        return temp_df,hits,skipped,exact_matches
+        return pd.DataFrame(),hits,skipped,exact_matches
+    elif len(fils)==1:
+        logging.info(f'\tWARNING! Could only locate 1 filterbank file in:\n\t{fildir+dat.split(datdir)[-1].split(dat.split("/")[-1])[0]}')
+        logging.info(f'\tProceeding with caution...')
+    # make a dataframe containing all the hits from all the dat files in the tuple and sort them by frequency
+    df0 = DOT.load_dat_df(dat,fils,hitstore)
+    df0 = df0.sort_values('Corrected_Frequency').reset_index(drop=True)
+    if df0.empty:
+        logging.info(f'\tWARNING! No hits found in this dat file.')
+        logging.info(f'\tSkipping...')
+        skipped+=1
+        mid, time_label = DOT.get_elapsed_time(start)
+        logging.info(f"Finished processing in %.2f {time_label}." %mid)
+        return pd.DataFrame(),hits,skipped,exact_matches
+    # apply spatial filtering if turned on with sf flag (default is off)
+    if sf!=None:  
+        df = DOT.cross_ref(df0,sf,hitstore)
+        exact_matches+=len(df0)-len(df)
+        hits+=len(df0)
+        mid, time_label = DOT.get_elapsed_time(start)
+        logging.info(f"\t{len(df0)-len(df)}/{len(df0)} hits removed as exact frequency matches in %.2f {time_label}." %mid)
+    else:
+        df = df0
+        hits+=len(df0)
+    if df.empty:
+        logging.info(f'\tWARNING! Empty dataframe constructed after spatial filtering of dat file.')
+        logging.info(f'\tSkipping this dat file because there are no remaining hits to comb through...')
+        skipped+=1
+    return df,hits,skipped,exact_matches
+
+def timed_prep_dat(args):
+    start = time.time()
+    result = prep_dat(args)
+    return args[0], result, os.getpid(), start, time.time()
+
+# comb through a chunk of hits of one dat file, correlate beam power for each hit 
+# and calculate attenuation with SNR-ratio. Returns the timing of the chunk for the worker stats.
+def comb_chunk(args):
+    key, df, outdir, obs, sf = args
+    start = time.time()
+    df = DOT.comb_df(df,outdir,obs,pickle_off=True,sf=sf)
+    return key, df, os.getpid(), start, time.time()
 
+# checkpoint files of finished work are kept in a directory per observation:
+#   prep_<dat>.pkl        the hits of a dat file left after cross referencing, with its counters
+#   comb_<dat>_<n>.pkl    the n-th chunk of combed hits of a dat file
+def checkpoint_dir(outdir, obs, params):
+    chkdir = outdir+f'{obs}_checkpoints/'
+    params_file = chkdir+'params.pkl'
+    if os.path.exists(params_file):
+        with open(params_file,'rb') as f:
+            if pickle.load(f)==params:
+                nfiles = len(glob.glob(chkdir+'comb_*.pkl'))
+                logging.info(f'\t***checkpoint directory found with {nfiles} finished chunks. Resuming...\n')
+                return chkdir
+        logging.info(f'\t***checkpoint directory found with different input arguments. Starting over...\n')
+        shutil.rmtree(chkdir)
+    os.makedirs(chkdir, exist_ok=True)
+    with open(params_file,'wb') as f:
+        pickle.dump(params, f)
+    return chkdir
+
+def dat_key(dat):
+    return hashlib.sha1(dat.encode()).hexdigest()[:16]
+
+def load_checkpoint(chkdir, name):
+    path = chkdir+name+'.pkl'
+    if not os.path.exists(path):
+        return None
+    with open(path,'rb') as f:
+        return pickle.load(f)
+
+# write to a temporary file first, so an interrupted write never leaves a truncated checkpoint
+def save_checkpoint(chkdir, name, obj):
+    path = chkdir+name+'.pkl'
+    with open(path+'.tmp','wb') as f:
+        pickle.dump(obj, f)
+    os.replace(path+'.tmp', path)
+
+# summarize the busy time and throughput of each worker over a parallel stage
+def log_worker_stats(label, stats, wall, unit):
+    logging.info(f"\n{label} worker stats over %.2f s:" %wall)
+    for n,(pid,s) in enumerate(sorted(stats.items())):
+        logging.info(f"\tworker {n} (pid {pid}): {s['tasks']} tasks, {s['items']} {unit} in %.2f s busy "
+                     f"(%.0f%% of the stage), %.1f {unit}/s"
+                     %(s['busy'], 100*s['busy']/max(wall,1e-9), s['items']/max(s['busy'],1e-9)))
+
+# depths holds the number of unfinished tasks at the start and after every completion
+def log_queue_stats(label, depths, num_processes):
+    if len(depths)<2:
+        return
+    depths = np.array(depths)
+    logging.info(f"\t{label} queue depth: {depths[0]} tasks at start, mean %.1f unfinished per completion, "
+                 f"fewer tasks than workers for the last {np.sum(depths[1:]<num_processes)} completions." %depths.mean())
 
     # Main program execution
 def main():
@@ -186,8 +255,11 @@ def main():
     tag = cmd_args["tag"]           # optional file label, default = None
     ncore = cmd_args["ncore"]       # optional, set number of cores to use, default = all
     sf = cmd_args["sf"]             # optional, flag to turn off spatial filtering
+    chunk = cmd_args["chunk"]       # optional, number of hits per work unit, default = 64
+    store = cmd_args["store"]       # optional, flag to retain checkpoint files
     before = cmd_args["before"]     # optional, MJD to limit observations
     after = cmd_args["after"]       # optional, MJD to limit observations
+    hitstore = cmd_args["hitstore"] # optional, columnar hit store directory
 
     # create the output directory if the specified path does not exist
     if not os.path.isdir(outdir):
@@ -226,6 +298,11 @@ def main():
     if errors:
         logging.info(f'{errors} errors when gathering dat files in the input directory. Check the log for skipped files.')
 
+    # parse any new dat files into the hit store, so the dats are read from its parquet files below
+    if hitstore:
+        import hit_store
+        hit_store.ingest(datdir,hitstore)
+
     if sf==None:
         logging.info("\nNo spatial filtering being applied since sf flag was not toggled on input command.\n")
     
@@ -237,21 +314,82 @@ def main():
     else:
         num_processes = ncore
     logging.info(f"\n{num_processes} cores requested by user for parallel processing.")
+    # finished work is checkpointed, so an interrupted run resumes where it left off
+    params = (datdir, fildir, beam, sf, before, after, chunk)
+    chkdir = checkpoint_dir(outdir, obs, params)
     # Initialize the Manager object for shared variables
     manager = Manager()
     count_lock = manager.Lock()
     proc_count = manager.Value('i', 0)  # Shared integer to track processed count
-    # Execute the parallelized function
-    input_args = [(dat_file, datdir, fildir, outdir, obs, sf, count_lock, proc_count, ndats, before, after) for dat_file in dat_files]
+    # the work is handed out one task at a time (imap_unordered with chunksize=1), 
+    # so idle workers pick up the next task instead of waiting on a long dat file
     with Pool(num_processes) as pool:
-        results = pool.map(dat_to_dataframe, input_args)
+        # first stage: load and cross reference the dat files not yet checkpointed
+        prepped = {dat_key(dat): load_checkpoint(chkdir, 'prep_'+dat_key(dat)) for dat in dat_files}
+        input_args = [(dat_file, datdir, fildir, outdir, obs, sf, count_lock, proc_count, ndats, before, after, hitstore) 
+                        for dat_file in dat_files if prepped[dat_key(dat_file)] is None]
+        proc_count.value = ndats-len(input_args)
+        stage_start = time.time()
+        prep_stats = {}
+        prep_depths = [len(input_args)]
+        for dat, result, pid, t0, t1 in pool.imap_unordered(timed_prep_dat, input_args, chunksize=1):
+            save_checkpoint(chkdir, 'prep_'+dat_key(dat), result)
+            prepped[dat_key(dat)] = result
+            prep_depths.append(len(input_args)-len(prep_depths))
+            stats = prep_stats.setdefault(pid, {'tasks':0, 'items':0, 'busy':0})
+            stats['tasks'] += 1
+            stats['items'] += result[1]
+            stats['busy'] += t1-t0
+        prep_wall = time.time()-stage_start
+
+        # second stage: comb through the hits in chunks of a fixed number of hits
+        combed = {}
+        tasks = []
+        for dat in dat_files:
+            key = dat_key(dat)
+            df = prepped[key][0]
+            for n in range(0, len(df), chunk):
+                name = f'comb_{key}_{n//chunk:06d}'
+                result = load_checkpoint(chkdir, name)
+                if result is None:
+                    tasks.append((name, df.iloc[n:n+chunk].copy(), outdir, obs, sf))
+                else:
+                    combed[name] = result
+        logging.info(f"\n{len(combed)} chunks of hits already combed, combing through the remaining {len(tasks)} chunks "
+                     f"({sum(len(t[1]) for t in tasks)} hits) in chunks of up to {chunk} hits.")
+        stage_start = time.time()
+        comb_stats = {}
+        depths = [len(tasks)]
+        for name, df, pid, t0, t1 in pool.imap_unordered(comb_chunk, tasks, chunksize=1):
+            save_checkpoint(chkdir, name, df)
+            combed[name] = df
+            depths.append(len(tasks)-len(depths))
+            stats = comb_stats.setdefault(pid, {'tasks':0, 'items':0, 'busy':0})
+            stats['tasks'] += 1
+            stats['items'] += len(df)
+            stats['busy'] += t1-t0
+            if len(depths)%max(len(tasks)//10,1)==0:
+                logging.info(f"\t{len(depths)-1}/{len(tasks)} chunks combed.")
+        comb_wall = time.time()-stage_start
 
     # Process the results as needed
-    result_dataframes, hits, skipped, exact_matches = zip(*results)
+    hits = [prepped[dat_key(dat)][1] for dat in dat_files]
+    skipped = [prepped[dat_key(dat)][2] for dat in dat_files]
+    exact_matches = [prepped[dat_key(dat)][3] for dat in dat_files]
 
-    # Concatenate the dataframes into a single dataframe
-    full_df = pd.concat(result_dataframes, ignore_index=True)
+    # Concatenate the chunks into a single dataframe, in the order of the dat files
+    dat_order = {dat_key(dat): i for i, dat in enumerate(dat_files)}
+    result_dataframes = [combed[name] for name in sorted(combed, key=lambda name: (dat_order[name.split('_')[1]], name))]
+    full_df = pd.concat(result_dataframes, ignore_index=True) if result_dataframes else pd.DataFrame()
     full_df.to_csv(f"{outdir}{obs}_DOTnbeam.csv")
+    # remove the checkpoints once the results are saved, unless asked to keep them
+    if not store:
+        shutil.rmtree(chkdir)
+
+    log_worker_stats("Cross referencing", prep_stats, prep_wall, 'hits')
+    log_queue_stats("Cross referencing", prep_depths, num_processes)
+    log_worker_stats("Combing", comb_stats, comb_wall, 'hits')
+    log_queue_stats("Combing", depths, num_processes)
 
     # Do something with the counters if needed
     total_hits = sum(hits)
@@ -0,0 +1,95 @@
+# Benchmark of DOT_utils.cross_ref on synthetic turboSETI .dat files.
+# Compares the sorted-interval join with the previous row-by-row comparison
+# (only run up to --max-loop hits, it is quadratic) and checks that both
+# drop the same hits.
+
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+import DOT_utils as DOT
+
+DAT_COLS = ['Top_Hit_#','Drift_Rate','SNR','Uncorrected_Frequency','Corrected_Frequency','Index',
+            'freq_start','freq_end','SEFD','SEFD_freq','Coarse_Channel_Number','Full_number_of_hits']
+
+# write a synthetic turboSETI .dat file (9 header lines, then one hit per line)
+def write_dat(path, df):
+    with open(path, 'w') as f:
+        f.write('# synthetic turboSETI .dat file\n'*9)
+        df[DAT_COLS].to_csv(f, sep='\t', header=False, index=False)
+
+# make the target beam hits and the other beam hits, a fraction of them duplicated
+def make_hits(n, rng, dup_frac=0.3):
+    freqs = rng.uniform(1000, 2000, n)
+    df = pd.DataFrame({'Top_Hit_#':np.arange(1,n+1),
+                       'Drift_Rate':np.round(rng.uniform(-4,4,n),6),
+                       'SNR':rng.uniform(10,1000,n),
+                       'Uncorrected_Frequency':freqs,
+                       'Corrected_Frequency':freqs,
+                       'Index':rng.integers(0,2**20,n),
+                       'freq_start':freqs-1e-6,
+                       'freq_end':freqs+1e-6,
+                       'SEFD':0.0,'SEFD_freq':0.0,
+                       'Coarse_Channel_Number':rng.integers(0,1024,n),
+                       'Full_number_of_hits':n})
+    other = df.copy()
+    new = rng.random(n) > dup_frac
+    other.loc[new,'Corrected_Frequency'] = rng.uniform(1000, 2000, new.sum())
+    other['Corrected_Frequency'] += rng.normal(0, 1e-6, n)
+    other['SNR'] *= rng.uniform(0.1, 2, n)
+    return df, other
+
+# the previous implementation: every hit against every hit in every other dat
+def cross_ref_loop(input_df, dat_dfs, sf):
+    rows_to_drop = []
+    for idx, row in input_df.iterrows():
+        for dat_df in dat_dfs:
+            within_tolerance = ((dat_df['Corrected_Frequency'] - row['Corrected_Frequency']).abs() < 2e-6) & \
+                               ((((dat_df['freq_start'] - row['freq_start']).abs() < 2e-6) & \
+                               ((dat_df['freq_end'] - row['freq_end']).abs() < 2e-6)) | \
+                               ((dat_df['Drift_Rate'] - row['Drift_Rate']).abs() < 1/16)) & \
+                               ((dat_df['SNR'] / row['SNR']).abs() >= 1/sf) & \
+                               ((row['SNR'] / dat_df['SNR']).abs() <= sf)
+            if within_tolerance.any():
+                rows_to_drop.append(idx)
+                break
+    return input_df.drop(rows_to_drop).reset_index(drop=True)
+
+def main():
+    p = argparse.ArgumentParser(description='cross_ref timing for 10^3 to 10^6 synthetic hits')
+    p.add_argument('--sizes', type=int, nargs='+', default=[10**3, 10**4, 10**5, 10**6])
+    p.add_argument('--max-loop', type=int, default=10**4, help='largest size to run the row-by-row loop on')
+    p.add_argument('--sf', type=float, default=4)
+    args = p.parse_args()
+    rng = np.random.default_rng(0)
+
+    print(f"{'hits':>9} {'loop [s]':>10} {'join [s]':>10} {'kept':>9} {'same':>5}")
+    for n in args.sizes:
+        with tempfile.TemporaryDirectory() as d:
+            df, other = make_hits(n, rng)
+            target = os.path.join(d, 'obs-beam0000.dat')
+            write_dat(target, df)
+            write_dat(os.path.join(d, 'obs-beam0001.dat'), other)
+            input_df = pd.read_csv(target, delim_whitespace=True, names=DAT_COLS, skiprows=9)
+            input_df = input_df.assign(dat_name=target)
+
+            start = time.time()
+            joined = DOT.cross_ref(input_df, args.sf)
+            t_join = time.time() - start
+
+            if n <= args.max_loop:
+                ref_df = pd.read_csv(os.path.join(d, 'obs-beam0001.dat'), delim_whitespace=True, names=DAT_COLS, skiprows=9)
+                start = time.time()
+                looped = cross_ref_loop(input_df, [ref_df], args.sf)
+                t_loop = f'{time.time() - start:10.2f}'
+                same = 'yes' if looped.equals(joined) else 'NO'
+            else:
+                t_loop, same = f'{"-":>10}', '-'
+        print(f'{n:>9} {t_loop} {t_join:>10.2f} {len(joined):>9} {same:>5}')
+
+if __name__ == '__main__':
+    main()
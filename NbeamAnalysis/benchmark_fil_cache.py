@@ -0,0 +1,83 @@
+# Benchmark of the shared filterbank cache used by comb_df (DOT_utils.fil_cache)
+# against reopening every .fil with blimpy for every hit.
+# Synthetic beams are generated with setigen and reports are in hits/s.
+
+import argparse
+import logging
+import os
+import tempfile
+import time
+
+import numpy as np
+import blimpy as bl
+import setigen as stg
+from astropy import units as u
+
+import DOT_utils as DOT
+
+# make the synthetic filterbank files, one per beam, with the same drifting signals
+def make_beams(outdir, nbeams, fchans, tchans, nsignals, seed=0):
+    rng = np.random.default_rng(seed)
+    starts = rng.integers(100, fchans-100, nsignals)
+    fils = []
+    for beam in range(nbeams):
+        frame = stg.Frame(fchans=fchans, tchans=tchans, df=2.79*u.Hz, dt=18.25*u.s, fch1=6000*u.MHz)
+        frame.add_noise(x_mean=10, noise_type='chi2')
+        for start in starts:
+            frame.add_signal(stg.constant_path(f_start=frame.get_frequency(int(start)), drift_rate=0.1*u.Hz/u.s),
+                             stg.constant_t_profile(level=frame.get_intensity(snr=30/(beam+1))),
+                             stg.gaussian_f_profile(width=20*u.Hz),
+                             stg.constant_bp_profile(level=1))
+        fil = os.path.join(outdir, f'synthetic-beam{beam:04d}.fil')
+        frame.save_fil(fil)
+        fils.append(fil)
+    return fils, np.array(frame.get_frequency(starts))/1e6 # MHz
+
+# the per-hit work of comb_df: grab the slice in every beam, SNRs and correlations
+def process_hits(fils, hit_freqs, grab):
+    for fmid in hit_freqs:
+        f1, f2 = round(fmid-250e-6, 6), round(fmid+250e-6, 6)
+        _, s0 = grab(fils[0], f1, f2)
+        SNR0 = DOT.mySNR(s0)
+        for other in fils[1:]:
+            _, s1 = grab(other, f1, f2)
+            SNR0/DOT.mySNR(s1)
+            DOT.sig_cor(s0-DOT.noise_median(s0), s1-DOT.noise_median(s1))
+
+def blimpy_grab(fil, f1, f2):
+    return bl.Waterfall(fil, f1, f2).grab_data(f1, f2)
+
+def main():
+    p = argparse.ArgumentParser(description='hits/s of comb_df data access, blimpy vs shared filterbank cache')
+    p.add_argument('--beams', type=int, default=2, help='number of beams')
+    p.add_argument('--fchans', type=int, default=2**20, help='fine channels per file')
+    p.add_argument('--tchans', type=int, default=16, help='time bins per file')
+    p.add_argument('--hits', type=int, default=200, help='number of hits')
+    args = p.parse_args()
+    logging.getLogger('blimpy').setLevel(logging.ERROR)
+    for name in list(logging.root.manager.loggerDict):
+        if name.startswith('blimpy'):
+            logging.getLogger(name).setLevel(logging.ERROR)
+
+    with tempfile.TemporaryDirectory() as outdir:
+        fils, freqs = make_beams(outdir, args.beams, args.fchans, args.tchans, args.hits)
+        # revisit every hit twice, as happens for hits reported in several beams
+        hit_freqs = np.concatenate([freqs, freqs])
+
+        start = time.time()
+        process_hits(fils, hit_freqs, blimpy_grab)
+        t_blimpy = time.time() - start
+
+        DOT.fil_cache.clear()
+        start = time.time()
+        process_hits(fils, hit_freqs, DOT.wf_data)
+        t_cache = time.time() - start
+
+    nhits = len(hit_freqs)
+    print(f'{args.beams} beams, {args.fchans} x {args.tchans} channels, {nhits} hits')
+    print(f'blimpy reopen: {nhits/t_blimpy:10.1f} hits/s')
+    print(f'shared cache:  {nhits/t_cache:10.1f} hits/s '
+          f'(slice cache {DOT.fil_cache.hits} hits / {DOT.fil_cache.misses} misses)')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,170 @@
+'''
+Columnar store of turboSETI hits, so that the .dat files are parsed only once.
+
+The ingest step walks a directory tree of .dat files and writes the hits of each
+.dat file into one parquet file, in a hive-style partition per source, node and beam:
+    <store>/source=<source>/node=<node>/beam=<beam>/<dat hash>.parquet
+A manifest records the size and modification time of every ingested .dat file,
+so that later ingests only pick up new (or rewritten) files, and drop the hits of
+deleted ones. The hits of a .dat file are sorted by Corrected_Frequency and written
+in row groups of ROW_GROUP_SIZE hits, so that each row group covers its own
+frequency range.
+
+Loads use pyarrow datasets, so filters on source/node/beam prune partitions and
+filters on frequency and SNR are pushed down to the parquet row groups.
+
+Typical command line usage to ingest (or update) a store:
+    python NbeamAnalysis/hit_store.py <dat_dir> <store_dir>
+
+DOTnbeam.py and DOTparallel.py use a store with the -hitstore flag.
+'''
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import time
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+
+import DOT_utils as DOT
+
+MANIFEST = 'manifest.json'
+ROW_GROUP_SIZE = 4096
+PARTITION_COLS = ['source', 'node', 'beam']
+PARTITIONING = ds.partitioning(pa.schema([(c, pa.string()) for c in PARTITION_COLS]), flavor='hive')
+
+# get the source, node and beam of a .dat file from its path, e.g.
+# .../seti-node2.0/fil_59884_17225_248799804_trappist1_0001-beam0000.dat
+def dat_keys(dat_file):
+    dat_file = os.path.abspath(dat_file)
+    fname = os.path.basename(dat_file)
+    beam = fname.split('beam')[-1].split('.')[0]
+    parts = fname.split('_')
+    source = '_'.join(parts[4:-1]) if len(parts) > 5 else 'UNKNOWN'
+    dirs = os.path.dirname(dat_file).split('/')
+    nodes = [d for d in dirs if 'seti-node' in d]
+    node = nodes[-1] if nodes else dirs[-1]
+    return {'source':source, 'node':node, 'beam':beam}
+
+# the parquet file holding the hits of a .dat file
+def dat_part_path(store, dat_file):
+    dat_file = os.path.abspath(dat_file)
+    keys = dat_keys(dat_file)
+    part = '/'.join(f'{c}={keys[c]}' for c in PARTITION_COLS)
+    name = hashlib.sha1(dat_file.encode()).hexdigest()[:16] + '.parquet'
+    return os.path.join(store, part, name)
+
+def read_manifest(store):
+    path = os.path.join(store, MANIFEST)
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r') as f:
+        return json.load(f)
+
+def write_manifest(store, manifest):
+    path = os.path.join(store, MANIFEST)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(manifest, f)
+    os.replace(path + '.tmp', path)
+
+# remove the parquet file of a .dat file, and the partition directories left empty
+def remove_dat(store, dat_file):
+    path = dat_part_path(store, dat_file)
+    if os.path.exists(path):
+        os.remove(path)
+    part_dir = os.path.dirname(path)
+    store = os.path.abspath(store)
+    while os.path.abspath(part_dir) != store and not os.listdir(part_dir):
+        os.rmdir(part_dir)
+        part_dir = os.path.dirname(part_dir)
+
+# ingest all new or changed .dat files below root_dir into the store,
+# and remove the hits of the ingested .dat files below root_dir that have been deleted
+# .dat files with incomplete turboSETI logs are skipped (and picked up once complete)
+def ingest(root_dir, store):
+    start = time.time()
+    os.makedirs(store, exist_ok=True)
+    manifest = read_manifest(store)
+    new, skipped, nhits = 0, 0, 0
+    root = os.path.join(os.path.abspath(root_dir), '')
+    removed = [dat_file for dat_file in manifest
+               if dat_file.startswith(root) and not os.path.exists(dat_file)]
+    for dat_file in removed:
+        remove_dat(store, dat_file)
+        del manifest[dat_file]
+    for dirpath, dirnames, filenames in os.walk(root_dir):
+        if os.path.abspath(dirpath).startswith(os.path.abspath(store)):
+            continue
+        for f in sorted(filenames):
+            if not f.endswith('.dat'):
+                continue
+            dat_file = os.path.abspath(os.path.join(dirpath, f))
+            stat = os.stat(dat_file)
+            if manifest.get(dat_file) == [stat.st_size, stat.st_mtime]:
+                continue
+            log_file = dat_file.replace('.dat','.log')
+            if not os.path.isfile(log_file) or DOT.check_logs(log_file)=="incomplete":
+                logging.info(f"{log_file} is incomplete. Not ingesting {dat_file} yet.")
+                skipped += 1
+                continue
+            df = DOT.read_dat(dat_file)
+            df = df.sort_values('Corrected_Frequency', kind='stable')
+            df['dat_name'] = dat_file
+            path = dat_part_path(store, dat_file)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            df.to_parquet(path, index=False, row_group_size=ROW_GROUP_SIZE)
+            manifest[dat_file] = [stat.st_size, stat.st_mtime]
+            new += 1
+            nhits += len(df)
+    write_manifest(store, manifest)
+    end, time_label = DOT.get_elapsed_time(start)
+    logging.info(f"Ingested {new} new dat files ({nhits} hits) into {store} in %.2f {time_label}. "
+                 f"{skipped} incomplete dat files skipped, {len(removed)} deleted dat files removed." %end)
+    return new
+
+# load the hits of a single ingested .dat file, with the same columns as DOT_utils.read_dat
+# (sorted by Corrected_Frequency)
+def load_dat(store, dat_file):
+    path = dat_part_path(store, dat_file)
+    if not os.path.exists(path):
+        raise FileNotFoundError(f'{dat_file} has not been ingested into {store}')
+    return pd.read_parquet(path).drop(columns='dat_name')
+
+# load hits from the store, optionally restricted to sources/nodes/beams (partition pruning)
+# and to frequency (MHz) and SNR ranges (pushed down to the parquet row groups)
+def load_hits(store, source=None, node=None, beam=None, f_min=None, f_max=None,
+              snr_min=None, snr_max=None, columns=None):
+    dataset = ds.dataset(store, format='parquet', partitioning=PARTITIONING,
+                         exclude_invalid_files=True)
+    conditions = []
+    for col, values in (('source',source), ('node',node), ('beam',beam)):
+        if values is not None:
+            values = [values] if isinstance(values, str) else list(values)
+            conditions.append(ds.field(col).isin(values))
+    if f_min is not None:
+        conditions.append(ds.field('Corrected_Frequency') >= f_min)
+    if f_max is not None:
+        conditions.append(ds.field('Corrected_Frequency') <= f_max)
+    if snr_min is not None:
+        conditions.append(ds.field('SNR') >= snr_min)
+    if snr_max is not None:
+        conditions.append(ds.field('SNR') <= snr_max)
+    expr = None
+    for condition in conditions:
+        expr = condition if expr is None else expr & condition
+    return dataset.to_table(filter=expr, columns=columns).to_pandas()
+
+def main():
+    parser = argparse.ArgumentParser(description='Ingest turboSETI .dat files into a columnar hit store.')
+    parser.add_argument('datdir', type=str, help='directory tree with the .dat files')
+    parser.add_argument('store', type=str, help='hit store directory (created if needed)')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    ingest(args.datdir, args.store)
+
+if __name__ == "__main__":
+    main()
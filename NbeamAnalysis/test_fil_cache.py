@@ -0,0 +1,77 @@
+# Test of the memory-mapped filterbank slices of DOT_utils (MappedFil, used by
+# fil_cache) against blimpy's Waterfall(fil,f1,f2).grab_data(f1,f2), on synthetic
+# files with ascending (foff > 0) and descending (foff < 0) frequencies, for
+# ranges within the band, reversed, straddling an edge and outside of the band.
+
+import argparse
+import logging
+import os
+import tempfile
+
+import numpy as np
+import blimpy as bl
+import setigen as stg
+from astropy import units as u
+
+import DOT_utils as DOT
+
+# a synthetic filterbank file of fchans channels from fch1, df apart (descending if df < 0)
+def make_fil(fil, fchans, tchans, df, seed=0):
+    frame = stg.Frame(fchans=fchans, tchans=tchans, df=abs(df)*u.Hz, dt=18.25*u.s, fch1=6000*u.MHz,
+                      ascending=df > 0, seed=seed)
+    frame.add_noise(x_mean=10, noise_type='chi2')
+    frame.save_fil(fil)
+
+# (f1, f2) ranges, in MHz, relative to the band of the file
+def make_ranges(f_lo, f_hi, rng, nranges):
+    bw = f_hi - f_lo
+    step = bw/1024
+    ranges = [(f_lo + 0.3*bw, f_lo + 0.31*bw),     # within the band
+              (f_lo + 0.61*bw, f_lo + 0.6*bw),     # reversed
+              (f_lo - 10*step, f_lo + 20*step),    # straddling the bottom edge
+              (f_hi - 20*step, f_hi + 10*step),    # straddling the top edge
+              (f_hi + 10*step, f_hi + 30*step),    # above the band
+              (f_lo - 30*step, f_lo - 10*step),    # below the band
+              (f_lo - step, f_hi + step)]          # around the band
+    for f1, f2 in rng.uniform(f_lo - 0.1*bw, f_hi + 0.1*bw, (nranges, 2)):
+        ranges.append((f1, f2))
+    return [(round(f1, 6), round(f2, 6)) for f1, f2 in ranges]
+
+# MappedFil.grab_data and wf_data against blimpy on ascending and descending files
+def check_mapped_fil(fchans, tchans, nranges):
+    for name in list(logging.root.manager.loggerDict):
+        if name.startswith('blimpy'):
+            logging.getLogger(name).setLevel(logging.ERROR)
+
+    rng = np.random.default_rng(0)
+    with tempfile.TemporaryDirectory() as outdir:
+        for df in [2.79, -2.79]:
+            fil = os.path.join(outdir, f'synthetic-foff{df:+.2f}.fil')
+            make_fil(fil, fchans, tchans, df)
+            mapped = DOT.MappedFil(fil)
+            assert np.sign(mapped.header['foff']) == np.sign(df)
+            ranges = make_ranges(mapped.f_start, mapped.f_stop, rng, nranges)
+            for f1, f2 in ranges:
+                ref_freqs, ref_data = bl.Waterfall(fil, f1, f2).grab_data(f1, f2)
+                freqs, data = mapped.grab_data(f1, f2)
+                assert np.array_equal(freqs, ref_freqs), f'foff {df:+} Hz, {f1}-{f2} MHz: frequencies differ'
+                assert np.array_equal(data, ref_data), f'foff {df:+} Hz, {f1}-{f2} MHz: data differ'
+                # through the shared cache as well
+                freqs, data = DOT.wf_data(fil, f1, f2)
+                assert np.array_equal(freqs, ref_freqs) and np.array_equal(data, ref_data)
+            print(f'foff {df:+} Hz: {len(ranges)} ranges equal to blimpy')
+
+# collected by pytest, with the default sizes
+def test_mapped_fil():
+    check_mapped_fil(4096, 8, 50)
+
+def main():
+    p = argparse.ArgumentParser(description='MappedFil.grab_data against blimpy, foff > 0 and foff < 0')
+    p.add_argument('--fchans', type=int, default=4096, help='fine channels per file')
+    p.add_argument('--tchans', type=int, default=8, help='time bins per file')
+    p.add_argument('--ranges', type=int, default=50, help='random ranges per file, on top of the edge cases')
+    args = p.parse_args()
+    check_mapped_fil(args.fchans, args.tchans, args.ranges)
+
+if __name__ == '__main__':
+    main()
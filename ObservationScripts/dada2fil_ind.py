@@ -4,7 +4,11 @@ from blimpy.io import sigproc
 from astropy import units as u
 from astropy.coordinates import Angle
 import numpy as np
+import os
 import sys
+import argparse
+import concurrent.futures
+import resource
 
 import pytz, datetime
 from astropy.time import Time
@@ -13,6 +17,9 @@ import time
 
 OFFSET = 675 - 629.1456
 DADA_HDR_SZE = 4096
+NSTOKES = 4 # float32 values per sample and channel: xx, yy, re(xy), im(xy)
+DEFAULT_BLOCK_MB = 64
+DEFAULT_NPROC = 1
 FC = 1400 - OFFSET
 BW = 450.
 NCHANS = 2048
@@ -49,47 +56,173 @@ utc_dt = local_dt.astimezone(pytz.utc)
 t = Time(utc_dt, scale='utc')
 tstart = t.to_value('mjd')
 """
-tstart = Time(datetime.datetime.fromtimestamp(pps_time)).to_value('mjd')
-print(tstart)
 
 
-# Hard code everything for now
-header = {
-        'src_raj': RA,
-        'src_dej': DEC,
-        'foff': BW/2048,
-        'nbits': 32,
-        'nchans': NCHANS,
-        'fch1': FC-BW/2,
-        'nifs': 1, 
-        'tstart': tstart,
-        'tsamp': TSAMP,
-        'data_type': 1,
-        'telescope': TELESCOPE,
-        'telescope_id': 9,
-        'source_name': SOURCE
-        }
-
-
-
-header_str = sigproc.generate_sigproc_header(FilBank(header))
-
-
-NSTOKES = True
-
-output_fil_x = open(sys.argv[-1]+"_x.fil", "wb")
-output_fil_y = open(sys.argv[-1]+"_y.fil", "wb")
-output_fil_x.write(header_str)
-output_fil_y.write(header_str)
-print(sys.argv[1:-1])
-
-for f in sys.argv[1:-1]:
-    input_dada = open(f, "rb")
-    input_dada.seek(DADA_HDR_SZE)
-    data_to_file = np.fromfile(input_dada, dtype=np.float32)
-
-    xx = data_to_file[0::4]
-    yy = data_to_file[1::4]
-
-    output_fil_x.write(xx.tobytes())
-    output_fil_y.write(yy.tobytes())
+def make_header(pps_time):
+    """
+    Returns the sigproc header of the outputs, for data starting at
+    unix time pps_time
+    """
+    # a unix time is UTC, whatever the local time zone
+    tstart = Time(pps_time, format='unix').mjd
+    print(tstart)
+
+    # Hard code everything for now
+    header = {
+            'src_raj': RA,
+            'src_dej': DEC,
+            'foff': BW/2048,
+            'nbits': 32,
+            'nchans': NCHANS,
+            'fch1': FC-BW/2,
+            'nifs': 1, 
+            'tstart': tstart,
+            'tsamp': TSAMP,
+            'data_type': 1,
+            'telescope': TELESCOPE,
+            'telescope_id': 9,
+            'source_name': SOURCE
+            }
+
+    return sigproc.generate_sigproc_header(FilBank(header))
+
+
+def read_dada_header(fname):
+    """
+    Returns the DADA header of fname as {key: value string}
+    """
+    with open(fname, "rb") as f:
+        lines = f.read(DADA_HDR_SZE).split(b"\0")[0].decode(errors="replace")
+    header = {}
+    for line in lines.splitlines():
+        words = line.split(None, 1)
+        if len(words) == 2:
+            header[words[0]] = words[1].strip()
+    return header
+
+
+def dada_data_range(fname):
+    """
+    Returns the offset and size [bytes] of the whole samples of fname
+    """
+    hdr_size = int(read_dada_header(fname).get('HDR_SIZE', DADA_HDR_SZE))
+    nbytes = os.path.getsize(fname) - hdr_size
+    return hdr_size, nbytes - nbytes % (NSTOKES*4)
+
+
+def convert_file(fname, out_x, out_y, offset, block_mb=DEFAULT_BLOCK_MB):
+    """
+    Writes the xx and yy of the DADA file fname into the filterbanks
+    out_x and out_y, from byte offset. The file is read block_mb MB at a
+    time into the same buffers, so the memory use does not depend on
+    the file size. Returns the number of bytes read and the elapsed time
+    """
+    t_start = time.time()
+    hdr_size, nbytes = dada_data_range(fname)
+    nvals = max(NSTOKES, block_mb*2**20//4//NSTOKES*NSTOKES)
+    block = np.empty(nvals, dtype=np.float32)
+    block_bytes = memoryview(block).cast("B")
+    xx = np.empty(nvals//NSTOKES, dtype=np.float32)
+    yy = np.empty(nvals//NSTOKES, dtype=np.float32)
+
+    fd_x = os.open(out_x, os.O_WRONLY)
+    fd_y = os.open(out_y, os.O_WRONLY)
+    try:
+        with open(fname, "rb", buffering=0) as f:
+            f.seek(hdr_size)
+            done = 0
+            while done < nbytes:
+                nread = f.readinto(block_bytes[:nbytes - done])
+                if not nread:
+                    raise RuntimeError("%s ends before its %i bytes" %(fname, nbytes))
+                nsamps = nread//(NSTOKES*4)
+                samples = block[:nsamps*NSTOKES].reshape(nsamps, NSTOKES)
+                np.copyto(xx[:nsamps], samples[:, 0])
+                np.copyto(yy[:nsamps], samples[:, 1])
+                os.pwrite(fd_x, xx[:nsamps], offset + done//NSTOKES)
+                os.pwrite(fd_y, yy[:nsamps], offset + done//NSTOKES)
+                done += nsamps*NSTOKES*4
+                # a partial sample is read again with the next block
+                f.seek(hdr_size + done)
+    finally:
+        os.close(fd_x)
+        os.close(fd_y)
+    return nbytes, time.time() - t_start
+
+
+def print_peak_rss():
+    rss_main = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss/1024.
+    rss_child = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss/1024.
+    print("Peak RSS: %.0f MB main process, %.0f MB largest worker"
+            %(rss_main, rss_child))
+
+
+def dada2fil(inp_list, out_base, pps_time=None, nproc=DEFAULT_NPROC,
+        block_mb=DEFAULT_BLOCK_MB):
+    """
+    Converts the DADA files of inp_list (consecutive parts of one
+    observation) into the filterbanks out_base_x.fil and out_base_y.fil.
+    Each file is written at its own place in the outputs, so nproc files
+    are converted concurrently. pps_time is the unix time of the start
+    of the data, by default the SYNC_TIME of the first DADA header plus
+    the duration of its OBS_OFFSET bytes.
+    Returns the number of bytes read and the elapsed time
+    """
+    t_start = time.time()
+    if pps_time is None:
+        dada_header = read_dada_header(inp_list[0])
+        if 'SYNC_TIME' not in dada_header:
+            raise RuntimeError("no SYNC_TIME in the header of %s, give the pps time"
+                    %inp_list[0])
+        # the first file starts OBS_OFFSET bytes into the observation
+        obs_offset = float(dada_header.get('OBS_OFFSET', 0))
+        pps_time = float(dada_header['SYNC_TIME']) + obs_offset/(NSTOKES*4*NCHANS)*TSAMP
+    header_str = make_header(pps_time)
+
+    sizes = [dada_data_range(fname)[1] for fname in inp_list]
+    offsets = len(header_str) + np.cumsum([0] + sizes[:-1])//NSTOKES
+    out_size = len(header_str) + sum(sizes)//NSTOKES
+    out_names = [out_base + "_x.fil", out_base + "_y.fil"]
+    for out_name in out_names:
+        with open(out_name, "wb") as out:
+            out.write(header_str)
+            out.truncate(out_size)
+
+    total_bytes = 0
+    with concurrent.futures.ProcessPoolExecutor(max_workers=nproc) as executor:
+        futures = {executor.submit(convert_file, fname, out_names[0], out_names[1],
+            int(offset), block_mb): fname for fname, offset in zip(inp_list, offsets)}
+        for future in concurrent.futures.as_completed(futures):
+            nbytes, elapsed = future.result()
+            total_bytes += nbytes
+            print("%s: %.1f MB in %.1f s (%.1f MB/s)" %(futures[future],
+                nbytes/1e6, elapsed, nbytes/1e6/max(elapsed, 1e-9)))
+    elapsed = time.time() - t_start
+    print("Total: %.1f MB in %.1f s (%.1f MB/s)"
+            %(total_bytes/1e6, elapsed, total_bytes/1e6/max(elapsed, 1e-9)))
+    return total_bytes, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Converts DADA spectra '\
+            'files into x and y sigproc filterbanks')
+    parser.add_argument('inputs', nargs='+', type=str,
+            help='DADA files, in time order')
+    parser.add_argument('outbase', type=str,
+            help='outputs are outbase_x.fil and outbase_y.fil')
+    parser.add_argument('-t', dest='pps_time', type=float, default=None,
+            help='unix time of the start of the data '\
+                    '[SYNC_TIME + OBS_OFFSET of the first DADA header]')
+    parser.add_argument('-p', dest='nproc', type=int, default=DEFAULT_NPROC,
+            help='files converted concurrently [%i]' %DEFAULT_NPROC)
+    parser.add_argument('-b', dest='block_mb', type=int, default=DEFAULT_BLOCK_MB,
+            help='MB read from a file at a time [%i]' %DEFAULT_BLOCK_MB)
+    args = parser.parse_args()
+
+    print(args.inputs)
+    dada2fil(args.inputs, args.outbase, args.pps_time, args.nproc, args.block_mb)
+    print_peak_rss()
+
+
+if __name__ == "__main__":
+    main()
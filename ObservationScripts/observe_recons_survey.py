@@ -43,6 +43,12 @@ def main():
     ata_control.reserve_antennas(ant_list)
     atexit.register(ata_control.release_antennas, ant_list, False)
 
+    # sky frequency, antenna positions and source coordinates only
+    # change on a retune or slew, so avoid re-querying them per scan
+    ata_control.enable_status_cache()
+    atexit.register(lambda: logger.info("status cache: {}".format(
+        ata_control.get_status_cache_stats())))
+
     #ata_control.set_freq(freqs, ant_list, lo='b', nofocus=True)
     #ata_control.set_freq(freqs_c, ant_list, lo='c')
 
@@ -2,24 +2,125 @@
 import sys,os
 import subprocess
 import argparse
+import concurrent.futures
+import resource
+import time
 from sigpyproc.Readers import FilReader
 import numpy as np
 
 from SNAPobs import snap_config
 
 DEFAULT_FNAME   = 'decimated.fil'
-DEFAULT_NPROC   = 1
+DEFAULT_NPROC   = None
+DEFAULT_NTHREADS = 1
+DEFAULT_GULP    = 1024
 DEFAULT_OUTDIR  = './ics'
 DEFAULT_OUTNAME = 'ics'
 DEFAULT_SCRIPT  = '/home/obsuser/scripts/sumfils/sumfils'
 
+# header values that have to match in all summed filterbanks
+MATCH_KEYS = ['nchans', 'nsamples', 'fch1', 'foff', 'tsamp', 'tstart']
+
+
+def sum_filterbanks(inp_list, out_name, gulp=DEFAULT_GULP):
+    """
+    Sums the filterbank files of inp_list into out_name as the sumfils
+    executable does: the output is the mean of the inputs, with the nbits
+    of the inputs (integer samples rounded half down and clipped).
+    gulp samples of every file are read at a time, so the memory use does
+    not depend on the file length.
+    Returns the number of bytes read and the elapsed time
+    """
+    t_start = time.time()
+    fils = [FilReader(fname) for fname in inp_list]
+    header = fils[0].header
+    for fname, fil in zip(inp_list[1:], fils[1:]):
+        for key in MATCH_KEYS + ['nbits']:
+            if fil.header[key] != header[key]:
+                raise RuntimeError("%s is not the same in %s and %s (%s, %s)"
+                        %(key, inp_list[0], fname, header[key], fil.header[key]))
+
+    out = header.prepOutfile(out_name)
+    try:
+        plans = [fil.readPlan(gulp, verbose=False) for fil in fils]
+        for blocks in zip(*plans):
+            total = blocks[0][2].astype(np.float32)
+            for nsamps, ii, data in blocks[1:]:
+                total += data
+            total /= len(fils)
+            if header.nbits < 32:
+                total -= 0.5
+                np.ceil(total, out=total)
+                np.clip(total, 0, 2**header.nbits - 1, out=total)
+            out.cwrite(total)
+    finally:
+        out.close()
+
+    nbytes = sum([fil.header.nsamples*fil.header.nchans*fil.header.nbits//8
+        for fil in fils])
+    return nbytes, time.time() - t_start
+
+
+def print_peak_rss():
+    rss_main = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss/1024.
+    rss_child = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss/1024.
+    print("Peak RSS: %.0f MB main process, %.0f MB largest worker"
+            %(rss_main, rss_child))
+
+
+def run_native(lo_inputs, nproc, gulp):
+    """
+    Sums the filterbanks of all LOs concurrently, one process per LO
+    """
+    t_start = time.time()
+    total_bytes = 0
+    with concurrent.futures.ProcessPoolExecutor(max_workers=nproc) as executor:
+        futures = {executor.submit(sum_filterbanks, inp_list, out_name, gulp): lo
+                for lo, (inp_list, out_name) in lo_inputs.items()}
+        for future in concurrent.futures.as_completed(futures):
+            lo = futures[future]
+            nbytes, elapsed = future.result()
+            total_bytes += nbytes
+            print("LO %s: summed %i files into %s, %.1f MB in %.1f s (%.1f MB/s)"
+                    %(lo, len(lo_inputs[lo][0]), lo_inputs[lo][1],
+                        nbytes/1e6, elapsed, nbytes/1e6/elapsed))
+    elapsed = time.time() - t_start
+    print("Total: %.1f MB in %.1f s (%.1f MB/s)"
+            %(total_bytes/1e6, elapsed, total_bytes/1e6/elapsed))
+    print_peak_rss()
+
+
+def run_external(lo_inputs, script, nthreads):
+    """
+    Runs the external sumfils script for all LOs concurrently, each with
+    nthreads threads
+    """
+    procs = {}
+    for lo, (inp_list, out_name) in lo_inputs.items():
+        cmd_args = [script] + inp_list + ["-o", out_name, "-p", str(nthreads)]
+        print("Running:")
+        print(cmd_args)
+        procs[lo] = subprocess.Popen(cmd_args,
+                stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    for lo, p in procs.items():
+        str_out, str_err = p.communicate()
+        if p.returncode:
+            print("LO %s: sumfils returned %i" %(lo, p.returncode))
+            print(str_out.decode(errors='replace'))
+            print(str_err.decode(errors='replace'))
+
 def main():
     parser = argparse.ArgumentParser(description='Wrapper to call'\
             'sumfilbanks')
     parser.add_argument('ants', nargs = '+', type=str,
             help = 'antennas in observation')
-    parser.add_argument('-p', dest='nproc', type=int,
-            help = 'nprocesses to run [%i]' %DEFAULT_NPROC,
+    parser.add_argument('-p', dest='nthreads', type=int,
+            help = 'threads of each sumfils executable [%i]'
+                    %DEFAULT_NTHREADS,
+            default=DEFAULT_NTHREADS)
+    parser.add_argument('-j', dest='nproc', type=int,
+            help = 'processes summing LOs concurrently, with -y '\
+                    '[number of LOs]',
             default=DEFAULT_NPROC)
     parser.add_argument('-s', dest='script', type=str,
             help = 'sumfils executable [%s]' %DEFAULT_SCRIPT,
@@ -36,6 +137,16 @@ def main():
     parser.add_argument('-o',dest= 'outname', type=str,
             help='outname to use [%s]' %DEFAULT_OUTNAME,
             default=DEFAULT_OUTNAME)
+    parser.add_argument('-b', dest='gulp', type=int,
+            help='samples read from every file at a time [%i]' %DEFAULT_GULP,
+            default=DEFAULT_GULP)
+    parser.add_argument('-e', dest='external',
+            action='store_true',
+            help="Run the sumfils executable (the default)")
+    parser.add_argument('-y', dest='native',
+            action='store_true',
+            help="Sum in python with sigpyproc instead of running the "\
+                    "sumfils executable (not checked against sumfils yet)")
 
     args = parser.parse_args()
 
@@ -45,29 +156,22 @@ def main():
     obs_ant_tab = snap_tab[snap_tab.ANT_name.isin(ants)]
     los = np.unique(obs_ant_tab.LO)
 
+    lo_inputs = {}
     for lo in los:
         subtab = obs_ant_tab[obs_ant_tab.LO == lo]
-        inp_list = " ".join([os.path.join(ant, args.filname) 
-                for ant in list(subtab.ANT_name)])
+        inp_list = [os.path.join(ant, args.filname) 
+                for ant in list(subtab.ANT_name)]
         out_basename = "%s_%s.fil" %(args.outname, lo)
         out_name = os.path.join(args.outdir, out_basename)
-        cmd = args.script +\
-                " " +\
-                inp_list +\
-                " " +\
-                " -o %s" %out_name +\
-                " " +\
-                " -p %i" %args.nproc
-        cmd_args = [subs for subs in cmd.split(" ") 
-                if subs]
-        if args.dry_run:
-            print(cmd_args)
-        else:
-            print("Running:")
-            print(cmd_args)
-            p = subprocess.Popen(cmd_args,
-                    stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-            str_out, str_err = p.communicate()
+        lo_inputs[lo] = (inp_list, out_name)
+
+    if args.dry_run:
+        for lo, (inp_list, out_name) in lo_inputs.items():
+            print("LO %s: %s -> %s" %(lo, " ".join(inp_list), out_name))
+    elif args.native:
+        run_native(lo_inputs, args.nproc, args.gulp)
+    else:
+        run_external(lo_inputs, args.script, args.nthreads)
 
 if __name__ == "__main__":
     main()
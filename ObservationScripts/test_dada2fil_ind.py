@@ -0,0 +1,243 @@
+#!/usr/bin/env python
+"""
+Test and benchmark of the streaming DADA to filterbank conversion of
+dada2fil_ind on synthetic DADA spectra files (several GB by default).
+The files are converted one at a time and with -p files concurrently,
+the x and y outputs are checked block by block against the generated
+values, and MB/s and peak RSS are printed. With -m, the previous
+conversion (each file read into memory at once) is timed on the same
+files. The tstart of the outputs is checked against the MJD of the pps
+time in a time zone other than UTC, also for files starting OBS_OFFSET
+bytes into the observation, and small files ending with a partial
+sample, also read with short reads, are converted and checked
+"""
+import os
+import argparse
+import multiprocessing
+import resource
+import tempfile
+import time
+
+import numpy as np
+from blimpy.io import sigproc
+
+import dada2fil_ind
+from dada2fil_ind import (DADA_HDR_SZE, NCHANS, NSTOKES, TSAMP, convert_file,
+        dada2fil, make_header)
+
+PPS_TIME = 1588818872
+# MJD of PPS_TIME (UTC): the unix epoch is MJD 40587
+TSTART = PPS_TIME/86400. + 40587
+# the values cycle with this period, so they are exact in float32
+PERIOD = 1000003
+BLOCK = 2**22 # values generated or checked at a time
+
+
+def write_dada(fname, first, nvals, npartial=0, obs_offset=0):
+    """
+    writes a DADA file of nvals float32 values, value i of the
+    observation being (first + i) % PERIOD, followed by a partial
+    sample of npartial (< NSTOKES) values -1, not to be converted.
+    The file starts obs_offset bytes into the observation
+    """
+    header = "HDR_SIZE %i\nNPOL %i\nNBIT 32\nSYNC_TIME %i\nOBS_OFFSET %i\n" \
+            %(DADA_HDR_SZE, NSTOKES, PPS_TIME, obs_offset)
+    with open(fname, 'wb') as f:
+        f.write(header.encode().ljust(DADA_HDR_SZE, b'\0'))
+        for start in range(0, nvals, BLOCK):
+            idx = np.arange(first + start, first + min(nvals, start + BLOCK))
+            f.write((idx % PERIOD).astype(np.float32).tobytes())
+        f.write(np.full(npartial, -1, dtype=np.float32).tobytes())
+
+
+def check_fil(fname, header_str, istokes, nsamps, tstart_ref=TSTART):
+    tstart = sigproc.read_header(fname)['tstart']
+    assert abs(tstart - tstart_ref) < 1e-9, "%s tstart %.9f, not %.9f" %(fname, tstart, tstart_ref)
+    with open(fname, 'rb') as f:
+        if header_str is None:
+            f.seek(len(make_header(PPS_TIME)))
+        else:
+            assert f.read(len(header_str)) == header_str, "%s header differs" %fname
+        for start in range(0, nsamps, BLOCK):
+            data = np.fromfile(f, dtype=np.float32, count=min(BLOCK, nsamps - start))
+            idx = (np.arange(start, start + len(data))*NSTOKES + istokes) % PERIOD
+            assert np.array_equal(data, idx.astype(np.float32)), "%s differs" %fname
+        assert not f.read(1), "%s too long" %fname
+
+
+def dada2fil_in_memory(inp_list, out_base):
+    """
+    the previous conversion
+    """
+    header_str = make_header(PPS_TIME)
+    output_fil_x = open(out_base + "_x.fil", "wb")
+    output_fil_y = open(out_base + "_y.fil", "wb")
+    output_fil_x.write(header_str)
+    output_fil_y.write(header_str)
+    for f in inp_list:
+        input_dada = open(f, "rb")
+        input_dada.seek(DADA_HDR_SZE)
+        data_to_file = np.fromfile(input_dada, dtype=np.float32)
+        xx = data_to_file[0::4]
+        yy = data_to_file[1::4]
+        output_fil_x.write(xx.tobytes())
+        output_fil_y.write(yy.tobytes())
+    output_fil_x.close()
+    output_fil_y.close()
+
+
+class ShortReads(object):
+    """
+    a file returning at most nmax bytes per readinto, as a pipe or a
+    network file system may
+    """
+    def __init__(self, f, nmax):
+        self.f = f
+        self.nmax = nmax
+
+    def readinto(self, buf):
+        return self.f.readinto(buf[:self.nmax])
+
+    def __getattr__(self, name):
+        return getattr(self.f, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.f.close()
+
+
+def check_partial_samples(tmpdir, header_str):
+    """
+    files whose size is not a whole number of samples: the partial
+    sample at the end of a file is dropped and the next file follows the
+    last whole sample. Then a file is converted with short reads, not a
+    whole number of samples each
+    """
+    nvals = 1000*NSTOKES
+    inp_list = []
+    for ifile, npartial in enumerate([3, 2, 0]):
+        fname = os.path.join(tmpdir, 'partial_%04i.dada' %ifile)
+        write_dada(fname, ifile*nvals, nvals, npartial)
+        assert (os.path.getsize(fname) - DADA_HDR_SZE) % (NSTOKES*4) == npartial*4
+        inp_list.append(fname)
+    out_base = os.path.join(tmpdir, 'partial')
+    dada2fil(inp_list, out_base, None, 2, 1)
+    for istokes, pol in enumerate("xy"):
+        check_fil(out_base + "_%s.fil" %pol, header_str, istokes, 3*nvals//NSTOKES)
+
+    # reads of 1000 bytes split the samples
+    short_open = lambda fname, mode, buffering=-1: ShortReads(open(fname, mode, buffering), 1000)
+    dada2fil_ind.open = short_open
+    try:
+        for pol in "xy":
+            with open(out_base + "_%s.fil" %pol, "wb") as out:
+                out.write(header_str)
+                out.truncate(len(header_str) + nvals//NSTOKES*4)
+        convert_file(inp_list[0], out_base + "_x.fil", out_base + "_y.fil",
+                len(header_str), 1)
+    finally:
+        del dada2fil_ind.open
+    for istokes, pol in enumerate("xy"):
+        check_fil(out_base + "_%s.fil" %pol, header_str, istokes, nvals//NSTOKES)
+    print("partial samples dropped, short reads resumed")
+
+
+def check_obs_offset(tmpdir):
+    """
+    a file starting 1000 spectra into the observation: the default
+    tstart is 1000 sampling times after the pps time, -t is used as is
+    """
+    nvals = 100*NSTOKES
+    fname = os.path.join(tmpdir, 'offset.dada')
+    write_dada(fname, 0, nvals, obs_offset=1000*NCHANS*NSTOKES*4)
+    out_base = os.path.join(tmpdir, 'offset')
+    for pps_time, tstart in [(None, TSTART + 1000*TSAMP/86400.),
+            (PPS_TIME + 1, TSTART + 1/86400.)]:
+        dada2fil([fname], out_base, pps_time, 1, 1)
+        for istokes, pol in enumerate("xy"):
+            check_fil(out_base + "_%s.fil" %pol, None, istokes, nvals//NSTOKES, tstart)
+    print("tstart follows OBS_OFFSET")
+
+
+def _measured(queue, func, args):
+    t_start = time.time()
+    func(*args)
+    queue.put((time.time() - t_start,
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss/1024.,
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss/1024.))
+
+
+def measure(func, *args):
+    """
+    runs func(*args) in a new process, returns the elapsed time and the
+    peak RSS [MB] of the process and of its largest worker
+    """
+    ctx = multiprocessing.get_context('fork')
+    queue = ctx.Queue()
+    proc = ctx.Process(target=_measured, args=(queue, func, args))
+    proc.start()
+    result = queue.get()
+    proc.join()
+    assert proc.exitcode == 0
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('-n', dest='nfiles', type=int, default=4,
+            help='DADA files [4]')
+    parser.add_argument('-s', dest='size_mb', type=int, default=1024,
+            help='MB of data per DADA file [1024]')
+    parser.add_argument('-p', dest='nproc', type=int, default=4,
+            help='files converted concurrently [4]')
+    parser.add_argument('-b', dest='block_mb', type=int, default=64,
+            help='MB read from a file at a time [64]')
+    parser.add_argument('-d', dest='tmpdir', type=str, default=None,
+            help='directory of the files [system temporary directory]')
+    parser.add_argument('-m', dest='in_memory', action='store_true',
+            help='also time the previous in-memory conversion')
+    args = parser.parse_args()
+
+    # the local time must not change the start time of the outputs
+    os.environ['TZ'] = 'America/Los_Angeles'
+    time.tzset()
+
+    nvals = args.size_mb*2**20//4//NSTOKES*NSTOKES
+    nbytes = args.nfiles*nvals*4
+    header_str = make_header(PPS_TIME)
+    with tempfile.TemporaryDirectory(dir=args.tmpdir) as tmpdir:
+        check_partial_samples(tmpdir, header_str)
+        check_obs_offset(tmpdir)
+
+        inp_list = []
+        for ifile in range(args.nfiles):
+            fname = os.path.join(tmpdir, 'obs_%04i.dada' %ifile)
+            write_dada(fname, ifile*nvals, nvals)
+            inp_list.append(fname)
+        print("%i DADA files, %.1f MB" %(args.nfiles, nbytes/1e6))
+
+        runs = [('streaming, 1 process', dada2fil, 1),
+                ('streaming, %i processes' %args.nproc, dada2fil, args.nproc)]
+        if args.in_memory:
+            runs.append(('in memory (previous)', dada2fil_in_memory, None))
+        for name, func, nproc in runs:
+            out_base = os.path.join(tmpdir, 'out')
+            if nproc is None:
+                elapsed, rss, rss_child = measure(func, inp_list, out_base)
+            else:
+                elapsed, rss, rss_child = measure(func, inp_list, out_base,
+                        None, nproc, args.block_mb)
+            print("%s: %.1f s (%.1f MB/s), peak RSS %.0f MB main process, "
+                    "%.0f MB largest worker" %(name, elapsed, nbytes/1e6/elapsed,
+                        rss, rss_child))
+            check_fil(out_base + "_x.fil", header_str, 0, nbytes//4//NSTOKES)
+            check_fil(out_base + "_y.fil", header_str, 1, nbytes//4//NSTOKES)
+            os.remove(out_base + "_x.fil")
+            os.remove(out_base + "_y.fil")
+    print("outputs equal")
+
+
+if __name__ == "__main__":
+    main()
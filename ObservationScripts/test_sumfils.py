@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+"""
+Test and benchmark of the python filterbank summation of sumfils_wrapper
+on synthetic 8-bit .fil files: a few antennas on each of 2 LOs are summed
+concurrently, the outputs are checked against the mean of the inputs
+(rounded half down, as the sumfils executable does), and MB/s and peak
+RSS are printed. With -s, the sumfils executable is timed on the same
+files, one LO after another as previously done, and the outputs compared
+"""
+import os
+import struct
+import argparse
+import subprocess
+import tempfile
+import time
+
+import numpy as np
+from sigpyproc.Readers import FilReader
+
+from sumfils_wrapper import run_native
+
+
+def _header_str(key, value=None):
+    s = struct.pack('i', len(key)) + key.encode()
+    if value is None:
+        return s
+    if isinstance(value, int):
+        return s + struct.pack('i', value)
+    return s + struct.pack('d', value)
+
+
+def write_fil(fname, data, fch1=1500., foff=-0.25, tsamp=1e-3, tstart=59000.):
+    """
+    writes a (nsamples, nchans) uint8 array as a sigproc filterbank
+    """
+    header = _header_str('HEADER_START') +\
+            _header_str('telescope_id', 9) +\
+            _header_str('data_type', 1) +\
+            _header_str('nchans', data.shape[1]) +\
+            _header_str('nbits', 8) +\
+            _header_str('nifs', 1) +\
+            _header_str('fch1', fch1) +\
+            _header_str('foff', foff) +\
+            _header_str('tsamp', tsamp) +\
+            _header_str('tstart', tstart) +\
+            _header_str('HEADER_END')
+    with open(fname, 'wb') as f:
+        f.write(header)
+        f.write(data.astype(np.uint8).tobytes())
+
+
+def make_data(lo, iant, nsamples, nchans):
+    rng = np.random.default_rng([ord(lo), iant])
+    return rng.integers(0, 256, (nsamples, nchans), dtype=np.uint8)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('-a', dest='nants', type=int, default=8,
+            help='antennas per LO [8]')
+    parser.add_argument('-c', dest='nchans', type=int, default=1024,
+            help='channels [1024]')
+    parser.add_argument('-t', dest='nsamples', type=int, default=16384,
+            help='samples per file [16384]')
+    parser.add_argument('-b', dest='gulp', type=int, default=1024,
+            help='samples read at a time [1024]')
+    parser.add_argument('-s', dest='script', type=str, default=None,
+            help='sumfils executable to compare with')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        # the data are generated again from the seeds for the check, so the
+        # memory of this process does not grow with the file sizes
+        lo_inputs = {}
+        for lo in ['a', 'b']:
+            inp_list = []
+            for iant in range(args.nants):
+                fname = os.path.join(tmpdir, 'ant%s%i.fil' %(lo, iant))
+                write_fil(fname, make_data(lo, iant, args.nsamples, args.nchans))
+                inp_list.append(fname)
+            lo_inputs[lo] = (inp_list, os.path.join(tmpdir, 'ics_%s.fil' %lo))
+
+        run_native(lo_inputs, None, args.gulp)
+
+        for lo, (inp_list, out_name) in lo_inputs.items():
+            fil = FilReader(out_name)
+            assert fil.header.nbits == 8
+            block = np.asarray(fil.readBlock(0, fil.header.nsamples)).T
+            total = np.zeros(block.shape, dtype=np.int64)
+            for iant in range(args.nants):
+                total += make_data(lo, iant, args.nsamples, args.nchans)
+            # mean rounded half down, in integers
+            expected = -((args.nants - 2*total)//(2*args.nants))
+            assert np.array_equal(block, expected), "LO %s sum differs" %lo
+
+        if args.script:
+            t_start = time.time()
+            for lo, (inp_list, out_name) in lo_inputs.items():
+                subprocess.check_call([args.script] + inp_list + ["-o", out_name + ".ext", "-p", "1"],
+                        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            elapsed = time.time() - t_start
+            nbytes = 2*args.nants*args.nsamples*args.nchans
+            print("sumfils executable, LOs one after another: %.1f MB in %.1f s (%.1f MB/s)"
+                    %(nbytes/1e6, elapsed, nbytes/1e6/elapsed))
+            for lo, (inp_list, out_name) in lo_inputs.items():
+                ndata = args.nsamples*args.nchans
+                with open(out_name, 'rb') as f, open(out_name + ".ext", 'rb') as fext:
+                    assert f.read()[-ndata:] == fext.read()[-ndata:], \
+                            "LO %s differs from the sumfils executable" %lo
+        print("sums equal")
+
+
+if __name__ == "__main__":
+    main()
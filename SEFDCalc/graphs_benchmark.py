@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+benchmark of the incremental rendering of sefd_graphs: synthetic On/Off
+results of a few antennas and frequencies are rendered (genImages,
+makeHtml and makeJson, without upload) into a temporary directory from
+scratch, again without any change, and again with one observation added.
+The rendering time and the number of rendered figures are reported
+"""
+
+import argparse
+import glob
+import os
+import tempfile
+import time
+
+import numpy
+
+import sefd_graphs
+
+class FakeUVData(object):
+    """
+    the parts of a pyuvdata UVData used by the spectrograms
+    """
+    def __init__(self, ntimes, nfreqs, on, seed):
+        rng = numpy.random.default_rng(seed)
+        self.freq_array = numpy.linspace(1.4e9, 1.5e9, nfreqs)[numpy.newaxis, :]
+        power = (1.15 if on else 1.0)*(1 + 0.01*rng.standard_normal((ntimes, 1, nfreqs, 2)))
+        self.data_array = power.astype(numpy.complex128)
+        self.flag_array = rng.random(self.data_array.shape) < 0.02
+
+def makeSet(ant, freq, ntries, ntimes, nfreqs, seed):
+    rng = numpy.random.default_rng(seed)
+    onData = [FakeUVData(ntimes, nfreqs, True, (seed, ii, 0)) for ii in range(ntries)]
+    offData = [FakeUVData(ntimes, nfreqs, False, (seed, ii, 1)) for ii in range(ntries)]
+    ret = {'ant': ant, 'freq': freq, 'source': 'casa', 'method': 'MAD', 'setid': 1,
+            'sefd_x': rng.normal(8000, 100, ntries), 'sefd_y': rng.normal(8000, 100, ntries),
+            'sefd_x_var': rng.uniform(50, 100, ntries), 'sefd_y_var': rng.uniform(50, 100, ntries),
+            'power_x': rng.normal(0, 1, 2*ntries*ntimes), 'power_y': rng.normal(0, 1, 2*ntries*ntimes),
+            'sefd_vec_x': rng.normal(8000, 100, ntries*ntimes), 'sefd_vec_y': rng.normal(8000, 100, ntries*ntimes)}
+    return onData, offData, ret
+
+def render(sets, directory, nworkers):
+    retlist = {}
+    for onData, offData, ret in sets:
+        powerplots, specplots, sefdplots = sefd_graphs.genImages(onData, offData, ret, upload=False,
+                genspectrograms=True, directory=directory, nworkers=nworkers)
+        ret['powerplots'] = powerplots
+        ret['specplots'] = specplots
+        ret['sefdplots'] = sefdplots
+        retlist.setdefault(ret['ant'], {})[ret['freq']] = ret
+    sefd_graphs.makeHtml(retlist, upload=False)
+    sefd_graphs.makeJson(retlist, upload=False)
+
+def timed(sets, directory, nworkers):
+    t_start = time.time()
+    time.sleep(0.01)
+    render(sets, directory, nworkers)
+    t_run = time.time() - t_start
+    files = glob.glob(os.path.join(directory, '*.png')) + glob.glob(os.path.join(directory, '*.html')) + \
+            glob.glob(os.path.join(directory, '*.jsonp'))
+    nrendered = len([f for f in files if os.path.getmtime(f) > t_start])
+    return t_run, nrendered, len(files)
+
+if __name__== "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('-a', '--nants', type=int, default=4)
+    parser.add_argument('-f', '--nfreqs', type=int, default=2)
+    parser.add_argument('-r', '--ntries', type=int, default=2)
+    parser.add_argument('-t', '--ntimes', type=int, default=32)
+    parser.add_argument('-c', '--nchans', type=int, default=2048)
+    parser.add_argument('-w', '--workers', type=int, default=None,
+            help='figure rendering processes, default: number of CPUs')
+    args = parser.parse_args()
+
+    sets = [makeSet('%d%s' % (ii//8 + 1, 'abcdefgh'[ii % 8]), 1000.0 + 500*jj, args.ntries, args.ntimes, args.nchans, (ii, jj))
+            for ii in range(args.nants) for jj in range(args.nfreqs)]
+    added = makeSet('9z', 1000.0, args.ntries, args.ntimes, args.nchans, (99, 0))
+
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        print('{} antennas x {} frequencies, {} On/Off tries of {} x {} channels'.format(
+            args.nants, args.nfreqs, args.ntries, args.ntimes, args.nchans))
+        for label, runsets in [('from scratch', sets), ('no change', sets), ('one set added', sets + [added])]:
+            t_run, nrendered, nfiles = timed(runsets, directory, args.workers)
+            print('{:>16s} {:>8.2f} s, {:>4d} of {:>4d} files rendered'.format(label, t_run, nrendered, nfiles))
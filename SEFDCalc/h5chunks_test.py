@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+test of the partial uvh5 reads of process_h5onoff: small single antenna
+waterfalls are written with pyuvdata into a temporary directory and read
+in chunks of integrations with obs_h5.getUVDataChunks. The chunk
+boundaries and the chunk contents are checked against a whole file read
+(obs_h5.getUVData), and the SEFD of the On/Off pair calculated by
+processSignleAntFreqSEFDfiles from chunks against the whole files.
+The estimateTaskMemory estimate is checked against the peak memory
+allocated (tracemalloc) by processSignleAntFreqSEFDfiles on larger files,
+with and without chunks, as a function of the number of channels
+"""
+
+import argparse
+import os
+import tempfile
+import tracemalloc
+
+import numpy
+import pyuvdata
+from astropy import units as u
+from astropy.coordinates import EarthLocation
+from astropy.time import Time
+
+from ATATools import ata_constants
+from ATAobs import obs_h5
+import process_h5onoff
+
+ANT = '1a'
+METHOD = 'MAD' # flags each integration alone, the same with and without chunks
+
+SOURCE = 'casa'
+FREQ = 1450.0 # MHz
+
+def writeWaterfall(directory, recid, ntimes, nfreqs, seed, on=True):
+    """
+    writes a waterfall of ntimes integrations named as the recorder does,
+    of Cas A (on) or 1 degree off, the on power being twice the off one
+    """
+    rng = numpy.random.default_rng(seed)
+    telescope = pyuvdata.Telescope.new(name=ata_constants.ATA_NAME,
+            location=EarthLocation.from_geodetic(ata_constants.ATA_LON, ata_constants.ATA_LAT, ata_constants.ATA_ELEV),
+            antenna_positions={ANT: [0.0, 0.0, 0.0]}, antenna_numbers=[0], instrument=ata_constants.ATA_NAME)
+    tstart = Time('2020-01-01T00:00:00') + (0 if on else 60)*u.s
+    times = tstart.jd + numpy.arange(ntimes)/86400.0
+    data = (rng.uniform(1, 1.1, (ntimes, nfreqs, 2))*(2 if on else 1)).astype(numpy.complex128)
+    name = SOURCE if on else SOURCE + '_off_1.0_0.0'
+    uv = pyuvdata.UVData.new(freq_array=numpy.linspace(1.4e9, 1.5e9, nfreqs), polarization_array=[-5, -6],
+            times=times, telescope=telescope, antpairs=[(0, 0)], do_blt_outer=True,
+            integration_time=1.0, data_array=data, flag_array=rng.random(data.shape) < 0.1,
+            nsample_array=numpy.ones(data.shape),
+            phase_center_catalog={0: {'cat_name': name, 'cat_type': 'sidereal',
+                'cat_lon': 0.0, 'cat_lat': 0.0, 'cat_frame': 'fk5', 'cat_epoch': 2000.0}},
+            phase_center_id_array=numpy.zeros(ntimes, dtype=int))
+    uv.write_uvh5(os.path.join(directory, 'snap_{}_casa_{}.h5'.format(recid, ANT)))
+    return {'recid': recid, 'ant': ANT, 'freq': FREQ, 'setid': 1, 'tstart': tstart.unix,
+            'az': 0.0 if on else 1.0, 'el': 0.0}
+
+def processPair(directory, cList, chunkTimes):
+    """
+    processSignleAntFreqSEFDfiles of an On/Off pair, without the database and
+    the plots, and the peak memory it allocated
+    """
+    tracemalloc.start()
+    ret = process_h5onoff.processSignleAntFreqSEFDfiles(directory, cList, METHOD, False, False, False,
+            chunkTimes=chunkTimes)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return ret, peak
+
+if __name__== "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('-t', '--ntimes', type=int, default=10)
+    parser.add_argument('-f', '--nfreqs', type=int, default=64)
+    parser.add_argument('-c', '--chunk', type=int, default=4)
+    parser.add_argument('--mem-ntimes', type=int, default=64,
+            help='integrations of the files of the memory check')
+    parser.add_argument('--mem-nfreqs', type=int, default=8192,
+            help='channels of the smaller files of the memory check')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        on = writeWaterfall(directory, 1, args.ntimes, args.nfreqs, 0)
+        off = writeWaterfall(directory, 2, args.ntimes, args.nfreqs, 1, on=False)
+
+        whole = obs_h5.getUVData(directory, on)
+        header, chunks = obs_h5.getUVDataChunks(directory, on, args.chunk)
+        assert header.data_array is None and header.Ntimes == args.ntimes
+        assert obs_h5.checkIfWaterfall(header, 1.45e9, ANT)
+
+        sizes = []
+        start = 0
+        for chunk in chunks:
+            stop = start + chunk.Ntimes
+            sizes.append(chunk.Ntimes)
+            assert numpy.array_equal(chunk.time_array, whole.time_array[start:stop])
+            assert numpy.array_equal(chunk.data_array, whole.data_array[start:stop])
+            assert numpy.array_equal(chunk.flag_array, whole.flag_array[start:stop])
+            # the bytes per visibility of the memory estimate
+            nbytes = chunk.data_array.nbytes + chunk.flag_array.nbytes + chunk.nsample_array.nbytes
+            assert nbytes == chunk.data_array.size*process_h5onoff.VIS_BYTES, nbytes
+            start = stop
+        expected = [args.chunk]*(args.ntimes//args.chunk) + ([args.ntimes % args.chunk] if args.ntimes % args.chunk else [])
+        print('chunks of {} integrations of {}: {}'.format(args.chunk, args.ntimes, sizes))
+        assert sizes == expected, sizes
+        header, chunks = obs_h5.getUVDataChunks(directory, on)
+        assert [chunk.Ntimes for chunk in chunks] == [args.ntimes]
+
+        # the SEFD of the pair, from chunks and from the whole files
+        whole, _ = processPair(directory, [on, off], None)
+        chunked, _ = processPair(directory, [on, off], args.chunk)
+        print('SEFD x {:.1f}, y {:.1f} Jy, with chunks {:.1f}, {:.1f} Jy'.format(whole['sefd_x'][0],
+            whole['sefd_y'][0], chunked['sefd_x'][0], chunked['sefd_y'][0]))
+        assert numpy.all(numpy.isfinite(whole['sefd_x'])) and numpy.all(whole['sefd_x'] > 0)
+        for key in ['sefd_x', 'sefd_y', 'sefd_x_var', 'sefd_y_var', 'power_x', 'power_y', 'ts',
+                'sefd_vec_x', 'sefd_vec_y']:
+            assert numpy.allclose(chunked[key], whole[key], rtol=1e-12, atol=0), key
+        assert chunked['source'] == whole['source'] == SOURCE
+
+    # the memory estimate against the peak memory allocated, with files of
+    # nfreqs and 2*nfreqs channels: the increase of the peak between both is
+    # compared with the increase of the estimate, as the peak also holds
+    # fixed allocations (metadata, astropy tables) counted in WORKER_BASE_BYTES
+    peaks = {}
+    estimates = {}
+    for nfreqs in [args.mem_nfreqs, 2*args.mem_nfreqs]:
+        with tempfile.TemporaryDirectory() as directory:
+            on = writeWaterfall(directory, 1, args.mem_ntimes, nfreqs, 0)
+            off = writeWaterfall(directory, 2, args.mem_ntimes, nfreqs, 1, on=False)
+            for chunkTimes in [args.chunk, None]:
+                _, peaks[nfreqs, chunkTimes] = processPair(directory, [on, off], chunkTimes)
+                estimates[nfreqs, chunkTimes] = process_h5onoff.estimateTaskMemory(directory,
+                        [on, off], chunkTimes)
+    for chunkTimes in [args.chunk, None]:
+        peak = peaks[2*args.mem_nfreqs, chunkTimes] - peaks[args.mem_nfreqs, chunkTimes]
+        estimate = estimates[2*args.mem_nfreqs, chunkTimes] - estimates[args.mem_nfreqs, chunkTimes]
+        print('chunks of {}: {} more channels, {:.1f} MB more allocated at most, {:.1f} MB '
+                'more estimated'.format(chunkTimes, args.mem_nfreqs, peak/1e6, estimate/1e6))
+        # not underestimated, and not more than twice the allocations
+        assert peak <= estimate <= 2*peak, (peak, estimate)
+    assert peaks[2*args.mem_nfreqs, args.chunk] < peaks[2*args.mem_nfreqs, None]/4
+    print('chunks equal to the whole file read')
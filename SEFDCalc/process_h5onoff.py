@@ -17,10 +17,19 @@ from SNAPobs import snap_dirs
 from ATATools import logger_defaults
 from ATAobs import obs_db,obs_list,obs_h5
 import sys
+import os
+import time
+import resource
 import pyuvdata
 import numpy
 import sefd_db
 
+#estimated memory use for the worker count, in bytes
+WORKER_BASE_BYTES = 300*1024**2 #python, numpy, pyuvdata and astropy of a worker process
+VIS_BYTES = 16 + 1 + 4 #complex128 data, bool flag and float32 nsample per read visibility
+VIS_WORK_BYTES = 4*8 #float64 mask and intermediate arrays per visibility of the calculated file
+DEFAULT_BUDGET_FRACTION = 0.5 #of the available memory, if no budget is given
+
 def sortOnOff(cList):
     logger = logger_defaults.getModuleLogger(__name__)
     onList = []
@@ -38,46 +47,56 @@ def sortOnOff(cList):
 
     return onList,offList
 
-def processSignleAntFreqSEFDfiles(datadir,cList,method,compareflag,uploadflag,dbflag):
+def getWaterfallData(datadir,recList,cfreq,cant,chunkTimes=None):
+    """
+    reads the files of recList, skipping the ones without h5 waterfall data.
+    If chunkTimes is given, returns generators of chunkTimes integrations
+    (partial reads) instead of the whole files
+    """
     logger = logger_defaults.getModuleLogger(__name__)
 
-    cant = cList[0]['ant']
-    cfreq = cList[0]['freq']
-    csetid = cList[0]['setid']
-    #TODO: check if all data is from cant and cfreq
-
-    onList,offList = sortOnOff(cList)
-    onData=[]
-    offData=[]
-    for cdat in onList:
+    dataList = []
+    for cdat in recList:
         try:
-            cpyuv = obs_h5.getUVData(datadir,cdat)
-            if (obs_h5.checkIfWaterfall(cpyuv,cfreq*1e6,cant)):
-                onData.append(cpyuv)
+            if chunkTimes:
+                cheader,cpyuv = obs_h5.getUVDataChunks(datadir,cdat,chunkTimes)
             else:
-                logger.warning('file {} does not seem to have h5 waterfall data'.format(cdat))
-        except:
-            logger.warning('unable to get the file corresponding to {}'.format(cdat))
-            raise
-            #pass
-    for cdat in offList:
-        try:
-            cpyuv = obs_h5.getUVData(datadir,cdat)
-            if (obs_h5.checkIfWaterfall(cpyuv,cfreq*1e6,cant)):
-                offData.append(cpyuv)
+                cpyuv = obs_h5.getUVData(datadir,cdat)
+                cheader = cpyuv
+            if (obs_h5.checkIfWaterfall(cheader,cfreq*1e6,cant)):
+                dataList.append(cpyuv)
             else:
                 logger.warning('file {} does not seem to have h5 waterfall data'.format(cdat))
         except:
             logger.warning('unable to get the file corresponding to {}'.format(cdat))
             raise
             #pass
+    return dataList
+
+def processSignleAntFreqSEFDfiles(datadir,cList,method,compareflag,uploadflag,dbflag,chunkTimes=None,renderWorkers=None):
+    logger = logger_defaults.getModuleLogger(__name__)
+
+    cant = cList[0]['ant']
+    cfreq = cList[0]['freq']
+    csetid = cList[0]['setid']
+    #TODO: check if all data is from cant and cfreq
+
+    onList,offList = sortOnOff(cList)
+    onData = getWaterfallData(datadir,onList,cfreq,cant,chunkTimes)
+    offData = getWaterfallData(datadir,offList,cfreq,cant,chunkTimes)
 
     if len(onData) != len(offData):
         logger.error('unable to get the same number of files for on and off observations ({} vs {})'.format( len(onData), len(offData)  ))
         raise RuntimeError("number of On files does not match number of Off files")
 
     if compareflag:
-        retsimple = OnOffCalc.calcSEFDpyuv(onData, offData, 'simple', updateFlags=False)
+        if chunkTimes:
+            #the chunk generators are used up by a calculation, the files are read again
+            retsimple = OnOffCalc.calcSEFDpyuvChunks(onData, offData, 'simple')
+            onData = getWaterfallData(datadir,onList,cfreq,cant,chunkTimes)
+            offData = getWaterfallData(datadir,offList,cfreq,cant,chunkTimes)
+        else:
+            retsimple = OnOffCalc.calcSEFDpyuv(onData, offData, 'simple', updateFlags=False)
         retsimple['ant'] = cant
         retsimple['freq'] = cfreq
         retsimple['setid'] = csetid
@@ -85,7 +104,10 @@ def processSignleAntFreqSEFDfiles(datadir,cList,method,compareflag,uploadflag,db
     else:
         retsimple = None
 
-    ret = OnOffCalc.calcSEFDpyuv(onData, offData, method, updateFlags=True)
+    if chunkTimes:
+        ret = OnOffCalc.calcSEFDpyuvChunks(onData, offData, method)
+    else:
+        ret = OnOffCalc.calcSEFDpyuv(onData, offData, method, updateFlags=True)
     ret['ant'] = cant
     ret['freq'] = cfreq
     ret['setid'] = csetid
@@ -99,7 +121,11 @@ def processSignleAntFreqSEFDfiles(datadir,cList,method,compareflag,uploadflag,db
 
     if uploadflag:
         imgdir = snap_dirs.get_imgdir_obsid(csetid)
-        powerplotnames,spectrogramplotnames,sefdplotnames = sefd_graphs.genImages(onData, offData, ret, comparedict=retsimple, upload=True, genspectrograms=True, directory=imgdir)
+        if chunkTimes:
+            #no spectrograms, the chunks (and the flags) are not kept
+            powerplotnames,spectrogramplotnames,sefdplotnames = sefd_graphs.genImages(None, None, ret, comparedict=retsimple, upload=True, genspectrograms=False, directory=imgdir, nworkers=renderWorkers)
+        else:
+            powerplotnames,spectrogramplotnames,sefdplotnames = sefd_graphs.genImages(onData, offData, ret, comparedict=retsimple, upload=True, genspectrograms=True, directory=imgdir, nworkers=renderWorkers)
         ret['powerplots'] = powerplotnames
         ret['specplots'] = spectrogramplotnames
         ret['sefdplots'] = sefdplotnames
@@ -111,7 +137,78 @@ def processSignleAntFreqSEFDfiles(datadir,cList,method,compareflag,uploadflag,db
     #{'sefd_x', 'sefd_y', 'sefd_x_var', 'sefd_y_var','sefd_ts', 'power_x', 'power_y', 'ts', 'source','ant','freq','setid','powerplots','specplots','method'}
     return ret
 
-def processSEFDfiles(datadir,rec_list,method=OnOffCalc.defaultFilterType,compareflag=False,uploadflag=False, dbflag = True):
+def availableMemory():
+    """
+    available memory of the machine, in bytes
+    """
+    try:
+        with open('/proc/meminfo') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1])*1024
+    except OSError:
+        pass
+    return os.sysconf('SC_PAGE_SIZE')*os.sysconf('SC_PHYS_PAGES')
+
+def estimateTaskMemory(datadir,cList,chunkTimes=None):
+    """
+    estimated peak memory, in bytes, of processSignleAntFreqSEFDfiles on
+    cList, from the uvh5 metadata of its files
+    """
+    nvis = []
+    for cdat in cList:
+        header = obs_h5.getUVDataHeader(datadir,cdat)
+        ntimes = header.Ntimes
+        if chunkTimes:
+            ntimes = min(ntimes,chunkTimes)
+        nvis.append(ntimes*header.Nbls*header.Nfreqs*header.Npols)
+
+    if chunkTimes:
+        #one chunk of an On and an Off file at a time
+        readvis = 2*max(nvis)
+    else:
+        readvis = sum(nvis)
+    return WORKER_BASE_BYTES + readvis*VIS_BYTES + 2*max(nvis)*VIS_WORK_BYTES
+
+def getWorkerCount(taskBytes,memBudget=None,maxWorkers=None):
+    """
+    number of worker processes fitting the estimated task memory in memBudget
+    (in bytes, default: DEFAULT_BUDGET_FRACTION of the available memory),
+    at most maxWorkers (default: number of CPUs)
+    """
+    logger = logger_defaults.getModuleLogger(__name__)
+
+    if not memBudget:
+        memBudget = DEFAULT_BUDGET_FRACTION*availableMemory()
+    if not maxWorkers:
+        maxWorkers = os.cpu_count() or 1
+
+    nworkers = int(memBudget // max(taskBytes))
+    if nworkers < 1:
+        logger.warning('the largest antenna-frequency set needs about {:.1f} GB, more than the memory budget of {:.1f} GB. '
+                'Consider reading the files in chunks'.format(max(taskBytes)/1024**3,memBudget/1024**3))
+        nworkers = 1
+    nworkers = min(nworkers,maxWorkers,len(taskBytes))
+    logger.info('{} worker(s) for a memory budget of {:.1f} GB, largest set about {:.1f} GB'.format(
+        nworkers,memBudget/1024**3,max(taskBytes)/1024**3))
+    return nworkers
+
+def reportRunStats(nfiles,t_start,nworkers=1):
+    """
+    prints the file rate and the peak RSS of the run
+    """
+    t_run = time.time() - t_start
+    rss_main = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss/1024.
+    rss_worker = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss/1024.
+    print('processed {} files in {:.1f} s ({:.1f} files/min) with {} worker(s)'.format(
+        nfiles,t_run,60.*nfiles/t_run,nworkers))
+    if nworkers > 1:
+        print('peak RSS: {:.0f} MB main process, {:.0f} MB largest worker'.format(rss_main,rss_worker))
+    else:
+        print('peak RSS: {:.0f} MB'.format(rss_main))
+
+def processSEFDfiles(datadir,rec_list,method=OnOffCalc.defaultFilterType,compareflag=False,uploadflag=False, dbflag = True,
+        memBudget=None, chunkTimes=None, maxWorkers=None):
     import concurrent.futures
     logger = logger_defaults.getModuleLogger(__name__)
 
@@ -119,15 +216,26 @@ def processSEFDfiles(datadir,rec_list,method=OnOffCalc.defaultFilterType,compare
         logger.error('Rec list is empty')
         raise RuntimeError('List is empty')
 
+    t_start = time.time()
+    nfiles = len(rec_list)
+
+    taskList = []
+    while(rec_list):
+        cant = rec_list[0]['ant']
+        cfreq = rec_list[0]['freq']
+        cList,rec_list = obs_list.split_ant_recording_list(rec_list,[cfreq],[cant])
+        taskList.append(cList)
+    taskBytes = [estimateTaskMemory(datadir,cList,chunkTimes) for cList in taskList]
+    nworkers = getWorkerCount(taskBytes,memBudget,maxWorkers)
+    #the figures of each set are rendered in parallel on the remaining CPUs
+    renderWorkers = max(1,(os.cpu_count() or 1)//nworkers)
+
     retlist = {}
-    with concurrent.futures.ProcessPoolExecutor(max_workers=8) as executor:
+    with concurrent.futures.ProcessPoolExecutor(max_workers=nworkers) as executor:
         threads = []
-        while(rec_list):
-            cant = rec_list[0]['ant']
-            cfreq = rec_list[0]['freq']
-            cList,rec_list = obs_list.split_ant_recording_list(rec_list,[cfreq],[cant])
+        for cList in taskList:
             #this part can be executed by calling in separate threads/processes
-            t = executor.submit(processSignleAntFreqSEFDfiles,datadir,cList,method,compareflag,uploadflag,dbflag)
+            t = executor.submit(processSignleAntFreqSEFDfiles,datadir,cList,method,compareflag,uploadflag,dbflag,chunkTimes,renderWorkers)
             threads.append(t)
 
 
@@ -153,15 +261,20 @@ def processSEFDfiles(datadir,rec_list,method=OnOffCalc.defaultFilterType,compare
         sefd_graphs.makeHtml(retlist)
         sefd_graphs.makeJson(retlist)
 
+    reportRunStats(nfiles,t_start,nworkers)
+
     return retlist
 
-def processSEFDfiles_s(datadir,rec_list,method=OnOffCalc.defaultFilterType,compareflag=False,uploadflag=False, dbflag = True):
+def processSEFDfiles_s(datadir,rec_list,method=OnOffCalc.defaultFilterType,compareflag=False,uploadflag=False, dbflag = True, chunkTimes=None):
     logger = logger_defaults.getModuleLogger(__name__)
 
     if not len(rec_list):
         logger.error('Rec list is empty')
         raise RuntimeError('List is empty')
 
+    t_start = time.time()
+    nfiles = len(rec_list)
+
     retlist = {}
     while(rec_list):
         cant = rec_list[0]['ant']
@@ -169,7 +282,7 @@ def processSEFDfiles_s(datadir,rec_list,method=OnOffCalc.defaultFilterType,compa
         cList,rec_list = obs_list.split_ant_recording_list(rec_list,[cfreq],[cant])
         #this part can be executed by calling in separate threads/processes
         try:
-            rval = processSignleAntFreqSEFDfiles(datadir,cList,method,compareflag,uploadflag,dbflag)
+            rval = processSignleAntFreqSEFDfiles(datadir,cList,method,compareflag,uploadflag,dbflag,chunkTimes)
             #preparation for multicore
             cant = rval['ant']
             cfreq = rval['freq']
@@ -189,6 +302,8 @@ def processSEFDfiles_s(datadir,rec_list,method=OnOffCalc.defaultFilterType,compa
         sefd_graphs.makeHtml(retlist)
         sefd_graphs.makeJson(retlist)
 
+    reportRunStats(nfiles,t_start)
+
     return retlist
 
 def main():
@@ -220,6 +335,14 @@ def main():
             help ='Method to be used in rfi rejection. Possible methods: \"{}\"'.format('\", \"'.join( OnOffCalc.filterTypes )))
     parser.add_option('--debug', dest='do_debug', action="store_true", default=False,
             help ="More printouts and run in single thread mode")
+    parser.add_option('--mem-budget', dest='mem_budget', type=float, action="store", default=None,
+            help ='Memory budget in GB, the number of worker processes is sized to fit in it. '
+                    'Default: {:.0f}% of the available memory'.format(100*DEFAULT_BUDGET_FRACTION))
+    parser.add_option('--max-workers', dest='max_workers', type=int, action="store", default=None,
+            help ='Maximum number of worker processes. Default: number of CPUs')
+    parser.add_option('--chunk', dest='chunk_times', type=int, action="store", default=None,
+            help ='Read the uvh5 files in chunks of that many integrations instead of whole, to bound the memory use. '
+                    'No spectrograms are created, and filters other than \"{}\" are run on each chunk separately'.format('\", \"'.join( OnOffCalc.rowFilterTypes )))
     
     
     (options,args) = parser.parse_args()
@@ -274,15 +397,23 @@ def main():
     compareflag = options.compare
     uploadflag = options.upload
     dbflag = True
+    chunkTimes = options.chunk_times
+    if options.mem_budget:
+        memBudget = options.mem_budget*1024**3
+    else:
+        memBudget = None
+
+    if chunkTimes and method not in OnOffCalc.rowFilterTypes:
+        logger.warning('method {} is run on each chunk of {} integrations separately'.format(method,chunkTimes))
 
     datadir = snap_dirs.get_dir_obsid(obs_set_id)
 
     if(options.do_debug):
         logger.info('processing {} data files (debug mode)'.format(len(rec_list)))
-        processSEFDfiles_s(datadir,rec_list,method,compareflag,uploadflag,dbflag)
+        processSEFDfiles_s(datadir,rec_list,method,compareflag,uploadflag,dbflag,chunkTimes)
     else:
         logger.info('processing {} data files'.format(len(rec_list)))
-        processSEFDfiles(datadir,rec_list,method,compareflag,uploadflag,dbflag)
+        processSEFDfiles(datadir,rec_list,method,compareflag,uploadflag,dbflag,memBudget,chunkTimes,options.max_workers)
 
 if __name__== "__main__":
     main()
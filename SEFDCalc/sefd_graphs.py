@@ -4,6 +4,9 @@
 from __future__ import division
 
 import os
+import io
+import hashlib
+import concurrent.futures
 # This way of importing matplotlib.pyplot allows running without an active X Server
 import matplotlib as mpl
 #mpl.use('Agg')
@@ -59,7 +62,155 @@ show_graphs = False
 
 """END OF VALUES TO CHANGE"""
 
-def makeJson(sefddict):
+#figures with unchanged content are not rendered nor uploaded again.
+#the content hash of each file is kept next to it, in .<file name>.sha1
+HASH_SUFFIX = ".sha1"
+
+def contentHash(*args):
+    """
+    sha1 of the inputs of a figure or page: numpy arrays, lists of them, strings, numbers
+    """
+    h = hashlib.sha1()
+    def update(arg):
+        if isinstance(arg, numpy.ndarray):
+            h.update(repr((arg.shape, arg.dtype.str)).encode())
+            h.update(numpy.ascontiguousarray(arg).tobytes())
+        elif isinstance(arg, (list, tuple)):
+            h.update(repr((type(arg).__name__, len(arg))).encode())
+            for item in arg:
+                update(item)
+        else:
+            h.update(repr(arg).encode())
+    for arg in args:
+        update(arg)
+    return h.hexdigest()
+
+def _hashFilename(filename):
+    dirname,basename = os.path.split(filename)
+    return os.path.join(dirname, '.' + basename + HASH_SUFFIX)
+
+def getRenderedHash(filename):
+    """
+    content hash and upload status of the last rendering of filename,
+    (None,False) if unknown
+    """
+    try:
+        with open(_hashFilename(filename)) as f:
+            stored = f.read().split()
+    except (OSError, IOError):
+        return None,False
+    if not stored:
+        return None,False
+    return stored[0],('uploaded' in stored[1:])
+
+def setRenderedHash(filename, chash, uploaded):
+    with open(_hashFilename(filename), "w") as f:
+        f.write(chash + (" uploaded" if uploaded else "") + "\n")
+
+def isRendered(filename, chash, upload, checkfile=True):
+    """
+    True if filename was rendered (and uploaded, if upload) from the same content
+    """
+    rhash,uploaded = getRenderedHash(filename)
+    if checkfile and not os.path.exists(filename):
+        return False
+    return rhash == chash and (uploaded or not upload)
+
+def uploadFiles(filenames, remotedir=SEFD_SERVER_DIR):
+    """
+    copies the files to remotedir on the SEFD server, over one ssh connection
+    """
+    if not filenames:
+        return
+    with plumbum.machines.SshMachine(SEFD_SERVER) as r:
+        to = r.path(remotedir)
+        for filename in filenames:
+            plumbum.path.utils.copy(plumbum.local.path(filename), to)
+
+def renderFigures(jobs, upload, nworkers=None):
+    """
+    renders (and uploads) the figures of the jobs list whose content changed
+    since their last rendering, in nworkers processes (default: number of CPUs)
+    jobs are (fullname, content hash, render function, render arguments),
+    the render function is called with fullname and the arguments
+    returns the list of rendered figures
+    """
+    todo = [job for job in jobs if not isRendered(job[0], job[1], upload)]
+    if nworkers is None:
+        nworkers = os.cpu_count() or 1
+    nworkers = min(nworkers, len(todo))
+
+    if nworkers > 1 and not show_graphs:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=nworkers) as executor:
+            futures = [executor.submit(func, fullname, *args) for fullname,chash,func,args in todo]
+            for future in futures:
+                future.result()
+    else:
+        for fullname,chash,func,args in todo:
+            func(fullname, *args)
+
+    if upload:
+        uploadFiles([job[0] for job in todo])
+    for fullname,chash,func,args in todo:
+        setRenderedHash(fullname, chash, upload)
+
+    return [job[0] for job in todo]
+
+def _renderPlot(fullname, power, ptitle):
+    plt.figure()
+    plt.plot(numpy.transpose(power))
+    plt.title(ptitle)
+    plt.savefig(fullname)
+
+    if show_graphs:
+        plt.show()
+    plt.close()
+
+def _renderSpectrogram(fullname, data, ptitle, dataExtent, dbscale):
+    plt.figure()
+    if dbscale:
+        plt.imshow(10*numpy.log10(data),aspect='auto', interpolation='none', extent=dataExtent,vmin=0)
+    else:
+        plt.imshow(data,aspect='auto', interpolation='none', extent=dataExtent,vmin=0)
+    plt.title(ptitle)
+    plt.xlabel('freq [MHz]')
+    plt.ylabel('snapshot no.')
+    plt.colorbar()
+
+    plt.savefig(fullname)
+
+    if show_graphs:
+        plt.show()
+    plt.close()
+
+def _imgTag(fullname):
+    #the url changes with the image content only, so browsers reload changed images
+    chash,uploaded = getRenderedHash(fullname)
+    if chash is None:
+        chash = '%d' % random.randint(1,50000)
+    return "<img src=\"http://%s/sefd/%s?x=%s\" width=\"400\">\n" % (SEFD_SERVER, os.path.basename(fullname), chash[:8])
+
+def _publishPage(filename, content, remotedir, upload):
+    """
+    writes (and uploads) the page if its content changed since the last time.
+    @CALCULATED@ in the content is replaced by the current time, which is
+    not part of the content hash. Returns True if it was written
+    """
+    chash = contentHash(content)
+    if isRendered(filename, chash, upload, checkfile=not upload):
+        return False
+
+    t = datetime.datetime.today().strftime('%Y-%m-%d&nbsp;%H:%M:%S')
+    with open(filename, "w") as file:
+        file.write(content.replace('@CALCULATED@', t))
+
+    if upload:
+        uploadFiles([filename], remotedir)
+        os.remove(filename)
+    setRenderedHash(filename, chash, upload)
+    return True
+
+def makeJson(sefddict,upload=True):
     jsonp = OrderedDict()
     antennas = sefddict.keys()
     jsonp["ants"] = list(antennas)
@@ -88,21 +239,14 @@ def makeJson(sefddict):
         jsonp[source][ant]['x'].sort(key=lambda sd: float(sd[0][0]))
         jsonp[source][ant]['y'].sort(key=lambda sd: float(sd[0][0]))
 
-    file = open("sefd.jsonp", "w")
     j = "sefd(" + json.dumps(jsonp) + ")"
-    file.write(j)
-    file.close()
+    return _publishPage("sefd.jsonp", j, SEFD_SERVER_DIR, upload)
 
-    r = plumbum.machines.SshMachine(SEFD_SERVER)
-    fro = plumbum.local.path("sefd.jsonp")
-    to =  r.path(SEFD_SERVER_DIR)
-    plumbum.path.utils.copy(fro, to);
-    os.remove("sefd.jsonp");
-
-def makeHtml( sefddict ):
+def makeHtml( sefddict, upload=True ):
     filename = "%s%s.html" % (HTML_FILENAME, 'moon')
 
-    file = open(filename, "w")
+    #the page is built in memory and only written if its content changed
+    file = io.StringIO()
 
     file.write('<html>\n<head>\n\t<link rel="stylesheet" type="text/css" href="css_sefd.css">\n')
     file.write('<title>Latest On/Off SEFDs</title>\n')
@@ -129,10 +273,7 @@ def makeHtml( sefddict ):
     file.write('</div>\n')
 
     file.write("<h1>Latest On/Off SEFDs</h1>\n")
-    t = datetime.datetime.today().strftime('%Y-%m-%d&nbsp;%H:%M:%S')
-    file.write("Calculated: {} UTC\n".format(t))
-
-    rand = random.randint(1,50000)
+    file.write("Calculated: @CALCULATED@ UTC\n")
 
     for ant in antkeys:
         file.write('<p id={0:s}>\n'.format(ant))
@@ -149,23 +290,15 @@ def makeHtml( sefddict ):
             s = "<h3>power vs time ({0:.2f} MHz)</h3>\n".format(freq)
             file.write(s)
             #printing power plots
-            iname1 = os.path.basename(cdict['powerplots']['x'])
-            s = "<img src=\"http://%s/sefd/%s?x=%d\" width=\"400\">\n" % (SEFD_SERVER, iname1, rand)
-            file.write(s)
-            iname2 = os.path.basename(cdict['powerplots']['y'])
-            s = "<img src=\"http://%s/sefd/%s?x=%d\" width=\"400\">\n" % (SEFD_SERVER, iname2, rand)
-            file.write(s)
+            file.write(_imgTag(cdict['powerplots']['x']))
+            file.write(_imgTag(cdict['powerplots']['y']))
             file.write("<BR>\n")
     
             s = "<h3>SEFD vs time ({0:.2f} MHz)</h3>\n".format(freq)
             file.write(s)
             #printing power plots
-            iname1 = os.path.basename(cdict['sefdplots']['x'])
-            s = "<img src=\"http://%s/sefd/%s?x=%d\" width=\"400\">\n" % (SEFD_SERVER, iname1, rand)
-            file.write(s)
-            iname2 = os.path.basename(cdict['sefdplots']['y'])
-            s = "<img src=\"http://%s/sefd/%s?x=%d\" width=\"400\">\n" % (SEFD_SERVER, iname2, rand)
-            file.write(s)
+            file.write(_imgTag(cdict['sefdplots']['x']))
+            file.write(_imgTag(cdict['sefdplots']['y']))
             file.write("<BR>\n")
     
             #checking if there are any spectrograms
@@ -175,9 +308,7 @@ def makeHtml( sefddict ):
                 cplotlist = cdict['specplots']['x']
                 i = 0
                 for img in cplotlist:
-                    imgbase = os.path.basename(img)
-                    s = "<img src=\"http://%s/sefd/%s?x=%d\" width=\"400\">\n" % (SEFD_SERVER, imgbase, rand)
-                    file.write(s)
+                    file.write(_imgTag(img))
                     i += 1
                     if i == 2:
                         file.write("<BR>\n")
@@ -187,9 +318,7 @@ def makeHtml( sefddict ):
                 cplotlist = cdict['specplots']['y']
                 i = 0
                 for img in cplotlist:
-                    imgbase = os.path.basename(img)
-                    s = "<img src=\"http://%s/sefd/%s?x=%d\" width=\"400\">\n" % (SEFD_SERVER, imgbase, rand)
-                    file.write(s)
+                    file.write(_imgTag(img))
                     i += 1
                     if i == 2:
                         file.write("<BR>\n")
@@ -202,42 +331,44 @@ def makeHtml( sefddict ):
 
     file.write("</body>\n</HTML>\n")
 
-    file.close()
-
-    r = plumbum.machines.SshMachine(SEFD_SERVER)
-    fro = plumbum.local.path(filename)
-    to =  r.path(HTML_DIR)
-    plumbum.path.utils.copy(fro, to);
-    os.remove(filename);
+    _publishPage(filename, file.getvalue(), HTML_DIR, upload)
 
     url = "http://%s/%s" % (SEFD_SERVER, filename)
     return url
 
-def genImages(onData,offData,sefddict,comparedict=None,upload=True,genspectrograms=True,directory='.'):
+def genImages(onData,offData,sefddict,comparedict=None,upload=True,genspectrograms=True,directory='.',nworkers=None):
+    """
+    creates (and uploads) the power, SEFD and spectrogram figures of sefddict.
+    Only the figures whose content changed are rendered, in nworkers
+    processes (default: number of CPUs)
+    """
     directoryfull = os.path.abspath(directory)
     
     #'x' and 'y'
     powerplots = {}
     spectrogramplots = {}
     sefdplots = {}
+    jobs = []
 
     cant = sefddict['ant']
     cfreq = sefddict['freq']
     csrc = sefddict['source']
 
     if comparedict:
-        powerplots['x'] = make1dGraph([sefddict['power_x'],comparedict['power_x']],cant,'x',cfreq,csrc,directoryfull,upload)
-        powerplots['y'] = make1dGraph([sefddict['power_y'],comparedict['power_y']],cant,'y',cfreq,csrc,directoryfull,upload)
-        sefdplots['x'] = make1dGraph([sefddict['sefd_vec_x'],comparedict['sefd_vec_x']],cant,'x',cfreq,csrc,directoryfull,upload,'sefd')
-        sefdplots['y'] = make1dGraph([sefddict['sefd_vec_y'],comparedict['sefd_vec_y']],cant,'y',cfreq,csrc,directoryfull,upload,'sefd')
+        powerplots['x'] = make1dGraph([sefddict['power_x'],comparedict['power_x']],cant,'x',cfreq,csrc,directoryfull,upload,jobs=jobs)
+        powerplots['y'] = make1dGraph([sefddict['power_y'],comparedict['power_y']],cant,'y',cfreq,csrc,directoryfull,upload,jobs=jobs)
+        sefdplots['x'] = make1dGraph([sefddict['sefd_vec_x'],comparedict['sefd_vec_x']],cant,'x',cfreq,csrc,directoryfull,upload,'sefd',jobs=jobs)
+        sefdplots['y'] = make1dGraph([sefddict['sefd_vec_y'],comparedict['sefd_vec_y']],cant,'y',cfreq,csrc,directoryfull,upload,'sefd',jobs=jobs)
     else:
-        powerplots['x'] = make1dGraph(sefddict['power_x'],cant,'x',cfreq,csrc,directoryfull,upload)
-        powerplots['y'] = make1dGraph(sefddict['power_y'],cant,'y',cfreq,csrc,directoryfull,upload)
-        sefdplots['x'] = make1dGraph(sefddict['sefd_vec_x'],cant,'x',cfreq,csrc,directoryfull,upload,'sefd')
-        sefdplots['y'] = make1dGraph(sefddict['sefd_vec_y'],cant,'y',cfreq,csrc,directoryfull,upload,'sefd')
+        powerplots['x'] = make1dGraph(sefddict['power_x'],cant,'x',cfreq,csrc,directoryfull,upload,jobs=jobs)
+        powerplots['y'] = make1dGraph(sefddict['power_y'],cant,'y',cfreq,csrc,directoryfull,upload,jobs=jobs)
+        sefdplots['x'] = make1dGraph(sefddict['sefd_vec_x'],cant,'x',cfreq,csrc,directoryfull,upload,'sefd',jobs=jobs)
+        sefdplots['y'] = make1dGraph(sefddict['sefd_vec_y'],cant,'y',cfreq,csrc,directoryfull,upload,'sefd',jobs=jobs)
 
     if genspectrograms:
-        spectrogramplots = makeSpectrograms(onData,offData,sefddict,comparedict,upload,directoryfull,flatspectra=True)
+        spectrogramplots = makeSpectrograms(onData,offData,sefddict,comparedict,upload,directoryfull,flatspectra=True,jobs=jobs)
+
+    renderFigures(jobs, upload, nworkers)
 
     return powerplots,spectrogramplots,sefdplots
 
@@ -248,12 +379,12 @@ def flatSpectraVector(onData,offData,drange):
 
     method = 'globmin'
 
-    xdata = offData[0].data_array[:,0,drange,0].real.copy()
-    ydata = offData[0].data_array[:,0,drange,1].real.copy()
+    xdata = OnOffCalc.misc.getUVBlock(offData[0].data_array)[:,drange,0].real.copy()
+    ydata = OnOffCalc.misc.getUVBlock(offData[0].data_array)[:,drange,1].real.copy()
 
     for ii in range(len(offData)-1):
-        xdata = numpy.concatenate((xdata,offData[ii+1].data_array[:,0,drange,0].real.copy()),axis=0)
-        ydata = numpy.concatenate((ydata,offData[ii+1].data_array[:,0,drange,1].real.copy()),axis=0)
+        xdata = numpy.concatenate((xdata,OnOffCalc.misc.getUVBlock(offData[ii+1].data_array)[:,drange,0].real.copy()),axis=0)
+        ydata = numpy.concatenate((ydata,OnOffCalc.misc.getUVBlock(offData[ii+1].data_array)[:,drange,1].real.copy()),axis=0)
 
 
     if method == 'poly':
@@ -297,12 +428,12 @@ def flatSpectraVector(onData,offData,drange):
         xminoff = numpy.min(xdata,axis=0)
         yminoff = numpy.min(ydata,axis=0)
 
-        xdata = onData[0].data_array[:,0,drange,0].real.copy()
-        ydata = onData[0].data_array[:,0,drange,1].real.copy()
+        xdata = OnOffCalc.misc.getUVBlock(onData[0].data_array)[:,drange,0].real.copy()
+        ydata = OnOffCalc.misc.getUVBlock(onData[0].data_array)[:,drange,1].real.copy()
 
         for ii in range(len(offData)-1):
-            xdata = numpy.concatenate((xdata,onData[ii+1].data_array[:,0,drange,0].real.copy()),axis=0)
-            ydata = numpy.concatenate((ydata,onData[ii+1].data_array[:,0,drange,1].real.copy()),axis=0)
+            xdata = numpy.concatenate((xdata,OnOffCalc.misc.getUVBlock(onData[ii+1].data_array)[:,drange,0].real.copy()),axis=0)
+            ydata = numpy.concatenate((ydata,OnOffCalc.misc.getUVBlock(onData[ii+1].data_array)[:,drange,1].real.copy()),axis=0)
 
         xminon = numpy.min(xdata,axis=0)
         yminon = numpy.min(ydata,axis=0)
@@ -315,10 +446,14 @@ def flatSpectraVector(onData,offData,drange):
 
     return {'x':pvalsx,'y':pvalsy}
 
-def makeSpectrograms(onData,offData,sefddict,comparedict,upload,directoryfull,flatspectra=False, dbscale=True):
+def makeSpectrograms(onData,offData,sefddict,comparedict,upload,directoryfull,flatspectra=False, dbscale=True, jobs=None):
+    """
+    creates the spectrograms of all On and Off data. If jobs is a list, the
+    figures are added to it for renderFigures instead of being rendered
+    """
     nReps = len(onData)
     assert (nReps == len(offData)), "data list mismatch"
-    drange = OnOffCalc.misc.getDatarange(onData[0].data_array[:,0,:,0].shape[1])
+    drange = OnOffCalc.misc.getDatarange(OnOffCalc.misc.getUVBlock(onData[0].data_array)[:,:,0].shape[1])
     retdict = {'x':[],'y':[]}
 
     if flatspectra:
@@ -328,30 +463,30 @@ def makeSpectrograms(onData,offData,sefddict,comparedict,upload,directoryfull,fl
 
     for ii in range(nReps):
         if comparedict:
-            retx,rety = makeXYSpectrograms(onData[ii],drange,"ON",ii,sefddict,useflags=False,upload=upload,directory=directoryfull,spectracorrectionvector=specvector, dbscale=dbscale)
+            retx,rety = makeXYSpectrograms(onData[ii],drange,"ON",ii,sefddict,useflags=False,upload=upload,directory=directoryfull,spectracorrectionvector=specvector, dbscale=dbscale, jobs=jobs)
             retdict['x'].append(retx)
             retdict['y'].append(rety)
 
-        retx,rety = makeXYSpectrograms(onData[ii],drange,"ON",ii,sefddict,useflags=True,upload=upload,directory=directoryfull,spectracorrectionvector=specvector, dbscale=dbscale)
+        retx,rety = makeXYSpectrograms(onData[ii],drange,"ON",ii,sefddict,useflags=True,upload=upload,directory=directoryfull,spectracorrectionvector=specvector, dbscale=dbscale, jobs=jobs)
         retdict['x'].append(retx)
         retdict['y'].append(rety)
 
         if comparedict:
-            retx,rety = makeXYSpectrograms(offData[ii],drange,"OFF",ii,sefddict,useflags=False,upload=upload,directory=directoryfull,spectracorrectionvector=specvector, dbscale=dbscale)
+            retx,rety = makeXYSpectrograms(offData[ii],drange,"OFF",ii,sefddict,useflags=False,upload=upload,directory=directoryfull,spectracorrectionvector=specvector, dbscale=dbscale, jobs=jobs)
             retdict['x'].append(retx)
             retdict['y'].append(rety)
 
-        retx,rety = makeXYSpectrograms(offData[ii],drange,"OFF",ii,sefddict,useflags=True,upload=upload,directory=directoryfull,spectracorrectionvector=specvector, dbscale=dbscale)
+        retx,rety = makeXYSpectrograms(offData[ii],drange,"OFF",ii,sefddict,useflags=True,upload=upload,directory=directoryfull,spectracorrectionvector=specvector, dbscale=dbscale, jobs=jobs)
         retdict['x'].append(retx)
         retdict['y'].append(rety)
 
     return retdict
 
-def makeXYSpectrograms(uvdata,drange,onoffstr,seqnum,sefddict,useflags,upload,directory,spectracorrectionvector, dbscale=True):
+def makeXYSpectrograms(uvdata,drange,onoffstr,seqnum,sefddict,useflags,upload,directory,spectracorrectionvector, dbscale=True, jobs=None):
 
     #copying is not time efficient, but we will be modifying values here and we don't want to affect the underlaying arrays
-    xdata = uvdata.data_array[:,0,drange,0].real.copy()
-    ydata = uvdata.data_array[:,0,drange,1].real.copy()
+    xdata = OnOffCalc.misc.getUVBlock(uvdata.data_array)[:,drange,0].real.copy()
+    ydata = OnOffCalc.misc.getUVBlock(uvdata.data_array)[:,drange,1].real.copy()
 
     freqrange = uvdata.freq_array[0,drange]/1e6 #in MHz
     ant = sefddict['ant']
@@ -400,68 +535,28 @@ def makeXYSpectrograms(uvdata,drange,onoffstr,seqnum,sefddict,useflags,upload,di
     xnamefull = os.path.join(directory,fnamex)
     ynamefull = os.path.join(directory,fnamey)
 
-    plt.figure()
-    if dbscale:
-        plt.imshow(10*numpy.log10(xdata),aspect='auto', interpolation='none', extent=dataExtent,vmin=0)
-    else:
-        plt.imshow(xdata,aspect='auto', interpolation='none', extent=dataExtent,vmin=0)
-    #plt.imshow(xdata,aspect='auto', interpolation='none', extent=dataExtent)
-    plt.title(xtitle)
-    plt.xlabel('freq [MHz]')
-    plt.ylabel('snapshot no.')
-    plt.colorbar()
-
-    plt.savefig(xnamefull)
-
-    if show_graphs:
-        plt.show()
-    plt.close()
-
-    plt.figure()
-    if dbscale:
-        plt.imshow(10*numpy.log10(ydata),aspect='auto', interpolation='none', extent=dataExtent,vmin=0)
+    figjobs = [(xnamefull, contentHash(xdata, xtitle, dataExtent, dbscale), _renderSpectrogram, (xdata, xtitle, dataExtent, dbscale)),
+            (ynamefull, contentHash(ydata, ytitle, dataExtent, dbscale), _renderSpectrogram, (ydata, ytitle, dataExtent, dbscale))]
+    if jobs is None:
+        renderFigures(figjobs, upload, 1)
     else:
-        plt.imshow(ydata,aspect='auto', interpolation='none', extent=dataExtent,vmin=0)
-    #plt.imshow(ydata,aspect='auto', interpolation='none', extent=dataExtent)
-    plt.title(ytitle)
-    plt.xlabel('freq [MHz]')
-    plt.ylabel('snapshot no.')
-    plt.colorbar()
-
-    plt.savefig(ynamefull)
-
-    if show_graphs:
-        plt.show()
-    plt.close()
-
-    if upload:
-        r = plumbum.machines.SshMachine(SEFD_SERVER)
-        fro = plumbum.local.path(xnamefull)
-        to =  r.path(SEFD_SERVER_DIR)
-        plumbum.path.utils.copy(fro, to);
-        fro = plumbum.local.path(ynamefull)
-        plumbum.path.utils.copy(fro, to);
+        jobs.extend(figjobs)
 
     return xnamefull,ynamefull
 
-def make1dGraph(power,ant,pol,freq,src,directoryfull,upload,prefix='power'):
-    plt.figure()
-    plt.plot(numpy.transpose(power))
+def make1dGraph(power,ant,pol,freq,src,directoryfull,upload,prefix='power',jobs=None):
+    """
+    creates the power (or SEFD) in time figure. If jobs is a list, the
+    figure is added to it for renderFigures instead of being rendered
+    """
     ptitle = "Antenna: "+ ant + pol + " Frequency: "+ '{0:.2f}'.format(freq) + " MHz source: " + src
-    plt.title(ptitle)
     fname = prefix + '_' + ant + pol + "_" + '{0:.2f}'.format(freq) + "_" + src + ".png"
     fullname = os.path.join(directoryfull,fname)
-    plt.savefig(fullname)
-
-    if show_graphs:
-        plt.show()
-    plt.close()
 
-    if upload:
-        r = plumbum.machines.SshMachine(SEFD_SERVER)
-        fro = plumbum.local.path(fullname)
-        to =  r.path(SEFD_SERVER_DIR)
-        plumbum.path.utils.copy(fro, to);
+    figjob = (fullname, contentHash(power, ptitle), _renderPlot, (power, ptitle))
+    if jobs is None:
+        renderFigures([figjob], upload, 1)
+    else:
+        jobs.append(figjob)
 
     return fullname
-
@@ -16,8 +16,9 @@ import re
 import ast
 import concurrent.futures
 import os
+import time
 from time import sleep
-from threading import Thread
+from threading import Thread, Lock
 
 from . import ata_remote,ata_constants,snap_array_helpers,logger_defaults
 from .ata_rest import ATARest, ATARestException
@@ -30,6 +31,128 @@ from .ata_rest import ATARest, ATARestException
 _source_offset_table = {}
 
 
+#####
+#
+# Opt-in TTL cache for slow-changing status queries.
+# Disabled by default; enable with enable_status_cache().
+# Every cached endpoint belongs to a category with its own TTL.
+# Setters that change the underlying state (e.g. set_freq,
+# track_source, set_az_el) invalidate their category.
+#
+#####
+
+STATUS_CACHE_DEFAULT_TTL = {
+        'locations': 3600.0, # get_ant_pos
+        'skyfreq': 60.0,     # get_sky_freq
+        'source': 600.0,     # get_source_ra_dec
+        'sources': 60.0,     # get_eph_source
+        }
+
+_status_cache_ttl = {}
+_status_cache = {}
+_status_cache_stats = {}
+# bumped by every invalidation, so that a query answered while the state
+# was changing is not cached
+_status_cache_generation = {}
+_status_cache_lock = Lock()
+
+def enable_status_cache(ttl=None):
+    """
+    Enable caching of slow-changing status queries.
+    ttl is an optional dictionary overriding the default
+    time-to-live (in seconds) per category, e.g. {'skyfreq': 10}.
+    A ttl of 0 disables caching for that category.
+    Categories are listed in STATUS_CACHE_DEFAULT_TTL
+    """
+    ttls = dict(STATUS_CACHE_DEFAULT_TTL)
+    if ttl:
+        for category in ttl:
+            if category not in ttls:
+                raise RuntimeError("unknown status cache category {}".format(category))
+        ttls.update(ttl)
+    with _status_cache_lock:
+        _status_cache_ttl.clear()
+        _status_cache_ttl.update({k: v for k, v in ttls.items() if v > 0})
+        _status_cache.clear()
+
+def disable_status_cache():
+    """
+    Disable the status cache and drop all cached values.
+    The hit/miss counters are kept
+    """
+    with _status_cache_lock:
+        _status_cache_ttl.clear()
+        _status_cache.clear()
+
+def clear_status_cache(*categories):
+    """
+    Drop cached values of given categories (all if none given)
+    """
+    with _status_cache_lock:
+        if not categories:
+            categories = set(STATUS_CACHE_DEFAULT_TTL) | set(_status_cache_generation)
+        for category in categories:
+            _status_cache_generation[category] = _status_cache_generation.get(category, 0) + 1
+        for key in list(_status_cache.keys()):
+            if key[0] in categories:
+                del _status_cache[key]
+
+def _put_invalidating(category, endpoint, **kwargs):
+    """
+    ATARest.put that changes the state cached in category. The category is
+    invalidated once the PUT returns (or fails), as a query made during
+    the PUT may have cached the previous state
+    """
+    try:
+        return ATARest.put(endpoint, **kwargs)
+    finally:
+        clear_status_cache(category)
+
+def get_status_cache_stats():
+    """
+    Return the cache hit/miss counters, e.g.
+    {'hits': 12, 'misses': 3, 'skyfreq': {'hits': 10, 'misses': 1}, ...}
+    Every hit is a saved REST round-trip
+    """
+    with _status_cache_lock:
+        retdict = {'hits': 0, 'misses': 0}
+        for category, stats in _status_cache_stats.items():
+            retdict[category] = dict(stats)
+            retdict['hits'] += stats['hits']
+            retdict['misses'] += stats['misses']
+        return retdict
+
+def reset_status_cache_stats():
+    with _status_cache_lock:
+        _status_cache_stats.clear()
+
+def _cached_get(category, endpoint, **kwargs):
+    """
+    ATARest.get through the status cache, if enabled for category
+    """
+    ttl = _status_cache_ttl.get(category)
+    if not ttl:
+        return ATARest.get(endpoint, **kwargs)
+
+    key = (category, endpoint, repr(sorted(kwargs.items())))
+    now = time.time()
+    with _status_cache_lock:
+        stats = _status_cache_stats.setdefault(category, {'hits': 0, 'misses': 0})
+        entry = _status_cache.get(key)
+        if entry and now - entry[0] < ttl:
+            stats['hits'] += 1
+            return entry[1]
+        stats['misses'] += 1
+        generation = _status_cache_generation.get(category, 0)
+
+    value = ATARest.get(endpoint, **kwargs)
+    with _status_cache_lock:
+        if category in _status_cache_ttl and \
+                _status_cache_generation.get(category, 0) == generation:
+            _status_cache[key] = (now, value)
+    return value
+
+
 #use discouraged. Use more specific functions instead
 def get_ascii_status():
     """
@@ -147,7 +270,7 @@ def get_ant_pos(ant_list):
 
     try:
         endpoint = '/antennas/{:s}/locations'.format(antstr)
-        ant_locs = ATARest.get(endpoint)
+        ant_locs = _cached_get('locations', endpoint)
     except Exception as e:
         logger.error('{:s} got error: {:s}'.format(endpoint, str(e)))
         raise
@@ -169,7 +292,7 @@ def get_source_ra_dec(source, deg=True):
 
     try:
         endpoint = '/source'
-        source_data = ATARest.get(endpoint, json={'source': source})
+        source_data = _cached_get('source', endpoint, json={'source': source})
     except Exception as e:
         logger.error('{:s} got error: {:s}'.format(endpoint, str(e)))
         raise
@@ -257,7 +380,7 @@ def set_az_el(ant_list, az, el):
 
     try:
         endpoint = '/antennas/{:s}/azel'.format(antstr)
-        antpos = ATARest.put(endpoint, data={'az': az, 'el': el, 'wait': True})
+        antpos = _put_invalidating('sources', endpoint, data={'az': az, 'el': el, 'wait': True})
     except Exception as e:
         logger.error('{:s} got error: {:s}'.format(endpoint, str(e)))
         raise
@@ -274,7 +397,7 @@ def get_eph_source(antlist):
 
     try:
         endpoint = '/antennas/{:s}/sources'.format(antstr)
-        sources = ATARest.get(endpoint)
+        sources = _cached_get('sources', endpoint)
     except Exception as e:
         logger.error('{:s} got error: {:s}'.format(endpoint, str(e)))
         raise
@@ -406,7 +529,7 @@ def track_ephemeris(ephemeris_id, antlist, wait=True):
 
         logger.info('Tracking ephemeris {:s} with {:s}'.format(ephemeris_id, antstr))
         endpoint = '/antennas/{:s}/track'.format(antstr)
-        ATARest.put(endpoint, json={'id': ephemeris_id, 'wait': wait})
+        _put_invalidating('sources', endpoint, json={'id': ephemeris_id, 'wait': wait})
     except Exception as e:
         logger.error('{:s} got error: {:s}'.format(endpoint, str(e)))
         raise
@@ -506,7 +629,7 @@ def make_and_track_source(source, antstr, **ephem_kwargs):
         logger.info("Tracking source {:s} with {:s}".format(source, antstr))
         ephem_id = retval['id']
         endpoint = '/antennas/{:s}/track'.format(antstr)
-        ATARest.put(endpoint, json={'id': ephem_id, 'wait': True})
+        _put_invalidating('sources', endpoint, json={'id': ephem_id, 'wait': True})
     except Exception as e:
         logger.error('{:s} got error: {:s}'.format(endpoint, str(e)))
         raise
@@ -534,7 +657,7 @@ def make_and_track_tle(tle_filename, antstr, **ephem_kwargs):
         ephem_id = retval['id']
         logger.info("Tracking source {:s} with {:s}".format(ephem_id, antstr))
         endpoint = '/antennas/{:s}/track'.format(antstr)
-        ATARest.put(endpoint, json={'id': ephem_id, 'wait': True})
+        _put_invalidating('sources', endpoint, json={'id': ephem_id, 'wait': True})
     except Exception as e:
         logger.error('{:s} got error: {:s}'.format(endpoint, str(e)))
         raise
@@ -558,7 +681,7 @@ def make_and_track_ra_dec(ra, dec, antstr, **ephem_kwargs):
 
         ephem_id = retval['id']
         endpoint = '/antennas/{:s}/track'.format(antstr)
-        ATARest.put(endpoint, json={'id': ephem_id, 'wait': True})
+        _put_invalidating('sources', endpoint, json={'id': ephem_id, 'wait': True})
     except Exception as e:
         logger.error('{:s} got error: {:s}'.format(endpoint, str(e)))
         raise
@@ -623,21 +746,22 @@ def set_pams(antdict):
     # very pythonic way to get unique antennas
     ants = list(set(ants_tmp))
 
-    # this is being done sequentially, not the best
-    # but the /antennas/1a,1f,3c/pams endpoint does not
-    # seem to work
+    # the /antennas/1a,1f,3c/pams endpoint does not
+    # seem to work, so issue one call per antenna concurrently
+    ant_kwargs = {}
     for ant in ants:
         json = {}
         if ant+"x" in antdict.keys():
             json["x"] = {'x': True, 'value': antdict[ant+"x"]}
         if ant+"y" in antdict.keys():
             json["y"] = {'y': True, 'value': antdict[ant+"y"]}
+        ant_kwargs[ant] = {'json': json}
 
-        try:
-            ret = ATARest.put("/antenna/%s/pams" %ant, json=json)
-        except Exception as e:
-            logger.error("set_pams got error: {}".format(str(e)))
-            raise
+    try:
+        ATARest.put_batch("/antenna/{}/pams", ants, key_kwargs=ant_kwargs)
+    except Exception as e:
+        logger.error("set_pams got error: {}".format(str(e)))
+        raise
 
 def get_pams(antlist):
     """
@@ -779,7 +903,7 @@ def get_sky_freq(lo='a'):
     tuned to the center of the ATA band
     """
     lo = lo.lower()
-    return ATARest.get('/lo1/skyfreq/' + lo)[lo]
+    return _cached_get('skyfreq', '/lo1/skyfreq/' + lo)[lo]
 
 def set_freq_focus(freq, ants, calibrate=False):
     """
@@ -850,7 +974,7 @@ def set_freq(freq, antlist, lo='a', nofocus=False):
     # Set LO tuning skyfreq
 
     try:
-        ATARest.put('/lo1/skyfreq/' + lo, data={'value': freq})
+        _put_invalidating('skyfreq', '/lo1/skyfreq/' + lo, data={'value': freq})
     except Exception as e:
         logger.error(str(e))
         raise
@@ -1045,7 +1169,7 @@ def park_antennas(antlist):
 
     try:
         endpoint = '/antennas/{:s}/park'.format(antstr)
-        ATARest.put(endpoint, data={'wait': True})
+        _put_invalidating('sources', endpoint, data={'wait': True})
     except Exception as e:
         logger.error('{:s} got error: {:s}'.format(endpoint, str(e)))
         raise
@@ -1335,7 +1459,7 @@ def track_and_offset(source, antstr, **ephem_kwargs):
         json = {'id': ephem_id, 'wait': True}
         json.update(ephem_kwargs)
         endpoint = '/antennas/{:s}/track'.format(antstr)
-        ATARest.put(endpoint, json=json)
+        _put_invalidating('sources', endpoint, json=json)
     except Exception as e:
         logger.error('{:s} got error: {:s}'.format(endpoint, str(e)))
         raise
@@ -1499,7 +1623,7 @@ def point_ants2(source, on_or_off, ant_list, **ephem_kwargs):
 
     try:
         endpoint = '/antennas/{:s}/track'.format(antstr)
-        ATARest.put(endpoint, json=ephem_kwargs)
+        _put_invalidating('sources', endpoint, json=ephem_kwargs)
     except Exception as e:
         logger.error('{:s} got error: {:s}'.format(endpoint, str(e)))
         raise
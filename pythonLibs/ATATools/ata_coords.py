@@ -4,12 +4,164 @@ from astropy import units as u
 from astropy.coordinates import Angle
 
 from . import ata_control, logger_defaults
+import json
+import os
 import threading
 import time
 
+import numpy as np
+
 
 _COORD_TYPES = ["azel", "radec"]
+_FILE_FORMATS = ["text", "binary"]
 _CADENCE = 0.5 #seconds
+_MIN_CADENCE = 0.05 #seconds, i.e. 20 Hz
+_RING_RECORDS = 72000 #1 hour at 20 Hz
+
+# binary ring buffer layout: a fixed-size header holding the magic,
+# the number of records written so far and JSON metadata, followed
+# by fixed-size records (unix time, then one coordinate pair per antenna)
+_RING_MAGIC = b"ATACOORD"
+_RING_HEADER_SIZE = 4096
+
+
+def _ring_dtype(nants):
+    return np.dtype([("time", "<f8"), ("coords", "<f8", (nants, 2))])
+
+
+class CoordRingBuffer:
+    """
+    A fixed-record, memory-mapped ring buffer of antenna coordinates.
+    Once nRecords records are written, the oldest ones are overwritten
+
+    Attributes
+    ----------
+    antList : list
+        list of antennas
+    coordType : str
+        'azel' or 'radec'
+    nRecords : int
+        capacity of the ring buffer, in records
+    """
+
+    def __init__(self, fileName, antList, coordType, nRecords=_RING_RECORDS):
+        self.antList = antList
+        self.coordType = coordType
+        self.nRecords = nRecords
+
+        meta = json.dumps({"antList": antList, "coordType": coordType,
+            "nRecords": nRecords}).encode()
+        if len(meta) > _RING_HEADER_SIZE - 16:
+            raise RuntimeError("too many antennas for the ring buffer header")
+
+        dtype = _ring_dtype(len(antList))
+        with open(fileName, "wb") as f:
+            f.write(_RING_MAGIC)
+            f.write(np.uint64(0).tobytes())
+            f.write(meta.ljust(_RING_HEADER_SIZE - 16, b"\0"))
+            f.truncate(_RING_HEADER_SIZE + nRecords * dtype.itemsize)
+
+        self._count = np.memmap(fileName, dtype="<u8", mode="r+",
+                offset=len(_RING_MAGIC), shape=(1,))
+        self._records = np.memmap(fileName, dtype=dtype, mode="r+",
+                offset=_RING_HEADER_SIZE, shape=(nRecords,))
+        self._nwritten = 0
+
+    def write(self, time_now, coords):
+        """
+        Append one record; coords is a dictionary as returned by
+        ata_control.get_az_el/get_ra_dec. Missing antennas are NaN
+        """
+        rec = self._records[self._nwritten % self.nRecords]
+        rec["time"] = time_now
+        for i, ant in enumerate(self.antList):
+            coord = coords.get(ant)
+            rec["coords"][i] = coord if coord else (np.nan, np.nan)
+        # the count is updated last. Once the ring is full, the slot being
+        # written is the oldest record read_coord_dump may see, so readers
+        # skip it and drop the records overwritten while they copied them
+        self._nwritten += 1
+        self._count[0] = self._nwritten
+
+    def close(self):
+        self._records.flush()
+        self._count.flush()
+        del self._records
+        del self._count
+
+
+def _ring_segments(first, last, nrec):
+    """
+    (sequence number, first slot, last slot) of the time-ordered
+    segments (at most two) holding records first to last - 1
+    """
+    segments = []
+    while first < last:
+        slot = first % nrec
+        n = min(last - first, nrec - slot)
+        segments.append((first, slot, slot + n))
+        first += n
+    return segments
+
+
+def read_coord_dump(fileName, t_start=None, t_stop=None):
+    """
+    Read a time slice of a binary coordinate dump without loading
+    the whole file. The dump can be read while it is being written
+
+    Parameters
+    ----------
+    fileName : str
+        name of a file written by CoordDumpThread with fileFormat='binary'
+    t_start, t_stop : float
+        unix time limits of the slice (t_start <= time < t_stop).
+        Default is the beginning / end of the dump
+
+    Returns
+    -------
+    dict
+        'antList', 'coordType', 'time' (n) and 'coords' (n, nants, 2)
+    """
+    with open(fileName, "rb") as f:
+        header = f.read(_RING_HEADER_SIZE)
+    if header[:len(_RING_MAGIC)] != _RING_MAGIC:
+        raise RuntimeError("%s is not a binary coordinate dump" %fileName)
+    meta = json.loads(header[16:].rstrip(b"\0").decode())
+
+    nrec = meta["nRecords"]
+    count = np.memmap(fileName, dtype="<u8", mode="r",
+            offset=len(_RING_MAGIC), shape=(1,))
+    records = np.memmap(fileName, dtype=_ring_dtype(len(meta["antList"])),
+            mode="r", offset=_RING_HEADER_SIZE, shape=(nrec,))
+
+    # record n is in slot n % nrec. Once the ring is full, the slot of the
+    # next record may be being written, it is left out
+    nwritten = int(count[0])
+    parts = []
+    for seq, s0, s1 in _ring_segments(max(0, nwritten + 1 - nrec), nwritten, nrec):
+        t = records["time"][s0:s1]
+        i0 = 0 if t_start is None else np.searchsorted(t, t_start, side="left")
+        i1 = len(t) if t_stop is None else np.searchsorted(t, t_stop, side="left")
+        parts.append((seq + i0, np.array(records[s0 + i0:s0 + i1])))
+
+    # drop the records overwritten while they were copied
+    first = int(count[0]) + 1 - nrec
+    parts = [part[max(0, first - seq):] for seq, part in parts]
+    data = np.concatenate(parts) if parts else np.empty(0, records.dtype)
+    del records, count
+
+    # a record overwritten during the search may have misplaced the limits
+    keep = np.ones(len(data), dtype=bool)
+    if t_start is not None:
+        keep &= data["time"] >= t_start
+    if t_stop is not None:
+        keep &= data["time"] < t_stop
+    data = data[keep]
+
+    return {"antList": meta["antList"], "coordType": meta["coordType"],
+            "time": data["time"], "coords": data["coords"]}
+
+
 class CoordDumpThread(threading.Thread):
     """
     A thread-based class used to dump coordinates (azel or radec) at high cadence to file
@@ -25,7 +177,12 @@ class CoordDumpThread(threading.Thread):
     coordType : str
         allowed values: 'azel' (default) and 'radec'
     cadence : float
-        update rate in seconds (default = 0.5) 
+        update rate in seconds (default = 0.5, minimum 0.05)
+    fileFormat : str
+        'text' (default) for one formatted line per update, or 'binary'
+        for a memory-mapped ring buffer, see read_coord_dump()
+    nRecords : int
+        capacity of the binary ring buffer (default 1 hour at 20 Hz)
 
     Methods
     -------
@@ -35,7 +192,8 @@ class CoordDumpThread(threading.Thread):
         stops thread
     """
 
-    def __init__(self, antList, outFileName, coordType="azel", cadence=None):
+    def __init__(self, antList, outFileName, coordType="azel", cadence=None,
+            fileFormat="text", nRecords=_RING_RECORDS):
         logger = logger_defaults.getModuleLogger(__name__)
 
         # make thread a daemon in case main wants to exit
@@ -47,11 +205,18 @@ class CoordDumpThread(threading.Thread):
             raise RuntimeError("coordType provided (%s) is not included in %s"
                     %(coordType, _COORD_TYPES))
 
+        if fileFormat not in _FILE_FORMATS:
+            raise RuntimeError("fileFormat provided (%s) is not included in %s"
+                    %(fileFormat, _FILE_FORMATS))
+
         # antList must be a list
         assert type(antList) == list, "antList argument must be a list"
 
-        # Open output file
-        self.OutFile = open(outFileName, "w")
+        # cadence in seconds
+        self.cadence = cadence if cadence else _CADENCE
+        if self.cadence < _MIN_CADENCE:
+            raise RuntimeError("cadence provided (%s) is below the minimum of %s s"
+                    %(self.cadence, _MIN_CADENCE))
 
         # set the data pulling function
         # and populate the header in the output file
@@ -69,25 +234,26 @@ class CoordDumpThread(threading.Thread):
             _ant_header_str = " ".join(_ant_header)
             header_str = "# Time_unix " + _ant_header_str + "\n"
 
-        # Write header
-        self.OutFile.write(header_str)
+        # Open output file and write header
+        self.fileFormat = fileFormat
+        if fileFormat == "text":
+            self.OutFile = open(outFileName, "w")
+            self.OutFile.write(header_str)
+        else:
+            self.OutFile = CoordRingBuffer(outFileName, antList, coordType, nRecords)
 
         self.antList = antList
 
         # a thread-stopping mechanism
-        self._stop = threading.Event()
-
-        # cadence in seconds
-        if not cadence:
-            self.cadence = _CADENCE
+        self._stop_event = threading.Event()
 
     def stop(self):
         logger = logger_defaults.getModuleLogger(__name__)
         logger.info("Stopping")
-        self._stop.set()
+        self._stop_event.set()
 
     def _is_terminated(self):
-        return self._stop.isSet()
+        return self._stop_event.is_set()
 
     def _to_string(self, time_now, coords):
         all_str = "%.6f" %time_now
@@ -100,14 +266,20 @@ class CoordDumpThread(threading.Thread):
     def run(self):
         logger = logger_defaults.getModuleLogger(__name__)
         logger.info("Starting coord dump thread")
+        next_time = time.time()
         while not self._is_terminated():
             time_now = time.time()
             coords = self._pull_func(self.antList)
-            coords_str = self._to_string(time_now, coords)
 
             # write to output file
-            self.OutFile.write(coords_str)
-            time.sleep(self.cadence)
+            if self.fileFormat == "text":
+                self.OutFile.write(self._to_string(time_now, coords))
+            else:
+                self.OutFile.write(time_now, coords)
+
+            # keep a fixed cadence, independent of the query time
+            next_time = max(next_time + self.cadence, time.time())
+            self._stop_event.wait(next_time - time.time())
 
         logger.info("Received stop, run() is returning")
         self.OutFile.close()
@@ -118,6 +118,48 @@ def generate_ephem_az_swivel(az_start, az_end, el_start, t_start, t_span,  steps
 
 
 
+def apply_pointing_model(ephem, pm, inverse=False):
+    """
+    Pointing model correction of an ephemeris
+
+    This function applies the TPOINT pointing model of an antenna to the
+    azimuth and elevation columns of an ephemeris array, in one vectorized
+    call for all the points
+
+    Parameters
+    ----------
+    ephem   : numpy_array
+              ephemeris array with 4 columns for time in TAI ns, azimuth,
+              elevation and inverse radius, as from generate_ephem_*_swivel
+    pm      : ata_pointing.PointingModel
+              pointing model of the antenna, see also
+              ata_pointing.load_pointing_models for offline use
+    inverse : bool
+              if True, remove the correction (encoder to sky Az/El)
+              instead of applying it
+
+    Returns
+    -------
+    ephem   : numpy_array
+              a copy of the ephemeris with corrected azimuth and elevation
+
+    """
+    ephem = np.array(ephem, copy=True)
+
+    az = ephem[:, 1].astype(float)
+    el = ephem[:, 2].astype(float)
+    if inverse:
+        az, el, _ = pm.removeTPOINTCorrections(az, el, 0)
+    else:
+        az, el, _ = pm.applyTPOINTCorrections(az, el, 0)
+
+    ephem[:, 1] = az
+    ephem[:, 2] = el
+
+    return(ephem)
+
+
+
 def ephem_to_txt(save_as, ephem_file):
     """
     Ephemeris to text file
@@ -4,9 +4,10 @@ from multiprocessing.pool import ThreadPool
 import threading
 import warnings
 
-from ATATools import logger_defaults
+from ATATools import logger_defaults, if_tuner
 from ata_snap import ata_snap_fengine, ata_rfsoc_fengine
 from SNAPobs.snap_config import get_ata_cfg
+from SNAPobs import snap_control
 
 
 # TODO: move and put in a config file
@@ -175,6 +176,12 @@ def tune_if(ant_list, los, pols=ALL_POLS, desired_rms=RFSOC_RMS):
 
     rms : float or int
         RMS to set the RFSoC digitizers to 
+
+    Returns
+    -------
+    report : Pandas DataFrame
+        final attenuation, RMS, iterations and wall time of each input,
+        see ATATools.if_tuner.tune
     """
     logger = logger_defaults.getModuleLogger(__name__)
     logger.debug("Entered 'tune_if' with parameters: %s %s %s %s"
@@ -199,100 +206,84 @@ def tune_if(ant_list, los, pols=ALL_POLS, desired_rms=RFSOC_RMS):
                                    ant=ant_list)
 
     sub_ant_mapping['desired_rms'] = [desired_rms] * len(sub_ant_mapping)
-    unique_gain_modules = sub_ant_mapping['gain-module'].unique()
-
-    ant_mappings_per_module = []
-    # now let's divide the table into their respective gain modules
-    for gain_module in unique_gain_modules:
-        mask = np.isin(sub_ant_mapping['gain-module'], gain_module)
-        ant_mappings_per_module.append(sub_ant_mapping[mask].copy())
+    return _tune_if_by_mapping(sub_ant_mapping)
 
-    pool = ThreadPool(processes = NPROCS)
-    pool.map(_tune_if_by_module_threaded, ant_mappings_per_module)
 
-
-def _get_adc(rfsoc, pipeline_id):
+def _get_adc(rfsoc, pipeline_id, ncycles=GET_ADC_CYCLES):
     rfsoc.pipeline_id = pipeline_id
-    x, y = (), ()
-    for icycle in range(GET_ADC_CYCLES):
+    x, y = [], []
+    for icycle in range(ncycles):
         xy = rfsoc.adc_get_samples()
-        x += xy[0]
-        y += xy[1]
-    return x,y
+        x.append(xy[0])
+        y.append(xy[1])
+    return np.concatenate(x), np.concatenate(y)
+
 
-def _tune_if_by_module_threaded(ant_mapping_per_module):
+def _tune_if_by_mapping(sub_ant_mapping):
     """
-    
+    Tunes all the inputs of an antenna mapping table to their
+    'desired_rms' concurrently, with ATATools.if_tuner: the gain modules
+    are set in parallel, and the RFSoC boards are read in parallel,
+    with 1 connection to each board switching between pipeline IDs
+
+    Parameters
+    ----------
+    sub_ant_mapping : Pandas DataFrame
+        subset of the antenna mapping table, with a 'desired_rms' column
+
+    Returns
+    -------
+    report : Pandas DataFrame
+        the if_tuner.tune report, indexed by antenna, LO and pol
+        (e.g. '1aAx'), with the iterations and wall time of each input
     """
     logger = logger_defaults.getModuleLogger(__name__)
-    logger.debug("Entered '_tune_if_by_module_threaded' with"\
-            "thread_number: %i and ant_mapping:\n%s"\
-                 %(threading.get_ident(), ant_mapping_per_module))
-
-    # Set the attenuation to an initial value
-    _set_attenuation_by_mapping(ant_mapping_per_module, 
-                                [INIT_ATT]*len(ant_mapping_per_module)) 
-
-    # An optimization here is to create 1 connection to each board, 
-    # and manually change the "pipeline_id" attribute to switch between 
-    # different antennas, rather than extablishing more than 1 
-    # connection for each pipeline ID
-    unique_rfsocs_pid = ant_mapping_per_module.hostname.unique()
-
-    # I am assuming the hostnames are the following: "rfsocXX-ctrl-Y"
-    # the [:-7] will remove the "-ctrl-7"
-    unique_rfsoc = np.unique([i[:-7] for i in unique_rfsocs_pid])
-
-    assert len(unique_rfsoc) == 1, "We should have 1 rfsoc per module"
-    unique_rfsoc = unique_rfsoc[0]
-
-    gain_module = ant_mapping_per_module['gain-module'].unique()[0]
-
-    rfsoc = ata_rfsoc_fengine.AtaRfsocFengine(unique_rfsoc, pipeline_id = 0)
-    ata_cfg = get_ata_cfg()
-    rfsoc_fpg_file = ata_cfg['RFSOCFPG']
-    rfsoc.fpga.get_system_information(rfsoc_fpg_file)
-    logger.info("Initialized RFSoC: %s" %unique_rfsoc)
-
-    #rfsoc = testRfsoc(unique_rfsoc)
-
-    ant_mapping_per_module['meas_rms'] = [0.]*len(ant_mapping_per_module)
-    ant_mapping_per_module['attn'] = [INIT_ATT]*len(ant_mapping_per_module)
-
-    # Do the calculation twice
-    for i in range(2):
-        # populate the current rms values of the boards
-        for unique_pid in unique_rfsocs_pid:
-            pipeline_id = int(unique_pid[-1])
-            x, y = _get_adc(rfsoc, pipeline_id-1) #TODO: implement!
-            rms_x = np.std(x)
-            rms_y = np.std(y)
-            logger.info("RMS values for x,y: %.3f %.3f" %(rms_x, rms_y))
-
-            tmp_mask = ant_mapping_per_module.hostname ==\
-                    str(unique_rfsoc) + "-ctrl-%i" %pipeline_id
-            tmp_mapping = ant_mapping_per_module[tmp_mask]
-
-            if 'x' in list(tmp_mapping.pol):
-                ant_mapping_per_module.loc[tmp_mask & 
-                            (ant_mapping_per_module.pol == 'x'), 
-                                           'meas_rms'] = rms_x
-            if 'y' in list(tmp_mapping.pol):
-                ant_mapping_per_module.loc[tmp_mask & 
-                            (ant_mapping_per_module.pol == 'y'), 
-                                           'meas_rms'] = rms_y
-
-        # now calculate what attenuation we need to set 
-        atten_diff = 20*np.log10(ant_mapping_per_module['meas_rms'] /
-                                 ant_mapping_per_module['desired_rms'])
-        ant_mapping_per_module['attn'] = _round50th(
-                ant_mapping_per_module['attn'] + atten_diff)
-
-        # apply the attenuation
-        _set_attn_by_module(gain_module,
-                            list(ant_mapping_per_module.ch),
-                            list(ant_mapping_per_module.attn))
+    logger.debug("Entered '_tune_if_by_mapping' with ant_mapping:\n%s"
+            %sub_ant_mapping)
+
+    inputs = {row.ant + row.LO.upper() + row.pol: row
+            for _, row in sub_ant_mapping.iterrows()}
+    att_groups = {}
+    adc_groups = {}
+    for inp, row in inputs.items():
+        # I am assuming the hostnames are the following: "rfsocXX-ctrl-Y"
+        # the [:-7] will remove the "-ctrl-Y"
+        att_groups.setdefault(row['gain-module'], []).append(inp)
+        adc_groups.setdefault(row.hostname[:-7], []).append(inp)
+
+    rfsoc_fpg_file = get_ata_cfg()['RFSOCFPG']
+    def connect(rfsoc_name):
+        rfsoc = ata_rfsoc_fengine.AtaRfsocFengine(rfsoc_name, pipeline_id = 0)
+        rfsoc.fpga.get_system_information(rfsoc_fpg_file)
+        logger.info("Initialized RFSoC: %s" %rfsoc_name)
+        return rfsoc
 
+    pool = ThreadPool(processes = NPROCS)
+    try:
+        rfsocs = dict(zip(adc_groups, pool.map(connect, list(adc_groups))))
+    finally:
+        pool.close()
+        pool.join()
+
+    def set_attn(gain_module, inps, attens):
+        _set_attn_by_module(gain_module, [inputs[inp].ch for inp in inps],
+                attens)
+
+    def read_rms(rfsoc_name, inps, ncycles):
+        # x and y of a pipeline ID are read together
+        rms = {}
+        for pipeline_id in sorted(set([int(inputs[inp].hostname[-1]) for inp in inps])):
+            x, y = _get_adc(rfsocs[rfsoc_name], pipeline_id-1, ncycles)
+            rms['x', pipeline_id] = np.std(x)
+            rms['y', pipeline_id] = np.std(y)
+        return [rms[inputs[inp].pol, int(inputs[inp].hostname[-1])] for inp in inps]
+
+    try:
+        return if_tuner.tune(att_groups, adc_groups, set_attn, read_rms,
+                {inp: row.desired_rms for inp, row in inputs.items()},
+                INIT_ATT, GET_ADC_CYCLES, nthreads=NPROCS)
+    finally:
+        snap_control.disconnect_snaps(list(rfsocs.values()))
 
 
 def _set_attenuation_by_mapping(sub_ant_mapping, attens):
@@ -1,3 +1,7 @@
+import json
+import os
+import time
+
 import numpy as np
 from .ata_rest import ATARest, ATARestException
 
@@ -10,6 +14,13 @@ PIBY2 = np.pi / 2.0
 
 MAX_EL_FOR_CORRECTION = 1.5533430342749532 #radians, 89.0 degrees
 
+# default location of the on-disk pointing model cache
+PM_CACHE_DIR = os.path.expanduser('~/.ata_pointing_models')
+
+# inverse correction iterations and tolerance (degrees)
+INVERSE_MAX_ITER = 10
+INVERSE_TOL = 1e-9
+
 
 class modelCoeff:
     pass
@@ -19,17 +30,31 @@ class PointingModel():
     """
     An exact translation from the java code that exists in:
     obs@control:/hcro/atasys/ata/src/ata/trajectory/PointingModel.java
+
+    All corrections accept both scalars and numpy arrays of az/el.
+
+    The model is fetched from /antenna/{ant}/pm, unless pointing_model
+    (the dictionary returned by that endpoint) is given. With cache_dir,
+    the model is read from (and stored to) an on-disk cache, and only
+    fetched if not cached or older than max_age seconds
     """
     _TPOINT_COEFFS = [
         'IA', 'AN', 'AW', 'CA', 'NPAE', 'ACES', 'ACEC', 'HASA2', 'HACA2',
         'IE', 'ECES', 'ECEC'
     ]
 
-    def __init__(self, ant):
+    def __init__(self, ant, pointing_model=None, cache_dir=None, max_age=None):
         self.antName = ant
         self.mCoef = modelCoeff()
 
-        pointing_model = ATARest.get('/antenna/{:s}/pm'.format(ant))
+        if pointing_model is None and cache_dir:
+            pointing_model = _load_cached_pm(ant, cache_dir, max_age)
+        if pointing_model is None:
+            pointing_model = ATARest.get('/antenna/{:s}/pm'.format(ant))
+            if cache_dir:
+                _store_cached_pm(ant, pointing_model, cache_dir)
+
+        self.pointing_model = pointing_model
         for key, value in pointing_model.items():
             if key in self._TPOINT_COEFFS:
                 setattr(self.mCoef, key, value)
@@ -51,15 +76,15 @@ class PointingModel():
         # the pointing model makes no sense very close to zenith
         # (you could never get there anyway cause these are nonperp terms)
         avoidance_zone = np.abs(self.mCoef.CA) * SEC2RAD + 0.0001;
-        if ( el_rad <  0.0          ):
-            return 0.0
-        if ( el_rad > (PIBY2 - avoidance_zone)):
-          return (PIBY2 - avoidance_zone);
-        return el_rad;
+        return np.clip(el_rad, 0.0, PIBY2 - avoidance_zone)
 
 
 
     def applyTPOINTCorrections(self, Az, El, IR):
+        """
+        Apply the pointing model to sky Az/El (degrees, scalars or
+        arrays), returning the encoder Az/El and IR
+        """
         # break out the individual tracks
         #Track az_track = new Track(track_in.getAz());
         #Track el_track = new Track(track_in.getEl());
@@ -89,6 +114,33 @@ class PointingModel():
         az = az * RAD2DEG;
         el = el * RAD2DEG;
 
+        if np.ndim(Az) == 0 and np.ndim(El) == 0:
+            return float(az), float(el), IR
+        return az, el, IR
+
+    def removeTPOINTCorrections(self, Az, El, IR):
+        """
+        Inverse of applyTPOINTCorrections: given encoder Az/El (degrees,
+        scalars or arrays) return the sky Az/El and IR.
+        The model terms are small, so a fixed point iteration converges
+        in a few steps. Points in the zenith avoidance zone, where the
+        forward model is clipped, are not invertible exactly
+        """
+        az_target = np.asarray(Az, dtype=float)
+        el_target = np.asarray(El, dtype=float)
+        az = az_target.copy()
+        el = el_target.copy()
+        for i in range(INVERSE_MAX_ITER):
+            az_fwd, el_fwd, _ = self.applyTPOINTCorrections(az, el, IR)
+            daz = az_fwd - az_target
+            del_ = el_fwd - el_target
+            az = az - daz
+            el = el - del_
+            if np.all(np.abs(daz) < INVERSE_TOL) and np.all(np.abs(del_) < INVERSE_TOL):
+                break
+
+        if np.ndim(Az) == 0 and np.ndim(El) == 0:
+            return float(az), float(el), IR
         return az, el, IR
 
     def applyECEC(self, az, el):
@@ -121,37 +173,27 @@ class PointingModel():
 
     def applyNPAE(self, az, el):
         # Prohibit tan(el) from reaching a value too large.
-        if (el > MAX_EL_FOR_CORRECTION):
-            az = az + SEC2RAD * self.mCoef.NPAE * np.tan(MAX_EL_FOR_CORRECTION)
-            return az, el
-        az = az + SEC2RAD * self.mCoef.NPAE * np.tan(el)
+        el_lim = np.minimum(el, MAX_EL_FOR_CORRECTION)
+        az = az + SEC2RAD * self.mCoef.NPAE * np.tan(el_lim)
         return az, el
 
     def applyCA(self, az, el):
         # Prohibit 1/cos(el) from reaching a value too large.
-        if (el > MAX_EL_FOR_CORRECTION):
-            az = az + SEC2RAD * self.mCoef.CA / np.cos(MAX_EL_FOR_CORRECTION)
-            return az, el
-        az = az + SEC2RAD * self.mCoef.CA / np.cos(el)
+        el_lim = np.minimum(el, MAX_EL_FOR_CORRECTION)
+        az = az + SEC2RAD * self.mCoef.CA / np.cos(el_lim)
         return az, el
 
     def applyAW(self, az, el):
         # Prohibit tan(el) from reaching a value too large.
-        if (el > MAX_EL_FOR_CORRECTION):
-            az = az + SEC2RAD * self.mCoef.AW * np.cos(az) * np.tan(MAX_EL_FOR_CORRECTION)
-            el = self.coerceEl(el - SEC2RAD * self.mCoef.AW * np.sin(az))
-            return az, el
-        az = az + SEC2RAD * self.mCoef.AW * np.cos(az) * np.tan(el)
+        el_lim = np.minimum(el, MAX_EL_FOR_CORRECTION)
+        az = az + SEC2RAD * self.mCoef.AW * np.cos(az) * np.tan(el_lim)
         el = self.coerceEl(el - SEC2RAD * self.mCoef.AW * np.sin(az))
         return az, el
 
     def applyAN(self, az, el):
         # Prohibit tan(el) from reaching a value too large.
-        if (el > MAX_EL_FOR_CORRECTION):
-            az = az + SEC2RAD *self. mCoef.AN * np.sin(az) * np.tan(MAX_EL_FOR_CORRECTION)
-            el = self.coerceEl(el + SEC2RAD * self.mCoef.AN * np.cos(az))
-            return az, el
-        az = az + SEC2RAD * self.mCoef.AN * np.sin(az) * np.tan(el)
+        el_lim = np.minimum(el, MAX_EL_FOR_CORRECTION)
+        az = az + SEC2RAD * self.mCoef.AN * np.sin(az) * np.tan(el_lim)
         el = self.coerceEl(el + SEC2RAD * self.mCoef.AN * np.cos(az))
         return az, el
 
@@ -163,11 +205,7 @@ class PointingModel():
         # tan(el) and sec(el) blow up too close to zenith
         # avoid those values
         roundoff_zone = 0.0001;
-        if ( el_rad <  0.0 ):
-            return 0.0
-        if ( el_rad > (PIBY2 - roundoff_zone)):
-          return (PIBY2 - roundoff_zone)
-        return el_rad
+        return np.clip(el_rad, 0.0, PIBY2 - roundoff_zone)
 
 
     def to_tpoint_str(self):
@@ -190,3 +228,58 @@ class PointingModel():
         return retStr
 
 
+def _cached_pm_filename(ant, cache_dir):
+    return os.path.join(cache_dir, 'pm_{:s}.json'.format(ant))
+
+
+def _load_cached_pm(ant, cache_dir, max_age=None):
+    """
+    Return the cached pointing model dictionary of ant, or None if
+    not cached or older than max_age seconds
+    """
+    filename = _cached_pm_filename(ant, cache_dir)
+    if not os.path.isfile(filename):
+        return None
+    if max_age is not None and time.time() - os.path.getmtime(filename) > max_age:
+        return None
+    with open(filename, 'r') as f:
+        return json.load(f)
+
+
+def _store_cached_pm(ant, pointing_model, cache_dir):
+    os.makedirs(cache_dir, exist_ok=True)
+    filename = _cached_pm_filename(ant, cache_dir)
+    # write to a temporary file first, so readers never see a partial file
+    with open(filename + '.tmp', 'w') as f:
+        json.dump(pointing_model, f)
+    os.replace(filename + '.tmp', filename)
+
+
+def fetch_pointing_models(ant_list, cache_dir=PM_CACHE_DIR):
+    """
+    Fetch the pointing models of all antennas concurrently and
+    store them in the on-disk cache
+
+    :returns dict of PointingModel, keyed by antenna
+    """
+    pms = ATARest.get_batch('/antenna/{}/pm', ant_list)
+    for ant, pointing_model in pms.items():
+        _store_cached_pm(ant, pointing_model, cache_dir)
+    return {ant: PointingModel(ant, pointing_model=pms[ant]) for ant in ant_list}
+
+
+def load_pointing_models(ant_list, cache_dir=PM_CACHE_DIR, max_age=None):
+    """
+    Load the pointing models of all antennas from the on-disk cache,
+    fetching (concurrently) only the ones not cached or older than
+    max_age seconds
+
+    :returns dict of PointingModel, keyed by antenna
+    """
+    cached = {ant: _load_cached_pm(ant, cache_dir, max_age) for ant in ant_list}
+    missing = [ant for ant, pm in cached.items() if pm is None]
+    pms = fetch_pointing_models(missing, cache_dir) if missing else {}
+    for ant in ant_list:
+        if ant not in pms:
+            pms[ant] = PointingModel(ant, pointing_model=cached[ant])
+    return {ant: pms[ant] for ant in ant_list}
@@ -23,6 +23,13 @@ from . import logger_defaults
 MIN_MOON_SUN_DIST = 45.0
 MIN_ELEV = 23.0
 
+# sidereal day length relative to solar day
+SIDEREAL_RATE = 1.00273790935
+
+# fixed az/el of the goes-16 satellite, in degrees
+GOES16_AZ = 121.998
+GOES16_EL = 23.598
+
 class ATAPositions:
 
     def __init__(self):
@@ -77,32 +84,18 @@ class ATAPositions:
                 return preference,0
         
         #since we are here, the prefered source is not up
-        preference_uptime = 0
-        now_date = d
-        preference=None
-        for s in sources:
-            c_uptime = 0
-            future_minutes = 1
-            while (future_minutes < 1440):
-                d = now_date + dt.timedelta(minutes=future_minutes)
-                sun_angle = ATAPositions.angular_distance('sun', s, d)
-                if(s == 'moon'):
-                    moon_angle = 90.0
-                else:
-                    moon_angle = ATAPositions.angular_distance('moon', s, d)
-                is_up = pos.isUp(s, d)
-                if(is_up == True and sun_angle >= MIN_MOON_SUN_DIST and moon_angle >= MIN_MOON_SUN_DIST):
-                    c_uptime += 1
-                    future_minutes +=1
-                else:
-                    break;
-
-            #if source is longer that last prefered, update prefered
-            if(preference_uptime < c_uptime):
-                preference = s
-                preference_uptime = c_uptime
-
-        return preference,1
+        #uptime is the number of consecutive minutes (starting
+        #a minute from now) the source is up, for up to a day
+        if not sources:
+            return None,1
+        up = pos.getUpGrid(sources, d)['up'][:, 1:]
+        uptime = np.where(up.all(axis=1), up.shape[1], np.argmin(up, axis=1))
+
+        #the first source with the longest uptime is prefered
+        best = int(np.argmax(uptime))
+        if uptime[best] == 0:
+            return None,1
+        return sources[best],1
 
 
 
@@ -114,42 +107,28 @@ class ATAPositions:
 
         pos = ATAPositions();
 
-        for s in sources:
-            info = pos.getAzEl(d, s)
-            sun_angle = ATAPositions.angular_distance('sun', s, d)
-            if(s == 'moon'):
-                moon_angle = 90.0
-            else:
-                moon_angle = ATAPositions.angular_distance('moon', s, d)
-            is_up = pos.isUp(s, d)
-            if(is_up == True and sun_angle >= MIN_MOON_SUN_DIST and moon_angle >= MIN_MOON_SUN_DIST):
+        if not sources:
+            return None
+
+        #If more than 1 day, something is wrong
+        up = pos.getUpGrid(sources, d, minutes=1440)['up']
+
+        for s, is_up in zip(sources, up[:, 0]):
+            if(is_up):
               info = pos.getAzEl(d, s)
               return { 'status' : 'up', 'source' : s, 'az' : info['az'], 'el' : info['el'] }
 
         # If we got this far, none are up. So get the next one to rise
-        future_minutes = 1;
-        now_date = d
-
-        while(future_minutes < 1440): #If more than 1 day, something is wrong
-
-            d = now_date + dt.timedelta(minutes=future_minutes)
-
-            for s in sources:
-                info = pos.getAzEl(dt.datetime.now(), s)
-                sun_angle = ATAPositions.angular_distance('sun', s, d)
-                if(s == 'moon'):
-                    moon_angle = 90.0
-                else:
-                    moon_angle = ATAPositions.angular_distance('moon', s, d)
-                is_up = pos.isUp(s, d)
-                if(is_up == True and sun_angle >= MIN_MOON_SUN_DIST and moon_angle >= MIN_MOON_SUN_DIST):
-                    info = pos.getAzEl(d, s)
-                    return { 'status' : 'next_up', 'source' : s, 'az' : info['az'], \
-                            'el' : info['el'], "minutes" : future_minutes }
-            future_minutes+=1;
+        # (first minute any source is up, first source in list order)
+        future = np.flatnonzero(up[:, 1:].any(axis=0))
+        if future.size == 0:
+            return None
 
-
-        return None
+        future_minutes = int(future[0]) + 1
+        s = sources[int(np.argmax(up[:, future_minutes]))]
+        info = pos.getAzEl(d + dt.timedelta(minutes=future_minutes), s)
+        return { 'status' : 'next_up', 'source' : s, 'az' : info['az'], \
+                'el' : info['el'], "minutes" : future_minutes }
 
     def getSunAzEl(self, d=None):
         if(d == None):
@@ -161,14 +140,11 @@ class ATAPositions:
         return { 'az' : sun.az * 180.0/math.pi, 'el' : sun.alt * 180.0/math.pi }
 
     
-    # Get the Az, El returned in decrees
-    # ra/dec options, ra in hours decimal, dec in degrees decimal
-    def getAzEl(self, d, name, ra=-99.0, dec=-99):
-
-        if(name == None and ra == -99 and dec == -99):
-            return None
-
-        self.observer.date = d
+    def _getBody(self, name, ra=-99.0, dec=-99):
+        """
+        Create the pyephem body for a source name (or ra/dec) at the
+        current observer date. Returns the body and its display name
+        """
         obj = None
         if(name != None):
 
@@ -194,7 +170,7 @@ class ATAPositions:
                 obj._dec = 12.391 * math.pi/180.0
             elif(name.lower() == "goes-16"):
                 obj =  ephem.FixedBody()
-                ra,dec = self.observer.radec_of(121.998 * math.pi/180.0, 23.598 * math.pi/180.0)
+                ra,dec = self.observer.radec_of(GOES16_AZ * math.pi/180.0, GOES16_EL * math.pi/180.0)
                 obj._ra =  ra
                 obj._dec = dec
             elif(name.lower() == "radec"):
@@ -207,6 +183,17 @@ class ATAPositions:
             obj._ra = ra * math.pi/180.0 * 15.0
             obj._dec = dec * math.pi/180.0
             name = "%f,%f" % (ra, dec)
+        return obj, name
+
+    # Get the Az, El returned in decrees
+    # ra/dec options, ra in hours decimal, dec in degrees decimal
+    def getAzEl(self, d, name, ra=-99.0, dec=-99):
+
+        if(name == None and ra == -99 and dec == -99):
+            return None
+
+        self.observer.date = d
+        obj, name = self._getBody(name, ra, dec)
 
         obj.compute(self.observer)
         return { 'name' : name,
@@ -216,6 +203,167 @@ class ATAPositions:
 
         return None
 
+    def _refraction(self, alt):
+        """
+        Atmospheric refraction (radians) to add to the geometric
+        altitude alt (radians), scaled to the observer pressure
+        and temperature like pyephem does
+        """
+        h = np.maximum(np.degrees(alt), -1.0)
+        r = 1.02 / np.tan(np.radians(h + 10.3 / (h + 5.11))) / 60.0
+        r *= (self.observer.pressure / 1010.0) * (283.0 / (273.0 + self.observer.temp))
+        return np.where(np.degrees(alt) > -1.0, np.radians(r), 0.0)
+
+    def getAzElGrid(self, sources, d=None, minutes=1440, step=1.0):
+        """
+        Vectorized Az/El of many sources over a time grid.
+        The apparent ra/dec of fixed sources is computed once at d,
+        sun and moon are computed once per grid point; the Az/El of
+        all sources at all times is then done in one numpy pass.
+        Above the horizon within 0.01 degree of getAzEl() (the
+        refraction model differs from pyephem below the horizon)
+
+        Parameters
+        ------------
+        sources : list
+            source names (as in getAzEl) or (ra, dec) tuples,
+            ra in decimal hours and dec in decimal degrees
+        d : datetime
+            start of the grid. Default is now
+        minutes : float
+            length of the grid in minutes. Default is a day
+        step : float
+            grid step in minutes
+
+        Returns
+        ------------
+        dict
+            'minutes': (ntimes) offsets from d in minutes
+            'az', 'el': (nsources, ntimes) arrays in degrees
+        """
+        if(d == None):
+            d = dt.datetime.now()
+
+        offsets = np.arange(0, minutes, step, dtype=float)
+        self.observer.date = d
+        start = float(self.observer.date)
+        lst = float(self.observer.sidereal_time()) + \
+                offsets * 2 * math.pi * SIDEREAL_RATE / 1440.0
+
+        # apparent ra/dec of every source, either scalar or per time
+        ra = np.empty((len(sources), offsets.size))
+        dec = np.empty((len(sources), offsets.size))
+        fixed_azel = []
+        moving = {}
+        for i, s in enumerate(sources):
+            if isinstance(s, str) and s.lower() in ('sun', 'moon'):
+                key = s.lower()
+                if key not in moving:
+                    obj, name = self._getBody(key)
+                    radec = np.empty((2, offsets.size))
+                    for j, offset in enumerate(offsets):
+                        self.observer.date = start + offset / 1440.0
+                        obj.compute(self.observer)
+                        radec[:, j] = obj.ra, obj.dec
+                    self.observer.date = start
+                    moving[key] = radec
+                ra[i], dec[i] = moving[key]
+                continue
+            if isinstance(s, str) and s.lower() == 'goes-16':
+                fixed_azel.append(i)
+                ra[i] = dec[i] = 0.0
+                continue
+            if isinstance(s, str):
+                obj, name = self._getBody(s)
+            else:
+                obj, name = self._getBody(None, s[0], s[1])
+            if obj is None:
+                raise RuntimeError("unknown source {}".format(s))
+            obj.compute(self.observer)
+            ra[i] = obj.ra
+            dec[i] = obj.dec
+
+        lat = float(self.observer.lat)
+        ha = lst[np.newaxis, :] - ra
+        alt = np.arcsin(np.sin(lat) * np.sin(dec) + np.cos(lat) * np.cos(dec) * np.cos(ha))
+        az = np.arctan2(-np.cos(dec) * np.sin(ha),
+                np.sin(dec) * np.cos(lat) - np.cos(dec) * np.sin(lat) * np.cos(ha))
+        alt = alt + self._refraction(alt)
+
+        az = np.degrees(az) % 360.0
+        el = np.degrees(alt)
+        for i in fixed_azel:
+            az[i] = GOES16_AZ
+            el[i] = GOES16_EL
+
+        return { 'minutes' : offsets, 'az' : az, 'el' : el }
+
+    @staticmethod
+    def _angularDistanceGrid(az1, el1, az2, el2):
+        """
+        angular_distance() on arrays of Az/El in degrees
+        """
+        close = (np.abs(az1 - az2) < 1) & (np.abs(el1 - el2) < 1)
+        az1, el1, az2, el2 = map(np.radians, (az1, el1, az2, el2))
+        cosd = np.sin(el1) * np.sin(el2) + np.cos(el1) * np.cos(el2) * np.cos(az1 - az2)
+        return np.where(close, 0.0, np.degrees(np.arccos(np.clip(cosd, -1.0, 1.0))))
+
+    def getUpGrid(self, sources, d=None, minutes=1440, step=1.0):
+        """
+        Vectorized up/down state of many sources over a time grid.
+        A source is up when it is above MIN_ELEV and at least
+        MIN_MOON_SUN_DIST away from the sun and moon (same as
+        isUp() and angular_distance() checks used in this class).
+        See getAzElGrid for the parameters
+
+        Returns
+        ------------
+        dict
+            as getAzElGrid, with an additional 'up' (nsources, ntimes)
+            boolean array
+        """
+        sources = list(sources)
+        grid = self.getAzElGrid(sources + ['sun', 'moon'], d, minutes, step)
+        az = grid['az'][:-2]
+        el = grid['el'][:-2]
+        sun_angle = ATAPositions._angularDistanceGrid(az, el, grid['az'][-2], grid['el'][-2])
+        moon_angle = ATAPositions._angularDistanceGrid(az, el, grid['az'][-1], grid['el'][-1])
+
+        names = [s.lower() if isinstance(s, str) else None for s in sources]
+        is_moon = np.array([n == 'moon' for n in names])[:, np.newaxis]
+        # goes-16 is always above the horizon (see isUp), but like any
+        # other source it is not up close to the sun or moon
+        is_goes = np.array([n == 'goes-16' for n in names])[:, np.newaxis]
+
+        up = (is_goes | (el > MIN_ELEV)) & (sun_angle >= MIN_MOON_SUN_DIST) & \
+                (is_moon | (moon_angle >= MIN_MOON_SUN_DIST))
+
+        return { 'minutes' : grid['minutes'], 'az' : az, 'el' : el, 'up' : up }
+
+    def getUpIntervals(self, sources, d=None, minutes=1440, step=1.0):
+        """
+        Up intervals of many sources. See getUpGrid for parameters
+        and the definition of up.
+
+        Returns
+        ------------
+        list
+            for every source a list of (start, stop) tuples, in minutes
+            from d. The source is up for start <= t < stop
+        """
+        grid = self.getUpGrid(sources, d, minutes, step)
+        offsets = grid['minutes']
+        stop_grid = np.append(offsets, offsets[-1] + step) if offsets.size else offsets
+
+        intervals = []
+        for up in grid['up']:
+            edges = np.diff(np.concatenate(([0], up.astype(np.int8), [0])))
+            starts = np.flatnonzero(edges == 1)
+            stops = np.flatnonzero(edges == -1)
+            intervals.append([(float(stop_grid[a]), float(stop_grid[b]))
+                for a, b in zip(starts, stops)])
+        return intervals
+
     def isUp(self, name, d=None, ra=-99.0, dec=-99):
         
         #TODO: JK: I am very hesitant to leave it here
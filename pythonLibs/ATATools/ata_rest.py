@@ -1,4 +1,9 @@
+import concurrent.futures
+import threading
+
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 
 class ATARestException(Exception):
@@ -25,8 +30,54 @@ class ATARest:
     _OP_POST = 'post'
     _OP_DEL = 'delete'
 
+    # Connection pool / retry settings for the shared session.
+    # Retries only cover connection errors and gateway failures;
+    # POST is never replayed on a read error (see Retry defaults)
+    POOL_SIZE = 64
+    RETRIES = 3
+    RETRY_BACKOFF = 0.1
+    RETRY_STATUS = (502, 503, 504)
+
+    # default number of concurrent requests for the *_batch calls
+    BATCH_WORKERS = 16
+
     _debug = False
 
+    _session = None
+    _session_lock = threading.Lock()
+
+    @classmethod
+    def get_session(cls):
+        """
+        Return the shared requests.Session used for all REST calls,
+        creating it on first use. The session keeps connections alive
+        and retries failed connections a bounded number of times.
+        """
+        if cls._session is None:
+            with cls._session_lock:
+                if cls._session is None:
+                    retry = Retry(total=cls.RETRIES, backoff_factor=cls.RETRY_BACKOFF,
+                            status_forcelist=cls.RETRY_STATUS,
+                            raise_on_status=False)
+                    adapter = HTTPAdapter(pool_connections=1,
+                            pool_maxsize=cls.POOL_SIZE, max_retries=retry)
+                    session = requests.Session()
+                    session.mount('http://', adapter)
+                    session.mount('https://', adapter)
+                    cls._session = session
+        return cls._session
+
+    @classmethod
+    def close_session(cls):
+        """
+        Close the shared session and drop all pooled connections.
+        A new session is created on the next REST call.
+        """
+        with cls._session_lock:
+            if cls._session is not None:
+                cls._session.close()
+                cls._session = None
+
     @classmethod
     def form_url(cls, endpoint):
         if not endpoint.startswith('/'):
@@ -54,14 +105,15 @@ class ATARest:
             if cls._debug:
                 print(url)
 
+            session = cls.get_session()
             if op == cls._OP_GET:
-                response = requests.get(url, **kwargs)
+                response = session.get(url, **kwargs)
             elif op == cls._OP_PUT:
-                response = requests.put(url, **kwargs)
+                response = session.put(url, **kwargs)
             elif op == cls._OP_DEL:
-                response = requests.delete(url, **kwargs)
+                response = session.delete(url, **kwargs)
             elif op == cls._OP_POST:
-                response = requests.post(url, **kwargs)
+                response = session.post(url, **kwargs)
             else:
                 raise ATARestException('Bad op given to ATARest._do_op()')
 
@@ -137,7 +189,90 @@ class ATARest:
         :raises ATARestException on any error response
         """
         return cls._do_op(cls._OP_DEL, endpoint, **kwargs)
-    
+
+    @classmethod
+    def _do_batch(cls, op, endpoint_fmt, keys, key_kwargs=None,
+            max_workers=None, **kwargs):
+        """
+        Perform the same HTTP operation for several keys concurrently
+
+        :param op: HTTP operation to perform
+        :param endpoint_fmt: REST endpoint with a single {} placeholder
+            that is filled with each key, e.g. '/antenna/{}/pams'
+        :param keys: list of keys (usually antenna names)
+        :param key_kwargs: optional dict mapping key to additional
+            arguments for that key only (e.g. per-antenna json)
+        :param max_workers: number of concurrent requests,
+            default BATCH_WORKERS
+        :param kwargs: any additional arguments common to all calls
+
+        :returns dict mapping every key to the JSON response
+        :rtype dict
+
+        :raises ATARestException if any of the calls failed. All calls
+            are completed before raising
+        """
+        keys = list(keys)
+        if not keys:
+            return {}
+        if key_kwargs is None:
+            key_kwargs = {}
+        if max_workers is None:
+            max_workers = cls.BATCH_WORKERS
+        max_workers = max(1, min(max_workers, len(keys)))
+
+        def one_call(key):
+            call_kwargs = dict(kwargs)
+            call_kwargs.update(key_kwargs.get(key, {}))
+            return cls._do_op(op, endpoint_fmt.format(key), **call_kwargs)
+
+        retdict = {}
+        errors = []
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {executor.submit(one_call, key): key for key in keys}
+            for future in concurrent.futures.as_completed(futures):
+                key = futures[future]
+                try:
+                    retdict[key] = future.result()
+                except ATARestException as e:
+                    errors.append('{:s}: {:s}'.format(str(key), str(e)))
+
+        if errors:
+            raise ATARestException('; '.join(sorted(errors)))
+        return retdict
+
+    @classmethod
+    def get_batch(cls, endpoint_fmt, keys, **kwargs):
+        """
+        Concurrent HTTP GET of endpoint_fmt.format(key) for every key
+
+        :param endpoint_fmt: REST endpoint with a {} placeholder
+        :param keys: list of keys (usually antenna names)
+        :param kwargs: see _do_batch
+
+        :returns dict mapping key to the JSON response
+        :rtype dict
+
+        :raises ATARestException on any error response
+        """
+        return cls._do_batch(cls._OP_GET, endpoint_fmt, keys, **kwargs)
+
+    @classmethod
+    def put_batch(cls, endpoint_fmt, keys, **kwargs):
+        """
+        Concurrent HTTP PUT of endpoint_fmt.format(key) for every key
+
+        :param endpoint_fmt: REST endpoint with a {} placeholder
+        :param keys: list of keys (usually antenna names)
+        :param kwargs: see _do_batch
+
+        :returns dict mapping key to the JSON response
+        :rtype dict
+
+        :raises ATARestException on any error response
+        """
+        return cls._do_batch(cls._OP_PUT, endpoint_fmt, keys, **kwargs)
+
 
 if __name__ == '__main__':
     print(ATARest.get('/antennas/1a/pams'))
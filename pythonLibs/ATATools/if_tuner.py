@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Closed-loop tuning of the IF attenuators to a target ADC RMS, for all
+inputs (antenna, LO, polarisation) at once.
+
+Each iteration sets the new attenuations on all the attenuator groups
+(gain modules) concurrently, then reads the ADC RMS of all the boards
+concurrently. The next attenuation of an input is predicted from a
+linear model of the ADC power [dB] vs attenuation [dB], whose slope is
+fitted from the previous iterations of that input (ideally -1 dB/dB).
+An input stops as soon as it is within tolerance or the model does not
+predict a different attenuator setting, so the loops stop independently.
+An input stopped by the model outside of the tolerance is reported as
+not converged
+
+Created Oct 2026
+"""
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from ATATools import logger_defaults
+
+MAX_ATT = 31.5
+MIN_ATT = 0.0
+ATT_STEP = 0.5
+
+TOL_DB = 0.25 # half an attenuator step
+MAX_ITER = 6
+# bounds of the fitted dB of power per dB of attenuation
+MIN_SLOPE = 0.5
+MAX_SLOPE = 2.0
+# inputs further than this from the target are read with 1 ADC cycle
+COARSE_DB = 3.0
+
+NTHREADS = 16
+
+
+def _round_step(attn):
+    return np.round(np.asarray(attn, dtype=float)/ATT_STEP)*ATT_STEP
+
+
+def _run_groups(executor, func, groups):
+    """
+    Calls func(group, *args) for all the (group, args) items of groups
+    concurrently and returns {group: result}
+    """
+    futures = {group: executor.submit(func, group, *args)
+            for group, args in groups.items()}
+    return {group: future.result() for group, future in futures.items()}
+
+
+def _set_groups(executor, set_attn, att_groups, attn):
+    """
+    Sets the attenuations {input: attenuation} of attn, one call of
+    set_attn per attenuator group
+    """
+    _run_groups(executor, set_attn, {group:
+        ([inp for inp in group_inputs if inp in attn],
+            [attn[inp] for inp in group_inputs if inp in attn])
+        for group, group_inputs in att_groups.items()
+        if any(inp in attn for inp in group_inputs)})
+
+
+def tune(att_groups, adc_groups, set_attn, read_rms, target_rms,
+        init_att, adc_cycles, tol_db=TOL_DB, max_iter=MAX_ITER,
+        nthreads=NTHREADS):
+    """
+    Tunes the attenuation of inputs so that their ADC RMS reach targets
+
+    Parameters
+    ----------
+    att_groups : dict
+        {attenuator group: list of inputs}, e.g. the inputs of each
+        gain module. set_attn is called concurrently for different groups
+
+    adc_groups : dict
+        {ADC group: list of inputs}, e.g. the inputs of each board.
+        read_rms is called concurrently for different groups
+
+    set_attn : callable
+        set_attn(att_group, inputs, attens) sets the attenuations [dB]
+        of a list of inputs of an attenuator group
+
+    read_rms : callable
+        read_rms(adc_group, inputs, ncycles) returns the ADC RMS of a
+        list of inputs of an ADC group, read over ncycles cycles
+
+    target_rms : dict
+        {input: desired RMS}
+
+    init_att : float or dict
+        initial attenuation, or {input: initial attenuation}
+
+    adc_cycles : int
+        ADC cycles read for the fine iterations (within COARSE_DB of
+        the target), the coarse ones read 1 cycle
+
+    tol_db : float
+        an input within tol_db of its target is tuned
+
+    max_iter : int
+        maximum number of ADC reads per input
+
+    nthreads : int
+        number of threads setting attenuators and reading ADCs
+
+    Returns
+    -------
+    report : Pandas DataFrame
+        indexed by input, with the columns attn, rms, target_rms,
+        error_db, iterations, time (wall time [s] until the input was
+        tuned) and status ('tuned' if within tol_db, 'limit' if the
+        attenuator range was not enough, 'not converged' if the model
+        expects no better setting outside of tol_db, 'max_iter' if still
+        tuning after max_iter reads)
+    """
+    logger = logger_defaults.getModuleLogger(__name__)
+
+    inputs = [inp for group in att_groups.values() for inp in group]
+    assert len(inputs) == len(set(inputs)), "inputs in several attenuator groups"
+    assert set(inputs) == set([inp for group in adc_groups.values() for inp in group]),\
+            "attenuator and ADC groups have different inputs"
+
+    if not isinstance(init_att, dict):
+        init_att = {inp: init_att for inp in inputs}
+    attn = {inp: float(np.clip(_round_step(init_att[inp]), MIN_ATT, MAX_ATT))
+            for inp in inputs}
+
+    report = pd.DataFrame(index=pd.Index(inputs, name='input'))
+    report['attn'] = [attn[inp] for inp in inputs]
+    report['rms'] = np.nan
+    report['target_rms'] = [float(target_rms[inp]) for inp in inputs]
+    report['error_db'] = np.nan
+    report['iterations'] = 0
+    report['time'] = np.nan
+    report['status'] = 'max_iter'
+
+    prev = {} # input: (attn, power dB) of the previous read
+    slope = {inp: 1.0 for inp in inputs}
+    error_db = {inp: np.inf for inp in inputs}
+    to_set = dict(attn)
+    t_start = time.time()
+
+    with ThreadPoolExecutor(max_workers=nthreads) as executor:
+        for iteration in range(max_iter):
+            if not to_set:
+                break
+            active = set(to_set)
+            _set_groups(executor, set_attn, att_groups, to_set)
+
+            reads = {}
+            for group, group_inputs in adc_groups.items():
+                group_active = [inp for inp in group_inputs if inp in active]
+                if not group_active:
+                    continue
+                fine = all(abs(error_db[inp]) < COARSE_DB for inp in group_active)
+                reads[group] = (group_active, adc_cycles if fine else 1)
+            rms_groups = _run_groups(executor, read_rms, reads)
+            t_read = time.time() - t_start
+
+            to_set = {}
+            for group, (group_active, ncycles) in reads.items():
+                for inp, rms in zip(group_active, rms_groups[group]):
+                    power_db = 20*np.log10(max(float(rms), 1e-6))
+                    error_db[inp] = power_db - 20*np.log10(target_rms[inp])
+
+                    # fit the slope of the model from the last step
+                    if inp in prev and prev[inp][0] != attn[inp]:
+                        fitted = (prev[inp][1] - power_db)/(attn[inp] - prev[inp][0])
+                        slope[inp] = float(np.clip(fitted, MIN_SLOPE, MAX_SLOPE))
+                    prev[inp] = (attn[inp], power_db)
+
+                    report.loc[inp, ['rms', 'error_db']] = [float(rms), error_db[inp]]
+                    report.loc[inp, 'iterations'] = iteration + 1
+                    report.loc[inp, 'time'] = t_read
+
+                    new_attn = float(np.clip(_round_step(attn[inp] + error_db[inp]/slope[inp]),
+                        MIN_ATT, MAX_ATT))
+                    if abs(error_db[inp]) <= tol_db:
+                        report.loc[inp, 'status'] = 'tuned'
+                    elif new_attn == attn[inp]:
+                        # the model does not expect a better setting
+                        at_limit = attn[inp] in (MIN_ATT, MAX_ATT)
+                        report.loc[inp, 'status'] = 'limit' if at_limit else 'not converged'
+                    else:
+                        to_set[inp] = new_attn
+                        attn[inp] = new_attn
+                        report.loc[inp, 'attn'] = new_attn
+
+        # the last settings are applied without being read back
+        if to_set:
+            _set_groups(executor, set_attn, att_groups, to_set)
+
+    for inp in to_set:
+        logger.warning("IF tuning of %s did not converge in %i iterations"
+                %(inp, max_iter))
+    for inp in report.index[report.status == 'not converged']:
+        logger.warning("IF tuning of %s stopped at attenuation %.1f, "
+                "%.1f dB from target" %(inp, attn[inp], error_db[inp]))
+    for inp in report.index[report.status == 'limit']:
+        logger.warning("IF tuning of %s stopped at attenuation limit %.1f, "
+                "%.1f dB from target" %(inp, attn[inp], error_db[inp]))
+    logger.info("IF tuning of %i inputs took %.2f s:\n%s"
+            %(len(inputs), time.time() - t_start, report))
+    return report
@@ -9,10 +9,158 @@ Created Jan 2020
 @author: jkulpa
 """
 
+import os
+import queue
+import threading
+from contextlib import contextmanager
+
 from ATATools import logger_defaults,ata_control
 from . import obs_common
 from ATAdb.connect import *
 
+DB_NAME = 'obs'
+POOL_SIZE = 4
+
+class ConnectionPool(object):
+    """
+    A pool of open database connections, reused between the obs_db calls
+    instead of connecting to the database for every statement
+
+    Parameters
+    -------------
+    connect : callable
+        returns a new DB-API connection, e.g. lambda: connect_to_db('obs')
+    size : int
+        maximal number of idle connections kept open. 0 closes every connection after use
+    """
+
+    def __init__(self, connect, size=POOL_SIZE):
+        self.connect = connect
+        self.size = size
+        self.pid = os.getpid()
+        self.nconnects = 0
+        self._idle = queue.LifoQueue()
+
+    def get(self):
+        """
+        returns an idle connection, or a new one if none is left (or alive)
+        """
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                self.nconnects += 1
+                return self.connect()
+            is_connected = getattr(conn, 'is_connected', None)
+            if is_connected is None or is_connected():
+                return conn
+            _close_quietly(conn)
+
+    def put(self, conn):
+        """
+        returns a connection to the pool, closing it if the pool is full
+        """
+        if self._idle.qsize() < self.size:
+            self._idle.put_nowait(conn)
+        else:
+            _close_quietly(conn)
+
+    def close(self):
+        """
+        closes all idle connections
+        """
+        while True:
+            try:
+                _close_quietly(self._idle.get_nowait())
+            except queue.Empty:
+                return
+
+def _close_quietly(conn):
+    try:
+        conn.close()
+    except Exception:
+        pass
+
+_pool = None
+_pool_lock = threading.Lock()
+_local = threading.local()
+
+def getConnectionPool():
+    """
+    Returns the connection pool of the obs database, creating it on first use.
+    A pool inherited from a parent process is dropped (not closed) and a new one created
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None or _pool.pid != os.getpid():
+            _pool = ConnectionPool(lambda: connect_to_db(DB_NAME))
+        return _pool
+
+def setConnectionPool(pool):
+    """
+    Replaces the connection pool, e.g. to change its size or to connect to
+    another database. The previous pool is closed
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is not None and _pool.pid == os.getpid():
+            _pool.close()
+        _pool = pool
+
+def closeConnectionPool():
+    """
+    Closes the idle connections of the pool
+    """
+    setConnectionPool(None)
+
+@contextmanager
+def transaction():
+    """
+    Groups the statements of all obs_db calls made inside the block in a single
+    transaction on one pooled connection, committed when the block ends and
+    rolled back if it raises. Nested blocks join the outer transaction.
+    e.g.:
+        with obs_db.transaction():
+            recids = obs_db.initRecordings(freqs,obstype,backend,desc,observer,setid)
+            obs_db.initAntennasTable(recids,antlist,sources)
+
+    Yields
+    -------------
+    the DB-API connection
+    """
+    conn = getattr(_local, 'conn', None)
+    if conn is not None:
+        yield conn
+        return
+
+    pool = getConnectionPool()
+    conn = pool.get()
+    _local.conn = conn
+    try:
+        yield conn
+        conn.commit()
+    except:
+        _local.conn = None
+        try:
+            conn.rollback()
+        except Exception:
+            # the connection is unusable, do not return it to the pool
+            _close_quietly(conn)
+            raise
+        pool.put(conn)
+        raise
+    _local.conn = None
+    pool.put(conn)
+
+@contextmanager
+def _cursor():
+    with transaction() as conn:
+        mycursor = conn.cursor()
+        try:
+            yield mycursor
+        finally:
+            mycursor.close()
+
 def getNewObsSetID(description="n/a"):
     """
     Get new unique observation set ID
@@ -31,22 +179,16 @@ def getNewObsSetID(description="n/a"):
 
     logger= logger_defaults.getModuleLogger(__name__)
 
-    mydb = ATAdb.connect_to_db('obs')
-    mycursor = mydb.cursor()
-
     insertcmd = ("insert into obs_sets set description=%(des)s")
     dict1 = {'des': description}
 
     logger.info("adding description {0!s}".format(description))
-    
-    mycursor.execute(insertcmd,dict1)
-    mydb.commit()
-    myid = mycursor.lastrowid
 
-    logger.info("got id {}".format(myid))
+    with _cursor() as mycursor:
+        mycursor.execute(insertcmd,dict1)
+        myid = mycursor.lastrowid
 
-    mycursor.close()
-    mydb.close()
+    logger.info("got id {}".format(myid))
 
     return myid
 
@@ -65,15 +207,13 @@ def getLatestSetID(obstype=None):
     else:
         dict1 = {}
         insertcmd = ("select setid from recordings where status='OK' order by setid desc limit 1")
-        linfo = ("fetching latest setid") 
-
-    mydb = ATAdb.connect_to_db('obs')
-    mycursor = mydb.cursor()
+        linfo = ("fetching latest setid")
 
     logger.info(linfo)
-    
-    mycursor.execute(insertcmd,dict1)
-    row = mycursor.fetchone()
+
+    with _cursor() as mycursor:
+        mycursor.execute(insertcmd,dict1)
+        row = mycursor.fetchone()
     if not row:
         logger.error("No matching recordings found")
         raise KeyError("No matching recordings found")
@@ -82,20 +222,19 @@ def getLatestSetID(obstype=None):
     setid = row[0]
     logger.info("SET {} is the latest found".format(setid))
 
-    mycursor.close()
-    mydb.close()
-
     return setid
 
 def initAntennasTable(recid,antlist,sources,azs=0.0,els=0.0, getpams=True):
     """
     Populates the antenna table with sources, azimuths and elevations, and by default with pam values
+    All rows are inserted with a single executemany, in one transaction
 
 
     Parameters
     -------------
-    recid : int
-        recording id
+    recid : int or int list
+        recording id, or list of recording ids (e.g. one per frequency, see initRecordings)
+        to populate with the same antennas
     antlist : str list
         list of antennas, short names, ie ['1a','2b']
     sources : str list or str
@@ -120,17 +259,17 @@ def initAntennasTable(recid,antlist,sources,azs=0.0,els=0.0, getpams=True):
     if not isinstance(els,list):
         els = [els] * nants;
 
-    
-    logger= logger_defaults.getModuleLogger(__name__)
+    if not isinstance(recid,list):
+        recid = [recid]
 
-    mydb = ATAdb.connect_to_db('obs')
-    mycursor = mydb.cursor()
 
-    insertcmdpams = ("insert into rec_ants set id=%(id)s, ant=%(ant)s, az=%(az)s, el=%(el)s, "
-                     "source=%(src)s, pamx=%(pamx)s, pamy=%(pamy)s, pamdetx=%(pamdetx)s, pamdety=%(pamdety)s")
+    logger= logger_defaults.getModuleLogger(__name__)
+
+    insertcmdpams = ("insert into rec_ants (id, ant, az, el, source, pamx, pamy, pamdetx, pamdety) "
+                     "values (%(id)s, %(ant)s, %(az)s, %(el)s, %(src)s, %(pamx)s, %(pamy)s, %(pamdetx)s, %(pamdety)s)")
 
-    insertcmdnopams = ("insert into rec_ants set id=%(id)s, ant=%(ant)s, az=%(az)s, el=%(el)s, "
-                     "source=%(src)s")
+    insertcmdnopams = ("insert into rec_ants (id, ant, az, el, source) "
+                     "values (%(id)s, %(ant)s, %(az)s, %(el)s, %(src)s)")
 
     if getpams:
         try:
@@ -141,26 +280,23 @@ def initAntennasTable(recid,antlist,sources,azs=0.0,els=0.0, getpams=True):
             logger.exception("unable to get pams, ignoring flag")
             getpams = False
 
-    #this is not the cleanest way. Probably the itertools.izip should be used
-    for x in range(nants):
-        cant = antlist[x]
-        dict1 = {'id': recid, 'ant': cant, 'az': azs[x], 'el': els[x], 'src': sources[x]}
-        if getpams:
-            insertcmd = insertcmdpams
-            dict1['pamx'] = pamvals['ant' + cant + 'x']
-            dict1['pamy'] = pamvals['ant' + cant + 'y']
-            dict1['pamdetx'] = detvals['ant' + cant + 'x']
-            dict1['pamdety'] = detvals['ant' + cant + 'y']
-        else:
-            insertcmd = insertcmdnopams
+    rows = []
+    for crecid in recid:
+        for cant,az,el,src in zip(antlist,azs,els,sources):
+            dict1 = {'id': crecid, 'ant': cant, 'az': az, 'el': el, 'src': src}
+            if getpams:
+                dict1['pamx'] = pamvals['ant' + cant + 'x']
+                dict1['pamy'] = pamvals['ant' + cant + 'y']
+                dict1['pamdetx'] = detvals['ant' + cant + 'x']
+                dict1['pamdety'] = detvals['ant' + cant + 'y']
+            rows.append(dict1)
 
-        logger.info("commiting for ant {}".format(cant))
-        mycursor.execute(insertcmd,dict1)
-        mydb.commit()
+    insertcmd = insertcmdpams if getpams else insertcmdnopams
+
+    logger.info("commiting {} rows for ants {}".format(len(rows), ", ".join(antlist)))
+    with _cursor() as mycursor:
+        mycursor.executemany(insertcmd,rows)
 
-    mycursor.close()
-    mydb.close()
-    
 
 
 def initRecording(frequency,obstype,obsbackend,description,observer="unknown",setid=None):
@@ -193,29 +329,60 @@ def initRecording(frequency,obstype,obsbackend,description,observer="unknown",se
 
     """
 
-    logger= logger_defaults.getModuleLogger(__name__)
+    return initRecordings([frequency],obstype,obsbackend,description,observer,setid)[0]
+
+def initRecordings(frequencies,obstype,obsbackend,description,observer="unknown",setid=None):
+    """
+    Crates a new recording entry per frequency, in one transaction, and retruns the new recording ids
+
+    Parameters
+    -------------
+    frequencies: float list
+        center frequencies
+    obstype : str
+        type of the recordings. see obs_common.getRecType
+    obsbackend : str
+        backend of the recordings. see obs_common.getRecBackend
+    description : str
+        observation description
+    observer : str
+        observer description. default unknown
+    setid : int
+        id of observation set. If observation does not belong to a set, leave None. default None
+
+    Returns
+    -------------
+    int list
+        recording ids, in the order of frequencies
+
+    Raises
+    -------------
+    KeyError
+
+    """
 
-    mydb = ATAdb.connect_to_db('obs')
-    mycursor = mydb.cursor()
+    logger= logger_defaults.getModuleLogger(__name__)
 
     if setid:
         insertcmd = ("insert into recordings set freq=%(freq)s, type=%(obstype)s, backend=%(obsbackend)s, observer=%(observer)s, description=%(desc)s, setid=%(setid)s")
-        dict1 = {'freq': frequency, 'obstype' : obs_common.getRecType(obstype), 'obsbackend' : obs_common.getRecBackend(obsbackend), 'observer' : observer, 'desc' : description, 'setid' : setid}
+        dict1 = {'obstype' : obs_common.getRecType(obstype), 'obsbackend' : obs_common.getRecBackend(obsbackend), 'observer' : observer, 'desc' : description, 'setid' : setid}
     else:
         insertcmd = ("insert into recordings set freq=%(freq)s, type=%(obstype)s, backend=%(obsbackend)s, observer=%(observer)s, description=%(desc)s")
-        dict1 = {'freq': frequency, 'obstype' : obs_common.getRecType(obstype), 'obsbackend' : obs_common.getRecBackend(obsbackend), 'observer' : observer, 'desc' : description}
-
-    logger.info("adding new observation {}".format( str(dict1) ))
-    mycursor.execute(insertcmd,dict1)
-    mydb.commit()
-    myid = mycursor.lastrowid
+        dict1 = {'obstype' : obs_common.getRecType(obstype), 'obsbackend' : obs_common.getRecBackend(obsbackend), 'observer' : observer, 'desc' : description}
 
-    logger.info("got id {}".format(myid))
+    myids = []
+    # one execute per row, as lastrowid is needed for each recording, but
+    # on the same connection and committed once
+    with _cursor() as mycursor:
+        for frequency in frequencies:
+            dict1['freq'] = frequency
+            logger.info("adding new observation {}".format( str(dict1) ))
+            mycursor.execute(insertcmd,dict1)
+            myids.append(mycursor.lastrowid)
 
-    mycursor.close()
-    mydb.close()
+    logger.info("got ids {}".format(", ".join(map(str,myids))))
 
-    return myid
+    return myids
 
 def startRecording(obsid, mydate=None):
     """
@@ -227,9 +394,6 @@ def startRecording(obsid, mydate=None):
     """
     logger= logger_defaults.getModuleLogger(__name__)
 
-    mydb = ATAdb.connect_to_db('obs')
-    mycursor = mydb.cursor()
-    
     if mydate:
         insertcmd = ("update recordings set tstart=%(strttime)s, status='STARTED' where id=%(id)s")
         dict1 = {'id': obsid, 'strttime': mydate.strftime('%Y-%m-%d %H:%M:%S')}
@@ -238,11 +402,8 @@ def startRecording(obsid, mydate=None):
         dict1 = {'id': obsid}
 
     logger.info("updating start time of the recording")
-    mycursor.execute(insertcmd,dict1)
-    mydb.commit()
-
-    mycursor.close()
-    mydb.close()
+    with _cursor() as mycursor:
+        mycursor.execute(insertcmd,dict1)
 
 
 def stopRecording(obsid):
@@ -251,22 +412,16 @@ def stopRecording(obsid):
     """
     logger= logger_defaults.getModuleLogger(__name__)
 
-    mydb = ATAdb.connect_to_db('obs')
-    mycursor = mydb.cursor()
-    
     insertcmd = ("update recordings set tstop=now(), status='STOPPED' where id=%(id)s")
     dict1 = {'id': obsid}
 
     logger.info("updating stop time of the recording")
-    mycursor.execute(insertcmd,dict1)
-    mydb.commit()
-
-    mycursor.close()
-    mydb.close()
+    with _cursor() as mycursor:
+        mycursor.execute(insertcmd,dict1)
 
 def markRecordingsBAD(obsid_list):
     """
-    mark recordings as bad. 
+    mark recordings as bad.
     """
 
     logger= logger_defaults.getModuleLogger(__name__)
@@ -277,25 +432,19 @@ def markRecordingsBAD(obsid_list):
     if not isinstance(obsid_list,list) and len(obsid_list) == 1:
         obsid_list = [obsid_list]
 
-    mydb = ATAdb.connect_to_db('obs')
-    mycursor = mydb.cursor()
-
     insertcmd_part = ("update recordings set status='BAD' where id in (%s)")
     #in_p=', '.join(map(lambda x: '%s', obsid_list))
     in_p=', '.join(['%s'] * len(obsid_list))
     insertcmd = insertcmd_part % in_p;
-    
+
     logger.info("changing status of recordings {} to BAD".format(', '.join(map(str,obsid_list))))
 
-    mycursor.execute(insertcmd,obsid_list)
-    mydb.commit()
-    
-    mycursor.close()
-    mydb.close()
+    with _cursor() as mycursor:
+        mycursor.execute(insertcmd,obsid_list)
 
 def markRecordingsOK(obsid_list):
     """
-    mark recordings as ok. 
+    mark recordings as ok.
     """
     logger= logger_defaults.getModuleLogger(__name__)
     if not obsid_list:
@@ -306,21 +455,15 @@ def markRecordingsOK(obsid_list):
         obsid_list = [obsid_list]
 
 
-    mydb = ATAdb.connect_to_db('obs')
-    mycursor = mydb.cursor()
-
     insertcmd_part = ("update recordings set status='OK' where id in (%s)")
     #in_p=', '.join(map(lambda x: '%s', obsid_list))
     in_p=', '.join(['%s'] * len(obsid_list))
     insertcmd = insertcmd_part % in_p;
-    
+
     logger.info("changing status of recordings {} to OK".format(', '.join(map(str,obsid_list))))
 
-    mycursor.execute(insertcmd,obsid_list)
-    mydb.commit()
-    
-    mycursor.close()
-    mydb.close()
+    with _cursor() as mycursor:
+        mycursor.execute(insertcmd,obsid_list)
 
 def getSetData(setid):
     """
@@ -329,7 +472,7 @@ def getSetData(setid):
     Parameters
     -------------
         setid : int
-            
+
 
     Returns
     -------------
@@ -346,16 +489,14 @@ def getSetData(setid):
 
     logger= logger_defaults.getModuleLogger(__name__)
 
-    mydb = ATAdb.connect_to_db('obs')
-    mycursor = mydb.cursor()
-
     insertcmd = ("select ts,description from obs_sets where id=%(myid)s")
     dict1 = {'myid': setid}
 
     logger.info("fetching info from set {}".format(setid))
-    
-    mycursor.execute(insertcmd,dict1)
-    row = mycursor.fetchone()
+
+    with _cursor() as mycursor:
+        mycursor.execute(insertcmd,dict1)
+        row = mycursor.fetchone()
     if not row:
         logger.error("Key {} not found in database".format(setid))
         raise KeyError("ID not found in the database")
@@ -364,15 +505,12 @@ def getSetData(setid):
     ts = row[0]
     logger.info("SET {}: at {} ( {} )".format(setid,ts,descr))
 
-    mycursor.close()
-    mydb.close()
-
     return ts,descr
 
 def updateAttenRMSVals(cobsid,attendict):
     """
     update the antennas information with a given dictionary
-    dictionary example: 
+    dictionary example:
     { '1a': {'attenx': 17, 'rmsy': 0.3544, 'rmsx': 12.2489, 'atteny': 0},
       '2a': {'attenx': 30, 'rmsy': 0.3846, 'rmsx': 26.9986, 'atteny': 0}   }
 
@@ -380,27 +518,22 @@ def updateAttenRMSVals(cobsid,attendict):
 
     logger= logger_defaults.getModuleLogger(__name__)
 
-    mydb = ATAdb.connect_to_db('obs')
-    mycursor = mydb.cursor()
-
     insertcmd = ("update rec_ants set dsp_atten_x=%(attenx)s, dsp_atten_y=%(atteny)s, "
             "dsp_rms_x=%(rmsx)s, dsp_rms_y=%(rmsy)s where ant=%(ant)s and id=%(id)s")
 
+    rows = []
     for ant in attendict.keys():
         cdict = attendict[ant].copy()
-        logger.info("updating attenuators/rms row for ant {} and recording id {}".format(ant,cobsid))
         cdict['ant'] = ant
         cdict['id']=cobsid
-        mycursor.execute(insertcmd,cdict)
-        mydb.commit()
-
-    mycursor.close()
-    mydb.close()
+        rows.append(cdict)
+    logger.info("updating attenuators/rms rows for ants {} and recording id {}".format(", ".join(attendict.keys()),cobsid))
+    _executemany(insertcmd,rows)
 
 def updateAttenVals(cobsid,attendict):
     """
     update the antennas information with a given dictionary
-    dictionary example: 
+    dictionary example:
     { '1a': {'attenx': 17, 'atteny': 0},
       '2a': {'attenx': 30, 'atteny': 0}   }
 
@@ -408,24 +541,17 @@ def updateAttenVals(cobsid,attendict):
 
     logger= logger_defaults.getModuleLogger(__name__)
 
-    mydb = ATAdb.connect_to_db('obs')
-    mycursor = mydb.cursor()
-
     insertcmd = ("update rec_ants set dsp_atten_x=%(attenx)s, dsp_atten_y=%(atteny)s where ant=%(ant)s and id=%(id)s")
 
-    for ant in attendict.keys():
-        cdict = {'ant' : ant, 'id':cobsid, 'attenx': attendict[ant]['attenx'], 'atteny': attendict[ant]['atteny']}
-        logger.info("updating attenuators row for ant {} and recording id {}".format(ant,cobsid))
-        mycursor.execute(insertcmd,cdict)
-        mydb.commit()
-
-    mycursor.close()
-    mydb.close()
+    rows = [{'ant' : ant, 'id':cobsid, 'attenx': attendict[ant]['attenx'], 'atteny': attendict[ant]['atteny']}
+            for ant in attendict.keys()]
+    logger.info("updating attenuators rows for ants {} and recording id {}".format(", ".join(attendict.keys()),cobsid))
+    _executemany(insertcmd,rows)
 
 def updateRMSVals(cobsid,attendict):
     """
     update the antennas information with a given dictionary
-    dictionary example: 
+    dictionary example:
     { '1a': {'rmsy': 0.3544, 'rmsx': 12.2489},
       '2a': {'rmsy': 0.3846, 'rmsx': 26.9986}   }
 
@@ -433,19 +559,18 @@ def updateRMSVals(cobsid,attendict):
 
     logger= logger_defaults.getModuleLogger(__name__)
 
-    mydb = ATAdb.connect_to_db('obs')
-    mycursor = mydb.cursor()
-
     insertcmd = ("update rec_ants set dsp_rms_x=%(rmsx)s, dsp_rms_y=%(rmsy)s where ant=%(ant)s and id=%(id)s")
 
-    for ant in attendict.keys():
-        cdict = {'ant' : ant, 'id':cobsid, 'rmsx': attendict[ant]['rmsx'], 'rmsy': attendict[ant]['rmsy']}
-        logger.info("updating rms row for ant {} and recording id {}".format(ant,cobsid))
-        mycursor.execute(insertcmd,cdict)
-        mydb.commit()
+    rows = [{'ant' : ant, 'id':cobsid, 'rmsx': attendict[ant]['rmsx'], 'rmsy': attendict[ant]['rmsy']}
+            for ant in attendict.keys()]
+    logger.info("updating rms rows for ants {} and recording id {}".format(", ".join(attendict.keys()),cobsid))
+    _executemany(insertcmd,rows)
 
-    mycursor.close()
-    mydb.close()
+def _executemany(insertcmd,rows):
+    if not rows:
+        return
+    with _cursor() as mycursor:
+        mycursor.executemany(insertcmd,rows)
 
 def getAntRecordings(obs_set_id):
     """
@@ -458,9 +583,6 @@ def getAntRecordings(obs_set_id):
         logger.error("no obsid provided")
         raise RuntimeError("no obsid provided")
 
-    mydb = ATAdb.connect_to_db('obs')
-    mycursor = mydb.cursor()
-
     insertcmd = ("select recordings.id, recordings.setid, recordings.tstart, recordings.tstop, "
                 "recordings.freq, recordings.type, recordings.description, rec_ants.ant, "
                 "rec_ants.az, rec_ants.el, rec_ants.source "
@@ -471,16 +593,15 @@ def getAntRecordings(obs_set_id):
     dict1 = {'id': obs_set_id}
 
     logger.info("fetching ant/recordings from set {}".format(obs_set_id))
-    
-    mycursor.execute(insertcmd,dict1)
-    rows = mycursor.fetchall()
-    
+
+    with _cursor() as mycursor:
+        mycursor.execute(insertcmd,dict1)
+        rows = mycursor.fetchall()
+
     retList = []
 
     if not rows:
         logger.warning("no recordings found")
-        mycursor.close()
-        mydb.close()
         return retList
 
     logger.info("found {} recordings".format(len(rows)))
@@ -490,8 +611,4 @@ def getAntRecordings(obs_set_id):
             'desc':row[6],'tstart':row[2],'tstop':row[3],'type':row[5],'source':row[10],'az':row[8],'el':row[9]}
         retList.append(cdict)
 
-    mycursor.close()
-    mydb.close()
-
     return retList
-
@@ -12,14 +12,15 @@ Created Feb 2020
 from ATATools import logger_defaults
 from . import obs_common
 import pyuvdata
+import gc
 import glob
 import os
 import numpy
 
-def getUVData(directory,datdictionary):
+def getUVFileName(directory,datdictionary):
     '''
     searches the directory for a file that matches file pattern (recid and ant from datdictionary)
-    returns pyuvdata object
+    returns the file name
     '''
     logger = logger_defaults.getModuleLogger(__name__)
 
@@ -32,13 +33,56 @@ def getUVData(directory,datdictionary):
         logger.error('there is not exactly 1 file matching the pattern. Got {}'.format(fnamelist))
         raise RuntimeError('not 1 filename matching the patter')
 
-    fname = fnamelist[0]
+    return fnamelist[0]
+
+def getUVData(directory,datdictionary):
+    '''
+    searches the directory for a file that matches file pattern (recid and ant from datdictionary)
+    returns pyuvdata object
+    '''
+    fname = getUVFileName(directory,datdictionary)
 
     UV = pyuvdata.UVData()
     UV.read_uvh5(fname)
 
     return UV
 
+def getUVDataHeader(directory,datdictionary):
+    '''
+    as getUVData, but only the metadata are read (no data, flag and nsample arrays)
+    '''
+    fname = getUVFileName(directory,datdictionary)
+
+    UV = pyuvdata.UVData()
+    UV.read_uvh5(fname,read_data=False)
+
+    return UV
+
+def getUVDataChunks(directory,datdictionary,ntimes=None):
+    '''
+    as getUVData, but the file is read in chunks of ntimes integrations (partial reads)
+    returns the pyuvdata object with the metadata only and a generator of pyuvdata
+    objects, one per chunk. If ntimes is None, the whole file is one chunk
+    '''
+    fname = getUVFileName(directory,datdictionary)
+
+    header = pyuvdata.UVData()
+    header.read_uvh5(fname,read_data=False)
+
+    return header,_readUVChunks(fname,numpy.unique(header.time_array),ntimes)
+
+def _readUVChunks(fname,times,ntimes):
+    if not ntimes:
+        ntimes = len(times)
+    for ii in range(0,len(times),ntimes):
+        UV = pyuvdata.UVData()
+        UV.read_uvh5(fname,times=times[ii:ii+ntimes])
+        yield UV
+        #a UVData holds reference cycles, so the previous chunks would only be
+        #freed by a full garbage collection, the young generations are collected
+        del UV
+        gc.collect(1)
+
 def checkIfWaterfall(dat,freq=None,ant=None):
     #is the data format right
     if not isinstance(dat,pyuvdata.uvdata.UVData):
@@ -46,10 +90,15 @@ def checkIfWaterfall(dat,freq=None,ant=None):
     #data from only 1 antenna, all indexes equal and all uvw == 0
     cc = dat.Nants_data == 1 and all(dat.ant_1_array == dat.ant_2_array ) and not numpy.any(dat.uvw_array)
     if freq:
-        cc = cc and dat.freq_array[0,0] <= freq and dat.freq_array[0,-1] >= freq 
+        #(1,Nfreqs) before pyuvdata 3.0, (Nfreqs,) since
+        freqs = numpy.ravel(dat.freq_array)
+        cc = cc and freqs[0] <= freq and freqs[-1] >= freq 
 
     if ant:
-        cc = cc and dat.antenna_names[dat.ant_1_array[0]] == ant
+        #pyuvdata >= 3.0 keeps the antennas in a Telescope object
+        telescope = getattr(dat,'telescope',dat)
+        names = dict(zip(telescope.antenna_numbers,telescope.antenna_names))
+        cc = cc and names[dat.ant_1_array[0]] == ant
 
     return cc
 
@@ -2,5 +2,7 @@ from .calcSingleAnt import calcSingleAnt
 from .calcSingleAntAllData import calcSingleAntAllData
 from .calcSEFDSingleAnt import calcSEFDSingleAnt
 from .calcSEFDThreeDict import calcSEFDThreeDict
-from .filterArray.configs import defaultFilterType,filterTypes
+from .filterArray.configs import defaultFilterType,filterTypes,rowFilterTypes
 from .calcSEFDpyuv import calcSEFDpyuv
+from .calcSEFDpyuvBlock import calcSEFDpyuvBlock
+from .calcSEFDpyuvChunks import calcSEFDpyuvChunks
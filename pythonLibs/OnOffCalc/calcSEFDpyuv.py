@@ -37,8 +37,8 @@ def calcSEFDpyuv(onList, offList, method, updateFlags=False):
     assert(len(onList) == len(offList)), "list len mismatch"
 
     freqLen = onList[0].Nfreqs
-    freq = onList[0].freq_array[0,freqLen//2]/1e6
-    source = onList[0].object_name
+    freq = OnOffCalc.misc.getUVFreqs(onList[0])[freqLen//2]/1e6
+    source = OnOffCalc.misc.getUVObjectName(onList[0])
 
     datetime_stamp = datetime.datetime.utcfromtimestamp(Time(onList[0].time_array[0],format='jd').unix)
     #datetime_stamp = datetime.datetime.utcfromtimestamp(Time(onList[0].time_array[0],format='mjd').unix)
@@ -57,8 +57,16 @@ def calcSEFDpyuv(onList, offList, method, updateFlags=False):
     timestamps = numpy.zeros(0,dtype='float')
 
     for nn in range(nTries):
-        SEFD_X[nn],SEFD_var_X[nn],powOn0X,powOff0X,indexesX,sefdvx = OnOffCalc.misc.calcSEFD(onList[nn].data_array[:,0,:,0].real, offList[nn].data_array[:,0,:,0].real,flx,method)
-        SEFD_Y[nn],SEFD_var_Y[nn],powOn0Y,powOff0Y,indexesY,sefdvy = OnOffCalc.misc.calcSEFD(onList[nn].data_array[:,0,:,1].real, offList[nn].data_array[:,0,:,1].real,flx,method)
+        # (pol, time, freq) views of both polarizations, calculated at once
+        onBlock = numpy.moveaxis(OnOffCalc.misc.getUVBlock(onList[nn].data_array)[:,:,0:2].real, -1, 0)
+        offBlock = numpy.moveaxis(OnOffCalc.misc.getUVBlock(offList[nn].data_array)[:,:,0:2].real, -1, 0)
+        SEFD,SEFD_var,powOn0,powOff0,indexes,sefdv = OnOffCalc.misc.calcSEFDArray(onBlock,offBlock,flx,method)
+        SEFD_X[nn],SEFD_Y[nn] = SEFD
+        SEFD_var_X[nn],SEFD_var_Y[nn] = SEFD_var
+        powOn0X,powOn0Y = powOn0
+        powOff0X,powOff0Y = powOff0
+        indexesX,indexesY = indexes
+        sefdvx,sefdvy = sefdv
         #SEFD_ts.append( datetime.datetime.utcfromtimestamp(Time(onList[nn].time_array[0],format='mjd').unix) )
         SEFD_ts.append( datetime.datetime.utcfromtimestamp(Time(onList[nn].time_array[0],format='jd').unix) )
 
@@ -69,10 +77,12 @@ def calcSEFDpyuv(onList, offList, method, updateFlags=False):
         timestamps = numpy.concatenate( (timestamps,onList[nn].time_array,offList[nn].time_array) )
 
         if updateFlags:
-            onList[nn].flag_array[:,0,:,0] = indexesX
-            offList[nn].flag_array[:,0,:,0] = indexesX
-            onList[nn].flag_array[:,0,:,1] = indexesY
-            offList[nn].flag_array[:,0,:,1] = indexesY
+            onFlags = OnOffCalc.misc.getUVBlock(onList[nn].flag_array)
+            offFlags = OnOffCalc.misc.getUVBlock(offList[nn].flag_array)
+            onFlags[:,:,0] = indexesX
+            offFlags[:,:,0] = indexesX
+            onFlags[:,:,1] = indexesY
+            offFlags[:,:,1] = indexesY
 
 
     #import pdb
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+calculation of SEFD using pyuvdata UVData read in time chunks
+Created on Oct 2026
+"""
+
+import OnOffCalc.flux
+import OnOffCalc.misc
+import numpy
+from astropy.time import Time
+import datetime
+import itertools
+
+def calcSEFDpyuvChunks(onList, offList, method):
+    """
+    Calculates the same results as calcSEFDpyuv, with each "on" and "off"
+    measurement given as an iterable of UVData objects holding consecutive
+    integrations (e.g. partial reads of a uvh5 file), so only one chunk of
+    each measurement is in memory at a time. The masks are not kept.
+    The results are equal to calcSEFDpyuv for filters working on each
+    integration alone (OnOffCalc.filterArray.rowFilterTypes), the other
+    filters are run on each chunk separately
+
+    Parameters
+    -------------
+    onList : list
+        list of iterables of UVData objects for "on" measurements
+    offList : list
+        list of iterables of UVData objects for "off" measurements
+    method : str
+        string describing the method See OnOffCalc.filterArray.filterTypes
+
+    Returns
+    -------------
+    dict :
+        dictionary with calculated results, as calcSEFDpyuv
+
+    Raises
+    -------------
+        AssertionError
+    """
+
+    nTries = len(onList)
+    assert(nTries > 0), "empty list"
+    assert(len(onList) == len(offList)), "list len mismatch"
+
+    flx = None
+    source = None
+
+    SEFD_X = numpy.zeros(nTries,dtype='float')
+    SEFD_var_X = numpy.zeros(nTries,dtype='float')
+    SEFD_Y = numpy.zeros(nTries,dtype='float')
+    SEFD_var_Y = numpy.zeros(nTries,dtype='float')
+    SEFD_ts = []
+    powerX = numpy.zeros(0,dtype='float')
+    powerY = numpy.zeros(0,dtype='float')
+    sefd_vec_X = numpy.zeros(0,dtype='float')
+    sefd_vec_Y = numpy.zeros(0,dtype='float')
+    timestamps = numpy.zeros(0,dtype='float')
+
+    for nn in range(nTries):
+        SEFDs = []
+        powOn = []
+        powOff = []
+        onTimes = []
+        offTimes = []
+        for onUV,offUV in itertools.zip_longest(onList[nn],offList[nn]):
+            assert(onUV is not None and offUV is not None), "On and Off integrations count mismatch"
+
+            if flx is None:
+                freqLen = onUV.Nfreqs
+                freq = OnOffCalc.misc.getUVFreqs(onUV)[freqLen//2]/1e6
+                source = OnOffCalc.misc.getUVObjectName(onUV)
+                datetime_stamp = datetime.datetime.utcfromtimestamp(Time(onUV.time_array[0],format='jd').unix)
+                flx = OnOffCalc.flux.sourceFlux(source,freq,datetime_stamp)
+            if not onTimes:
+                SEFD_ts.append( datetime.datetime.utcfromtimestamp(Time(onUV.time_array[0],format='jd').unix) )
+
+            # (pol, time, freq) views of both polarizations of the chunk
+            onBlock = numpy.moveaxis(OnOffCalc.misc.getUVBlock(onUV.data_array)[:,:,0:2].real, -1, 0)
+            offBlock = numpy.moveaxis(OnOffCalc.misc.getUVBlock(offUV.data_array)[:,:,0:2].real, -1, 0)
+            indexes,sefds,pon,poff = OnOffCalc.misc.calcOnOffParamArray(onBlock,offBlock,method)
+            SEFDs.append(sefds)
+            powOn.append(pon)
+            powOff.append(poff)
+            onTimes.append(onUV.time_array)
+            offTimes.append(offUV.time_array)
+            # freed before the next chunks are read
+            del onUV,offUV,onBlock,offBlock
+        assert(onTimes), "empty measurement"
+
+        SEFD,SEFD_var,powOn0,powOff0,sefdv = OnOffCalc.misc.calcSEFDStats(numpy.concatenate(SEFDs,axis=-1),
+                numpy.concatenate(powOn,axis=-1),numpy.concatenate(powOff,axis=-1),flx)
+        SEFD_X[nn],SEFD_Y[nn] = SEFD
+        SEFD_var_X[nn],SEFD_var_Y[nn] = SEFD_var
+        powOn0X,powOn0Y = powOn0
+        powOff0X,powOff0Y = powOff0
+        sefdvx,sefdvy = sefdv
+
+        powerX = numpy.concatenate( (powerX,powOn0X,powOff0X) )
+        powerY = numpy.concatenate( (powerY,powOn0Y,powOff0Y) )
+        sefd_vec_X = numpy.concatenate( (sefd_vec_X,sefdvx) )
+        sefd_vec_Y = numpy.concatenate( (sefd_vec_Y,sefdvy) )
+        timestamps = numpy.concatenate( [timestamps] + onTimes + offTimes )
+
+    return {'sefd_x' : SEFD_X, 'sefd_y' : SEFD_Y, 'sefd_x_var': SEFD_var_X, 'sefd_y_var': SEFD_var_Y, 'sefd_ts': SEFD_ts, 'power_x': powerX, 'power_y': powerY, 'ts': timestamps, 'source':source, 'sefd_vec_x':sefd_vec_X, 'sefd_vec_y': sefd_vec_Y}
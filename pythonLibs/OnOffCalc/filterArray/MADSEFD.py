@@ -8,6 +8,7 @@ Created on Thu Jul 31 2019
 
 import OnOffCalc.misc
 import numpy
+import bottleneck as bn
 
 import pdb
 
@@ -20,9 +21,9 @@ def MADSEFD(onArray, offArray):
     Parameters
     -------------
     onArray : numpy.array
-        Data array for ON measurement
+        (..., time, freq) data array for ON measurement
     offArray : numpy.array
-        Data array for OFF measurement
+        (..., time, freq) data array for OFF measurement
         
     Returns
     -------------
@@ -34,34 +35,27 @@ def MADSEFD(onArray, offArray):
          AssertionError     
     """
     
-    Larray = len(onArray)
-    Larray2 = len(offArray)
+    assert onArray.shape == offArray.shape, "both arrays should have the same size"
     
-    assert Larray == Larray2, "both arrays should have the same size"
-    
-    #onFiltered = []
-    #offFiltered = []
-    drange = OnOffCalc.misc.getDatarange(onArray.shape[1])
+    drange = OnOffCalc.misc.getDatarange(onArray.shape[-1])
     dataMask = numpy.ones(onArray.shape)
     
-    for iK in range(Larray):
-        onVectSel = onArray[iK,drange]
-        offVectSel = offArray[iK,drange]
-        tmpVect = numpy.divide(offVectSel,(onVectSel - offVectSel),dtype='float')
+    # getDatarange is contiguous, a slice selects it without copies
+    dslice = slice(drange[0], drange[-1] + 1)
     
-        xMed = numpy.median(tmpVect);
-        xMAD = numpy.median(numpy.abs(tmpVect - xMed))
+    # all rows at once: the median and MAD of each row, then the bins
+    # within median +/- MADMultiplier*MAD of their row are kept
+    onMatSel = onArray[...,dslice]
+    offMatSel = offArray[...,dslice]
+    tmpMat = numpy.divide(offMatSel,(onMatSel - offMatSel),dtype='float')
     
-        # extracting indexes of values in tmpVect being median +/- 3*MAD
-        indexList = numpy.asarray( (tmpVect < (xMed + MADMultiplier*xMAD)) * (tmpVect > (xMed - MADMultiplier*xMAD)) ).nonzero()[0]
-        
-        #onFiltered.append(onVectSel[indexList])
-        #offFiltered.append(offVectSel[indexList])
-        
-        #uniqueIdList = list(set(uniqueIdList.append(indexList)))
-        dataMask[iK,drange[indexList]] = 0
+    xMed = bn.median(tmpMat, axis=-1)[...,numpy.newaxis]
+    xMAD = bn.median(numpy.abs(tmpMat - xMed), axis=-1)[...,numpy.newaxis]
+    
+    keepMat = (tmpMat < (xMed + MADMultiplier*xMAD)) * (tmpMat > (xMed - MADMultiplier*xMAD))
+    
+    dataMask[...,dslice] = ~keepMat
     
-    #return onFiltered,offFiltered,OnOff.misc.constants.dataRange[uniqueIdList]
     return dataMask
 
 def MADSEFDAll(onArray, offArray):
@@ -71,9 +65,9 @@ def MADSEFDAll(onArray, offArray):
     Parameters
     -------------
     onArray : numpy.array
-        Data array for ON measurement
+        (..., time, freq) data array for ON measurement
     offArray : numpy.array
-        Data array for OFF measurement
+        (..., time, freq) data array for OFF measurement
         
     Returns
     -------------
@@ -85,26 +79,27 @@ def MADSEFDAll(onArray, offArray):
          AssertionError     
     """
     
-    Larray = len(onArray)
-    Larray2 = len(offArray)
+    assert onArray.shape == offArray.shape, "both arrays should have the same size"
     
-    assert Larray == Larray2, "both arrays should have the same size"
-    
-    drange = OnOffCalc.misc.getDatarange(onArray.shape[1])
+    drange = OnOffCalc.misc.getDatarange(onArray.shape[-1])
     dataMask = numpy.ones(onArray.shape)
     
-    onSum = numpy.sum(onArray[:,drange],axis=0)
-    offSum = numpy.sum(offArray[:,drange],axis=0)
+    # getDatarange is contiguous, a slice selects it without copies
+    dslice = slice(drange[0], drange[-1] + 1)
+    
+    # the time sums of each time-freq matrix
+    onSum = numpy.sum(onArray[...,dslice],axis=-2)
+    offSum = numpy.sum(offArray[...,dslice],axis=-2)
     
     tmpVect = numpy.divide(offSum,(onSum - offSum),dtype='float')
     
-    xMed = numpy.median(tmpVect);
-    xMAD = numpy.median(numpy.abs(tmpVect - xMed))
+    xMed = numpy.median(tmpVect, axis=-1, keepdims=True)
+    xMAD = numpy.median(numpy.abs(tmpVect - xMed), axis=-1, keepdims=True)
 
-    # extracting indexes of values in tmpVect being median +/- 3*MAD
-    indexList = numpy.asarray( (tmpVect < (xMed + MADMultiplier*xMAD)) * (tmpVect > (xMed - MADMultiplier*xMAD)) ).nonzero()[0]
+    # keeping the bins of tmpVect being median +/- 3*MAD, at all times
+    keepVect = (tmpVect < (xMed + MADMultiplier*xMAD)) * (tmpVect > (xMed - MADMultiplier*xMAD))
     
-    dataMask[:,drange[indexList]] = 0
+    dataMask[...,dslice] = ~keepVect[...,numpy.newaxis,:]
     
     #pdb.set_trace()
     
@@ -8,5 +8,8 @@ Created on Feb 7 2020
 
 filterTypes = ['MADall','simple','MAD','aoflagger']
 defaultFilterType = 'aoflagger'
+#filters flagging each integration on its own, giving the same masks
+#on time chunks as on the whole measurement
+rowFilterTypes = ['simple','MAD']
 
 
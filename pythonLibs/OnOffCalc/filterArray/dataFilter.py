@@ -7,6 +7,7 @@ Created on Thu Dec 3 2019
 """
 
 from . import simple,MADSEFD,ata_aoflag
+import numpy
 
 
 def filterFun(onArray, offArray, method):
@@ -17,9 +18,9 @@ def filterFun(onArray, offArray, method):
     Parameters
     -------------
     onArray : numpy.array
-        Data array for ON measurement
+        (..., time, freq) data array for ON measurement
     offArray : numpy.array
-        Data array for OFF measurement
+        (..., time, freq) data array for OFF measurement
         
     Returns
     -------------
@@ -42,6 +43,12 @@ def filterFun(onArray, offArray, method):
     
     assert func is not None, "unknown filter call"
     
-    maksedArray = func(onArray, offArray)
+    if method == 'aoflagger' and onArray.ndim > 2:
+        # aoflagger flags one time-freq image at a time
+        maksedArray = numpy.empty(onArray.shape)
+        for ind in numpy.ndindex(onArray.shape[:-2]):
+            maksedArray[ind] = func(onArray[ind], offArray[ind])
+    else:
+        maksedArray = func(onArray, offArray)
     
     return maksedArray
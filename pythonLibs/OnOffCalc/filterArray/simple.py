@@ -18,9 +18,9 @@ def simple(onArray, offArray):
     Parameters
     -------------
     onArray : numpy.array
-        Data array for ON measurement
+        (..., time, freq) data array for ON measurement
     offArray : numpy.array
-        Data array for OFF measurement
+        (..., time, freq) data array for OFF measurement
         
     Returns
     -------------
@@ -32,19 +32,17 @@ def simple(onArray, offArray):
          AssertionError     
     """
     
-    Larray = len(onArray)
-    Larray2 = len(offArray)
-    
-    assert Larray == Larray2, "both arrays should have the same size"
+    assert onArray.shape == offArray.shape, "both arrays should have the same size"
     
     #onFiltered = numpy.array(onArray)[:,OnOff.misc.constants.dataRange]
     #offFiltered = numpy.array(offArray)[:,OnOff.misc.constants.dataRange]
     
     #return onFiltered,offFiltered,OnOff.misc.constants.dataRange
-    drange = OnOffCalc.misc.getDatarange(onArray.shape[1])
+    drange = OnOffCalc.misc.getDatarange(onArray.shape[-1])
     dataMask = numpy.ones(onArray.shape)
     #dataMask[:,OnOffCalc.misc.constants.dataRange] = 0
-    dataMask[:,drange] = 0
+    # getDatarange is contiguous, a slice selects it without copies
+    dataMask[...,drange[0]:drange[-1]+1] = 0
     
     return dataMask
     
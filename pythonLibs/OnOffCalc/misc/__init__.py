@@ -11,4 +11,10 @@ Created on Thu Jul 18 2019
 from .calculations import calcSourceTemp
 from .calculations import calcAntennaTemp
 from .calculations import calcSEFD
+from .calculations import calcSEFDArray
+from .calculations import calcOnOffParamArray
+from .calculations import calcSEFDStats
 from .calculations import getDatarange
+from .calculations import getUVFreqs
+from .calculations import getUVBlock
+from .calculations import getUVObjectName
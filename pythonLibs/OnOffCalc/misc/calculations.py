@@ -23,6 +23,32 @@ def getDatarange(veclen):
         uv =  int(numpy.floor(constants.upperval/2048.0*veclen))
         return numpy.array(range(lv,uv))
 
+def getUVFreqs(uvd):
+    """
+    Frequencies [Hz] of a UVData, (1, Nfreqs) before pyuvdata 3.0 and
+    (Nfreqs,) since, as a (Nfreqs,) array
+    """
+    return numpy.ravel(uvd.freq_array)
+
+def getUVBlock(uvArray):
+    """
+    (Nblts, Nfreqs, Npols) view of a UVData data, flag or nsample array,
+    (Nblts, 1, Nfreqs, Npols) before pyuvdata 3.0 and (Nblts, Nfreqs, Npols)
+    since. Writing into the view writes into the UVData array
+    """
+    if uvArray.ndim == 4:
+        return uvArray[:,0]
+    return uvArray
+
+def getUVObjectName(uvd):
+    """
+    Source name of a UVData, object_name before pyuvdata 3.0 and the name
+    of the phase center of the first integration since
+    """
+    if hasattr(uvd, 'object_name'):
+        return uvd.object_name
+    return uvd.phase_center_catalog[uvd.phase_center_id_array[0]]['cat_name']
+
 def calcOnOffParamVec(onVectIn, offVectIn, maskedVect):
     """
     Calculation of vector of SFED values
@@ -71,48 +97,55 @@ def calcOnOffParamVec(onVectIn, offVectIn, maskedVect):
 def calcOnOffParamMat(onMatIn, offMatIn, maskedMat):
     """
     Calculation of vector of SFED values
+    As for calcSEFD, the masked bins of onMatIn and offMatIn are set to nan
         
     Parameters
     -------------
     onMat : array_like
-        freq-time mat of On data
+        time-freq mat of On data, or (..., time, freq) block of mats
     offMat : array_like
-        freq-time mat of Off data
+        time-freq mat of Off data, or (..., time, freq) block of mats
         
     Returns
     -------------
-    float
-        the SEFD value
-    float
-        power on    
-    float
-        power off
+    array_like
+        (..., time) SEFD values
+    array_like
+        (..., time) power on    
+    array_like
+        (..., time) power off
         
     """   
     
-    assert len(onMatIn) == len(offMatIn), "both vectors should have the same size"
-    assert len(onMatIn) == len(maskedMat), "mask vector should have the same size as the others"
+    assert onMatIn.shape == offMatIn.shape, "both vectors should have the same size"
+    assert onMatIn.shape == maskedMat.shape, "mask vector should have the same size as the others"
     
     onMat = onMatIn
     offMat = offMatIn
 
-    unq = np.unique(maskedMat)
-    assert len(unq) == 2, "mask vector should be a binary"
-    assert np.all(unq == np.array([0,1])), "mask vector should be a binary"
+    # same check as np.unique(maskedMat) == [0,1] for each mat, without sorting the mask,
+    # from the masked bins count of each row
+    maskedBool = (maskedMat == 1)
+    maskedRowCount = np.count_nonzero(maskedBool, axis=-1)
+    maskedCount = maskedRowCount.sum(axis=-1)
+    assert np.all(maskedCount > 0) and np.all(maskedCount < maskedMat.shape[-2]*maskedMat.shape[-1]), "mask vector should be a binary"
+    assert np.count_nonzero(maskedMat == 0) == maskedMat.size - maskedCount.sum(), "mask vector should be a binary"
 
 
-    onMat[maskedMat == 1] = np.nan
-    offMat[maskedMat == 1] = np.nan
-    maskedArrOkNsamps = maskedMat.shape[1] - maskedMat.sum(axis=1)
+    np.copyto(onMat, np.nan, where=maskedBool)
+    np.copyto(offMat, np.nan, where=maskedBool)
+    maskedArrOkNsamps = maskedMat.shape[-1] - maskedRowCount
     
     #pdb.set_trace()
     
-    tmpMat = numpy.divide(offMat, (onMat - offMat))
+    tmpMat = numpy.subtract(onMat, offMat)
+    numpy.divide(offMat, tmpMat, out=tmpMat)
 
-    onoffparam = bn.nanmedian(tmpMat, axis=1)
+    onoffparam = bn.nanmedian(tmpMat, axis=-1)
 
-    powOn = np.sqrt(bn.nansum(onMat*onMat, axis=1))/maskedArrOkNsamps
-    powOff = np.sqrt(bn.nansum(offMat*offMat, axis=1))/maskedArrOkNsamps
+    # the squares reuse tmpMat, not allocating other block sized arrays
+    powOn = np.sqrt(bn.nansum(np.square(onMat, out=tmpMat), axis=-1))/maskedArrOkNsamps
+    powOff = np.sqrt(bn.nansum(np.square(offMat, out=tmpMat), axis=-1))/maskedArrOkNsamps
     
     return onoffparam,powOn,powOff
 
@@ -181,6 +214,126 @@ def calcSEFD(onArrayM, offArrayM, srcFlux, method=OnOffCalc.filterArray.defaultF
     return SEFD,SEFD_var,powOn,powOff,maskedBinsArray,(srcFlux*SEFDs)
     
 
+def calcSEFDArray(onArrayM, offArrayM, srcFlux, method=OnOffCalc.filterArray.defaultFilterType):
+    """
+    Calculation of SFED for a whole block of measurements at once, e.g.
+    all antennas and polarizations of an observation. Equivalent to calling
+    calcSEFD for each time-freq matrix of the block, the filter and the
+    statistics being calculated on the whole block, along the last axes.
+    As calcSEFD, the masked bins of onArrayM and offArrayM are set to nan.
+    The results are bit-for-bit equal to the calcSEFD calls, but it is not
+    faster: x0.8 to x1.0 the speed of the loop on 42 antennas x 4096
+    channels (Tests/sefdArrayBenchmark.py)
+        
+    Parameters
+    -------------
+    onArrayM : array_like
+        (..., time, freq) block of On data
+    offArrayM : array_like
+        (..., time, freq) block of Off data
+    srcFlux : float
+        flux of the source
+        
+    Returns
+    -------------
+    array_like
+        (...) SEFD values
+    array_like
+        (...) SEFD variance in time
+    array_like 
+        (..., time) On power in time
+    array_like 
+        (..., time) Off power in time
+    array_like
+        (..., time, freq) masks used for calculation
+    array_like
+        (..., time) SEFD in time
+           
+    """
+
+    maskedBinsArray, SEFDs, powOn, powOff = calcOnOffParamArray(onArrayM, offArrayM, method)
+    SEFD,SEFD_var,powOn,powOff,SEFDv = calcSEFDStats(SEFDs, powOn, powOff, srcFlux)
+
+    return SEFD,SEFD_var,powOn,powOff,maskedBinsArray,SEFDv
+
+def calcOnOffParamArray(onArrayM, offArrayM, method=OnOffCalc.filterArray.defaultFilterType):
+    """
+    Per time part of calcSEFDArray: filter and SEFD, On and Off power of
+    each integration of a (..., time, freq) block. Blocks of consecutive
+    integrations can be calculated one after another and concatenated along
+    the time axis before calcSEFDStats
+    As calcSEFD, the masked bins of onArrayM and offArrayM are set to nan
+
+    Parameters
+    -------------
+    onArrayM : array_like
+        (..., time, freq) block of On data
+    offArrayM : array_like
+        (..., time, freq) block of Off data
+    method : str
+        string describing the method See OnOffCalc.filterArray.filterTypes
+
+    Returns
+    -------------
+    array_like
+        (..., time, freq) masks used for calculation
+    array_like
+        (..., time) SEFD in time, not scaled by the source flux
+    array_like
+        (..., time) On power in time
+    array_like
+        (..., time) Off power in time
+
+    """
+
+    assert onArrayM.shape == offArrayM.shape, "both blocks should have the same shape"
+
+    maskedBinsArray = OnOffCalc.filterArray.filterFun(onArrayM,offArrayM,method)
+    SEFDs, powOn, powOff = calcOnOffParamMat(onArrayM, offArrayM, maskedBinsArray)
+
+    return maskedBinsArray,SEFDs,powOn,powOff
+
+def calcSEFDStats(SEFDs, powOn, powOff, srcFlux):
+    """
+    Time statistics part of calcSEFDArray, on the outputs of
+    calcOnOffParamArray
+
+    Parameters
+    -------------
+    SEFDs : array_like
+        (..., time) SEFD in time, not scaled by the source flux
+    powOn : array_like
+        (..., time) On power in time
+    powOff : array_like
+        (..., time) Off power in time
+    srcFlux : float
+        flux of the source
+
+    Returns
+    -------------
+    array_like
+        (...) SEFD values
+    array_like
+        (...) SEFD variance in time
+    array_like
+        (..., time) On power in time, minus the mean Off power
+    array_like
+        (..., time) Off power in time, minus the mean Off power
+    array_like
+        (..., time) SEFD in time
+
+    """
+
+    #normalization towars 0?
+    mean_off = numpy.mean(powOff, axis=-1, keepdims=True)
+    powOn = powOn - mean_off
+    powOff = powOff - mean_off
+
+    SEFD = srcFlux * bn.nanmedian(SEFDs, axis=-1)
+    SEFD_var = srcFlux * bn.nanstd(SEFDs, axis=-1)
+
+    return SEFD,SEFD_var,powOn,powOff,(srcFlux*SEFDs)
+
 def calcAntennaTemp(yFactor, TSrc, localTCold = constants.TCold):
     """
     Calculation of source temperature based on source flux and antenna size
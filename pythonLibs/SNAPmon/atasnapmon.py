@@ -7,7 +7,11 @@ import dash
 import dash_table
 import dash_core_components as dcc
 import dash_html_components as html
-from dash.dependencies import Input,Output
+from dash.dependencies import Input,Output,State
+try:
+    from dash import Patch
+except ImportError:
+    Patch = None
 
 import numpy as np
 import pandas as pd
@@ -22,12 +26,14 @@ from datetime import datetime
 from SNAPobs import snap_defaults, snap_config, snap_control
 from ATATools import ata_control
 import casperfpga
-from threading import Thread
+from threading import Thread, Lock
+from collections import deque
 from itertools import repeat
 import atexit
 
 from ATATools import ata_helpers
 from ATATools.device_lock import set_device_lock, release_device_lock
+from SNAPmon.spectrum_bus import SpectrumBus
 
 ATA_CFG = snap_config.get_ata_cfg()
 ATA_SNAP_TAB = snap_config.get_ata_snap_tab()
@@ -38,6 +44,10 @@ FOFF = BW/NCHANS
 
 TZ = pytz.timezone('America/Los_Angeles')
 
+BUS_FILE = '/dev/shm/atasnapmon'
+NADC = 16384 # ADC samples per pol kept on the bus
+HIST_BINS = 64
+
 snaps = ['frb-snap1-pi', 'frb-snap2-pi', 
         'frb-snap3-pi', 'frb-snap4-pi',
         'frb-snap5-pi', 'frb-snap6-pi',
@@ -76,12 +86,16 @@ class cfreqThread(Thread):
 
 
 class SnapThread(Thread):
-    def __init__(self, fengs, *args, **kwargs):
+    """
+    The single producer: polls the boards and publishes their spectra
+    and ADC samples into the shared memory spectrum bus
+    """
+    def __init__(self, fengs, bus, *args, **kwargs):
         super(SnapThread,self).__init__(*args, **kwargs)
         self.fengs = fengs
+        self.bus = bus
         self.hosts = [snap.host for snap in fengs]
         self.nsnap = len(self.hosts)
-        self.snaps_res = dict.fromkeys(self.hosts)
 
         self.defs = {}
         self.defs['def_xx'] = np.ones(NCHANS) * 200000
@@ -111,94 +125,155 @@ class SnapThread(Thread):
         return (defs['def_xx'], defs['def_yy'], 
                 defs['def_adc_x'], defs['def_adc_y'])
 
+    def publish_bp(self, snap):
+        xx,yy,adc_x,adc_y = self.get_bp_thread(snap, self.defs)
+        self.bus.publish(snaps.index(snap.host), xx, yy, adc_x, adc_y)
+
     def run(self):
         conn = ThreadPoolExecutor(max_workers=self.nsnap)
         while True:
-            t = time.time()
-            snaps_res = conn.map(self.get_bp_thread, self.fengs, 
-                    repeat(self.defs))
-            self.snaps_res = {host:data for host,data in
-                    zip(self.hosts,snaps_res)}
+            # each board is published as soon as it is read
+            list(conn.map(self.publish_bp, self.fengs))
+            self.bus.heartbeat()
             time.sleep(1)
 
-LOs = pd.unique(ATA_SNAP_TAB.LO)
-cfreq_thread = cfreqThread(LOs)
-cfreq_thread.daemon = True
-cfreq_thread.start()
-
-
-fengs = snap_control.init_snaps(snaps, True)
-
-snap_thread = SnapThread(fengs)
-snap_thread.daemon = True
-snap_thread.start()
 
-# give the thread sometime to pull data
-time.sleep(10)
-snaps_res = snap_thread.snaps_res
-
-FIGS = {}
-for snap in fengs:
+class MonitorStats(object):
+    """
+    Frame rate of the producer and latency of the Dash callbacks
+    """
+    def __init__(self, nlatencies=100):
+        self.latencies = deque(maxlen=nlatencies)
+        self.nframes = bus.nframes()
+        self.t = time.time()
+        self.frame_rate = 0.0
+        self.lock = Lock()
+
+    def add_latency(self, latency):
+        with self.lock:
+            self.latencies.append(latency)
+
+    def update_frame_rate(self):
+        with self.lock:
+            if bus.reopen_if_replaced():
+                # a new producer took over, its frames count from 0
+                with FIGS_LOCK:
+                    FIGS[:] = [(None, None, TEMPLATES[isnap])
+                            for isnap in range(len(snaps))]
+                self.nframes = bus.nframes()
+            nframes = bus.nframes()
+            t = time.time()
+            if t - self.t > 1:
+                # frames of each board per second
+                self.frame_rate = (nframes - self.nframes)/(t - self.t)/len(snaps)
+                self.nframes = nframes
+                self.t = t
+            latencies = np.array(self.latencies)
+        if len(latencies) == 0:
+            latencies = np.zeros(1)
+        return (self.frame_rate, bus.producer_age(),
+                np.median(latencies)*1e3, latencies.max()*1e3)
+
+
+def make_template(snap_host):
+    """
+    Empty figure of a board, with the data of each frame filled in
+    by get_figure
+    """
     fig = make_subplots(rows=1, cols=2, 
             column_widths=[0.8, 0.2], horizontal_spacing=0.05,
             )
-
-    cfreqs = cfreq_thread.cfreqs
-    lo = ATA_SNAP_TAB[ATA_SNAP_TAB.snap_hostname == snap.host].LO.values[0]
-    cfreq = cfreqs[lo]
-
-    xx,yy,adc_x,adc_y = snaps_res[snap.host]
-    #x = np.linspace(cfreq - BW/2, cfreq + BW/2, len(xx)) - FOFF/2.
-    #x = np.linspace(cfreq - BW/2 + FOFF/2., cfreq + BW/2 + FOFF/2., 
-    #        len(xx)+1) - FOFF/2.
-    #x = x[:-1]
-    x = np.arange(cfreq - BW/2, cfreq + BW/2, FOFF)
-
-    fig.append_trace({
-	    'x': x,
-	    'y': 10*np.log10(xx+0.1),
-	    'name': 'X-pol',
-	    'mode': 'lines',
-	    'type': 'scatter'
-	}, 1, 1)
-    fig.append_trace({
-	    'x': x,
-	    'y': 10*np.log10(yy+0.1),
-	    'name': 'Y-pol',
-	    'mode': 'lines',
-	    'type': 'scatter'
-	}, 1, 1)
-
-    fig.append_trace(
-            go.Histogram(x=adc_x, name='RMS_x: %.2f' %np.std(adc_x), 
-                marker_color='blue'), 
-            1, 2)
-    fig.append_trace(
-            go.Histogram(x=adc_y, name='RMS_y: %.2f' %np.std(adc_y), 
-                marker_color='red'), 
-            1, 2)
-
-    ant_name = ATA_SNAP_TAB[ATA_SNAP_TAB.snap_hostname == snap.host].ANT_name
-    ant_name = ant_name.values[0]
-    #ind = np.where(snap_ant[:,0] == snap.host)[0]
-    #ant_name = snap_ant[ind,1][0]
-
+    fig.add_trace(go.Scatter(name='X-pol', mode='lines'), 1, 1)
+    fig.add_trace(go.Scatter(name='Y-pol', mode='lines'), 1, 1)
+    # the ADC histograms are binned here rather than in each browser
+    fig.add_trace(go.Bar(marker_color='blue'), 1, 2)
+    fig.add_trace(go.Bar(marker_color='red'), 1, 2)
     fig.update_layout(
-            title="<b>Antenna:</b> %s  ---  <b>Snap:</b> %s  "
-            "---  <b>LO:</b> %s, <b>cfreq:</b> %.4f"
-              %(ant_name, snap.host, lo, cfreq),
             xaxis_title = 'Frequency (MHz)',
             yaxis_title = 'Power (dB)',
             xaxis2_title = 'ADC values',
+            bargap = 0,
             margin=dict(l=30, r=30, b=50, t=50),
             font = dict(family='Times new roman', size=20),
             #annotations = dict(size=60)
             )
+    return fig.to_dict()
+
+
+def _hist(adc):
+    counts, edges = np.histogram(adc, bins=HIST_BINS)
+    return {'x': (edges[:-1] + edges[1:])/2., 'y': counts,
+            'width': edges[1] - edges[0]}
+
+
+def get_figure(isnap, cfreq):
+    """
+    Figure of the latest frame of board isnap, built once for each new
+    frame or cfreq and shared by all the clients
+    """
+    frame = int(bus.frames()[isnap])
+    with FIGS_LOCK:
+        if FIGS[isnap][:2] == (frame, cfreq):
+            return FIGS[isnap]
+
+    snap_host = snaps[isnap]
+    ant_name, lo = BOARD_INFO[snap_host]
+    res = bus.read(isnap)
+    if res is None:
+        xx = yy = np.zeros(NCHANS)
+        adc_x = adc_y = np.zeros(1)
+    else:
+        frame,_,xx,yy,adc_x,adc_y = res
+    #x = np.linspace(cfreq - BW/2, cfreq + BW/2, len(xx)) - FOFF/2.
+    #x = np.linspace(cfreq - BW/2 + FOFF/2., cfreq + BW/2 + FOFF/2., 
+    #        len(xx)+1) - FOFF/2.
+    #x = x[:-1]
+    x = np.round(np.arange(cfreq - BW/2, cfreq + BW/2, FOFF), 4)
+
+    fig = dict(TEMPLATES[isnap])
+    data = [dict(trace) for trace in fig['data']]
+    data[0].update(x=x, y=np.round(10*np.log10(xx+0.1), 2))
+    data[1].update(x=x, y=np.round(10*np.log10(yy+0.1), 2))
+    data[2].update(_hist(adc_x), name='RMS_x: %.2f' %np.std(adc_x))
+    data[3].update(_hist(adc_y), name='RMS_y: %.2f' %np.std(adc_y))
+    fig['data'] = data
+    fig['layout'] = dict(fig['layout'],
+            title="<b>Antenna:</b> %s  ---  <b>Snap:</b> %s  "
+            "---  <b>LO:</b> %s, <b>cfreq:</b> %.4f"
+              %(ant_name, snap_host, lo, cfreq))
 
-    FIGS[snap.host] = fig
+    with FIGS_LOCK:
+        FIGS[isnap] = (frame, cfreq, fig)
+    return FIGS[isnap]
 
 
-graphs = [dcc.Graph(figure=FIGS[snap_name], id=snap_name) for snap_name in snaps]
+LOs = pd.unique(ATA_SNAP_TAB.LO)
+cfreq_thread = cfreqThread(LOs)
+cfreq_thread.daemon = True
+cfreq_thread.start()
+
+# the first process creates the bus and polls the boards, the others
+# (e.g. other web server workers) only read it
+bus = SpectrumBus.open_or_create(BUS_FILE, len(snaps), NCHANS, NADC)
+atexit.register(bus.close)
+if bus.created:
+    fengs = snap_control.init_snaps(snaps, True)
+
+    snap_thread = SnapThread(fengs, bus)
+    snap_thread.daemon = True
+    snap_thread.start()
+
+BOARD_INFO = {}
+for snap_host in snaps:
+    snap_tab = ATA_SNAP_TAB[ATA_SNAP_TAB.snap_hostname == snap_host]
+    BOARD_INFO[snap_host] = (snap_tab.ANT_name.values[0], snap_tab.LO.values[0])
+
+TEMPLATES = [make_template(snap_host) for snap_host in snaps]
+FIGS = [(None, None, TEMPLATES[isnap]) for isnap in range(len(snaps))]
+FIGS_LOCK = Lock()
+STATS = MonitorStats()
+
+graphs = [dcc.Graph(figure=FIGS[isnap][2], id=snap_name) for isnap,snap_name in enumerate(snaps)]
 FIGS_HTML = html.Div(graphs, id='figs_html')
 TIME_HTML = html.Div(html.H3(""), id="time_html")
 
@@ -210,6 +285,8 @@ app.layout = html.Div(
     [TIME_HTML] + 
     [html.Br()]*3 +
     [FIGS_HTML] + 
+    # frame and cfreq of each figure shown by this client
+    [dcc.Store(id='shown-frames', data={})] +
     [dcc.Interval(
         id='plot-update',
         interval = 5*1000,
@@ -217,51 +294,53 @@ app.layout = html.Div(
     )
 
 @app.callback(
-        [Output("figs_html", "children")],
-        [Input("plot-update", "n_intervals")])
-def gen_bp(interval=None):
-    #cfreq = cfreq_thread.cfreq
+        [Output(snap_name, "figure") for snap_name in snaps] +
+        [Output("shown-frames", "data")],
+        [Input("plot-update", "n_intervals")],
+        [State("shown-frames", "data")])
+def gen_bp(interval=None, shown=None):
+    """
+    Sends to this client only the boards with a new frame since its
+    last update: their new traces if the client has the figure already
+    (with dash >= 2.9), otherwise the whole figure
+    """
+    t = time.time()
     cfreqs = cfreq_thread.cfreqs
-    snaps_res = snap_thread.snaps_res.copy()
-
-
-    for i,snap in enumerate(fengs):
-        xx, yy, adc_x, adc_y = snaps_res[snap.host]
-        lo = ATA_SNAP_TAB[ATA_SNAP_TAB.snap_hostname == snap.host].LO.values[0]
-        cfreq = cfreqs[lo]
-        ant_name = ATA_SNAP_TAB[ATA_SNAP_TAB.snap_hostname ==\
-                snap.host].ANT_name
-        ant_name = ant_name.values[0]
-        #x = np.linspace(cfreq - BW/2, cfreq + BW/2, len(xx)) - FOFF/2.
-        #x = np.linspace(cfreq - BW/2 + FOFF/2., cfreq + BW/2 + FOFF/2., 
-        #        len(xx)+1) - FOFF/2.
-        #x = x[:-1]
-        x = np.arange(cfreq - BW/2, cfreq + BW/2, FOFF)
-        FIGS_HTML.children[i].figure.data[0].y = 10*np.log10(xx + 0.1)
-        FIGS_HTML.children[i].figure.data[0].x = x
-        FIGS_HTML.children[i].figure.data[1].y = 10*np.log10(yy + 0.1)
-        FIGS_HTML.children[i].figure.data[1].x = x
-
-        FIGS_HTML.children[i].figure.data[2].x = adc_x
-        FIGS_HTML.children[i].figure.data[2].name = 'RMS_x: %.2f' %np.std(adc_x)
-        FIGS_HTML.children[i].figure.data[3].x = adc_y
-        FIGS_HTML.children[i].figure.data[3].name = 'RMS_y: %.2f' %np.std(adc_y)
-
-        FIGS_HTML.children[i].figure.layout.title="""<b>Antenna:</b> %s  ---  
-<b>Snap:</b> %s  
----  <b>LO:</b> %s, <b>cfreq:</b> %.4f"""\
-                %(ant_name, snap.host, lo, cfreq)
-
-
-    return [FIGS_HTML.children]
+    shown = dict(shown or {})
+
+    figs = []
+    for isnap,snap_host in enumerate(snaps):
+        cfreq = cfreqs[BOARD_INFO[snap_host][1]]
+        frame, cfreq, fig = get_figure(isnap, cfreq)
+        prev = shown.get(snap_host)
+        if prev == [frame, cfreq]:
+            figs.append(dash.no_update)
+        elif Patch is not None and prev is not None and prev[1] == cfreq:
+            # same frequency axis and title: only the new trace values
+            patch = Patch()
+            for itrace in [0, 1]:
+                patch['data'][itrace]['y'] = fig['data'][itrace]['y']
+            for itrace in [2, 3]:
+                for key in ['x', 'y', 'width', 'name']:
+                    patch['data'][itrace][key] = fig['data'][itrace][key]
+            figs.append(patch)
+        else:
+            figs.append(fig)
+        shown[snap_host] = [frame, cfreq]
+
+    STATS.add_latency(time.time() - t)
+    return figs + [shown]
 
 @app.callback(
         [Output("time_html", "children")],
         [Input("plot-update", "n_intervals")])
 def update_time(interval=None):
     tstr = datetime.now(tz=TZ).strftime("%Y-%m-%d %H:%M:%S.%f")[:-4]
-    TIME_HTML.children = html.H3("Last updated (local time): %s" %tstr)
-    return [TIME_HTML.children]
+    frame_rate, age, latency_med, latency_max = STATS.update_frame_rate()
+    return [html.H3("Last updated (local time): %s  ---  "
+            "%.2f frames/s per board (last %.1f s ago)  ---  "
+            "callback latency: median %.1f ms, max %.1f ms"
+            %(tstr, frame_rate, age, latency_med, latency_max))]
 
 #HOST = "snapmon"
 HOST = "10.10.1.156"
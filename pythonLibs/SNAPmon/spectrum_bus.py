@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Shared memory bus of the latest spectra and ADC samples of the SNAP/RFSoC
+boards, written by a single producer and read by any number of monitor
+processes (e.g. the web server workers) without copies through pipes.
+The bus is a file memory-mapped by all processes, in /dev/shm.
+
+Each board has a ring of nslots frames. A frame is written in the slot
+after the latest one, which is marked invalid during the write, and is
+then published as the latest frame of the board. Readers copy the
+latest slot and check that it was not overwritten meanwhile (a sequence
+lock), so the producer never waits for the readers.
+
+A bus is created and initialised under a temporary name, then linked
+into place, so it is never seen partly initialised. open_or_create runs
+under a lock file, so of several processes only one creates the bus or
+takes over a bus left by a dead producer. Readers reopen a bus replaced
+by a new producer with reopen_if_replaced
+
+Created Oct 2026
+"""
+
+import fcntl
+import os
+import time
+
+import numpy as np
+
+DEFAULT_NSLOTS = 4
+
+# header: producer pid, producer heartbeat [unix time], frames published
+_HDR_PID = 0
+_HDR_HEARTBEAT = 1
+_HDR_NFRAMES = 2
+_HDR_LEN = 4
+
+
+class SpectrumBus(object):
+    """
+    Parameters
+    ----------
+    fileName : str
+        file of the bus, e.g. in /dev/shm
+
+    nboards : int
+        number of boards
+
+    nchans : int
+        channels of the spectra
+
+    nadc : int
+        ADC samples per polarisation
+
+    nslots : int
+        frames kept per board
+
+    create : bool
+        create the bus (the producer), otherwise attach to an existing one
+
+    Raises
+    ------
+    FileExistsError
+        if create and the bus already exists
+    FileNotFoundError
+        if not create and the bus does not exist
+    ValueError
+        if not create and the bus is smaller than expected
+    """
+    def __init__(self, fileName, nboards, nchans, nadc, nslots=DEFAULT_NSLOTS,
+            create=False):
+        self.fileName = fileName
+        self.nboards = nboards
+        self.nchans = nchans
+        self.nadc = nadc
+        self.nslots = nslots
+        self.created = create
+
+        layout = [
+                ('header', np.float64, (_HDR_LEN,)),
+                ('latest', np.int64, (nboards,)),
+                ('slot_frame', np.int64, (nboards, nslots)),
+                ('slot_time', np.float64, (nboards, nslots)),
+                ('slot_nadc', np.int64, (nboards, nslots)),
+                ('spec', np.float32, (nboards, nslots, 2, nchans)),
+                ('adc', np.float32, (nboards, nslots, 2, nadc)),
+                ]
+        offsets = []
+        size = 0
+        for _, dtype, shape in layout:
+            offsets.append(size)
+            size += int(np.prod(shape))*np.dtype(dtype).itemsize
+
+        self._layout = list(zip(layout, offsets))
+        self._size = size
+
+        if create:
+            # initialised under a temporary name, then linked into place:
+            # only one process can create the file
+            tmpName = '%s.%i.tmp' %(fileName, os.getpid())
+            fd = os.open(tmpName, os.O_CREAT | os.O_EXCL | os.O_RDWR, 0o644)
+            try:
+                os.ftruncate(fd, size)
+                self._map(tmpName)
+                self._header[_HDR_PID] = float(os.getpid())
+                self._header[_HDR_HEARTBEAT] = time.time()
+                self._mm.flush()
+                os.link(tmpName, fileName)
+            finally:
+                os.close(fd)
+                os.remove(tmpName)
+        else:
+            self._map(fileName)
+
+    def _map(self, fileName):
+        """
+        Maps fileName, and keeps its inode to detect a replaced bus
+        """
+        with open(fileName, 'r+b') as f:
+            ino = os.fstat(f.fileno()).st_ino
+            if os.fstat(f.fileno()).st_size < self._size:
+                raise ValueError("spectrum bus %s is smaller than expected" %fileName)
+            self._mm = np.memmap(f, dtype=np.uint8, mode="r+", shape=(self._size,))
+        self._ino = ino
+        for (key, dtype, shape), offset in self._layout:
+            setattr(self, '_' + key, np.ndarray(shape, dtype=dtype,
+                buffer=self._mm, offset=offset))
+
+    @classmethod
+    def open_or_create(cls, fileName, nboards, nchans, nadc, nslots=DEFAULT_NSLOTS):
+        """
+        Attaches to the bus if it exists and its producer runs, otherwise
+        creates it. Only one of several processes calling this concurrently
+        creates the bus and should produce the frames (the returned bus has
+        created == True). The processes are serialised with a lock on
+        fileName.lock, which is left in place
+        """
+        with open(fileName + '.lock', 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                bus = cls(fileName, nboards, nchans, nadc, nslots, create=False)
+            except FileNotFoundError:
+                return cls(fileName, nboards, nchans, nadc, nslots, create=True)
+            if bus.producer_alive():
+                return bus
+            # left behind by a producer that did not close it
+            bus.close()
+            os.remove(fileName)
+            return cls(fileName, nboards, nchans, nadc, nslots, create=True)
+
+    def reopen_if_replaced(self):
+        """
+        Maps the bus again if its file was replaced, e.g. by a producer
+        taking over from a dead one. Returns True if it was. A removed
+        bus is kept mapped, with its last frames
+        """
+        try:
+            ino = os.stat(self.fileName).st_ino
+        except FileNotFoundError:
+            return False
+        if ino == self._ino or self.created:
+            return False
+        self._map(self.fileName)
+        return True
+
+    def producer_alive(self):
+        """
+        Returns True if the process that created the bus is running
+        """
+        pid = int(self._header[_HDR_PID])
+        if pid == 0:
+            # never initialised, a bus is linked into place once it is
+            return False
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            pass
+        return True
+
+    def publish(self, iboard, xx, yy, adc_x, adc_y, t=None):
+        """
+        Publishes a new frame of board iboard. At most nadc ADC samples
+        are kept
+        """
+        frame = int(self._latest[iboard]) + 1
+        slot = frame % self.nslots
+        nadc = min(len(adc_x), len(adc_y), self.nadc)
+        self._slot_frame[iboard, slot] = -1
+        self._spec[iboard, slot, 0] = xx
+        self._spec[iboard, slot, 1] = yy
+        self._adc[iboard, slot, 0, :nadc] = np.asarray(adc_x)[:nadc]
+        self._adc[iboard, slot, 1, :nadc] = np.asarray(adc_y)[:nadc]
+        self._slot_nadc[iboard, slot] = nadc
+        self._slot_time[iboard, slot] = time.time() if t is None else t
+        self._slot_frame[iboard, slot] = frame
+        self._latest[iboard] = frame
+        self._header[_HDR_NFRAMES] += 1
+        self._header[_HDR_HEARTBEAT] = time.time()
+
+    def heartbeat(self):
+        """
+        Marks the producer as alive, when it has no new frames
+        """
+        self._header[_HDR_HEARTBEAT] = time.time()
+
+    def frames(self):
+        """
+        Returns the latest frame number of each board (0: no frame yet)
+        """
+        return self._latest.copy()
+
+    def nframes(self):
+        """
+        Returns the number of frames published on all boards
+        """
+        return int(self._header[_HDR_NFRAMES])
+
+    def producer_age(self):
+        """
+        Returns the time since the producer last published or beat [s]
+        """
+        return time.time() - self._header[_HDR_HEARTBEAT]
+
+    def read(self, iboard, ntries=10):
+        """
+        Returns a copy of the latest frame of board iboard as (frame, time,
+        xx, yy, adc_x, adc_y), or None if the board has no frame yet
+
+        Raises
+        ------
+        RuntimeError
+            if the frame is overwritten during each of ntries reads
+        """
+        for itry in range(ntries):
+            frame = int(self._latest[iboard])
+            if frame == 0:
+                return None
+            slot = frame % self.nslots
+            t = float(self._slot_time[iboard, slot])
+            nadc = int(self._slot_nadc[iboard, slot])
+            spec = self._spec[iboard, slot].copy()
+            adc = self._adc[iboard, slot, :, :nadc].copy()
+            if self._slot_frame[iboard, slot] == frame:
+                return frame, t, spec[0], spec[1], adc[0], adc[1]
+        raise RuntimeError("frame of board %i overwritten during %i reads"
+                %(iboard, ntries))
+
+    def close(self):
+        """
+        Detaches from the bus, and removes it if this is the producer
+        """
+        for key in ['header', 'latest', 'slot_frame', 'slot_time', 'slot_nadc',
+                'spec', 'adc', 'mm']:
+            setattr(self, '_' + key, None)
+        if self.created:
+            # unless already replaced by another producer
+            try:
+                if os.stat(self.fileName).st_ino == self._ino:
+                    os.remove(self.fileName)
+            except FileNotFoundError:
+                pass
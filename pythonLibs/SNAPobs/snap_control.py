@@ -4,68 +4,197 @@ import time
 import numpy as np
 import argparse
 import warnings
+import concurrent.futures
+from concurrent.futures import ThreadPoolExecutor
 from ATATools import logger_defaults
 from .snap_config import get_ata_cfg
 
 from ata_snap import ata_snap_fengine, ata_rfsoc_fengine
 
 
-def init_snaps(snap_list, load_system_information=False):
+NTHREADS = 32 # boards configured at once
+BOARD_TIMEOUT = 60 # seconds, a board not done by then is reported as failed
+
+# {operation: {host: seconds}} of the last call of each operation, None
+# for the boards that did not finish in time
+last_timings = {}
+
+
+class SnapControlError(RuntimeError):
+    """
+    Raised when some boards failed, once all the other boards are done.
+
+    Attributes
+    ----------
+    failed : dict
+        {host: exception} of the failed boards
+    results : list
+        (board, result) of the boards that succeeded
+    """
+    def __init__(self, msg, failed, results):
+        super(SnapControlError, self).__init__(msg)
+        self.failed = failed
+        self.results = results
+
+
+def _per_board(action, func, boards, hosts=None, skip_failed=False,
+        timeout=None):
+    """
+    Calls func(board) for all the boards concurrently, so that a slow
+    or dead board does not hold up or abort the others. The time taken
+    by each board is logged and kept in last_timings[action].
+    A board not done after timeout seconds (default: BOARD_TIMEOUT) is
+    reported as failed, its thread is left running
+
+    Returns
+    -------
+    list
+        (board, func(board)) of the boards that succeeded, in order
+
+    Raises
+    ------
+    SnapControlError
+        if some boards failed, unless skip_failed and some boards succeeded
+    """
+    logger = logger_defaults.getModuleLogger(__name__)
+    if hosts is None:
+        hosts = [board.host for board in boards]
+    if timeout is None:
+        timeout = BOARD_TIMEOUT
+    timings = dict.fromkeys(hosts)
+
+    def timed(host, board):
+        t = time.time()
+        try:
+            return func(board)
+        finally:
+            timings[host] = time.time() - t
+
+    t_start = time.time()
+    executor = ThreadPoolExecutor(max_workers=max(1, min(NTHREADS, len(boards))))
+    futures = [executor.submit(timed, host, board)
+            for host, board in zip(hosts, boards)]
+    concurrent.futures.wait(futures, timeout=timeout)
+    executor.shutdown(wait=False)
+
+    results = []
+    failed = {}
+    for host, board, future in zip(hosts, boards, futures):
+        if not future.done():
+            failed[host] = TimeoutError("not done after %.1f s" %timeout)
+            continue
+        try:
+            results.append((board, future.result()))
+        except Exception as e:
+            failed[host] = e
+    last_timings[action] = dict(timings)
+
+    done = [(t, host) for host, t in timings.items() if t is not None]
+    logger.info("%s: %i boards in %.2f s%s" %(action, len(boards),
+        time.time() - t_start,
+        ", slowest: %s (%.2f s)" %max(done)[::-1] if done else ""))
+    logger.debug("%s timings: %s" %(action, timings))
+    for host, e in failed.items():
+        logger.error("%s failed on %s: %r" %(action, host, e))
+
+    if failed and not skip_failed:
+        raise SnapControlError("%s failed on %s" %(action, ", ".join(failed)),
+                failed, results)
+    if failed and not results:
+        raise SnapControlError("%s failed on all the boards" %action,
+                failed, results)
+    return results
+
+
+def _new_feng(snap_name):
+    if snap_name.startswith("frb-snap"):
+        return ata_snap_fengine.AtaSnapFengine(snap_name,
+            transport=casperfpga.KatcpTransport)
+    elif snap_name.startswith("rfsoc"):
+        pipeline_id = int(snap_name[-1])
+        return ata_rfsoc_fengine.AtaRfsocFengine(snap_name, 
+                pipeline_id=pipeline_id-1)
+
+
+def init_snaps(snap_list, load_system_information=False, skip_failed=False):
+    """
+    Connects to the boards of snap_list concurrently, and loads their
+    system information if load_system_information.
+    Returns the F-engines, in the snap_list order. If skip_failed, the
+    boards that failed are logged and left out, otherwise
+    SnapControlError is raised once the other boards are connected.
+    SnapControlError is also raised if all the boards failed
+    """
     logger = logger_defaults.getModuleLogger(__name__)
     logger.info("Initialising snaps: %s" %snap_list)
-    snaps = []
 
-    for snap_name in snap_list:
-        if snap_name.startswith("frb-snap"):
-            snaps.append(ata_snap_fengine.AtaSnapFengine(snap_name,
-                transport=casperfpga.KatcpTransport))
-        elif snap_name.startswith("rfsoc"):
-            pipeline_id = int(snap_name[-1])
-            snaps.append(ata_rfsoc_fengine.AtaRfsocFengine(snap_name, 
-                    pipeline_id=pipeline_id-1))
+    results = _per_board("init_snaps", _new_feng, snap_list, snap_list,
+            skip_failed)
+    snaps = [snap for _, snap in results if snap is not None]
 
     if load_system_information:
-        get_system_information(snaps)
+        snaps = get_system_information(snaps, skip_failed)
 
     return snaps
 
-def get_system_information(snaps):
+def get_system_information(snaps, skip_failed=False):
+    """
+    Loads the system information of the boards concurrently, and
+    returns the boards that succeeded (see init_snaps for skip_failed)
+    """
     ata_cfg = get_ata_cfg()
     snap_fpg_file = ata_cfg['SNAPFPG']
     rfsoc_fpg_file = ata_cfg['RFSOCFPG']
 
-    for snap in snaps:
+    def get_single(snap):
         if snap.host.startswith("frb-snap"):
             snap.fpga.get_system_information(snap_fpg_file)
         elif snap.host.startswith("rfsoc"):
             snap.fpga.get_system_information(rfsoc_fpg_file)
 
+    results = _per_board("get_system_information", get_single, snaps,
+            skip_failed=skip_failed)
+    return [snap for snap, _ in results]
+
 
 def disconnect_snaps(snaps):
     logger = logger_defaults.getModuleLogger(__name__)
     logger.info("disconnecting snaps")
-    for snap in snaps:
-        try:
-            snap.fpga.disconnect()
-        except Exception as e:
-            warnings.warn(str(e))
+    try:
+        _per_board("disconnect_snaps", lambda snap: snap.fpga.disconnect(),
+                snaps)
+    except SnapControlError as e:
+        for host, err in e.failed.items():
+            warnings.warn(str(err))
 
 
-def set_acc_len(snaps, acclen):
+def set_acc_len(snaps, acclen, skip_failed=False):
+    """
+    Returns the boards that succeeded (see init_snaps for skip_failed)
+    """
     logger = logger_defaults.getModuleLogger(__name__)
     hosts = [snap.host for snap in snaps]
     logger.info("Setting accumulation of snaps: %s to "\
             "a length of: %i" %(",".join(hosts), acclen))
-    for snap in snaps:
-        snap.set_accumulation_length(acclen)
+    results = _per_board("set_acc_len",
+            lambda snap: snap.set_accumulation_length(acclen),
+            snaps, skip_failed=skip_failed)
+    return [snap for snap, _ in results]
 
 
-def arm_snaps(snaps):
+def arm_snaps(snaps, skip_failed=False):
+    """
+    Arms all the boards concurrently, just after a sync pulse, so they
+    are all armed within the same sync period. With skip_failed, the
+    boards that could not be disabled or armed are left out (and their
+    output stays disabled), otherwise SnapControlError is raised. It is
+    also raised if no board is left to arm
+    """
     logger = logger_defaults.getModuleLogger(__name__)
 
     logger.info("Arming snaps...")
 
-    disable_ethernet_output(snaps)
+    snaps = disable_ethernet_output(snaps, skip_failed)
 
     current_sync = snaps[0].sync_get_ext_count()
     time.sleep(0.05)
@@ -73,16 +202,17 @@ def arm_snaps(snaps):
     while(snaps[0].sync_get_ext_count() == current_sync):
         time.sleep(0.05)
 
-    sync_time_arr = []
-    for snap in snaps:
-        sync_time = snap.sync_arm()
-        sync_time_arr.append(sync_time)
+    results = _per_board("arm_snaps", lambda snap: snap.sync_arm(), snaps,
+            skip_failed=skip_failed)
+    snaps = [snap for snap, _ in results]
+    sync_time_arr = [sync_time for _, sync_time in results]
     if len(set(sync_time_arr)) != 1:
         for i,snap in enumerate(snaps):
             print(snap.host, sync_time_arr[i])
         raise RuntimeError("Sync times is different across all FPGAs!")
+    sync_time = sync_time_arr[0]
 
-    enable_ethernet_output(snaps)
+    enable_ethernet_output(snaps, skip_failed)
 
     logger = logger_defaults.getModuleLogger(__name__)
     logger.info("Snaps armed successfully, synctime: %i" %sync_time)
@@ -90,24 +220,38 @@ def arm_snaps(snaps):
 
 
 
-def disable_ethernet_output(snaps):
+def disable_ethernet_output(snaps, skip_failed=False):
+    """
+    Returns the boards that succeeded (see init_snaps for skip_failed)
+    """
     logger = logger_defaults.getModuleLogger(__name__)
     logger.debug("Disabling ethernet output")
-    for snap in snaps:
-        snap.eth_reset()
+    results = _per_board("disable_ethernet_output", lambda snap: snap.eth_reset(),
+            snaps, skip_failed=skip_failed)
+    return [snap for snap, _ in results]
 
-def enable_ethernet_output(snaps):
+def enable_ethernet_output(snaps, skip_failed=False):
+    """
+    Returns the boards that succeeded (see init_snaps for skip_failed)
+    """
     logger = logger_defaults.getModuleLogger(__name__)
     logger.debug("Enabling ethernet output")
-    for snap in snaps:
-        snap.eth_enable_output(enable=True)
+    results = _per_board("enable_ethernet_output",
+            lambda snap: snap.eth_enable_output(enable=True),
+            snaps, skip_failed=skip_failed)
+    return [snap for snap, _ in results]
 
 
-def stop_snaps(snaps):
+def stop_snaps(snaps, skip_failed=False):
+    """
+    Returns the boards that succeeded (see init_snaps for skip_failed)
+    """
     logger = logger_defaults.getModuleLogger(__name__)
     logger.info("Stopping SNAPs")
-    for snap in snaps:
-        snap.eth_enable_output(enable=False)
+    results = _per_board("stop_snaps",
+            lambda snap: snap.eth_enable_output(enable=False),
+            snaps, skip_failed=skip_failed)
+    return [snap for snap, _ in results]
 
 
 def get_acc_len_single(snap):
@@ -347,15 +347,17 @@ def start_recording(antlo_list, tobs, npolout = 2, ics=False,
     #reduce size of buffers in case low time resolution
     fact = max(1, get_nearest_pow_2(acclen/snap_dada_defaults.acclen))
 
+    # brings up and tears down all the buffers and their clients at once
+    supervisor = snap_dada_control.DadaSupervisor()
     if ics:
         keylist = snap_dada_control.gen_key_list(len(snaps)+1)
         bufsze_list = [snap_dada_defaults.bufsze//fact]*(len(snaps)+1)
-        snap_dada_control.create_buffers(keylist, bufsze_list, buflogfile)
+        supervisor.create_buffers(keylist, bufsze_list, buflogfile)
     else:
         keylist = snap_dada_control.gen_key_list(len(snaps))
 #        bufsze_list = [snap_dada_defaults.bufsze]*len(snaps)
         bufsze_list = [snap_dada_defaults.bufsze//fact]*(len(snaps))
-        snap_dada_control.create_buffers(keylist, bufsze_list, buflogfile)
+        supervisor.create_buffers(keylist, bufsze_list, buflogfile)
 
     # Always start at the start+0.3 of a second
     ata_helpers.wait_until(np.ceil(time.time()) + 0.3)
@@ -402,40 +404,55 @@ def start_recording(antlo_list, tobs, npolout = 2, ics=False,
     cpu_cores = dup_arr(snap_dada_defaults.NIC_cores, len(ant_list))
     udpdb_logs = [os.path.join(ATA_CFG['LOGDIR'], "udpdb_%s.log")
             %hostn for hostn in list(sub_tab.snap_hostname)]
-    if ics:
-        snap_dada_control.udpdb(list(sub_tab.snap_hostname), list(sub_tab.recv_host),
-                list(sub_tab.recv_port), cpu_cores, header_paths, keylist[:-1],
-                udpdb_logs)
-    else:
-        snap_dada_control.udpdb(list(sub_tab.snap_hostname), list(sub_tab.recv_host),
-                list(sub_tab.recv_port), cpu_cores, header_paths, keylist,
-                udpdb_logs)
-
-    if dbnull:
-        snap_dada_control.dbnull(keylist)
-    else:
-        #dbsigproc_cores = snap_dada_defaults.proc_cores[:len(ant_list)]
-        dbsigproc_cores = dup_arr(snap_dada_defaults.proc_cores, len(antlo_list))
+    try:
         if ics:
-            #snap_dada_control.dbsigproc(keylist[-1])
-            raise RuntimeError("ICS mode not fully implemented")
+            supervisor.start_udpdb(list(sub_tab.snap_hostname), list(sub_tab.recv_host),
+                    list(sub_tab.recv_port), cpu_cores, header_paths, keylist[:-1],
+                    udpdb_logs)
         else:
-            dbsigproc_logs = [os.path.join(ATA_CFG['LOGDIR'], "dbsigproc_%s.log")
-                %hostn for hostn in list(sub_tab.snap_hostname)]
-            snap_dada_control.dbsigproc(keylist, dbsigproc_cores, 
-                    dbsigproc_logs, npolout,
-                    base_obs, invert_freqs=True, disable_rfi=disable_rfi)
+            supervisor.start_udpdb(list(sub_tab.snap_hostname), list(sub_tab.recv_host),
+                    list(sub_tab.recv_port), cpu_cores, header_paths, keylist,
+                    udpdb_logs)
+
+        if dbnull:
+            supervisor.start_dbnull(keylist)
+        else:
+            #dbsigproc_cores = snap_dada_defaults.proc_cores[:len(ant_list)]
+            dbsigproc_cores = dup_arr(snap_dada_defaults.proc_cores, len(antlo_list))
+            if ics:
+                #snap_dada_control.dbsigproc(keylist[-1])
+                raise RuntimeError("ICS mode not fully implemented")
+            else:
+                dbsigproc_logs = [os.path.join(ATA_CFG['LOGDIR'], "dbsigproc_%s.log")
+                    %hostn for hostn in list(sub_tab.snap_hostname)]
+                supervisor.start_dbsigproc(keylist, dbsigproc_cores, 
+                        dbsigproc_logs, npolout,
+                        base_obs, invert_freqs=True, disable_rfi=disable_rfi)
+
+        # writers and readers come up together
+        supervisor.wait_ready()
+    except Exception:
+        logger.error("DADA pipeline not started, tearing it down")
+        try:
+            snap_control.stop_snaps(list(snaps.values()), skip_failed=True)
+        finally:
+            supervisor.stop(buflogfile)
+            snap_control.disconnect_snaps(list(snaps.values()))
+        raise
+    logger.info("DADA pipeline setup times [s]: %s" %supervisor.timings)
 
 
     logger.info("Recording... waiting for obs finish time")
     time.sleep(tobs)
 
     logger.info("Stopping obs")
-    snap_control.stop_snaps(list(snaps.values()))
-    time.sleep(1)
-
-    snap_dada_control.destroy_buffers(keylist, buflogfile)
-    snap_control.disconnect_snaps(list(snaps.values()))
+    try:
+        snap_control.stop_snaps(list(snaps.values()))
+        time.sleep(1)
+    finally:
+        # the buffers and clients go even if a board could not be stopped
+        supervisor.stop(buflogfile)
+        snap_control.disconnect_snaps(list(snaps.values()))
     logger.info("Obs ended")
     write_obs_finished(base_obs)
 
@@ -1,4 +1,6 @@
 import os 
+import subprocess
+import time
 
 from . import snap_dada_defaults
 from ATATools import logger_defaults
@@ -10,78 +12,288 @@ DADAKEYS += ['c%ic%i' %(i,i) for i in range(10)]
 DADAKEYS += ['e%ie%i' %(i,i) for i in range(10)]
 DADAKEYS += ['f%if%i' %(i,i) for i in range(10)]
 
+POLL_INTERVAL = 0.01 # seconds between readiness checks
+
+
+class DadaControlError(RuntimeError):
+    """
+    Raised when some buffers or clients are not ready, once all the
+    others are.
+
+    Attributes
+    ----------
+    failed : dict
+        {(stage, key): reason} of the buffers and clients not ready
+    """
+    def __init__(self, msg, failed):
+        super(DadaControlError, self).__init__(msg)
+        self.failed = failed
+
+
+def _shm_key(key):
+    return int(key, 16)
+
+
+def buffer_exists(key):
+    """
+    Returns True if the shared memory of the dada buffer key exists
+    """
+    with open("/proc/sysvipc/shm") as f:
+        next(f)
+        return any(int(line.split()[0]) == _shm_key(key) for line in f)
+
+
+def client_attached(pid, key):
+    """
+    Returns True if process pid has attached the shared memory of the
+    dada buffer key
+    """
+    segment = "/SYSV%08x" %_shm_key(key)
+    try:
+        with open("/proc/%i/maps" %pid) as f:
+            return any(segment in line for line in f)
+    except (FileNotFoundError, ProcessLookupError):
+        return False
+
+
+class DadaSupervisor(object):
+    """
+    Brings up the dada buffers and their clients (ata_udpdb writers,
+    ata_dbsigproc or dada_dbnull readers) of all the antennas at once,
+    and tears them down.
+
+    All the processes of a stage are launched together. A buffer is
+    ready once dada_db has returned and its shared memory exists, a
+    client once it has attached the shared memory of its buffer. The
+    time from launch to ready of each buffer and client is logged and
+    kept in timings
+
+    Parameters
+    ----------
+    timeout : float
+        seconds for the buffers and clients to be ready
+
+    Attributes
+    ----------
+    timings : dict
+        {stage: {key: seconds}}, None for the ones that were not ready
+    """
+    def __init__(self, timeout=snap_dada_defaults.ready_timeout):
+        self.timeout = timeout
+        self.keys = []
+        self.clients = [] # (stage, key, process)
+        self.timings = {}
+        self._pending = [] # (stage, key, process, launch time, ready)
+        self._unfinished = [] # dada_db processes not done in time
+
+    def _launch(self, stage, key, cmd, logfile, ready):
+        logger = logger_defaults.getModuleLogger(__name__)
+        logger.info("Executing: %s" %" ".join(cmd))
+        if logfile:
+            with open(logfile, "a") as log:
+                proc = subprocess.Popen(cmd, stdout=log,
+                        stderr=subprocess.STDOUT, start_new_session=True)
+        else:
+            proc = subprocess.Popen(cmd, start_new_session=True)
+        self._pending.append((stage, key, proc, time.time(), ready))
+        return proc
+
+    def _launch_client(self, stage, key, cmd, cpu_core, logfile):
+        if cpu_core is not None:
+            cmd = ["numactl", "-C", str(cpu_core)] + cmd
+        proc = self._launch(stage, key, cmd, logfile,
+                lambda proc: client_attached(proc.pid, key))
+        self.clients.append((stage, key, proc))
+
+    def wait_ready(self):
+        """
+        Waits until all the buffers and clients launched are ready
+
+        Raises
+        ------
+        DadaControlError
+            if some exited or were not ready after timeout seconds
+        """
+        logger = logger_defaults.getModuleLogger(__name__)
+        pending, self._pending = self._pending, []
+        for stage, key, _, _, _ in pending:
+            self.timings.setdefault(stage, {})[key] = None
+        failed = {}
+        t_start = time.time()
+        while pending:
+            still_pending = []
+            for item in pending:
+                stage, key, proc, t_launch, ready = item
+                if ready(proc):
+                    self.timings[stage][key] = time.time() - t_launch
+                elif proc.poll() is not None:
+                    failed[(stage, key)] = "exited with code %i" %proc.returncode
+                else:
+                    still_pending.append(item)
+            pending = still_pending
+            if pending and time.time() - t_start > self.timeout:
+                for stage, key, proc, _, _ in pending:
+                    failed[(stage, key)] = "not ready after %.1f s" %self.timeout
+                    if stage in ("create_buffers", "destroy_buffers"):
+                        self._unfinished.append(proc)
+                break
+            if pending:
+                time.sleep(POLL_INTERVAL)
+
+        for stage, timings in self.timings.items():
+            done = [(t, key) for key, t in timings.items() if t is not None]
+            if done:
+                logger.info("%s: %i ready, slowest: %s (%.2f s)" %(stage,
+                    len(done), max(done)[1], max(done)[0]))
+        for (stage, key), reason in failed.items():
+            logger.error("%s %s %s" %(stage, key, reason))
+        if failed:
+            raise DadaControlError("%i buffers/clients not ready: %s"
+                    %(len(failed), sorted(failed)), failed)
+
+    def create_buffers(self, keylist, bufsze_list, logfile,
+            nbufs=snap_dada_defaults.nbufs):
+        """
+        Creates the dada buffers of keylist concurrently, and waits for them
+        """
+        for key, bufsze in zip(keylist, bufsze_list):
+            self._launch("create_buffers", key, [snap_dada_defaults.dada_db,
+                "-k", key, "-b", str(bufsze), "-n", str(nbufs)], logfile,
+                lambda proc, key=key: proc.poll() == 0 and buffer_exists(key))
+            self.keys.append(key)
+        self.wait_ready()
+
+    def destroy_buffers(self, keylist, logfile):
+        """
+        Destroys the dada buffers of keylist concurrently, and waits for it
+        """
+        logger = logger_defaults.getModuleLogger(__name__)
+        logger.info("Destroying dada buffers")
+        for key in keylist:
+            self._launch("destroy_buffers", key, [snap_dada_defaults.dada_db,
+                "-k", key, "-d"], logfile,
+                lambda proc, key=key: proc.poll() == 0 and not buffer_exists(key))
+        self.keys = [key for key in self.keys if key not in keylist]
+        self.wait_ready()
+
+    def start_udpdb(self, snap_hosts, rx_hosts, rx_ports, cpu_cores,
+            header_files, keylist, logfiles):
+        """
+        Launches an ata_udpdb writer per buffer, see wait_ready
+        """
+        for snap_host, rx_host, rx_port, cpu_core, header_file, key, logfile in\
+                zip(snap_hosts, rx_hosts, rx_ports, cpu_cores, header_files,
+                        keylist, logfiles):
+            self._launch_client("udpdb", key, [snap_dada_defaults.udpdb_exe,
+                header_file, "-p", str(rx_port), "-k", key, "-i", rx_host],
+                cpu_core, logfile)
+
+    def start_dbsigproc(self, keylist, cpu_cores, logfiles, npol, basedir,
+            disable_rfi, invert_freqs=True):
+        """
+        Launches an ata_dbsigproc reader per buffer, see wait_ready
+        """
+        flags = ["-s", "-p", str(npol), "-D", basedir]
+        if invert_freqs:
+            flags.append("-i")
+        if disable_rfi:
+            flags.append("-m")
+        for cpu_core, key, logfile in zip(cpu_cores, keylist, logfiles):
+            self._launch_client("dbsigproc", key, [snap_dada_defaults.dbsigproc_exe,
+                "-k", key] + flags, cpu_core, logfile)
+
+    def start_dbnull(self, inkeys, logfile=None):
+        """
+        Launches a dada_dbnull reader per buffer, see wait_ready
+        """
+        for key in inkeys:
+            self._launch_client("dbnull", key, [snap_dada_defaults.dbnull_exe,
+                "-k", key, "-s", "-z"], None, logfile)
+
+    def stop(self, logfile, timeout=None):
+        """
+        Destroys the buffers, waits for their clients to exit and
+        terminates the ones still running after timeout seconds
+        (default: the supervisor timeout)
+        """
+        logger = logger_defaults.getModuleLogger(__name__)
+        if timeout is None:
+            timeout = self.timeout
+        try:
+            # a late dada_db could create a buffer after it is destroyed
+            for proc in self._unfinished:
+                proc.terminate()
+                proc.wait()
+            self._unfinished = []
+            # the buffers of a failed create_buffers may not exist
+            keys = [key for key in self.keys if buffer_exists(key)]
+            if keys:
+                self.destroy_buffers(keys, logfile)
+            self.keys = []
+        finally:
+            t_stop = time.time() + timeout
+            for stage, key, proc in self.clients:
+                try:
+                    proc.wait(max(0, t_stop - time.time()))
+                except subprocess.TimeoutExpired:
+                    logger.warning("%s %s still running, terminating it" %(stage, key))
+                    proc.terminate()
+                    try:
+                        proc.wait(1)
+                    except subprocess.TimeoutExpired:
+                        proc.kill()
+                        proc.wait()
+            self.clients = []
+
+
 def create_buffers(keylist, bufsze_list, logfile):
-    logger = logger_defaults.getModuleLogger(__name__)
-    pairs = ""
-    for key, bufsze in zip(keylist, bufsze_list):
-        pairs += key
-        pairs += " "
-        pairs += str(bufsze)
-        pairs += " "
-    script = os.path.join(MYCWD, snap_dada_defaults.create_buf_script)
-    cmd = script + " " + pairs + ">> " + logfile + " 2>&1"
-    logger.info("Executing: %s" %cmd)
-    os.system(cmd)
+    """
+    Creates the dada buffers concurrently, and returns their supervisor
+    """
+    supervisor = DadaSupervisor()
+    supervisor.create_buffers(keylist, bufsze_list, logfile)
+    return supervisor
 
 
 def destroy_buffers(keylist, logfile):
-    logger = logger_defaults.getModuleLogger(__name__)
-    logger.info("Destroying dada buffers")
-    script = os.path.join(MYCWD, snap_dada_defaults.destroy_buf_script)
-    cmd = script + " " + " ".join(keylist) + ">> " + logfile + " 2>&1"
-    logger.info("Executing: %s" %cmd)
-    os.system(cmd)
+    DadaSupervisor().destroy_buffers(keylist, logfile)
 
 
-# ugly funcion...
 def udpdb(snap_hosts, rx_hosts, rx_ports, 
         cpu_cores, header_files, keylist, logfiles):
-    rx_ports = [str(i) for i in rx_ports]
-    cpu_cores = [str(i) for i in cpu_cores]
-    logger = logger_defaults.getModuleLogger(__name__)
-    logger.debug(snap_hosts)
-    logger.debug(rx_hosts)
-    logger.debug(rx_ports)
-    logger.debug(cpu_cores)
-    logger.debug(header_files)
-    logger.debug(keylist)
-    logger.debug(logfiles)
-
-    script = os.path.join(MYCWD, snap_dada_defaults.udpdb_script)
-    cmd = script + " "
-    for allParams in zip(snap_hosts, rx_hosts, rx_ports, 
-            cpu_cores, header_files, keylist, logfiles):
-        cmd += " ".join(allParams) + " "
-
-    logger.info("Executing: %s" %cmd)
-    os.system(cmd)
+    """
+    Launches the ata_udpdb writers, and returns their supervisor once
+    they are ready
+    """
+    supervisor = DadaSupervisor()
+    supervisor.start_udpdb(snap_hosts, rx_hosts, rx_ports,
+            cpu_cores, header_files, keylist, logfiles)
+    supervisor.wait_ready()
+    return supervisor
 
 
 def dbsigproc(keylist, cpu_cores, logfiles, npol, basedir, 
         disable_rfi, invert_freqs=True):
-    logger = logger_defaults.getModuleLogger(__name__)
-    script = os.path.join(MYCWD, snap_dada_defaults.dbsigproc_script)
-    cpu_cores = [str(i) for i in cpu_cores]
-    cmd = script + " "
-    if invert_freqs:
-        cmd += " -i "
-    if disable_rfi:
-        cmd += " -m "
-    cmd += " -p %i " %npol
-    cmd += " -D %s " %basedir
-    for cpu_key_log in zip(cpu_cores, keylist, logfiles):
-        cmd += " ".join(cpu_key_log) + " "
-    logger.info("Executing: %s" %cmd)
-    os.system(cmd)
+    """
+    Launches the ata_dbsigproc readers, and returns their supervisor once
+    they are ready
+    """
+    supervisor = DadaSupervisor()
+    supervisor.start_dbsigproc(keylist, cpu_cores, logfiles, npol, basedir,
+            disable_rfi, invert_freqs)
+    supervisor.wait_ready()
+    return supervisor
 
 
 def dbnull(inkeys):
-    logger = logger_defaults.getModuleLogger(__name__)
-    script = os.path.join(MYCWD, snap_dada_defaults.dbnull_script)
-    cmd = script + " " + " ".join(inkeys)
-    logger.info("Executing: %s" %cmd)
-    os.system(cmd)
-
+    """
+    Launches the dada_dbnull readers, and returns their supervisor once
+    they are ready
+    """
+    supervisor = DadaSupervisor()
+    supervisor.start_dbnull(inkeys)
+    supervisor.wait_ready()
+    return supervisor
 
 
 def dbsumdb(inkeys, outkey, loggerfile):
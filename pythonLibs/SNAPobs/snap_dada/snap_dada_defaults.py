@@ -4,6 +4,12 @@ udpdb_script = "udpdb.sh"
 dbsumdb_script = "ata_dbsumdb"
 dbsigproc_script = "dbsigproc.sh"
 dbnull_script = "dbnull.sh"
+dada_db = "dada_db"
+udpdb_exe = "ata_udpdb"
+dbsigproc_exe = "ata_dbsigproc"
+dbnull_exe = "dada_dbnull"
+nbufs = 32 # blocks per dada buffer
+ready_timeout = 20 # seconds for the buffers and clients to be ready
 #NIC_cores = [8,9,10,11,12,13,14,15,24,25,26,27,28,29,30,31]
 NIC_cores = [8,9,10,11,12,13,14,15]
 #proc_cores = [4,5,6,7,16,17,18,19,20,21,22,23]
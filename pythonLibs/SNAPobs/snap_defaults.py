@@ -14,6 +14,8 @@ ifc = 512.0
 mux_sel = {'auto':0, 'cross':1}
 bw = srate/2 #MHz
 nchan = 4096
+#captures per block streamed by snap_recorder.captureSpectra to the uvh5 writer
+capture_block = 64
 base_name = "frb-snap"
 template_header = "template_header.txt"
 discone_name = 'rfi'
@@ -8,19 +8,20 @@ save functions for snap uvh5 file
 from ATATools import logger_defaults,ata_constants,ata_control
 from . import snap_dirs
 import pyuvdata
+import h5py
 from astropy.time import Time
+from astropy.coordinates import EarthLocation
 import datetime
 import numpy
 import datetime
 import os
 
-def create_snap_uvdata(snapdict,azoffset,eloffset,recid,setid=None):
-    logger_defaults.getModuleLogger(__name__)
+def _create_snap_uvdata_v2(snapdict,ashape,object_name,aind,tt,antenna_positions,
+        phase_center_ra,phase_center_dec,metadata_only):
+    """
+    the UVData of pyuvdata < 3.0, filled attribute by attribute
+    """
     obj = pyuvdata.UVData()
-
-    ant = snapdict['ant']
-    ashape = numpy.shape(snapdict['auto0'])
-
     #obj.latitude = ata_constants.ATA_LAT
     #obj.longitude = ata_constants.ATA_LON
     #obj.altitude = ata_constants.ATA_ELEV
@@ -30,15 +31,11 @@ def create_snap_uvdata(snapdict,azoffset,eloffset,recid,setid=None):
         obj.telescope_location = pyuvdata.utils.XYZ_from_LatLonAlt(ata_constants.ATA_LAT/180.0*numpy.pi,ata_constants.ATA_LON/180.0*numpy.pi,ata_constants.ATA_ELEV) 
     obj.telescope_name = ata_constants.ATA_NAME
     obj.instrument = ata_constants.ATA_NAME + snapdict['host']
-    if azoffset == 0 and eloffset == 0:
-        obj.object_name = snapdict['source']
-    else:
-        obj.object_name = '{0:s}_off_{1:03.1f}_{2:03.1f}'.format(snapdict['source'],azoffset,eloffset)
+    obj.object_name = object_name
     obj.history = 'Snap Waterfall measurement'
     obj.phase_type = 'phased'
     obj.Nants_data = 1
     obj.Nants_telescope = len(ata_constants.ant_names)
-    aind = ata_constants.ant_names.index(ant)
     obj.ant_1_array = numpy.array([aind] * ashape[0])
     obj.ant_2_array = numpy.array([aind] * ashape[0])
     obj.baseline_array = pow(2,16) + (numpy.array([aind] * ashape[0])+1) * 2049
@@ -52,7 +49,6 @@ def create_snap_uvdata(snapdict,azoffset,eloffset,recid,setid=None):
     obj.Ntimes = ashape[0]
     obj.Nspws = 1
     obj.uvw_array = numpy.zeros((ashape[0],3),dtype=float)
-    tt = Time(snapdict['auto0_timestamp'],format='unix',location=(ata_constants.ATA_LON,ata_constants.ATA_LAT,ata_constants.ATA_ELEV))
     #obj.time_array = tt.to_value('mjd', 'long')
     obj.time_array = tt.jd
     #utils.get_lst_for_time?
@@ -69,35 +65,95 @@ def create_snap_uvdata(snapdict,azoffset,eloffset,recid,setid=None):
     #-5 is XX, -6 is YY
     obj.polarization_array = [-5,-6]
     obj.vis_units = 'uncalib'
-    obj.nsample_array = numpy.ones((ashape[0],1,ashape[1],2),dtype=float)
-    obj.flag_array = numpy.zeros((ashape[0],1,ashape[1],2),dtype=bool)
-    obj.data_array = numpy.zeros((ashape[0],1,ashape[1],2),dtype=numpy.complex64)
-    xx = numpy.array(snapdict['auto0'],dtype=numpy.complex64)
-    obj.data_array[:,0,:,0] = xx
-    yy = numpy.array(snapdict['auto1'],dtype=numpy.complex64)
-    obj.data_array[:,0,:,1] = yy
-    #now we have all required parameters, let's fill the extra keywords
-    apos_dict = ata_control.get_ant_pos(ata_constants.ant_names)
-    obj.antenna_positions = numpy.zeros((len(ata_constants.ant_names),3),dtype=float)
-    for ii in range(len(ata_constants.ant_names)):
-        cant = ata_constants.ant_names[ii]
-        obj.antenna_positions[ii][0] = apos_dict[cant][1]
-        obj.antenna_positions[ii][1] = apos_dict[cant][0]
-        obj.antenna_positions[ii][2] = apos_dict[cant][2]
+    if not metadata_only:
+        obj.nsample_array = numpy.ones((ashape[0],1,ashape[1],2),dtype=float)
+        obj.flag_array = numpy.zeros((ashape[0],1,ashape[1],2),dtype=bool)
+        obj.data_array = numpy.zeros((ashape[0],1,ashape[1],2),dtype=numpy.complex64)
+        xx = numpy.array(snapdict['auto0'],dtype=numpy.complex64)
+        obj.data_array[:,0,:,0] = xx
+        yy = numpy.array(snapdict['auto1'],dtype=numpy.complex64)
+        obj.data_array[:,0,:,1] = yy
+    obj.antenna_positions = antenna_positions
 
     #optional arguments
     obj.timesys = datetime.datetime.utcfromtimestamp(snapdict['auto0_timestamp'][0]).strftime('%Y-%m-%d %H:%M:%S')
 
-    if 'ra' in snapdict:
-        obj.phase_center_ra = snapdict['ra']/12*numpy.pi
-    else:
-        obj.phase_center_ra = 0
-    if 'dec' in snapdict:
-        obj.phase_center_dec = snapdict['dec']/180*numpy.pi
-    else:
-        obj.phase_center_dec = 0
+    obj.phase_center_ra = phase_center_ra
+    obj.phase_center_dec = phase_center_dec
     #J2000.0
     obj.phase_center_epoch = 2000.0
+    return obj
+
+def create_snap_uvdata(snapdict,azoffset,eloffset,recid,setid=None,metadata_only=False):
+    """
+    with metadata_only, the data, flag and nsample arrays are not created and
+    snapdict['auto0'] may be the (ncaptures, nchans) shape of the recording
+    """
+    logger_defaults.getModuleLogger(__name__)
+
+    ant = snapdict['ant']
+    if metadata_only:
+        ashape = tuple(snapdict['auto0'])
+    else:
+        ashape = numpy.shape(snapdict['auto0'])
+
+    if azoffset == 0 and eloffset == 0:
+        object_name = snapdict['source']
+    else:
+        object_name = '{0:s}_off_{1:03.1f}_{2:03.1f}'.format(snapdict['source'],azoffset,eloffset)
+    aind = ata_constants.ant_names.index(ant)
+    tt = Time(snapdict['auto0_timestamp'],format='unix',location=(ata_constants.ATA_LON,ata_constants.ATA_LAT,ata_constants.ATA_ELEV))
+    apos_dict = ata_control.get_ant_pos(ata_constants.ant_names)
+    antenna_positions = numpy.zeros((len(ata_constants.ant_names),3),dtype=float)
+    for ii in range(len(ata_constants.ant_names)):
+        cant = ata_constants.ant_names[ii]
+        antenna_positions[ii][0] = apos_dict[cant][1]
+        antenna_positions[ii][1] = apos_dict[cant][0]
+        antenna_positions[ii][2] = apos_dict[cant][2]
+    phase_center_ra = snapdict['ra']/12*numpy.pi if 'ra' in snapdict else 0
+    phase_center_dec = snapdict['dec']/180*numpy.pi if 'dec' in snapdict else 0
+
+    if hasattr(pyuvdata,'Telescope'):
+        #pyuvdata >= 3.0, the telescope metadata are in a Telescope object,
+        #the phase center in a catalog and the arrays have no spw axis
+        telescope = pyuvdata.Telescope.new(name=ata_constants.ATA_NAME,
+                location=EarthLocation.from_geodetic(ata_constants.ATA_LON,ata_constants.ATA_LAT,ata_constants.ATA_ELEV),
+                antenna_positions=antenna_positions,
+                antenna_names=list(ata_constants.ant_names),
+                antenna_numbers=list(range(len(ata_constants.ant_names))),
+                instrument=ata_constants.ATA_NAME + snapdict['host'])
+        freq_array = numpy.asarray(snapdict['frange'],dtype=float)*1e6
+        if metadata_only:
+            data = {}
+        else:
+            data_array = numpy.zeros((ashape[0],ashape[1],2),dtype=numpy.complex64)
+            data_array[:,:,0] = snapdict['auto0']
+            data_array[:,:,1] = snapdict['auto1']
+            data = {'data_array': data_array,
+                    'flag_array': numpy.zeros(data_array.shape,dtype=bool),
+                    'nsample_array': numpy.ones(data_array.shape,dtype=float)}
+        obj = pyuvdata.UVData.new(freq_array=freq_array,
+                #-5 is XX, -6 is YY
+                polarization_array=[-5,-6],
+                times=tt.jd,
+                telescope=telescope,
+                antpairs=[(aind,aind)]*ashape[0],
+                do_blt_outer=False,
+                integration_time=numpy.full(ashape[0],snapdict['tint'],dtype=float),
+                channel_width=numpy.full(ashape[1],(snapdict['frange'][1]-snapdict['frange'][0])*1e6),
+                history='Snap Waterfall measurement',
+                vis_units='uncalib',
+                phase_center_catalog={0: {'cat_name': object_name, 'cat_type': 'sidereal',
+                    'cat_lon': phase_center_ra, 'cat_lat': phase_center_dec,
+                    'cat_frame': 'fk5', 'cat_epoch': 2000.0}},
+                phase_center_id_array=numpy.zeros(ashape[0],dtype=int),
+                **data)
+        #the same lst as the older versions and SnapH5Writer.close
+        obj.lst_array = numpy.array(tt.sidereal_time('apparent'))/12*numpy.pi
+        obj.timesys = datetime.datetime.utcfromtimestamp(snapdict['auto0_timestamp'][0]).strftime('%Y-%m-%d %H:%M:%S')
+    else:
+        obj = _create_snap_uvdata_v2(snapdict,ashape,object_name,aind,tt,antenna_positions,
+                phase_center_ra,phase_center_dec,metadata_only)
 
     #now we are creating an extra keywords dictionary
     ek = {}
@@ -144,12 +200,80 @@ def create_snap_uvdata(snapdict,azoffset,eloffset,recid,setid=None):
     obj.extra_keywords = ek
     return obj
 
+def snapFileName(filepart,ant,recid):
+    return os.path.join(snap_dirs.get_output_dir(),'snap_' + str(recid) + '_' + filepart + '_' + ant + '.h5')
+
 def saveFile(filepart,snapdict,azoffset,eloffset,recid,setid):
     logger_defaults.getModuleLogger(__name__)
     uvdat = create_snap_uvdata(snapdict,azoffset,eloffset,recid,setid=None)
-    filename = os.path.join(snap_dirs.get_output_dir(),'snap_' + str(recid) + '_' + filepart + '_' + snapdict['ant'] + '.h5')
+    filename = snapFileName(filepart,snapdict['ant'],recid)
     uvdat.write_uvh5(filename)
 
+class SnapH5Writer(object):
+    """
+    streams a snap recording into a uvh5 file while it is being captured,
+    a block of captures at a time, so the whole recording is never held
+    in memory. The file written is the same as with saveFile.
+
+    snapdict holds the information not known to snap_recorder.gatherData
+    (source, ra, dec, az, el, host, fpga_clk, fpgfile, srate).
+    The header is written on the first block, with the capture timestamps
+    extrapolated from the first one, and the timestamps and overflow
+    counters are updated with the recorded values by close
+    """
+    def __init__(self,filename,azoffset,eloffset,recid,setid=None,snapdict=None):
+        self.filename = filename
+        self.azoffset = azoffset
+        self.eloffset = eloffset
+        self.recid = recid
+        self.setid = setid
+        self.snapdict = dict(snapdict or {})
+        self.uvdat = None
+
+    def open(self,snapdict):
+        logger = logger_defaults.getModuleLogger(__name__)
+        header = dict(self.snapdict)
+        header.update(snapdict)
+        ncaptures = len(snapdict['auto0_timestamp'])
+        header['auto0'] = (ncaptures,len(snapdict['frange']))
+        header['auto0_timestamp'] = snapdict['auto0_timestamp'][0] + snapdict['tint']*numpy.arange(ncaptures)
+        self.uvdat = create_snap_uvdata(header,self.azoffset,self.eloffset,self.recid,setid=None,metadata_only=True)
+        self.uvdat.initialize_uvh5_file(self.filename,clobber=True)
+        logger.info('streaming {} captures to {}'.format(ncaptures,self.filename))
+
+    def write(self,start,auto0,auto1,snapdict):
+        if self.uvdat is None:
+            self.open(snapdict)
+        n,nchans = numpy.shape(auto0)
+        if hasattr(pyuvdata,'Telescope'):
+            #pyuvdata >= 3.0, no spw axis
+            data = numpy.zeros((n,nchans,2),dtype=numpy.complex64)
+            data[:,:,0] = auto0
+            data[:,:,1] = auto1
+        else:
+            data = numpy.zeros((n,1,nchans,2),dtype=numpy.complex64)
+            data[:,0,:,0] = auto0
+            data[:,0,:,1] = auto1
+        self.uvdat.write_uvh5_part(self.filename,data_array=data,
+                flag_array=numpy.zeros(data.shape,dtype=bool),nsample_array=numpy.ones(data.shape,dtype=float),
+                blt_inds=numpy.arange(start,start+n),
+                #the header was written by open, no need to read it back every block
+                check_header=False)
+
+    def close(self,snapdict):
+        """
+        write the recorded timestamps and overflow counters in the file header
+        """
+        tt = Time(snapdict['auto0_timestamp'],format='unix',location=(ata_constants.ATA_LON,ata_constants.ATA_LAT,ata_constants.ATA_ELEV))
+        with h5py.File(self.filename,'r+') as f:
+            header = f['Header']
+            header['time_array'][:] = tt.jd
+            header['lst_array'][:] = numpy.array(tt.sidereal_time('apparent'))/12*numpy.pi
+            ek = header['extra_keywords']
+            for key in ['fft_of0','fft_of1','auto0_of_count','auto1_of_count']:
+                for ii in range(len(snapdict[key])):
+                    ek[key + '_' + str(ii)][()] = snapdict[key][ii]
+
 if __name__== "__main__":
     import pickle
     f = open('testing_save1a.pkl','rb')
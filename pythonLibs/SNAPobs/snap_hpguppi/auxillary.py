@@ -134,14 +134,108 @@ def generate_freq_auto_string_per_channel(
   hpguppi_redis_get_channels
 ):
   log_string_per_channel = []
+  snaps_per_channel = get_stream_hostnames_of_redis_chans(redis_obj, hpguppi_redis_get_channels)
   for channel in hpguppi_redis_get_channels:
-    snaps = get_stream_hostnames_of_redis_chan(redis_obj, channel)
+    snaps = snaps_per_channel[channel]
     antdict = get_antennalo_name_dict_for_stream_hostnames(snaps)
     log_string_per_channel.append(
       str(snap_dada.get_freq_auto([antdict[snap] for snap in snaps]))
     )
   return log_string_per_channel
 
+# Redis commands are batched into pipelines (not transactions) so that fanning
+# out to many hashpipe instances costs one round-trip instead of one per command.
+# Each helper counts what it issued in a summary dict, printed when it returns
+# and kept in last_redis_summary.
+last_redis_summary = None
+
+def new_redis_summary(label):
+  return {'label': label, 'commands': 0, 'round_trips': 0}
+
+def print_redis_summary(summary):
+  global last_redis_summary
+  last_redis_summary = summary
+  print('{}: {} redis commands in {} round-trip{}'.format(
+    summary['label'], summary['commands'], summary['round_trips'],
+    '' if summary['round_trips'] == 1 else 's'
+  ))
+
+def redis_pipeline_execute(redis_obj, commands, summary=None):
+  '''
+  Executes the commands in a single pipelined round-trip.
+
+  Parameters
+  ----------
+  redis_obj: redis.Redis
+  commands: list
+    (method_name, *args) tuples, e.g. ('hget', channel, key)
+  summary: dict
+    A summary (from new_redis_summary) to count the commands and round-trip in
+  
+  Returns
+  -------
+  list: The result of each command, or the exception it raised
+  '''
+  if len(commands) == 0:
+    return []
+  pipe = redis_obj.pipeline(transaction=False)
+  for method, *args in commands:
+    getattr(pipe, method)(*args)
+  try:
+    results = pipe.execute(raise_on_error=False)
+  except Exception as e:
+    # connection-level failure, every command failed
+    results = [e]*len(commands)
+  if summary is not None:
+    summary['commands'] += len(commands)
+    summary['round_trips'] += 1
+  return results
+
+def _decode_redis_value(value):
+  if value is None or isinstance(value, Exception):
+    return None
+  try:
+    return value.decode()
+  except:
+    return None
+
+def redis_hmget_many(redis_obj, redis_chans, keys, retry_count=5, summary=None):
+  '''
+  Gets the keys of every redis hash in one pipelined round-trip, retrying
+  (in one round-trip per attempt) the hashes with missing values.
+
+  Parameters
+  ----------
+  redis_chans: list
+    The redis hashes to consult
+  keys: list
+    The keys to get from every hash
+  retry_count: int
+    The number of attempts for hashes with missing values
+
+  Returns
+  -------
+  dict: {redis_chan: {key: str value or None}}
+  '''
+  values = {chan: {key: None for key in keys} for chan in redis_chans}
+  pending = list(dict.fromkeys(redis_chans))
+  while len(pending) > 0 and retry_count > 0:
+    results = redis_pipeline_execute(
+      redis_obj,
+      [('hmget', chan, list(keys)) for chan in pending],
+      summary
+    )
+    for chan, result in zip(pending, results):
+      if isinstance(result, Exception):
+        continue
+      for key, value in zip(keys, result):
+        value = _decode_redis_value(value)
+        if value is not None:
+          values[chan][key] = value
+    pending = [chan for chan in pending if any(v is None for v in values[chan].values())]
+    retry_count -= 1
+  return values
+
 def redis_hget_retry(redis_obj, redis_chan, key, retry_count=5):
   value = None
   while value is None and retry_count > 0:
@@ -152,32 +246,72 @@ def redis_hget_retry(redis_obj, redis_chan, key, retry_count=5):
     retry_count -= 1
   return value
 
+def get_antennae_of_redis_chans(redis_obj, redis_chans, summary=None):
+  '''
+  Collects the antenna names (ANTNAMES, continued in ANTNMSxx up to NANTS names)
+  of every redis hash, in two pipelined round-trips regardless of the number of hashes.
+
+  Returns
+  -------
+  dict: {redis_chan: [antenna names]}
+  '''
+  print_summary = summary is None
+  if print_summary:
+    summary = new_redis_summary('get_antennae_of_redis_chans')
+
+  heads = redis_hmget_many(redis_obj, redis_chans, ['ANTNAMES', 'NANTS'], summary=summary)
+  antennae = {}
+  antennae_counts = {}
+  for chan, head in heads.items():
+    antennae[chan] = [] if head['ANTNAMES'] is None else head['ANTNAMES'].split(',')
+    try:
+      antennae_counts[chan] = int(head['NANTS'])
+    except (TypeError, ValueError):
+      antennae_counts[chan] = 0
+
+  # the continuation keys hold at least one name each, so NANTS bounds their number
+  incomplete = [chan for chan in heads if antennae_counts[chan] > len(antennae[chan])]
+  if len(incomplete) > 0:
+    results = redis_pipeline_execute(
+      redis_obj,
+      [('hmget', chan, ['ANTNMS%02d'%key_enum for key_enum in range(1, antennae_counts[chan]+1)])
+        for chan in incomplete],
+      summary
+    )
+    for chan, result in zip(incomplete, results):
+      continuations = [] if isinstance(result, Exception) else [_decode_redis_value(v) for v in result]
+      key_enum = 0
+      while(antennae_counts[chan] > len(antennae[chan])):
+        key_enum += 1
+        ant_names = continuations[key_enum-1] if key_enum <= len(continuations) else None
+        if ant_names is None:
+          print(
+            ('Could only collect {}/{} antennae, '
+              '{} does not exist in channel {}').format(
+              len(antennae[chan]), antennae_counts[chan], 'ANTNMS%02d'%key_enum, chan
+            )
+          )
+          break
+        antennae[chan] += ant_names.split(',')
+
+  if print_summary:
+    print_redis_summary(summary)
+  return antennae
+
 def get_antennae_of_redis_chan(redis_obj, redis_chan):
-  antennae_names = redis_hget_retry(redis_obj, redis_chan, 'ANTNAMES')
-  if antennae_names is None:
-    antennae_names = []
-  else:
-    antennae_names = antennae_names.split(',')
-  
-  antennae_count = redis_hget_retry(redis_obj, redis_chan, 'NANTS')
-  if antennae_count is None:
-    antennae_count = 0
-  else:
-    antennae_count = int(antennae_count)
-  key_enum = 0
-  while(antennae_count > len(antennae_names)):
-    key_enum += 1
-    ant_names = redis_hget_retry(redis_obj, redis_chan, 'ANTNMS%02d'%key_enum)
-    if ant_names is None:
-      print(
-        ('Could only collect {}/{} antennae, '
-          '{} does not exist in channel {}').format(
-          len(antennae_names), antennae_count, 'ANTNMS%02d'%key_enum, redis_chan
-        )
-      )
-      break
-    antennae_names += ant_names.split(',')
-  return antennae_names
+  # counted in a summary of its own, not printed: the single channel
+  # lookup is called in loops
+  summary = new_redis_summary('get_antennae_of_redis_chan')
+  return get_antennae_of_redis_chans(redis_obj, [redis_chan], summary=summary)[redis_chan]
+
+def get_stream_hostnames_of_redis_chans(redis_obj, redis_chans, summary=None):
+  '''
+  Returns
+  -------
+  dict: {redis_chan: [stream hostnames]}, see get_antennae_of_redis_chans
+  '''
+  antennae = get_antennae_of_redis_chans(redis_obj, redis_chans, summary=summary)
+  return {chan: get_stream_hostname_per_antennalo_names(ants) for chan, ants in antennae.items()}
 
 def get_stream_hostnames_of_redis_chan(redis_obj, redis_chan):
   antennae = get_antennae_of_redis_chan(redis_obj, redis_chan)
@@ -247,32 +381,39 @@ def publish_keyval_dict_to_redis(
   '''
 
   print(keyval_dict)
+  summary = new_redis_summary('publish_keyval_dict_to_redis')
   redis_publish_command = redis_publish_command_from_dict(keyval_dict)
   redis_pubsub_channels = [
     chan.decode()
       for chan in hpguppi_defaults.redis_obj.pubsub_channels()
   ]
+  summary['commands'] += 1
+  summary['round_trips'] += 1
   
   if isinstance(targets, dict):
     targets = redis_hashpipe_channels_from_dict(targets, postproc=postproc)
   
+  commands = []
+  errors = []
   print('Publishing to:')
   for target in targets:
     if target in redis_pubsub_channels:
       print('\t@', target)
-      if dry_run:
-        print('*** Dry Run ***')
-      else:
-        hpguppi_defaults.redis_obj.publish(
-          target,
-          redis_publish_command
-        )
+      commands.append(('publish', target, redis_publish_command))
     else:
       print('\t# ', target)
-      if dry_run:
-        print('*** Dry Run ***')
-      else:
-        hpguppi_defaults.redis_obj.hset(target, mapping=keyval_dict)
+      commands.append(('hset', target, None, None, keyval_dict))
+  if dry_run:
+    print('*** Dry Run ***')
+  else:
+    results = redis_pipeline_execute(hpguppi_defaults.redis_obj, commands, summary)
+    errors = [result for result in results if isinstance(result, Exception)]
+    for command, result in zip(commands, results):
+      if isinstance(result, Exception):
+        print('Failed to {} {}: {}'.format(command[0], command[1], result))
+  print_redis_summary(summary)
+  if len(errors) > 0:
+    raise errors[0]
 
 
 def _block_until_key_has_value(targets, key, value, verbose=True):
@@ -294,10 +435,15 @@ def _block_until_key_has_value(targets, key, value, verbose=True):
     '''
     len_per_value = 80//len(targets)
     value_slice = slice(-len_per_value, None)
+    summary = new_redis_summary('_block_until_key_has_value')
 
     while True:
-      rr = [hpguppi_defaults.redis_obj.hget(hsh, key) for hsh in targets]
-      rets = [r.decode() if(r) else 'NONE' for r in rr]
+      rr = redis_pipeline_execute(
+        hpguppi_defaults.redis_obj,
+        [('hget', hsh, key) for hsh in targets],
+        summary
+      )
+      rets = [_decode_redis_value(r) or 'NONE' for r in rr]
       if verbose:
         print_strings = [
           ('{: ^%d}'%len_per_value).format(ret[value_slice]) for ret in rets
@@ -306,6 +452,7 @@ def _block_until_key_has_value(targets, key, value, verbose=True):
       if all([re.fullmatch(value, ret) for ret in rets]):
         if verbose:
           print()
+          print_redis_summary(summary)
         break
       time.sleep(1)
 
@@ -4,6 +4,9 @@ import time
 import os
 import glob
 import re
+import mmap
+import ctypes
+import ctypes.util
 
 from SNAPobs import snap_defaults
 
@@ -15,6 +18,247 @@ init_redis_gateway_sh = os.path.join(ATA_EXEC_DIR, 'init_redis_gateway.sh')
 kill_redis_gateway_sh = os.path.join(ATA_EXEC_DIR, 'kill_redis_gateway.sh')
 kill_hashpipe_related_sh = os.path.join(ATA_EXEC_DIR, 'kill_hashpipe_related.sh')
 
+# layout of the hashpipe status buffer (hashpipe_status.h): FITS-like 80 character
+# cards ("KEY     = value"), terminated by an END card
+HASHPIPE_STATUS_TOTAL_SIZE = 2880*64
+HASHPIPE_STATUS_RECORD_SIZE = 80
+SHM_RDONLY = 0o10000
+
+# whether get_hashpipe_key_value reads the status shared memory directly,
+# falling back to hashpipe_check_status if the segment cannot be attached
+USE_SHM_STATUS = True
+
+def hashpipe_keyfile():
+    return os.environ.get('HASHPIPE_KEYFILE', os.environ.get('HOME', '/tmp'))
+
+def hashpipe_status_key(instance=0):
+    '''
+    The SysV IPC key of the status segment of a hashpipe instance,
+    as computed by hashpipe_status_key(): ftok(keyfile, (instance&0x3f)|0x40)
+
+    Parameters
+    ----------
+    instance: int
+        The enumeration of the hashpipe instance
+
+    Returns
+    -------
+    int: The IPC key
+    '''
+    st = os.stat(hashpipe_keyfile())
+    proj_id = (instance & 0x3f) | 0x40
+    key = (st.st_ino & 0xffff) | ((st.st_dev & 0xff) << 16) | ((proj_id & 0xff) << 24)
+    # key_t is a signed int
+    return key - (1 << 32) if key >= (1 << 31) else key
+
+def hashpipe_status_semname(instance=0):
+    '''
+    The name of the POSIX semaphore guarding the status segment of a hashpipe
+    instance, as computed by hashpipe_status_semname(): the keyfile path with
+    all but the leading '/' converted to '_', followed by _hashpipe_status_<instance>
+
+    Parameters
+    ----------
+    instance: int
+        The enumeration of the hashpipe instance
+
+    Returns
+    -------
+    str: The semaphore name
+    '''
+    keyfile = hashpipe_keyfile()
+    return '/' + keyfile.lstrip('/').replace('/', '_') + '_hashpipe_status_%d' % (instance & 0x3f)
+
+def parse_hashpipe_status(buf):
+    '''
+    Parses the cards of a hashpipe status buffer, up to the END card.
+    String values are unquoted and stripped of trailing blanks, as returned
+    by hashpipe_check_status --query.
+
+    Parameters
+    ----------
+    buf: bytes
+        The raw status buffer
+
+    Returns
+    -------
+    dict: The status, key to value strings
+    '''
+    status = {}
+    for offset in range(0, len(buf), HASHPIPE_STATUS_RECORD_SIZE):
+        card = buf[offset:offset+HASHPIPE_STATUS_RECORD_SIZE].decode('ascii', errors='replace')
+        key = card[:8].rstrip()
+        if key == 'END':
+            break
+        if card[8:10] != '= ':
+            continue
+        value = card[10:].strip()
+        if value.startswith("'"):
+            # FITS strings escape a quote by doubling it
+            m = re.match(r"'((?:[^']|'')*)'", value)
+            value = m.group(1).replace("''", "'").rstrip() if m else value[1:].rstrip()
+        status[key] = value
+    return status
+
+class HashpipeStatusReader:
+    '''
+    Reads the status buffer of a hashpipe instance directly from its shared
+    memory, a whole snapshot of the keys at a time, without forking
+    hashpipe_check_status for every key.
+
+    The SysV segment of the instance is attached read-only, and the status
+    semaphore is held while the buffer is copied, as hashpipe_check_status does.
+    Alternatively a path to a file holding a status buffer (e.g. in /dev/shm)
+    can be given, in which case it is memory mapped instead.
+    '''
+    _libc = None
+
+    def __init__(self, instance=0, path=None):
+        self.instance = instance
+        self.path = path
+        self._shmid = None
+        self._addr = None
+        self._mmap = None
+        self._sem = None
+        self._last = (None, {})
+        if path is not None:
+            with open(path, 'rb') as f:
+                self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self._buf = self._mmap
+        else:
+            self._attach()
+
+    @classmethod
+    def libc(cls):
+        if cls._libc is None:
+            libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+            libc.shmget.restype = ctypes.c_int
+            libc.shmget.argtypes = [ctypes.c_int, ctypes.c_size_t, ctypes.c_int]
+            libc.shmat.restype = ctypes.c_void_p
+            libc.shmat.argtypes = [ctypes.c_int, ctypes.c_void_p, ctypes.c_int]
+            libc.shmdt.argtypes = [ctypes.c_void_p]
+            # sem_* moved from libpthread into libc in glibc 2.34
+            sem = libc if hasattr(libc, 'sem_open') else ctypes.CDLL(ctypes.util.find_library('pthread'))
+            sem.sem_open.restype = ctypes.c_void_p
+            sem.sem_open.argtypes = [ctypes.c_char_p, ctypes.c_int]
+            sem.sem_wait.argtypes = [ctypes.c_void_p]
+            sem.sem_post.argtypes = [ctypes.c_void_p]
+            sem.sem_close.argtypes = [ctypes.c_void_p]
+            libc.sem = sem
+            cls._libc = libc
+        return cls._libc
+
+    def _attach(self):
+        libc = self.libc()
+        shmid = libc.shmget(hashpipe_status_key(self.instance), HASHPIPE_STATUS_TOTAL_SIZE, 0)
+        if shmid < 0:
+            raise OSError(ctypes.get_errno(), 'no hashpipe status segment for instance %d' % self.instance)
+        addr = libc.shmat(shmid, None, SHM_RDONLY)
+        if addr is None or addr == ctypes.c_void_p(-1).value:
+            raise OSError(ctypes.get_errno(), 'could not attach the hashpipe status segment of instance %d' % self.instance)
+        self._shmid = shmid
+        self._addr = addr
+        self._buf = (ctypes.c_char * HASHPIPE_STATUS_TOTAL_SIZE).from_address(addr)
+        sem = libc.sem.sem_open(hashpipe_status_semname(self.instance).encode(), 0)
+        # SEM_FAILED is NULL on linux
+        self._sem = sem if sem else None
+
+    def is_current(self):
+        '''
+        Returns
+        -------
+        bool: False if the instance's status segment has been recreated
+            (e.g. the hashpipe was restarted) since it was attached
+        '''
+        if self._shmid is None:
+            return self._buf is not None
+        return self.libc().shmget(hashpipe_status_key(self.instance), HASHPIPE_STATUS_TOTAL_SIZE, 0) == self._shmid
+
+    def raw(self):
+        '''
+        Returns
+        -------
+        bytes: A copy of the status buffer
+        '''
+        if self._sem is not None:
+            self.libc().sem.sem_wait(self._sem)
+            try:
+                return bytes(self._buf)
+            finally:
+                self.libc().sem.sem_post(self._sem)
+        return bytes(self._buf)
+
+    def snapshot(self):
+        '''
+        Returns
+        -------
+        dict: All the keys of the status, key to value strings
+        '''
+        buf = self.raw()
+        # the status only changes every so often, skip parsing an identical buffer
+        if buf != self._last[0]:
+            self._last = (buf, parse_hashpipe_status(buf))
+        return dict(self._last[1])
+
+    def get(self, key, default=None):
+        return self.snapshot().get(key, default)
+
+    def close(self):
+        if self._sem is not None:
+            self.libc().sem.sem_close(self._sem)
+            self._sem = None
+        if self._addr is not None:
+            self.libc().shmdt(self._addr)
+            self._addr = None
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        self._buf = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+_status_readers = {}
+
+def get_hashpipe_status_reader(instance=0):
+    '''
+    Returns the (cached) shared memory status reader of a hashpipe instance,
+    or None if its status segment cannot be attached.
+    '''
+    reader = _status_readers.get(instance)
+    if reader is not None and not reader.is_current():
+        reader.close()
+        reader = None
+    if reader is None:
+        try:
+            reader = HashpipeStatusReader(instance)
+        except (OSError, AttributeError, TypeError):
+            return None
+        _status_readers[instance] = reader
+    return reader
+
+def get_hashpipe_status(instance=0):
+    '''
+    Returns a snapshot of all the keys of the hashpipe's status,
+    read from its shared memory.
+
+    Parameters
+    ----------
+    instance: int
+        The enumeration of the hashpipe instance whose status is consulted
+
+    Returns
+    -------
+    dict: The status, key to value strings, or None if the segment cannot be attached
+    '''
+    reader = get_hashpipe_status_reader(instance)
+    if reader is None:
+        return None
+    return reader.snapshot()
+
 def set_hashpipe_key_value(key, value, instance=0):
     '''
     Sets the value of a key by calling hashpipe_check_status, which is expected to be in the path.
@@ -55,9 +299,14 @@ def get_hashpipe_key_value(key, instance=0):
     Returns
     -------
     bytearray: The raw output of the hashpipe_check_status call
+        (or the same output, from the status shared memory)
     '''
     # REDISGET = REDISGETGW.substitute(host=hostname, inst=args.instance)
     # r.hget(REDISGET, "PPRWSARG")
+    if USE_SHM_STATUS:
+        status = get_hashpipe_status(instance)
+        if status is not None:
+            return (status[key] + '\n').encode() if key in status else b''
     return subprocess.run(['hashpipe_check_status', '--instance='+str(instance), '--query='+key], capture_output=True).stdout
 
 def get_hashpipe_key_value_str(key, instance=0):
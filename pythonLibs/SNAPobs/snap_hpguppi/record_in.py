@@ -2,6 +2,7 @@ from numpy import ceil
 import re
 import time
 from datetime import datetime
+import concurrent.futures
 
 import csv
 
@@ -50,6 +51,98 @@ def _get_uniform_source_name_for_streams(streams):
     source_dict = ata_control.get_eph_source(ant_names[0:1])
     return source_dict[ant_names[0]].replace(' ', '_')
 
+def _gather_target_state(
+    get_channel,
+    stream_hostnames,
+    tbin,
+    universal_synctime,
+    universal_tbin,
+    universal_source_name
+):
+    '''
+    Collects the sync time, TBIN and source name of one hashpipe instance.
+
+    Returns
+    -------
+    tuple: (sync_time, tbin, source_name, gather latency in seconds), or None
+        if the instance has no stream_hostnames
+    '''
+    t_start = time.time()
+    if universal_synctime is False: # 
+        channel_sync_times = _get_sync_time_for_streams(stream_hostnames)
+        channel_synct_times_setlen = len(set(channel_sync_times))
+        if channel_synct_times_setlen == 0:
+            print(
+                'Hpguppi channel',
+                get_channel,
+                'has no stream_hostnames, excluding from observation.'
+            )
+            return None
+        elif channel_synct_times_setlen > 1:
+            error_statement = (
+                'Hpguppi channel {} has the following'
+                'stream_hostnames, with non-uniform sync-times:\n'
+            ).format(get_channel)
+            for i in range(len(stream_hostnames)):
+                error_statement += "{} {}\n".format(
+                    stream_hostnames[i],
+                    channel_sync_times[i]
+                )
+            error_statement = (
+                'Cannot reliably start a recording: {}'.format(
+                    error_statement
+                )
+            )
+            raise RuntimeError(error_statement)
+        
+        sync_time = channel_sync_times[0]
+    else: # universal_synctime
+        sync_time = universal_synctime
+    
+    if universal_tbin is False:
+        try:
+            tbin = float(tbin)
+        except:
+            error_statement = (
+                'Cannot reliably start a recording: Hpguppi channel {} '
+                'has a non-numeric TBIN value {}.').format(
+                    get_channel, tbin)
+            raise RuntimeError(error_statement)
+    else:
+        tbin = float(universal_tbin)
+
+    if universal_source_name is False:
+        source_name = _get_uniform_source_name_for_streams(stream_hostnames)
+    else:
+        source_name = universal_source_name
+
+    return sync_time, tbin, source_name, time.time() - t_start
+
+last_gather_timing = None
+
+def _report_gather_timing(gather_s, target_latencies, t_start):
+    '''
+    Prints the wall-clock time taken to gather the state of the targets, the
+    slowest target, and the slack left between publishing and the chosen start.
+    '''
+    global last_gather_timing
+    slack_s = t_start - time.time()
+    last_gather_timing = {
+        'gather_s': gather_s,
+        'target_latencies': target_latencies,
+        'start': t_start,
+        'slack_s': slack_s
+    }
+    slowest = max(target_latencies, key=target_latencies.get) if len(target_latencies) > 0 else None
+    print('Gathered {} target(s) in {:.3f} s{}'.format(
+        len(target_latencies),
+        gather_s,
+        '' if slowest is None else ' (slowest {} in {:.3f} s)'.format(slowest, target_latencies[slowest])
+    ))
+    print('Published with {:.3f} s of slack before the start'.format(slack_s))
+    if slack_s < 0:
+        print('WARNING: the start had passed before it was published, increase obs_delay_s')
+
 def block_until_hpguppi_idling(targets, verbose=True):
     '''
     Loop (block) until the key in all the targets match the value given.
@@ -128,21 +221,40 @@ def block_until_post_processing_waiting(targets, verbose=True):
         verbose=verbose
     )
 
-def _publish_obs_start_stop(redis_obj, channel_list, obsstart, obsstop, obs_source_name, dry_run=False):
+def _obs_start_stop_command(obsstart, obsstop, obs_source_name):
     # cmd = 'OBSSTART=%i\nOBSSTOP=%i\n'  %(obsstart, obsstop)
     cmd = 'PKTSTART=%i\nPKTSTOP=%i'  %(obsstart, obsstop)
     if obs_source_name:
         cmd +='\nSRC_NAME=%s' % obs_source_name
+    return cmd
+
+def _publish_obs_start_stop(redis_obj, channel_list, obsstart, obsstop, obs_source_name, dry_run=False):
+    cmd = _obs_start_stop_command(obsstart, obsstop, obs_source_name)
 
     if isinstance(channel_list, str):
         channel_list = [channel_list]
     
-    for channel in channel_list:
+    _publish_commands(redis_obj, [(channel, cmd) for channel in channel_list], dry_run)
+
+def _publish_commands(redis_obj, channel_cmd_list, dry_run=False):
+    '''
+    Publishes each (channel, cmd) pair, in a single pipelined round-trip.
+    '''
+    for channel, cmd in channel_cmd_list:
         print(channel, cmd.replace('\n', '\t'))
-        if not dry_run:
-            redis_obj.publish(channel, cmd)
     if dry_run:
         print('***DRY RUN***')
+        return
+    summary = hpguppi_auxillary.new_redis_summary('_publish_commands')
+    results = hpguppi_auxillary.redis_pipeline_execute(
+        redis_obj,
+        [('publish', channel, cmd) for channel, cmd in channel_cmd_list],
+        summary
+    )
+    hpguppi_auxillary.print_redis_summary(summary)
+    for result in results:
+        if isinstance(result, Exception):
+            raise result
 
 def _calculate_obs_start_stop(t_start, duration_s, sync_time, tbin):
     tdiff = t_start - sync_time
@@ -236,78 +348,61 @@ def record_in(
         )
         print()
     
+    for set_channel in hashpipe_targets:
+        assert (re.match(hpguppi_defaults.REDISSETGW_re, set_channel) or
+         set_channel == hpguppi_defaults.REDISSET
+        )
+
     target_sync_times = {}
     target_tbin_values = {}
     target_source_names = {}
     # gather data first, then calculate obsstart/stop for syncronicity
-    # (reading sync_time from the FEngines is the biggest bottleneck)
-    for set_channel in hashpipe_targets:
-        assert (re.match(hpguppi_defaults.REDISSETGW_re, set_channel) or
-         set_channel == hpguppi_defaults.REDISSET
+    # (reading sync_time from the FEngines is the biggest bottleneck, so
+    # the targets are gathered concurrently)
+    t_gather = time.time()
+    target_states = {}
+    if reset:
+        target_states = {set_channel: (None, None, None, 0.0) for set_channel in hashpipe_targets}
+    else:
+        get_channels = {
+            set_channel: hpguppi_auxillary.redis_get_channel_from_set_channel(set_channel)
+            for set_channel in hashpipe_targets
+            if set_channel != hpguppi_defaults.REDISSET
+        }
+        # the redis state of all the targets, in pipelined round-trips
+        summary = hpguppi_auxillary.new_redis_summary('record_in gather')
+        stream_hostnames = hpguppi_auxillary.get_stream_hostnames_of_redis_chans(
+            hpguppi_defaults.redis_obj, list(get_channels.values()), summary=summary
         )
-        if reset:
-            target_sync_times[set_channel] = None
-            target_tbin_values[set_channel] = None
-            target_source_names[set_channel] = None
-        else:
-            if set_channel != hpguppi_defaults.REDISSET:
-                get_channel = hpguppi_auxillary.redis_get_channel_from_set_channel(
-                    set_channel
-                )
-                # get the hostnames of the antenna streams for this hashpipe instance
-                stream_hostnames = hpguppi_auxillary.get_stream_hostnames_of_redis_chan(
-                    hpguppi_defaults.redis_obj, get_channel
-                )
+        tbins = {}
+        if universal_tbin is False:
+            tbins = hpguppi_auxillary.redis_hmget_many(
+                hpguppi_defaults.redis_obj, list(get_channels.values()), ['TBIN'], summary=summary
+            )
+        hpguppi_auxillary.print_redis_summary(summary)
 
-            if universal_synctime is False: # 
-                channel_sync_times = _get_sync_time_for_streams(stream_hostnames)
-                channel_synct_times_setlen = len(set(channel_sync_times))
-                if channel_synct_times_setlen == 0:
-                    print(
-                        'Hpguppi channel',
-                        get_channel,
-                        'has no stream_hostnames, excluding from observation.'
-                    )
-                    continue
-                elif channel_synct_times_setlen > 1:
-                    error_statement = (
-                        'Hpguppi channel {} has the following'
-                        'stream_hostnames, with non-uniform sync-times:\n'
-                    ).format(get_channel)
-                    for i in range(len(stream_hostnames)):
-                        error_statement += "{} {}\n".format(
-                            stream_hostnames[i],
-                            channel_sync_times[i]
-                        )
-                    error_statement = (
-                        'Cannot reliably start a recording: {}'.format(
-                            error_statement
-                        )
-                    )
-                    raise RuntimeError(error_statement)
-                
-                target_sync_times[set_channel] = channel_sync_times[0]
-            else: # universal_synctime
-                target_sync_times[set_channel] = universal_synctime
-            
-            if universal_tbin is False:
-                tbin = hpguppi_auxillary.redis_hget_retry(hpguppi_defaults.redis_obj, get_channel, 'TBIN')
-                try:
-                    target_tbin_values[set_channel] = float(tbin)
-                except:
-                    error_statement = (
-                        'Cannot reliably start a recording: Hpguppi channel {} '
-                        'has a non-numeric TBIN value {}.').format(
-                            get_channel, tbin)
-                    raise RuntimeError(error_statement)
-            else:
-                target_tbin_values[set_channel] = float(universal_tbin)
-
-            if universal_source_name is False:
-                target_source_names[set_channel] = _get_uniform_source_name_for_streams(stream_hostnames)
-            else:
-                target_source_names[set_channel] = universal_source_name
+        def gather(set_channel):
+            get_channel = get_channels.get(set_channel)
+            return _gather_target_state(
+                get_channel,
+                stream_hostnames.get(get_channel),
+                tbins[get_channel]['TBIN'] if get_channel in tbins else None,
+                universal_synctime,
+                universal_tbin,
+                universal_source_name
+            )
 
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, len(hashpipe_targets))) as executor:
+            # map keeps the order of the targets, and raises the first exception
+            for set_channel, state in zip(hashpipe_targets, executor.map(gather, hashpipe_targets)):
+                if state is not None:
+                    target_states[set_channel] = state
+    t_gather = time.time() - t_gather
+
+    for set_channel, (sync_time, tbin, source_name, latency) in target_states.items():
+        target_sync_times[set_channel] = sync_time
+        target_tbin_values[set_channel] = tbin
+        target_source_names[set_channel] = source_name
         
     assert len(target_sync_times.keys()) == len(target_tbin_values.keys()) == len(target_source_names.keys())
 
@@ -318,15 +413,31 @@ def record_in(
     t_in_x = int(ceil(t_now + obs_delay_s))
     source_name = None
 
+    # publish the observation range of every target in one go
+    target_ranges = {}
     for target_i, target_set_chan in enumerate(target_sync_times.keys()):
         if not reset:
             sync_time = target_sync_times[target_set_chan]
             tbin = target_tbin_values[target_set_chan]
             source_name = target_source_names[target_set_chan]
             obsstart, obsstop, npackets = _calculate_obs_start_stop(t_in_x, obs_duration_s, sync_time, tbin)
+        target_ranges[target_set_chan] = (obsstart, obsstop, npackets,
+            _obs_start_stop_command(obsstart, obsstop, source_name))
 
-        _publish_obs_start_stop(hpguppi_defaults.redis_obj, target_set_chan, obsstart, obsstop, source_name, dry_run)
-    
+    _publish_commands(
+        hpguppi_defaults.redis_obj,
+        [(chan, target_range[3]) for chan, target_range in target_ranges.items()],
+        dry_run
+    )
+    if not reset:
+        _report_gather_timing(
+            t_gather,
+            {chan: state[3] for chan, state in target_states.items()},
+            t_in_x
+        )
+
+    for target_i, target_set_chan in enumerate(target_ranges.keys()):
+        obsstart, obsstop, npackets, _ = target_ranges[target_set_chan]
         log_string = log_string_per_channel[target_i:] if log_string_per_channel is not None else None
 
         if log and not reset and not dry_run:
@@ -137,6 +137,7 @@ antlo_names = []
 hpguppi_redis_reset_chans = []
 
 ifnames_ip_dict = {socket.gethostbyaddr(ip)[0]:ip for ip in ips}
+hpguppi_instance_redis_getchans = []
 for ip_ifname, ip in ifnames_ip_dict.items():
 	# remove -40, -100g-1, -100g-2
 	m = re.match(r'(.*)-(\d+g-)(\d+)', ip_ifname)
@@ -148,12 +149,16 @@ for ip_ifname, ip in ifnames_ip_dict.items():
 	else:
 		print('%s: %s does not have -\d+g-\d+ suffix... taking it verbatim'%(ip, ip_ifname))
 
-	hpguppi_instance_redis_getchan = hpguppi_defaults.REDISGETGW.substitute(host=host, inst=instance)
+	hpguppi_instance_redis_getchans.append(hpguppi_defaults.REDISGETGW.substitute(host=host, inst=instance))
+
+# the antennae of all the instances are collected in pipelined round-trips
+hpguppi_instance_antennae = hpguppi_auxillary.get_antennae_of_redis_chans(hpguppi_defaults.redis_obj, hpguppi_instance_redis_getchans)
+for hpguppi_instance_redis_getchan in hpguppi_instance_redis_getchans:
 	antnames = None
 	try:
-		antnames = hpguppi_auxillary.get_stream_hostnames_of_redis_chan(hpguppi_defaults.redis_obj, hpguppi_instance_redis_getchan)
+		antnames = hpguppi_auxillary.get_stream_hostname_per_antennalo_names(hpguppi_instance_antennae[hpguppi_instance_redis_getchan])
 	except:# RuntimeError:
-		print('hpguppi_auxillary.get_stream_hostnames_of_redis_chan failed on {}'.format(hpguppi_instance_redis_getchan))
+		print('hpguppi_auxillary.get_stream_hostname_per_antennalo_names failed on {}'.format(hpguppi_instance_redis_getchan))
 	
 	if antnames is not None:
 		for ant_name in stream_antlo_names:
@@ -38,8 +38,11 @@ def sync(stream_list=None, all_snaps=False, check_sync_all=True, publish_global_
         if publish_global_key:
             print("Writing sync time to redis database")
             r = redis.Redis(host='redishost')
-            r.set('SYNCTIME', sync_time)
-            print(r.get('SYNCTIME'))
+            # set and read back in one round-trip
+            pipe = r.pipeline(transaction=False)
+            pipe.set('SYNCTIME', sync_time)
+            pipe.get('SYNCTIME')
+            print(pipe.execute()[-1])
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='Syncs antenna streams')
@@ -68,16 +68,22 @@ def resolve_hashpipe_targets():
 
 	hashpipe_targets_LoA = {}
 	hashpipe_targets_LoB = {}
+	redis_get_chans = {
+		(seti_node, instance): REDISGETGW.substitute(
+			host=seti_node, inst=instance
+		)
+		for seti_node in seti_nodes
+		for instance in instances
+	}
+	# collected in pipelined round-trips, the summary is not printed on import
+	antenna_lists = hpguppi_aux.get_antennae_of_redis_chans(
+		redis_obj,
+		list(redis_get_chans.values()),
+		summary=hpguppi_aux.new_redis_summary('resolve_hashpipe_targets')
+	)
 	for seti_node in seti_nodes:
 		for instance in instances:
-			redis_get_chan = REDISGETGW.substitute(
-				host=seti_node, inst=instance
-			)
-
-			antenna_list = hpguppi_aux.get_antennae_of_redis_chan(
-				redis_obj,
-				redis_get_chan
-			)
+			antenna_list = antenna_lists[redis_get_chans[(seti_node, instance)]]
 			if len(antenna_list) == 0:
 				continue
 
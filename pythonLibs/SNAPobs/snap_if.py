@@ -1,6 +1,6 @@
 from ata_snap import ata_snap_fengine
 from SNAPobs import snap_defaults, snap_config, snap_control
-from ATATools import ata_helpers, logger_defaults
+from ATATools import ata_helpers, logger_defaults, if_tuner
 from ATATools.device_lock import set_device_lock, release_device_lock
 import warnings
 
@@ -14,6 +14,7 @@ import pandas as pd
 
 START_ATTN = 27
 TARGET_RMS = 17
+ADC_CYCLES = 5 # adc sample cycles of the fine tuning reads
 
 MAX_ATT = 31.5
 MIN_ATT = 0.0
@@ -109,7 +110,10 @@ def _setatten(chanlist, attenlist, module=0):
 
 def tune_if(snap_hosts):
     """
-    Function to tune the IF
+    Function to tune the IF of all the inputs of snap_hosts concurrently,
+    see ATATools.if_tuner.tune.
+    Returns the tuning report, with the iterations and wall time of each
+    input (snap hostname + pol)
     """
     logger = logger_defaults.getModuleLogger(__name__)
     logger.info("IF tuner entered")
@@ -128,80 +132,65 @@ def tune_if(snap_hosts):
     snap_names = list(snaps_dict.keys())
 
     if_tab = ATA_SNAP_IF[ATA_SNAP_IF.snap_hostname.isin(snap_names)]
-    #ant_ch = if_tab.values[:,1:].flatten()
-    att_numbs = if_tab.module.unique()
-    for att_num in att_numbs:
-        #print(if_tab)
-        #print(att_num)
-        if_tab_sub = if_tab[if_tab.module == att_num]
-        #print(if_tab_sub)
-        ant_ch = if_tab_sub[['chx', 'chy']].values.flatten()
-
-        logger.info("Tuning: %s" %if_tab.snap_hostname)
-        logger.info("Attemp chans: %s" %ant_ch)
-
-        prev_attn = np.array([START_ATTN]*len(ant_ch))
-        target_rms = []
-        for host_name in if_tab_sub.snap_hostname:
-            #print(host_name)
-            if host_name.startswith("frb-snap"):
-                target_rms.append(17) #X pol
-                target_rms.append(17) #Y pol
-            elif host_name.startswith("rfsoc"):
-                target_rms.append(1024) #X pol
-                target_rms.append(1024) #Y pol
-            else:
-                print("Something is wrong")
-                sys.exit(-1)
-        target_rms = np.array(target_rms)
-
-        for i in range(3):
-            if np.any(prev_attn > MAX_ATT):
-                warn_ant_ch = ant_ch[prev_attn > MAX_ATT]
-                warn_prev_attn = prev_attn[prev_attn > MAX_ATT]
-                warnings.warn("Trying to set attenuator on channels %s to values %s, which is more than max [%i]"
-                        %(list(warn_ant_ch), list(warn_prev_attn), MAX_ATT))
-                prev_attn[prev_attn > MAX_ATT] = MAX_ATT
-            if np.any(prev_attn < MIN_ATT):
-                warn_ant_ch = ant_ch[prev_attn < MIN_ATT]
-                warn_prev_attn = prev_attn[prev_attn < MIN_ATT]
-                warnings.warn("Trying to set attenuator on channels %s to values %s, which is less than min [%i]"
-                        %(list(warn_ant_ch), list(warn_prev_attn), MIN_ATT))
-                prev_attn[prev_attn < MIN_ATT] = MIN_ATT
-
-            _setatten(ant_ch, prev_attn, att_num)
-            rms = []
-            for snap_name in list(if_tab_sub.snap_hostname.values):
-                snap = snaps_dict[snap_name]
-
-                x, y = (), ()
-
-                if snap_name.lower().startswith('rfsoc'):
-                    # e.g. snap_name "rfsoc2-ctrl-3"
-                    # so lock_name = "rfsoc2"
-                    lock_name = snap_name[:6]
-                else:
-                    lock_name = snap_name
-
-                set_device_lock(lock_name)
-                for i in range(5):
-                    tmpx, tmpy = snap.adc_get_samples()
-                    x += tmpx
-                    y += tmpy
-                release_device_lock(lock_name)
-
-                x = np.array(x)
-                y = np.array(y)
-                print(np.std(x),np.std(y))
-
-                rms.append(x.std())
-                rms.append(y.std())
-
-            rms = np.array(rms)
-            d_attn = 20*np.log10(rms/target_rms)
-            prev_attn = round50th(prev_attn + d_attn)
-    snap_control.disconnect_snaps(snaps)
+    logger.info("Tuning: %s" %list(if_tab.snap_hostname))
+
+    # inputs are named snap_hostname + pol, all of them are tuned at once
+    if_chans = {}
+    att_groups = {}
+    adc_groups = {}
+    target_rms = {}
+    for _, row in if_tab.iterrows():
+        host_name = row.snap_hostname
+        if host_name.startswith("frb-snap"):
+            host_rms = 17
+        elif host_name.startswith("rfsoc"):
+            host_rms = 1024
+        else:
+            print("Something is wrong")
+            sys.exit(-1)
+
+        if host_name.lower().startswith('rfsoc'):
+            # e.g. snap_name "rfsoc2-ctrl-3"
+            # so lock_name = "rfsoc2"
+            lock_name = host_name[:6]
+        else:
+            lock_name = host_name
+
+        for pol in ['x', 'y']:
+            inp = host_name + pol
+            if_chans[inp] = row['ch'+pol]
+            att_groups.setdefault(row.module, []).append(inp)
+            adc_groups.setdefault(lock_name, []).append(inp)
+            target_rms[inp] = host_rms
+
+    def set_attn(att_num, inps, attens):
+        _setatten([if_chans[inp] for inp in inps], attens, att_num)
+
+    def read_rms(lock_name, inps, ncycles):
+        # boards sharing a lock are read one after another
+        rms = {}
+        set_device_lock(lock_name)
+        try:
+            for snap_name in sorted(set([inp[:-1] for inp in inps])):
+                x, y = [], []
+                for i in range(ncycles):
+                    tmpx, tmpy = snaps_dict[snap_name].adc_get_samples()
+                    x.append(tmpx)
+                    y.append(tmpy)
+                rms[snap_name + 'x'] = np.std(np.concatenate(x))
+                rms[snap_name + 'y'] = np.std(np.concatenate(y))
+        finally:
+            release_device_lock(lock_name)
+        return [rms[inp] for inp in inps]
+
+    try:
+        report = if_tuner.tune(att_groups, adc_groups, set_attn, read_rms,
+                target_rms, START_ATTN, ADC_CYCLES)
+    finally:
+        snap_control.disconnect_snaps(snaps)
+    print(report)
     logger.info("IF tuner ended")
+    return report
 
 
 def tune_if_ants(ant_list, target_rms=TARGET_RMS):
@@ -211,7 +200,7 @@ def tune_if_ants(ant_list, target_rms=TARGET_RMS):
     snap_hosts = list(obs_ant_tab.snap_hostname.values)
     #print("snap_hosts:")
     #print(snap_hosts)
-    tune_if(snap_hosts)
+    return tune_if(snap_hosts)
 
 
 def tune_if_antslo(antlo_list):
@@ -221,7 +210,7 @@ def tune_if_antslo(antlo_list):
     snap_hosts = list(obs_ant_tab.snap_hostname.values)
     #print("snap_hosts:")
     #print(snap_hosts)
-    tune_if(snap_hosts)
+    return tune_if(snap_hosts)
 
 
 
@@ -16,15 +16,14 @@ def single_snap_recording(host,ant,ncaptures,fpga_file,freq,filefragment,source,
 
     ant_azel = ata_control.getAzEl([ant])
     ant_radec = ata_control.getRaDec([ant])
-    measDict = snap_recorder.getData(host,ant,ncaptures,fpga_file,freq)
-    measDict['source'] = source
-    measDict['ra'] = ant_radec[ant][0]
-    measDict['dec'] = ant_radec[ant][1]
-    measDict['az'] = ant_azel[ant][0]
-    measDict['el'] = ant_azel[ant][1]
+    pointing = {'source': source, 'ra': ant_radec[ant][0], 'dec': ant_radec[ant][1],
+            'az': ant_azel[ant][0], 'el': ant_azel[ant][1]}
 
+    #the spectra are written to the h5 file while they are captured
     logger.info('saving h5 file {}'.format(filefragment))
-    snap_h5.saveFile(filefragment,measDict,az_offset,el_offset,recid,setid)
+    writer = snap_h5.SnapH5Writer(snap_h5.snapFileName(filefragment,ant,recid),az_offset,el_offset,recid,setid,pointing)
+    measDict = snap_recorder.getData(host,ant,ncaptures,fpga_file,freq,writer=writer)
+    measDict.update(pointing)
 
     rmsDict = {ant: {'rmsx' : measDict['adc0_stats']['dev'], 'rmsy' :  measDict['adc1_stats']['dev']}}
     obs_db.updateRMSVals(recid,rmsDict)
@@ -111,18 +110,19 @@ def record_same(ant_dict,freq,source,ncaptures,obstype,obsuser,desc,filefragment
     logger = logger_defaults.getModuleLogger(__name__)
     #setting up the observation and starting it
 
-    recid = obs_db.initRecording(freq,obstype,backend,desc,obsuser,obs_set_id)
+    ant_list = snap_array_helpers.dict_to_list(ant_dict)
+    with obs_db.transaction():
+        recid = obs_db.initRecording(freq,obstype,backend,desc,obsuser,obs_set_id)
 
-    logger.info("got recording id {}".format(recid))
+        logger.info("got recording id {}".format(recid))
 
-    snap_dirs.set_output_dir_obsid(obs_set_id) 
+        logger.info("updating database with antennas {}".format(", ".join(ant_list)))
+        obs_db.initAntennasTable(recid,ant_list,source,az_offset,el_offset,True)
 
-    ant_list = snap_array_helpers.dict_to_list(ant_dict)
-    logger.info("updating database with antennas {}".format(", ".join(ant_list)))
-    obs_db.initAntennasTable(recid,ant_list,source,az_offset,el_offset,True)
+        logger.info("starting recording {}".format(recid))
+        obs_db.startRecording(recid)
 
-    logger.info("starting recording {}".format(recid))
-    obs_db.startRecording(recid)
+    snap_dirs.set_output_dir_obsid(obs_set_id) 
 
     snaps = ant_dict.keys()
     nsnaps = len(snaps)
@@ -7,7 +7,6 @@ import adc5g
 
 import time
 import numpy as np
-import struct
 from ATATools import ata_control,logger_defaults
 from . import snap_defaults 
 import logging
@@ -153,17 +152,19 @@ def setRMS(snap,ant,rms=snap_defaults.rms):
     logger.warning("RMS requirement for {} not met. got I: {}, Q: {} target: {}".format(ant,meas_stdx,meas_stdy,rms))
     return retdict
 
-def getData(host,ant,ncaptures,fpga_file,freq,srate=snap_defaults.srate,ifc=snap_defaults.ifc):
+def getData(host,ant,ncaptures,fpga_file,freq,srate=snap_defaults.srate,ifc=snap_defaults.ifc,writer=None):
     snap = getSnap(host,fpga_file)
     fpga_clk = syncFpgaClock(snap,srate)
-    retdict = gatherData(snap,ant,ncaptures,srate,ifc,freq)
-    retdict['host'] = host
-    retdict['fpga_clk'] = fpga_clk
-    retdict['fpgfile'] = fpga_file
-    retdict['srate'] = srate
+    info = {'host': host, 'fpga_clk': fpga_clk, 'fpgfile': fpga_file, 'srate': srate}
+    if writer is not None:
+        writer.snapdict.update(info)
+    retdict = gatherData(snap,ant,ncaptures,srate,ifc,freq,writer)
+    retdict.update(info)
+    if writer is not None:
+        writer.close(retdict)
     return retdict
 
-def gatherData(snap,ant,ncaptures,srate,ifc,rfc=None):
+def gatherData(snap,ant,ncaptures,srate,ifc,rfc=None,writer=None):
 
     logger = logger_defaults.getModuleLogger(__name__)
 
@@ -222,51 +223,67 @@ def gatherData(snap,ant,ncaptures,srate,ifc,rfc=None):
     a_set = ant_settings[0]
     logger.info( "%s: Setting snapshot select to %s (%d)" % (ant, a_set, snap_defaults.mux_sel[a_set]))
     snap.write_int('vacc_ss_sel', snap_defaults.mux_sel[a_set])
+    captureSpectra(snap,ncaptures,acc_len,out,srate,ifc,writer)
+
+    logger.info("recording finished for {}".format(ant))
+    return out 
+
+def captureSpectra(snap,ncaptures,acc_len,out,srate,ifc,writer=None,block=snap_defaults.capture_block):
+    """
+    read ncaptures accumulations from the vacc snapshot into out.
+    Each capture is decoded with np.frombuffer straight into preallocated
+    arrays. If a writer (snap_h5.SnapH5Writer) is given, the spectra are
+    passed to it every block captures and only one block is kept in
+    memory, otherwise the whole recording is returned in out['auto0'] and
+    out['auto1']
+    """
+    logger = logger_defaults.getModuleLogger(__name__)
+
+    if writer is None:
+        block = ncaptures
+    block = min(block,ncaptures)
+    tarray = np.zeros(ncaptures)
+    data0cnt = np.zeros(ncaptures)
+    data1cnt = np.zeros(ncaptures)
+    fft0cnt = np.zeros(ncaptures)
+    fft1cnt = np.zeros(ncaptures)
+    out['auto0_timestamp'] = tarray
+    out['auto0_of_count'] = data0cnt
+    out['fft_of0'] = fft0cnt
+    out['auto1_timestamp'] = tarray
+    out['auto1_of_count'] = data1cnt
+    out['fft_of1'] = fft1cnt
+
     for ii in range(ncaptures):
 
-        logger.info( "%s: Grabbing data (%d of %d)" % (ant, ii+1, ncaptures))
+        logger.debug( "%s: Grabbing data (%d of %d)" % (out['ant'], ii+1, ncaptures))
         x,t = snap.snapshots.vacc_ss_ss.read_raw()
-        d = np.array(struct.unpack('>%dL' % (x['length']/4), x['data'])) / acc_len
+        d = np.frombuffer(x['data'], dtype='>u4', count=int(x['length'])//4)
 
         if ii == 0:
-            data0 = np.zeros((ncaptures,d.shape[0]//2))
-            data1 = np.zeros((ncaptures,d.shape[0]//2))
-            tarray = np.zeros(ncaptures)
-            data0cnt = np.zeros(ncaptures)
-            data1cnt = np.zeros(ncaptures)
-            fft0cnt = np.zeros(ncaptures)
-            fft1cnt = np.zeros(ncaptures)
-            frange = np.linspace(out['rfc'] - (srate - ifc), out['rfc'] - (srate - ifc) + srate/2., d.shape[0]//2)
-
-        data0[ii,:] = d[0::2]
-        data1[ii,:] = d[1::2]
+            nchans = d.shape[0]//2
+            data0 = np.zeros((block,nchans))
+            data1 = np.zeros((block,nchans))
+            out['frange'] = np.linspace(out['rfc'] - (srate - ifc), out['rfc'] - (srate - ifc) + srate/2., nchans)
+
+        row = ii % block
+        np.divide(d[0::2], acc_len, out=data0[row])
+        np.divide(d[1::2], acc_len, out=data1[row])
         tarray[ii] = t
         data0cnt[ii] = snap.read_int('power_vacc0_of_count')
         fft0cnt[ii] = snap.read_int('fft_of')
         data1cnt[ii] = snap.read_int('power_vacc1_of_count')
-        #is this read necessary?
-        fft1cnt[ii] = snap.read_int('fft_of')
-        #out['auto0'] += [d[0::2]]
-        #out['auto0_timestamp'] += [t]
-        #out['auto0_of_count'] += [snap.read_int('power_vacc0_of_count')]
-        #out['fft_of0'] += [snap.read_int('fft_of')]
-        #out['auto1'] += [d[1::2]]
-        #out['auto1_timestamp'] += [t]
-        #out['auto1_of_count'] += [snap.read_int('power_vacc1_of_count')]
-        #out['fft_of1'] += [snap.read_int('fft_of')]
-
-    out['frange'] = frange
-    out['auto0'] = data0
-    out['auto0_timestamp'] = tarray
-    out['auto0_of_count'] = data0cnt
-    out['fft_of0'] = fft0cnt
-    out['auto1'] = data1
-    out['auto1_timestamp'] = tarray
-    out['auto1_of_count'] = data1cnt
-    out['fft_of1'] = fft1cnt
+        # the same fft_of register as fft0cnt, no need to read it twice
+        fft1cnt[ii] = fft0cnt[ii]
 
-    logger.info("recording finished for {}".format(ant))
-    return out 
+        if writer is not None and (row == block-1 or ii == ncaptures-1):
+            writer.write(ii-row,data0[:row+1],data1[:row+1],out)
+
+    if writer is None:
+        out['auto0'] = data0
+        out['auto1'] = data1
+    logger.info( "%s: %d captures grabbed" % (out['ant'], ncaptures))
+    return out
 
 def selectMux(snap,a_sel):
     logger = logger_defaults.getModuleLogger(__name__)
@@ -275,7 +292,7 @@ def selectMux(snap,a_sel):
 
 def get_log_data(snap, a_sel, rfc, srate=snap_defaults.srate, ifc=snap_defaults.ifc):
     x,t = snap.snapshots.vacc_ss_ss.read_raw()
-    d = np.array(struct.unpack('>%dL' % (x['length']/4), x['data']))
+    d = np.frombuffer(x['data'], dtype='>u4', count=int(x['length'])//4)
     # Calculate Frequency scale of plots
     # d array holds twice as many values as there are freq channels (either xx & yy, or xy_r & xy_i
     frange = np.linspace(rfc - (srate - ifc), rfc - (srate - ifc) + srate/2., d.shape[0]//2)
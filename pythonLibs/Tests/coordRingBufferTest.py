@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+test of the binary coordinate dump of ATATools.ata_coords (CoordRingBuffer
+and read_coord_dump) once the ring wraps around.
+Records are written with all their coordinates equal to their time, so a
+torn record is detected. Checks a buffer written and read in turn, then
+reads a small ring while another process keeps writing it: every read
+must be time ordered, consecutive and made of whole records
+"""
+
+import sys
+
+sys.path.append("..")
+
+import argparse
+import multiprocessing
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from ATATools.ata_coords import CoordRingBuffer, read_coord_dump
+
+
+def write_records(ring, ants, first, last):
+    for t in range(first, last):
+        ring.write(float(t), {ant: (float(t), float(t)) for ant in ants})
+
+
+def check_dump(dump, times):
+    assert np.array_equal(dump["time"], times), "times {} instead of {}".format(
+            dump["time"], times)
+    assert np.all(dump["coords"] == dump["time"][:, np.newaxis, np.newaxis]), "torn record"
+
+
+def check_wrap(fileName, ants, nrec):
+    ring = CoordRingBuffer(fileName, ants, "azel", nrec)
+    write_records(ring, ants, 0, nrec//2)
+    check_dump(read_coord_dump(fileName), np.arange(nrec//2))
+
+    # wrapped: the oldest slot is the one written next, it is left out
+    write_records(ring, ants, nrec//2, 2*nrec + 3)
+    check_dump(read_coord_dump(fileName), np.arange(nrec + 4, 2*nrec + 3))
+    # slices within and across the end of the file
+    split = nrec + 3
+    for t_start, t_stop in [(None, split + 2), (split - 2, split + 2), (split + 2, None),
+            (0, nrec), (1.5*nrec, 1.5*nrec + 2.5), (3*nrec, None)]:
+        times = np.arange(nrec + 4, 2*nrec + 3)
+        if t_start is not None:
+            times = times[times >= t_start]
+        if t_stop is not None:
+            times = times[times < t_stop]
+        check_dump(read_coord_dump(fileName, t_start, t_stop), times)
+    ring.close()
+    print("wrapped ring of {} records read back OK".format(nrec))
+
+
+def writer(fileName, ants, nrec, started, stop):
+    ring = CoordRingBuffer(fileName, ants, "azel", nrec)
+    started.set()
+    t = 0
+    while not stop.is_set():
+        write_records(ring, ants, t, t + 100)
+        t += 100
+    ring.close()
+
+
+def check_concurrent(fileName, ants, nrec, duration):
+    ctx = multiprocessing.get_context("fork")
+    started = ctx.Event()
+    stop = ctx.Event()
+    proc = ctx.Process(target=writer, args=(fileName, ants, nrec, started, stop))
+    proc.start()
+    started.wait()
+    nreads = 0
+    t_end = time.time() + duration
+    try:
+        while time.time() < t_end:
+            dump = read_coord_dump(fileName)
+            if len(dump["time"]) == 0:
+                continue
+            t0 = dump["time"][0]
+            check_dump(dump, t0 + np.arange(len(dump["time"])))
+            assert len(dump["time"]) < nrec
+            nreads += 1
+    finally:
+        stop.set()
+        proc.join()
+    print("{} reads of a ring of {} records being written OK".format(nreads, nrec))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("-a", "--nants", type=int, default=42)
+    parser.add_argument("-r", "--nrecords", type=int, default=16)
+    parser.add_argument("-t", "--time", type=float, default=5.)
+    args = parser.parse_args()
+
+    ants = ["ant%02d" % i for i in range(args.nants)]
+    fileName = os.path.join(tempfile.mkdtemp(), "coords.bin")
+    try:
+        check_wrap(fileName, ants, args.nrecords)
+        check_concurrent(fileName, ants, args.nrecords, args.time)
+    finally:
+        os.remove(fileName)
+        os.rmdir(os.path.dirname(fileName))
@@ -0,0 +1,204 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+test of the DADA pipeline supervisor (SNAPobs.snap_dada.snap_dada_control)
+with stub executables of dada_db, ata_udpdb, ata_dbsigproc, dada_dbnull
+and numactl put first in the PATH (Linux only, no PSRDADA needed). The
+stubs create, attach and remove real SysV shared memory, after an
+injected latency, so the readiness checks are those used with PSRDADA.
+The previous serial creation and removal of the buffers (one dada_db
+after another, as the retired create_buf.sh and destroy_buf.sh did) are
+timed against the supervisor, then a scan is set up with one slow client, one
+client exiting at start and one client never attaching its buffer.
+Reports the setup time of each stage, and checks that the faulty clients
+are reported and that everything is torn down
+"""
+
+import sys
+
+sys.path.append("..")
+
+import argparse
+import logging
+import os
+import shutil
+import stat
+import subprocess
+import tempfile
+import time
+
+from SNAPobs.snap_dada import snap_dada_control, snap_dada_defaults
+
+SHM = '''#!{python} -S
+import ctypes, os, sys, time
+libc = ctypes.CDLL(None, use_errno=True)
+libc.shmat.restype = ctypes.c_void_p
+IPC_CREAT, IPC_EXCL, IPC_RMID = 0o1000, 0o2000, 0
+key = int(sys.argv[sys.argv.index("-k") + 1], 16)
+'''
+
+DADA_DB = SHM + '''
+time.sleep(float(os.environ["STUB_DB_LATENCY"]))
+if "-d" in sys.argv:
+    shmid = libc.shmget(key, 0, 0)
+    sys.exit(shmid < 0 or libc.shmctl(shmid, IPC_RMID, None) < 0)
+sys.exit(libc.shmget(key, 4096, IPC_CREAT | IPC_EXCL | 0o600) < 0)
+'''
+
+CLIENT = SHM + '''
+name = "%x" %key
+time.sleep(float(os.environ["STUB_CLIENT_LATENCY"])*
+        (10 if name == os.environ.get("STUB_SLOW") else 1))
+if name == os.environ.get("STUB_DEAD"):
+    sys.exit(2)
+if name != os.environ.get("STUB_HUNG"):
+    libc.shmat(libc.shmget(key, 0, 0), None, 0)
+# until the buffer is destroyed
+while libc.shmget(key, 0, 0) >= 0:
+    time.sleep(0.05)
+'''
+
+NUMACTL = '''#!/bin/sh
+shift 2
+exec "$@"
+'''
+
+
+def write_stubs(bindir):
+    stubs = {'dada_db': DADA_DB, 'numactl': NUMACTL}
+    for exe in [snap_dada_defaults.udpdb_exe, snap_dada_defaults.dbsigproc_exe,
+            snap_dada_defaults.dbnull_exe]:
+        stubs[exe] = CLIENT
+    for exe, script in stubs.items():
+        path = os.path.join(bindir, exe)
+        with open(path, 'w') as f:
+            f.write(script.format(python=sys.executable))
+        os.chmod(path, os.stat(path).st_mode | stat.S_IEXEC)
+
+
+def destroy_leftovers(keys, logfile):
+    leftovers = [key for key in keys if snap_dada_control.buffer_exists(key)]
+    if leftovers:
+        snap_dada_control.destroy_buffers(leftovers, logfile)
+
+
+def serial_run(keys, logfile):
+    """
+    the previous creation and removal, one dada_db after another
+    """
+    times = {}
+    try:
+        with open(logfile, 'a') as log:
+            t = time.time()
+            for key in keys:
+                subprocess.call([snap_dada_defaults.dada_db, '-k', key, '-b', '4096',
+                    '-n', str(snap_dada_defaults.nbufs)], stdout=log, stderr=log)
+            times['create_buffers'] = time.time() - t
+            t = time.time()
+            for key in keys:
+                subprocess.call([snap_dada_defaults.dada_db, '-k', key, '-d'],
+                        stdout=log, stderr=log)
+            times['destroy_buffers'] = time.time() - t
+    finally:
+        destroy_leftovers(keys, logfile)
+    return times
+
+
+def supervised_run(keys, logdir, dbnull=False):
+    """
+    a scan as in snap_dada.start_recording
+    """
+    logfile = os.path.join(logdir, 'dadadb.log')
+    logs = [os.path.join(logdir, 'client_%s.log' %key) for key in keys]
+    times = {}
+    supervisor = snap_dada_control.DadaSupervisor(timeout=args.timeout)
+    try:
+        t = time.time()
+        supervisor.create_buffers(keys, [4096]*len(keys), logfile)
+        times['create_buffers'] = time.time() - t
+
+        t = time.time()
+        try:
+            supervisor.start_udpdb(['frb-snap%i-pi' %ii for ii in range(len(keys))],
+                    ['10.11.1.1']*len(keys), range(4015, 4015 + len(keys)),
+                    range(len(keys)), ['obs.header']*len(keys), keys, logs)
+            if dbnull:
+                supervisor.start_dbnull(keys)
+            else:
+                supervisor.start_dbsigproc(keys, range(len(keys)), logs, 2, logdir, False)
+            supervisor.wait_ready()
+            error = None
+        except snap_dada_control.DadaControlError as e:
+            error = e
+        times['clients'] = time.time() - t
+    finally:
+        # also after a failure, so that no buffer or client is left behind
+        clients = [proc for _, _, proc in supervisor.clients]
+        t = time.time()
+        supervisor.stop(logfile, timeout=1)
+        times['stop'] = time.time() - t
+    assert all(proc.poll() is not None for proc in clients)
+    return supervisor, times, error
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('-n', '--nkeys', type=int, default=20)
+    parser.add_argument('-d', '--db-latency', type=float, default=0.3,
+            help='time of dada_db to create or destroy a buffer [s]')
+    parser.add_argument('-c', '--client-latency', type=float, default=0.2,
+            help='time of a client to attach its buffer [s]')
+    parser.add_argument('-t', '--timeout', type=float, default=None,
+            help='supervisor timeout [s], default: scaled with the number of '
+            'buffers and the latencies, as all the stubs share the CPUs')
+    parser.add_argument('-v', '--verbose', action='store_true')
+    args = parser.parse_args()
+    if args.verbose:
+        logging.basicConfig(level=logging.INFO)
+    if args.timeout is None:
+        # the slow client takes 10 client latencies
+        args.timeout = 5 + args.nkeys*(0.5 + args.db_latency + 2*args.client_latency) +\
+                10*args.client_latency
+
+    tmpdir = tempfile.mkdtemp(prefix='dadaSupervisorTest')
+    write_stubs(tmpdir)
+    os.environ['PATH'] = tmpdir + os.pathsep + os.environ['PATH']
+    os.environ['STUB_DB_LATENCY'] = str(args.db_latency)
+    os.environ['STUB_CLIENT_LATENCY'] = str(args.client_latency)
+    # keys unlikely to be used by a real pipeline on this machine
+    base = 0x7a000000 + (os.getpid() % 0x10000)*0x100
+    keys = ['%x' %(base + 2*ii) for ii in range(args.nkeys)]
+
+    try:
+        print('{} buffers, dada_db {} s, client {} s'.format(args.nkeys,
+            args.db_latency, args.client_latency))
+        times = serial_run(keys, os.path.join(tmpdir, 'serial.log'))
+        print('serial:     create {create_buffers:.2f} s, destroy {destroy_buffers:.2f} s'.format(**times))
+        assert not any(snap_dada_control.buffer_exists(key) for key in keys)
+
+        supervisor, times, error = supervised_run(keys, tmpdir)
+        print('supervised: create {create_buffers:.2f} s, clients ready {clients:.2f} s, '
+                'stop {stop:.2f} s'.format(**times))
+        assert error is None, error
+        for stage, timings in supervisor.timings.items():
+            print('{:>16s}: slowest {:.2f} s'.format(stage, max(timings.values())))
+        assert set(supervisor.timings) == {'create_buffers', 'udpdb', 'dbsigproc', 'destroy_buffers'}
+        assert not any(snap_dada_control.buffer_exists(key) for key in keys)
+
+        # faulty clients
+        slow, dead, hung = keys[1], keys[2], keys[3]
+        os.environ.update({'STUB_SLOW': slow, 'STUB_DEAD': dead, 'STUB_HUNG': hung})
+        supervisor, times, error = supervised_run(keys, tmpdir, dbnull=True)
+        print('faulty:     create {create_buffers:.2f} s, clients {clients:.2f} s, '
+                'stop {stop:.2f} s'.format(**times))
+        print('not ready: {}'.format(error.failed))
+        assert sorted(error.failed) == [('dbnull', dead), ('dbnull', hung),
+                ('udpdb', dead), ('udpdb', hung)], error.failed
+        assert supervisor.timings['udpdb'][hung] is None
+        # ready, and not before the latency it was given
+        assert supervisor.timings['dbnull'][slow] >= 10*args.client_latency
+        assert not any(snap_dada_control.buffer_exists(key) for key in keys)
+        print('faulty clients reported, pipeline torn down')
+    finally:
+        destroy_leftovers(keys, os.path.join(tmpdir, 'cleanup.log'))
+        shutil.rmtree(tmpdir)
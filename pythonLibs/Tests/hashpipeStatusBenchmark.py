@@ -0,0 +1,224 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+test and benchmark of the shared memory hashpipe status reader
+of hpguppi_monitor.
+A fake status buffer is built as a SysV shared memory segment, with the
+key and the semaphore of a hashpipe instance (HASHPIPE_KEYFILE pointing
+to a temporary directory), and read back with get_hashpipe_status, also
+after the segment is recreated. The same buffer is written to a file in
+/dev/shm, read back with HashpipeStatusReader(path=...). The reader of
+the segment is then compared in keys/s with the subprocess path:
+hashpipe_check_status if it is in the path and an instance is running
+(-i), otherwise a stand-in shell script that forks to look the key up
+in the file
+"""
+
+import sys
+
+sys.path.append("..")
+
+import argparse
+import ctypes
+import os
+import shutil
+import stat
+import subprocess
+import tempfile
+import time
+
+from SNAPobs.snap_hpguppi import hpguppi_monitor
+from SNAPobs.snap_hpguppi.hpguppi_monitor import (HashpipeStatusReader,
+        HASHPIPE_STATUS_TOTAL_SIZE, HASHPIPE_STATUS_RECORD_SIZE)
+
+libc = ctypes.CDLL(None, use_errno=True)
+libc.shmat.restype = ctypes.c_void_p
+libc.shmat.argtypes = [ctypes.c_int, ctypes.c_void_p, ctypes.c_int]
+libc.shmdt.argtypes = [ctypes.c_void_p]
+libc.sem_open.restype = ctypes.c_void_p
+libc.sem_close.argtypes = [ctypes.c_void_p]
+IPC_CREAT, IPC_EXCL, IPC_RMID = 0o1000, 0o2000, 0
+O_CREAT, O_EXCL = os.O_CREAT, os.O_EXCL
+
+FAKE_STATUS = {
+    'INSTANCE': 0,
+    'DAQPULSE': 'Mon Jan 10 10:10:10 2022',
+    'DAQSTATE': 'RECORD',
+    'DATADIR': '/mnt/buf0',
+    'PROJID': 'dmpauto',
+    'BACKEND': 'GUPPI',
+    'BANK': '.',
+    'PKTFMT': 'ATASNAPV',
+    'OBSSTART': 0,
+    'OBSSTOP': 0,
+    'SRC_NAME': "3C'84",
+    'NBITS': 4,
+    'FENCHAN': 4096,
+    'TBIN': 4.0e-6,
+    'OBSBW': -250.0,
+}
+# pad the status with as many keys as a running hpguppi instance has
+for i in range(150):
+    FAKE_STATUS['XKEY%04d' % i] = 'value %d' % i
+
+STAND_IN = """#!/bin/sh
+key=${2#--query=}
+fold -w 80 "$STATUS_FILE" | sed -n "s/^$(printf '%-8s' "$key")= *'\\{0,1\\}\\([^']*\\)'\\{0,1\\} *$/\\1/p" | sed 's/ *$//'
+"""
+
+
+def status_card(key, value):
+    """
+    a status card, formatted as hputs/hputi/hputr do
+    """
+    if isinstance(value, str):
+        value = "'{:8s}'".format(value.replace("'", "''"))
+        card = '{:8s}= {}'.format(key, value)
+    else:
+        card = '{:8s}= {:>20s}'.format(key, str(value))
+    return card.ljust(HASHPIPE_STATUS_RECORD_SIZE).encode()
+
+
+def status_buffer(status):
+    """
+    the cards of status and the END card, padded to the buffer size
+    """
+    buf = b''.join(status_card(k, v) for k, v in status.items())
+    buf += b'END'.ljust(HASHPIPE_STATUS_RECORD_SIZE)
+    return buf.ljust(HASHPIPE_STATUS_TOTAL_SIZE)
+
+
+def make_status_segment(path, status):
+    """
+    fixture: writes a fake hashpipe status buffer to path
+    """
+    with open(path, 'wb') as f:
+        f.write(status_buffer(status))
+    return path
+
+
+class StatusShm(object):
+    """
+    fixture: a fake hashpipe status buffer in a SysV shared memory segment
+    with the key of the instance, and its status semaphore, as created by
+    hashpipe_status_attach
+    """
+    def __init__(self, status, instance=0):
+        self.instance = instance
+        self.shmid = libc.shmget(hpguppi_monitor.hashpipe_status_key(instance),
+                HASHPIPE_STATUS_TOTAL_SIZE, IPC_CREAT | IPC_EXCL | 0o600)
+        if self.shmid < 0:
+            raise OSError(ctypes.get_errno(), 'could not create the status segment')
+        self.addr = libc.shmat(self.shmid, None, 0)
+        if self.addr == ctypes.c_void_p(-1).value:
+            libc.shmctl(self.shmid, IPC_RMID, None)
+            raise OSError(ctypes.get_errno(), 'could not attach the status segment')
+        self.semname = hpguppi_monitor.hashpipe_status_semname(instance).encode()
+        self.sem = libc.sem_open(self.semname, O_CREAT | O_EXCL, ctypes.c_uint(0o600), ctypes.c_uint(1))
+        if not self.sem:
+            self.remove()
+            raise OSError(ctypes.get_errno(), 'could not create the status semaphore')
+        ctypes.memmove(self.addr, status_buffer(status), HASHPIPE_STATUS_TOTAL_SIZE)
+
+    def remove(self):
+        if self.sem:
+            libc.sem_close(self.sem)
+            libc.sem_unlink(self.semname)
+            self.sem = None
+        libc.shmdt(self.addr)
+        libc.shmctl(self.shmid, IPC_RMID, None)
+
+
+def check_reader(path):
+    with HashpipeStatusReader(path=path) as reader:
+        snapshot = reader.snapshot()
+    expected = {k: str(v) for k, v in FAKE_STATUS.items()}
+    assert snapshot == expected, 'status read back differs from the fake segment'
+    print('fake status file read back: {} keys OK'.format(len(snapshot)))
+
+
+def check_shm(instance):
+    expected = {k: str(v) for k, v in FAKE_STATUS.items()}
+    shm = StatusShm(FAKE_STATUS, instance)
+    try:
+        assert hpguppi_monitor.get_hashpipe_status(instance) == expected, \
+                'status read back differs from the fake segment'
+        assert hpguppi_monitor.get_hashpipe_status_reader(instance)._sem is not None, \
+                'status semaphore not opened'
+        assert hpguppi_monitor.get_hashpipe_key_value('PROJID', instance) == b'dmpauto\n'
+        assert hpguppi_monitor.get_hashpipe_key_value('NOSUCHKEY', instance) == b''
+    finally:
+        shm.remove()
+    # a restarted instance recreates its segment, the reader attaches the new one
+    shm = StatusShm(dict(FAKE_STATUS, DAQSTATE='IDLE'), instance)
+    try:
+        assert hpguppi_monitor.get_hashpipe_status(instance) == dict(expected, DAQSTATE='IDLE'), \
+                'recreated segment not attached'
+    except BaseException:
+        shm.remove()
+        raise
+    print('fake SysV status segment read back: {} keys OK'.format(len(expected)))
+    return shm
+
+
+def keys_per_s(func, keys, repeat):
+    t = time.time()
+    for i in range(repeat):
+        for key in keys:
+            func(key)
+    return repeat*len(keys)/(time.time() - t)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('-i', '--instance', type=int, default=None,
+            help='benchmark against this running hashpipe instance instead of the fake segment')
+    parser.add_argument('-n', '--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    path = make_status_segment('/dev/shm/fake_hashpipe_status_%d' % os.getpid(), FAKE_STATUS)
+    tmpdir = tempfile.mkdtemp()
+    shm = None
+    try:
+        check_reader(path)
+        keys = ['DAQPULSE', 'DATADIR', 'PROJID', 'BACKEND', 'BANK', 'OBSBW']
+
+        if args.instance is not None:
+            reader = HashpipeStatusReader(args.instance)
+            checker = 'hashpipe_check_status'
+            instance = args.instance
+        else:
+            # a key of our own, not the one of a hashpipe running here
+            os.environ['HASHPIPE_KEYFILE'] = tmpdir
+            instance = 0
+            shm = check_shm(instance)
+            reader = hpguppi_monitor.get_hashpipe_status_reader(instance)
+            checker = os.path.join(tmpdir, 'hashpipe_check_status')
+            with open(checker, 'w') as f:
+                f.write(STAND_IN)
+            os.chmod(checker, os.stat(checker).st_mode | stat.S_IEXEC)
+            os.environ['STATUS_FILE'] = path
+            assert (subprocess.run([checker, '--instance=0', '--query=PROJID'], capture_output=True).stdout
+                    == b'dmpauto\n'), 'stand-in hashpipe_check_status is broken'
+
+        def subprocess_get(key):
+            return subprocess.run([checker, '--instance='+str(instance), '--query='+key], capture_output=True).stdout
+
+        t_sub = keys_per_s(subprocess_get, keys, args.repeat)
+        t_key = keys_per_s(reader.get, keys, args.repeat*100)
+        t = time.time()
+        nsnap = args.repeat*100
+        for i in range(nsnap):
+            nkeys = len(reader.snapshot())
+        t_snap = nsnap*nkeys/(time.time() - t)
+        reader.close()
+
+        print('{:>36s} {:>14.0f} keys/s'.format(os.path.basename(checker) + ' subprocess'
+            + ('' if args.instance is not None else ' (stand-in)'), t_sub))
+        print('{:>36s} {:>14.0f} keys/s'.format('shared memory, one key per read', t_key))
+        print('{:>36s} {:>14.0f} keys/s ({} keys per snapshot)'.format('shared memory, whole snapshot', t_snap, nkeys))
+    finally:
+        if shm is not None:
+            shm.remove()
+        os.remove(path)
+        shutil.rmtree(tmpdir)
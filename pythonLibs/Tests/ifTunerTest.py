@@ -0,0 +1,174 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+test of the closed-loop IF tuner (ATATools.if_tuner) against simulated
+gain modules and RFSoC ADCs. Each simulated input has its own signal
+level and attenuator slope and ripple, the ADC samples are noisy and
+clipped to 12 bits, and setting attenuators and reading ADCs take time.
+The tuner is compared with the previous fixed loop (3 iterations of
+5 ADC cycles, one gain module after another). Reports the iterations and
+wall time per input, and checks that all inputs are tuned to within the
+tolerance or reported as not converged (the model expecting no better
+setting, within half a step), except the one that is too weak for the
+attenuator range
+"""
+
+import sys
+
+sys.path.append("..")
+
+import argparse
+import threading
+import time
+
+import numpy as np
+
+from ATATools import if_tuner
+
+TARGET_RMS = 1024
+INIT_ATT = 23
+ADC_SAMPLES = 8192 # per cycle
+ADC_MAX = 2047
+
+
+class SimIF(object):
+    """
+    simulated gain modules and ADCs of nants antennas x nlos LOs x 2 pols.
+    Inputs are named as by ata_if, e.g. '1aAx'
+    """
+    def __init__(self, nants, nlos, nchans_module, npipelines, set_latency,
+            cycle_latency, seed=0):
+        rng = np.random.default_rng(seed)
+        self.set_latency = set_latency
+        self.cycle_latency = cycle_latency
+        self.inputs = ['%i%s%s%s' %(iant//8 + 1, 'abcdefgh'[iant%8], lo, pol)
+                for lo in 'ABCD'[:nlos] for iant in range(nants) for pol in 'xy']
+        n = len(self.inputs)
+        self.module = {inp: 'gain-module%i' %(ii//nchans_module + 1) for ii, inp in enumerate(self.inputs)}
+        self.board = {inp: 'rfsoc%i' %(ii//(2*npipelines) + 1) for ii, inp in enumerate(self.inputs)}
+        self.pipeline = {inp: (ii//2)%npipelines for ii, inp in enumerate(self.inputs)}
+        # RMS without attenuation, between 5 and 25 dB above the target
+        level_db = 20*np.log10(TARGET_RMS) + rng.uniform(5, 25, n)
+        level_db[n//2] = 20*np.log10(TARGET_RMS) - 3 # too weak
+        self.level_db = dict(zip(self.inputs, level_db))
+        self.slope = dict(zip(self.inputs, rng.uniform(0.85, 1.15, n)))
+        self.ripple = dict(zip(self.inputs, rng.uniform(0, 0.6, n)))
+        self.attn = {inp: 0.0 for inp in self.inputs}
+        self.nsets = 0
+        self.ncycles = 0
+        self.lock = threading.Lock()
+
+    def set_attn(self, module, inps, attens):
+        time.sleep(self.set_latency)
+        with self.lock:
+            self.nsets += 1
+        for inp, attn in zip(inps, attens):
+            assert self.module[inp] == module
+            assert if_tuner.MIN_ATT <= attn <= if_tuner.MAX_ATT and attn % 0.5 == 0, attn
+            self.attn[inp] = attn
+
+    def read_rms(self, board, inps, ncycles):
+        rng = np.random.default_rng()
+        rms = {}
+        for pipeline in sorted(set([self.pipeline[inp] for inp in inps])):
+            time.sleep(self.cycle_latency*ncycles)
+            with self.lock:
+                self.ncycles += ncycles
+            for inp in self.inputs:
+                if self.board[inp] != board or self.pipeline[inp] != pipeline:
+                    continue
+                attn = self.attn[inp]
+                power_db = self.level_db[inp] - self.slope[inp]*attn - \
+                        self.ripple[inp]*np.sin(attn)
+                samples = rng.standard_normal(ADC_SAMPLES*ncycles)*10**(power_db/20)
+                rms[inp] = np.std(np.clip(np.round(samples), -ADC_MAX - 1, ADC_MAX))
+        return [rms[inp] for inp in inps]
+
+    def groups(self, mapping):
+        groups = {}
+        for inp in self.inputs:
+            groups.setdefault(mapping[inp], []).append(inp)
+        return groups
+
+    def error_db(self, inp):
+        return 20*np.log10(self.read_rms(self.board[inp], [inp], 5)[0]/TARGET_RMS)
+
+
+def tune_fixed(sim, niter=3, ncycles=5):
+    """
+    the previous tuning: fixed iterations, one gain module after another
+    """
+    for module, inps in sim.groups(sim.module).items():
+        attn = np.array([INIT_ATT]*len(inps), dtype=float)
+        for i in range(niter):
+            attn = np.clip(attn, if_tuner.MIN_ATT, if_tuner.MAX_ATT)
+            sim.set_attn(module, inps, attn)
+            rms = []
+            for inp in inps:
+                rms += sim.read_rms(sim.board[inp], [inp], ncycles)
+            attn = if_tuner._round_step(attn + 20*np.log10(np.array(rms)/TARGET_RMS))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('-a', '--nants', type=int, default=20)
+    parser.add_argument('-l', '--nlos', type=int, default=2)
+    parser.add_argument('-s', '--set-latency', type=float, default=0.2,
+            help='time to set a gain module [s]')
+    parser.add_argument('-c', '--cycle-latency', type=float, default=0.01,
+            help='time to read an ADC cycle [s]')
+    parser.add_argument('--nofixed', action='store_true',
+            help='do not run the previous fixed loop')
+    args = parser.parse_args()
+
+    def make_sim():
+        return SimIF(args.nants, args.nlos, 16, 8, args.set_latency, args.cycle_latency)
+
+    sim = make_sim()
+    print('{} inputs, {} gain modules, {} boards'.format(len(sim.inputs),
+        len(sim.groups(sim.module)), len(sim.groups(sim.board))))
+
+    t = time.time()
+    report = if_tuner.tune(sim.groups(sim.module), sim.groups(sim.board),
+            sim.set_attn, sim.read_rms, {inp: TARGET_RMS for inp in sim.inputs},
+            INIT_ATT, 3)
+    t_tuner = time.time() - t
+    print(report.to_string())
+    print('tuner: {:.2f} s, {} gain module sets, {} ADC cycles, iterations per input: '
+            'mean {:.1f} max {}'.format(t_tuner, sim.nsets, sim.ncycles,
+                report.iterations.mean(), report.iterations.max()))
+
+    weak = sim.inputs[len(sim.inputs)//2]
+    assert report.loc[weak, 'status'] == 'limit' and report.loc[weak, 'attn'] == if_tuner.MIN_ATT
+    tuned = report.index[report.index != weak]
+    assert report.loc[tuned, 'status'].isin(['tuned', 'not converged']).all(), \
+            report[~report.status.isin(['tuned', 'not converged'])]
+    # the status follows the last read error
+    within = report.error_db.abs() <= if_tuner.TOL_DB
+    assert (within[tuned] == (report.loc[tuned, 'status'] == 'tuned')).all(), report[tuned]
+    print('tuner: {} inputs tuned, {} not converged'.format((report.status == 'tuned').sum(),
+        (report.status == 'not converged').sum()))
+    # checked again on the simulated hardware: within half a step and the model ripple
+    errors = np.array([sim.error_db(inp) for inp in tuned])
+    assert np.all(np.abs(errors) < 0.5), errors
+    print('tuner: final error max {:.2f} dB'.format(np.abs(errors).max()))
+
+    # 0.2 dB above the target, no step of the model is closer: not converged
+    # with a tolerance of 0.1 dB, tuned with the default tolerance
+    for tol_db, status in [(0.1, 'not converged'), (if_tuner.TOL_DB, 'tuned')]:
+        report = if_tuner.tune({'module': ['inp']}, {'board': ['inp']},
+                lambda module, inps, attens: None,
+                lambda board, inps, ncycles: [TARGET_RMS*10**(0.2/20)],
+                {'inp': TARGET_RMS}, INIT_ATT, 3, tol_db=tol_db)
+        assert report.loc['inp', 'status'] == status, report
+        assert report.loc['inp', 'iterations'] == 1 and report.loc['inp', 'attn'] == INIT_ATT
+
+    if not args.nofixed:
+        sim = make_sim()
+        t = time.time()
+        tune_fixed(sim)
+        t_fixed = time.time() - t
+        errors = np.array([sim.error_db(inp) for inp in tuned])
+        print('fixed loop: {:.2f} s, {} gain module sets, {} ADC cycles, '
+                'final error max {:.2f} dB'.format(t_fixed, sim.nsets, sim.ncycles,
+                    np.abs(errors).max()))
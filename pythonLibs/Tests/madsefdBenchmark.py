@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+test and benchmark of the vectorized MAD flagger (filterArray.MADSEFD)
+against the previous row by row implementation (kept here).
+The masks must be equal, including rows with nan, inf (On == Off)
+and constant values, for even and odd numbers of channels
+"""
+
+import sys
+
+sys.path.append("..")
+
+import argparse
+import time
+
+import numpy
+
+import OnOffCalc.misc
+from OnOffCalc.filterArray import MADSEFD
+
+
+def legacy_MADSEFD(onArray, offArray):
+    """
+    MADSEFD as it was, one row at a time
+    """
+    drange = OnOffCalc.misc.getDatarange(onArray.shape[1])
+    dataMask = numpy.ones(onArray.shape)
+    for iK in range(len(onArray)):
+        onVectSel = onArray[iK, drange]
+        offVectSel = offArray[iK, drange]
+        tmpVect = numpy.divide(offVectSel, (onVectSel - offVectSel), dtype='float')
+        xMed = numpy.median(tmpVect)
+        xMAD = numpy.median(numpy.abs(tmpVect - xMed))
+        indexList = numpy.asarray((tmpVect < (xMed + MADMultiplier*xMAD)) * (tmpVect > (xMed - MADMultiplier*xMAD))).nonzero()[0]
+        dataMask[iK, drange[indexList]] = 0
+    return dataMask
+
+MADMultiplier = MADSEFD.MADMultiplier
+
+
+def make_data(ntimes, nfreqs, seed):
+    rng = numpy.random.default_rng(seed)
+    off = rng.uniform(1.0, 2.0, (ntimes, nfreqs))
+    on = off*rng.normal(1.15, 0.01, (ntimes, nfreqs))
+    rfi = rng.integers(0, nfreqs, nfreqs//50)
+    on[:, rfi] *= 3
+    if ntimes > 4:
+        on[1, nfreqs//2] = off[1, nfreqs//2]       # inf
+        on[2, nfreqs//2 + 1] = numpy.nan            # nan
+        on[3] = 2.0                                 # constant ratio
+        off[3] = 1.0
+        on[4, nfreqs//3:nfreqs//2] = off[4, nfreqs//3:nfreqs//2]  # many inf
+    return on, off
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('-t', '--ntimes', type=int, default=64)
+    parser.add_argument('-f', '--nfreqs', type=int, nargs='+', default=[2048, 4096, 16384])
+    parser.add_argument('-n', '--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    # exactness, on small odd and even channel counts as well
+    for nfreqs in [7, 2047, 2048, 4095] + args.nfreqs:
+        for seed in range(3):
+            on, off = make_data(8, nfreqs, seed)
+            with numpy.errstate(all='ignore'):
+                assert numpy.array_equal(legacy_MADSEFD(on, off), MADSEFD.MADSEFD(on, off)), \
+                    'masks differ for {} channels'.format(nfreqs)
+    print('masks equal')
+
+    for nfreqs in args.nfreqs:
+        on, off = make_data(args.ntimes, nfreqs, 0)
+        with numpy.errstate(all='ignore'):
+            t = time.time()
+            for i in range(args.repeat):
+                legacy_MADSEFD(on, off)
+            t_legacy = (time.time() - t)/args.repeat
+            t = time.time()
+            for i in range(args.repeat):
+                MADSEFD.MADSEFD(on, off)
+            t_vect = (time.time() - t)/args.repeat
+        print('{:>6d} x {:>6d} {:>10.4f} s row by row {:>10.4f} s vectorized (x{:.1f})'.format(
+            args.ntimes, nfreqs, t_legacy, t_vect, t_legacy/t_vect))
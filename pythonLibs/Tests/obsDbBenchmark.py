@@ -0,0 +1,208 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+test and benchmark of the obs_db connection pool and bulk inserts.
+A local SQLite file stands in for the obs MySQL database (the MySQL
+%(name)s / %s placeholders and now() are translated), and each new
+connection can be delayed by --connect-latency to model the MySQL
+handshake. A multi-frequency, multi-antenna observation is registered
+as previously done (one connection and one commit per statement) and
+with the pooled, transactional obs_db, and the rows/s are reported. The
+default pool is also checked, with ATAdb's connect_to_db replaced.
+mysql.connector and ATATools must be importable, as for any ATAobs
+import
+"""
+
+import sys
+
+sys.path.append("..")
+
+import argparse
+import os
+import re
+import sqlite3
+import tempfile
+import time
+
+from ATAobs import obs_db, obs_common
+
+SCHEMA = """
+create table if not exists obs_sets (id integer primary key autoincrement,
+    ts timestamp default current_timestamp, description text);
+create table if not exists recordings (id integer primary key autoincrement,
+    setid integer, freq real, type text, backend text, observer text, description text,
+    tstart timestamp, tstop timestamp, status text default 'NEW');
+create table if not exists rec_ants (id integer, ant text, az real, el real, source text,
+    pamx real, pamy real, pamdetx real, pamdety real,
+    dsp_atten_x real, dsp_atten_y real, dsp_rms_x real, dsp_rms_y real);
+"""
+
+
+def to_sqlite(cmd):
+    cmd = re.sub(r'%\((\w+)\)s', r':\1', cmd)
+    cmd = cmd.replace('%s', '?').replace('now()', 'current_timestamp')
+    # "insert into t set a=x, b=y" is MySQL only
+    m = re.match(r'insert into (\w+) set (.*)$', cmd)
+    if m:
+        cols, vals = zip(*[kv.split('=') for kv in m.group(2).split(', ')])
+        cmd = 'insert into {} ({}) values ({})'.format(m.group(1), ', '.join(cols), ', '.join(vals))
+    return cmd
+
+
+class SqliteCursor(object):
+    def __init__(self, cursor):
+        self.cursor = cursor
+
+    def execute(self, cmd, params=()):
+        return self.cursor.execute(to_sqlite(cmd), params)
+
+    def executemany(self, cmd, rows):
+        return self.cursor.executemany(to_sqlite(cmd), rows)
+
+    def __getattr__(self, name):
+        return getattr(self.cursor, name)
+
+
+class SqliteConnection(object):
+    """
+    the parts of a mysql.connector connection used by obs_db
+    """
+    def __init__(self, path, latency):
+        time.sleep(latency)
+        self.conn = sqlite3.connect(path)
+
+    def cursor(self):
+        return SqliteCursor(self.conn.cursor())
+
+    def is_connected(self):
+        return True
+
+    def commit(self):
+        self.conn.commit()
+
+    def rollback(self):
+        self.conn.rollback()
+
+    def close(self):
+        self.conn.close()
+
+
+def legacy_register(connect, freqs, antlist, source, attendict):
+    """
+    the registration as previously done, one connection and commit per statement
+    """
+    recids = []
+    for freq in freqs:
+        mydb = connect()
+        mycursor = mydb.cursor()
+        mycursor.execute("insert into recordings set freq=%(freq)s, type=%(obstype)s, backend=%(obsbackend)s, "
+                "observer=%(observer)s, description=%(desc)s",
+                {'freq': freq, 'obstype': obs_common.getRecType('ON-OFF'),
+                    'obsbackend': obs_common.getRecBackend('SNAP'), 'observer': 'bench', 'desc': 'bench'})
+        mydb.commit()
+        recids.append(mycursor.lastrowid)
+        mycursor.close()
+        mydb.close()
+    for recid in recids:
+        mydb = connect()
+        mycursor = mydb.cursor()
+        for ant in antlist:
+            mycursor.execute("insert into rec_ants set id=%(id)s, ant=%(ant)s, az=%(az)s, el=%(el)s, source=%(src)s",
+                    {'id': recid, 'ant': ant, 'az': 0.0, 'el': 0.0, 'src': source})
+            mydb.commit()
+        mycursor.close()
+        mydb.close()
+        mydb = connect()
+        mycursor = mydb.cursor()
+        for ant in attendict:
+            cdict = {'ant': ant, 'id': recid, 'attenx': attendict[ant]['attenx'], 'atteny': attendict[ant]['atteny']}
+            mycursor.execute("update rec_ants set dsp_atten_x=%(attenx)s, dsp_atten_y=%(atteny)s where ant=%(ant)s and id=%(id)s", cdict)
+            mydb.commit()
+        mycursor.close()
+        mydb.close()
+    return recids
+
+
+def pooled_register(freqs, antlist, source, attendict):
+    with obs_db.transaction():
+        recids = obs_db.initRecordings(freqs, 'ON-OFF', 'SNAP', 'bench', 'bench')
+        obs_db.initAntennasTable(recids, antlist, source, getpams=False)
+        for recid in recids:
+            obs_db.updateAttenVals(recid, attendict)
+    return recids
+
+
+def dump(path, recids):
+    conn = sqlite3.connect(path)
+    rows = conn.execute('select r.freq, a.ant, a.source, a.dsp_atten_x, a.dsp_atten_y from rec_ants a '
+            'join recordings r on r.id = a.id where a.id in ({}) order by r.freq, a.ant'.format(
+                ', '.join(map(str, recids)))).fetchall()
+    conn.close()
+    return rows
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('-f', '--nfreqs', type=int, default=8)
+    parser.add_argument('-a', '--nants', type=int, default=42)
+    parser.add_argument('-l', '--connect-latency', type=float, default=0.005,
+            help='seconds added to each new connection')
+    args = parser.parse_args()
+
+    freqs = [1000.0 + 500*i for i in range(args.nfreqs)]
+    antlist = ['%d%s' % (i//8 + 1, 'abcdefgh'[i % 8]) for i in range(args.nants)]
+    attendict = {ant: {'attenx': i % 32, 'atteny': (i + 1) % 32} for i, ant in enumerate(antlist)}
+    nrows = len(freqs)*(1 + 2*len(antlist))
+
+    with tempfile.TemporaryDirectory() as d:
+        path = os.path.join(d, 'obs.sqlite')
+        conn = sqlite3.connect(path)
+        conn.executescript(SCHEMA)
+        conn.close()
+        connect = lambda: SqliteConnection(path, args.connect_latency)
+
+        t = time.time()
+        legacy_ids = legacy_register(connect, freqs, antlist, 'casa', attendict)
+        t_legacy = time.time() - t
+
+        pool = obs_db.ConnectionPool(connect)
+        obs_db.setConnectionPool(pool)
+        t = time.time()
+        pooled_ids = pooled_register(freqs, antlist, 'casa', attendict)
+        t_pooled = time.time() - t
+        # a second registration reuses the pooled connection
+        t = time.time()
+        pooled_register(freqs, antlist, 'casa', attendict)
+        t_reused = time.time() - t
+
+        assert dump(path, legacy_ids) == dump(path, pooled_ids), 'pooled rows differ from the legacy ones'
+        assert pool.nconnects == 1, 'expected 1 connection, got {}'.format(pool.nconnects)
+
+        # a failing block leaves nothing behind
+        nrecs = sqlite3.connect(path).execute('select count(*) from recordings').fetchone()[0]
+        try:
+            with obs_db.transaction():
+                obs_db.initRecordings(freqs, 'ON-OFF', 'SNAP', 'bench', 'bench')
+                raise RuntimeError('abort')
+        except RuntimeError:
+            pass
+        assert sqlite3.connect(path).execute('select count(*) from recordings').fetchone()[0] == nrecs, \
+            'rolled back recordings were kept'
+        obs_db.closeConnectionPool()
+
+        # the default pool connects with ATAdb's connect_to_db
+        databases = []
+        def connect_to_db(db_name):
+            databases.append(db_name)
+            return SqliteConnection(path, 0)
+        obs_db.connect_to_db = connect_to_db
+        default_ids = pooled_register(freqs, antlist, 'casa', attendict)
+        assert databases == [obs_db.DB_NAME], databases
+        assert dump(path, default_ids) == dump(path, legacy_ids), 'default pool rows differ'
+        obs_db.closeConnectionPool()
+
+    print('{} frequencies x {} antennas, {} rows per registration, {:.3f} s per new connection'.format(
+        args.nfreqs, args.nants, nrows, args.connect_latency))
+    print('{:>28s} {:>10.0f} rows/s'.format('connect/commit per row', nrows/t_legacy))
+    print('{:>28s} {:>10.0f} rows/s'.format('pooled, one transaction', nrows/t_pooled))
+    print('{:>28s} {:>10.0f} rows/s'.format('pooled, connection reused', nrows/t_reused))
@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+benchmark of the source scheduling in ATAPositions.
+Compares the minute-by-minute pyephem loop (as previously
+done in getPreferedSourceUp) with the vectorized getUpGrid
+for a growing number of ra/dec sources and day lengths, and checks
+the up state of named sources (goes-16 passing close to the sun, the
+moon) against the per-minute checks of getFirstInListThatIsUp
+"""
+
+import sys
+
+sys.path.append("..")
+
+import datetime as dt
+import time
+
+import numpy as np
+
+from ATATools.ata_positions import ATAPositions, MIN_ELEV, MIN_MOON_SUN_DIST
+
+
+def distance(p1, p2):
+    return ATAPositions._angularDistanceGrid(p1['az'], p1['el'], p2['az'], p2['el'])
+
+
+def scalar_uptime(pos, radec, d, minutes):
+    """
+    consecutive up minutes of every source, one pyephem call
+    per source and minute
+    """
+    uptimes = []
+    for ra, dec in radec:
+        c_uptime = 0
+        for future_minutes in range(1, minutes):
+            t = d + dt.timedelta(minutes=future_minutes)
+            src = pos.getAzEl(t, None, ra, dec)
+            sun = pos.getAzEl(t, 'sun')
+            moon = pos.getAzEl(t, 'moon')
+            if(src['el'] > MIN_ELEV and distance(src, sun) >= MIN_MOON_SUN_DIST
+                    and distance(src, moon) >= MIN_MOON_SUN_DIST):
+                c_uptime += 1
+            else:
+                break
+        uptimes.append(c_uptime)
+    return uptimes
+
+
+def scalar_up(pos, name, d):
+    """
+    the up check of getPreferedSourceUp and getFirstInListThatIsUp
+    """
+    sun_angle = ATAPositions.angular_distance('sun', name, d)
+    if(name == 'moon'):
+        moon_angle = 90.0
+    else:
+        moon_angle = ATAPositions.angular_distance('moon', name, d)
+    return bool(pos.isUp(name, d) and sun_angle >= MIN_MOON_SUN_DIST
+            and moon_angle >= MIN_MOON_SUN_DIST)
+
+
+def vector_uptime(pos, radec, d, minutes):
+    up = pos.getUpGrid(radec, d, minutes)['up'][:, 1:]
+    return np.where(up.all(axis=1), up.shape[1], np.argmin(up, axis=1))
+
+
+if __name__ == '__main__':
+    pos = ATAPositions()
+    d = dt.datetime(2024, 3, 1, 4, 0)
+    rng = np.random.default_rng(0)
+
+    # on that day the sun passes within a few degrees of goes-16
+    names = ['goes-16', 'moon', 'casa']
+    step = 10
+    grid = pos.getUpGrid(names, d, 1440, step)
+    sun = pos.getAzElGrid(['goes-16', 'sun'], d, 1440, step)
+    goes_sun = distance({'az': sun['az'][0], 'el': sun['el'][0]},
+            {'az': sun['az'][1], 'el': sun['el'][1]})
+    assert goes_sun.min() < MIN_MOON_SUN_DIST
+    for name, up in zip(names, grid['up']):
+        ref = [scalar_up(pos, name, d + dt.timedelta(minutes=float(m)))
+                for m in grid['minutes']]
+        # the grid and the loop may differ at a transition
+        ndiff = np.sum(up != np.array(ref))
+        assert ndiff <= 2, (name, ndiff)
+        print('{}: up {} of {} minutes, {} differ from the loop'.format(name,
+            np.sum(up)*step, len(up)*step, ndiff))
+    assert not grid['up'][0].all()
+
+    print('{:>8s} {:>8s} {:>12s} {:>12s} {:>8s}'.format(
+        'sources', 'minutes', 'loop [s]', 'vector [s]', 'agree'))
+    for nsources in [10, 100, 1000]:
+        radec = list(zip(rng.uniform(0, 24, nsources), rng.uniform(-20, 89, nsources)))
+        for minutes in [360, 1440]:
+            t = time.time()
+            vec = vector_uptime(pos, radec, d, minutes)
+            t_vec = time.time() - t
+
+            # the loop is too slow for large lists, time a subset
+            nloop = min(nsources, 10)
+            t = time.time()
+            ref = scalar_uptime(pos, radec[:nloop], d, minutes)
+            t_loop = (time.time() - t) * nsources / nloop
+            agree = np.sum(np.abs(vec[:nloop] - np.array(ref)) <= 1)
+
+            print('{:>8d} {:>8d} {:>12.3f} {:>12.3f} {:>5d}/{:d}'.format(
+                nsources, minutes, t_loop, t_vec, agree, nloop))
@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+benchmark of the synchronized-start gather of record_in.
+The F-engine sync time and ephemeris reads are replaced by sleeps of
+--latency seconds and the gateway hashes live in fakeredis, so no
+hardware is needed (but ata_snap and ATATools must be importable, as
+for any snap_hpguppi import). The gather latency and the slack left
+before the chosen start are reported, from a dry run of record_in,
+along with the start lead (call to start) against that of the previous
+serial gather
+"""
+
+import sys
+
+sys.path.append("..")
+
+import argparse
+import time
+
+import fakeredis
+
+from SNAPobs.snap_hpguppi import snap_hpguppi_defaults as hpguppi_defaults
+from SNAPobs.snap_hpguppi import record_in as hpguppi_record_in
+
+SYNC_TIME = 1600000000
+TBIN = 4.0e-6
+
+
+def populate(redis_obj, ninstances):
+    """
+    fixture: one rfsoc stream per instance
+    """
+    set_channels = []
+    for i in range(ninstances):
+        host, inst = 'seti-node%d' % (i//2 + 1), i % 2
+        redis_obj.hset(hpguppi_defaults.REDISGETGW.substitute(host=host, inst=inst),
+                mapping={'ANTNAMES': 'fake%dA' % i, 'NANTS': 1, 'TBIN': TBIN})
+        set_channels.append(hpguppi_defaults.REDISSETGW.substitute(host=host, inst=inst))
+    return set_channels
+
+
+def fake_reads(latency):
+    def get_sync_time_for_streams(stream_hostnames):
+        time.sleep(latency)
+        return [SYNC_TIME for stream in stream_hostnames]
+    def get_uniform_source_name_for_streams(streams):
+        time.sleep(latency)
+        return 'casa'
+    hpguppi_record_in._get_sync_time_for_streams = get_sync_time_for_streams
+    hpguppi_record_in._get_uniform_source_name_for_streams = get_uniform_source_name_for_streams
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('-n', '--ninstances', type=int, default=16)
+    parser.add_argument('-l', '--latency', type=float, default=0.2,
+            help='seconds taken by each fake F-engine/ephemeris read')
+    parser.add_argument('-d', '--delay', type=float, default=2,
+            help='obs_delay_s passed to record_in')
+    args = parser.parse_args()
+
+    hpguppi_defaults.redis_obj = fakeredis.FakeRedis()
+    set_channels = populate(hpguppi_defaults.redis_obj, args.ninstances)
+    hpguppi_record_in.hpguppi_auxillary.get_stream_hostname_per_antennalo_names = (
+            lambda antlo_names: ['rfsoc-%s' % ant for ant in antlo_names])
+    fake_reads(args.latency)
+
+    # serial reference, one target after the other as previously done
+    t = time.time()
+    for set_channel in set_channels:
+        hpguppi_record_in._get_sync_time_for_streams(['stream'])
+        hpguppi_record_in._get_uniform_source_name_for_streams(['stream'])
+    t_serial = time.time() - t
+
+    t_call = time.time()
+    hpguppi_record_in.record_in(args.delay, 10, hashpipe_targets=set_channels, dry_run=True, log=False)
+    timing = hpguppi_record_in.last_gather_timing
+    assert len(timing['target_latencies']) == args.ninstances
+
+    print()
+    print('{} instances, {:.3f} s per read'.format(args.ninstances, args.latency))
+    print('{:>12s} gather {:>8.3f} s, start lead ~{:>7.3f} s'.format('serial', t_serial, t_serial + args.delay))
+    print('{:>12s} gather {:>8.3f} s, start lead {:>8.3f} s, slack {:.3f} s'.format('concurrent',
+        timing['gather_s'], timing['start'] - t_call, timing['slack_s']))
@@ -0,0 +1,163 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+test and benchmark of the pipelined redis helpers of
+snap_hpguppi.auxillary.
+64 hashpipe gateway hashes are populated in a redis stand-in
+(fakeredis, or a real server with --host) and read back and
+written to both one command at a time, as previously done, and
+with the pipelined helpers. The results must agree; the commands,
+round-trips and time taken by each are reported
+"""
+
+import sys
+
+sys.path.append("..")
+
+import argparse
+import time
+
+import redis
+
+from SNAPobs.snap_hpguppi import snap_hpguppi_defaults as hpguppi_defaults
+from SNAPobs.snap_hpguppi import auxillary as hpguppi_auxillary
+
+NINSTANCES = 64
+ANTS_PER_KEY = 4
+
+
+class CountingRedis(object):
+    """
+    proxy of a redis.Redis that counts the commands sent, and the
+    round-trips (one per command, or per pipeline execution)
+    """
+    def __init__(self, redis_obj):
+        self.redis_obj = redis_obj
+        self.commands = 0
+        self.round_trips = 0
+
+    def pipeline(self, *args, **kwargs):
+        pipe = self.redis_obj.pipeline(*args, **kwargs)
+        execute = pipe.execute
+        def counted_execute(*args, **kwargs):
+            self.commands += len(pipe.command_stack)
+            self.round_trips += 1
+            return execute(*args, **kwargs)
+        pipe.execute = counted_execute
+        return pipe
+
+    def __getattr__(self, name):
+        attr = getattr(self.redis_obj, name)
+        if not callable(attr):
+            return attr
+        def counted(*args, **kwargs):
+            self.commands += 1
+            self.round_trips += 1
+            return attr(*args, **kwargs)
+        return counted
+
+
+def gateway_channels(ninstances):
+    return [hpguppi_defaults.REDISGETGW.substitute(host='blpn%d' % (i//2), inst=i % 2)
+            for i in range(ninstances)]
+
+
+def populate(redis_obj, channels):
+    """
+    fixture: each instance has 4 to 11 antennae, the first ANTS_PER_KEY
+    in ANTNAMES and the others continued in ANTNMSxx
+    """
+    expected = {}
+    for i, chan in enumerate(channels):
+        ants = ['%d%sA' % (i, chr(ord('a') + j)) for j in range(4 + i % 8)]
+        mapping = {'NANTS': len(ants), 'ANTNAMES': ','.join(ants[:ANTS_PER_KEY]), 'DAQSTATE': 'idling'}
+        for key_enum, k in enumerate(range(ANTS_PER_KEY, len(ants), ANTS_PER_KEY)):
+            mapping['ANTNMS%02d' % (key_enum + 1)] = ','.join(ants[k:k + ANTS_PER_KEY])
+        redis_obj.delete(chan)
+        redis_obj.hset(chan, mapping=mapping)
+        expected[chan] = ants
+    return expected
+
+
+def sequential_get_antennae_of_redis_chan(redis_obj, redis_chan):
+    """
+    get_antennae_of_redis_chan as previously done, one hget at a time
+    """
+    antennae_names = hpguppi_auxillary.redis_hget_retry(redis_obj, redis_chan, 'ANTNAMES')
+    antennae_names = [] if antennae_names is None else antennae_names.split(',')
+    antennae_count = hpguppi_auxillary.redis_hget_retry(redis_obj, redis_chan, 'NANTS')
+    antennae_count = 0 if antennae_count is None else int(antennae_count)
+    key_enum = 0
+    while(antennae_count > len(antennae_names)):
+        key_enum += 1
+        ant_names = hpguppi_auxillary.redis_hget_retry(redis_obj, redis_chan, 'ANTNMS%02d' % key_enum)
+        if ant_names is None:
+            break
+        antennae_names += ant_names.split(',')
+    return antennae_names
+
+
+def measure(counting, func):
+    counting.commands = 0
+    counting.round_trips = 0
+    t = time.time()
+    ret = func()
+    return ret, counting.commands, counting.round_trips, time.time() - t
+
+
+def report(label, commands, round_trips, seconds):
+    print('{:>36s} {:>6d} commands {:>6d} round-trips {:>10.2f} ms'.format(
+        label, commands, round_trips, seconds*1e3))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--host', type=str, default=None,
+            help='benchmark against this redis server instead of fakeredis (its gateway hashes are overwritten)')
+    parser.add_argument('-n', '--ninstances', type=int, default=NINSTANCES)
+    args = parser.parse_args()
+
+    if args.host is None:
+        import fakeredis
+        redis_obj = fakeredis.FakeRedis()
+    else:
+        redis_obj = redis.Redis(args.host)
+    counting = CountingRedis(redis_obj)
+    hpguppi_defaults.redis_obj = counting
+
+    channels = gateway_channels(args.ninstances)
+    expected = populate(redis_obj, channels)
+    print('{} gateway hashes, {} antennae'.format(len(channels), sum(len(a) for a in expected.values())))
+
+    # antennae reads
+    seq, *stats = measure(counting,
+            lambda: {chan: sequential_get_antennae_of_redis_chan(counting, chan) for chan in channels})
+    assert seq == expected, 'sequential antennae differ from the fixture'
+    report('antennae, one hget at a time', *stats)
+    pip, *stats = measure(counting,
+            lambda: hpguppi_auxillary.get_antennae_of_redis_chans(counting, channels))
+    assert pip == expected, 'pipelined antennae differ from the fixture'
+    assert stats[1] == 2, 'expected 2 round-trips, got {}'.format(stats[1])
+    report('antennae, pipelined', *stats)
+
+    # polling one key of every hash
+    rets, *stats = measure(counting,
+            lambda: [counting.hget(chan, 'DAQSTATE') for chan in channels])
+    report('DAQSTATE poll, one hget at a time', *stats)
+    _, *stats = measure(counting,
+            lambda: hpguppi_auxillary._block_until_key_has_value(channels, 'DAQSTATE', 'idling', verbose=False))
+    assert stats[1] == 1, 'expected 1 round-trip, got {}'.format(stats[1])
+    report('DAQSTATE poll, pipelined', *stats)
+
+    # writes to hashes (no subscribers, so every target is hset)
+    keyval_dict = {'PKTSTART': 1000, 'PKTSTOP': 2000, 'SRC_NAME': 'casa'}
+    _, *stats = measure(counting,
+            lambda: [counting.hset(chan, mapping=keyval_dict) for chan in channels])
+    report('hset, one at a time', *stats)
+    for chan in channels:
+        redis_obj.hdel(chan, *keyval_dict.keys())
+    _, *stats = measure(counting,
+            lambda: hpguppi_auxillary.publish_keyval_dict_to_redis(keyval_dict, channels))
+    assert stats[1] == 2, 'expected 2 round-trips, got {}'.format(stats[1])
+    assert all(redis_obj.hget(chan, 'SRC_NAME') == b'casa' for chan in channels), 'pipelined hset missed a hash'
+    report('hset, pipelined', *stats)
@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+benchmark of ATARest against a local stand-in REST server.
+Compares one-connection-per-call requests with the pooled
+session and the concurrent get_batch call for 42 antennas.
+Reports calls/s and p99 latency.
+"""
+
+import sys
+
+sys.path.append("..")
+
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+from ATATools.ata_rest import ATARest
+
+NANTS = 42
+NREPEAT = 10
+# simulated server-side processing time per request [s]
+SERVER_LATENCY = 0.005
+ANTS = ['ant{:02d}'.format(i) for i in range(NANTS)]
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        time.sleep(SERVER_LATENCY)
+        body = json.dumps({'az': 10.0, 'el': 20.0}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def p99(latencies):
+    latencies = sorted(latencies)
+    return latencies[int(0.99 * (len(latencies) - 1))]
+
+
+def bench_unpooled():
+    lat = []
+    t0 = time.time()
+    for i in range(NREPEAT):
+        for ant in ANTS:
+            t = time.time()
+            requests.get(ATARest.form_url('/antenna/{}/azel'.format(ant))).json()
+            lat.append(time.time() - t)
+    return NREPEAT * NANTS / (time.time() - t0), p99(lat)
+
+
+def bench_pooled():
+    lat = []
+    t0 = time.time()
+    for i in range(NREPEAT):
+        for ant in ANTS:
+            t = time.time()
+            ATARest.get('/antenna/{}/azel'.format(ant))
+            lat.append(time.time() - t)
+    return NREPEAT * NANTS / (time.time() - t0), p99(lat)
+
+
+def bench_batch():
+    lat = []
+    t0 = time.time()
+    for i in range(NREPEAT):
+        t = time.time()
+        ATARest.get_batch('/antenna/{}/azel', ANTS)
+        lat.append(time.time() - t)
+    return NREPEAT * NANTS / (time.time() - t0), p99(lat)
+
+
+if __name__ == '__main__':
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StandInHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    ATARest.HOST = '127.0.0.1'
+    ATARest.PORT = server.server_address[1]
+
+    print('{:<12s} {:>10s} {:>12s}'.format('mode', 'calls/s', 'p99 [ms]'))
+    for name, bench in [('unpooled', bench_unpooled),
+                        ('pooled', bench_pooled),
+                        ('get_batch', bench_batch)]:
+        rate, lat = bench()
+        # for get_batch the latency is per 42-antenna batch
+        print('{:<12s} {:>10.1f} {:>12.2f}'.format(name, rate, lat * 1e3))
+
+    ATARest.close_session()
+    server.shutdown()
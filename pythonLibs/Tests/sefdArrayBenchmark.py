@@ -0,0 +1,167 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+test and benchmark of the array SEFD engine (OnOffCalc.calcSEFDpyuvBlock)
+against per antenna, per polarization calls of the previous calcSEFD (kept
+here) and of the current one, on a synthetic 42-antenna, 4096-channel
+On/Off auto-correlation data set. The results must be bit-for-bit equal.
+The data set is checked both in the pyuvdata 2 layout (a stand-in object)
+and as a pyuvdata 3 UVData built with UVData.new
+"""
+
+import sys
+
+sys.path.append("..")
+
+import argparse
+import time
+
+import bottleneck as bn
+import numpy
+import pyuvdata
+from astropy.coordinates import EarthLocation
+from astropy.time import Time
+
+import OnOffCalc
+import OnOffCalc.filterArray
+import OnOffCalc.misc
+from ATATools import ata_constants
+
+
+class FakeUVData(object):
+    """
+    the parts of a pyuvdata UVData used by the SEFD calculations, with
+    baseline-time ordered auto-correlations
+    """
+    def __init__(self, nants, ntimes, nfreqs, on, seed):
+        rng = numpy.random.default_rng(seed)
+        self.Nfreqs = nfreqs
+        self.freq_array = numpy.linspace(1.4e9, 1.5e9, nfreqs)[numpy.newaxis, :]
+        self.object_name = 'casa'
+        self.antenna_numbers = numpy.arange(nants)
+        self.antenna_names = ['ant%02d' % i for i in range(nants)]
+        t0 = Time('2026-01-01T00:00:00').jd
+        times = t0 + numpy.arange(ntimes)/86400.0
+        self.time_array = numpy.repeat(times, nants)
+        self.ant_1_array = numpy.tile(self.antenna_numbers, ntimes)
+        self.ant_2_array = self.ant_1_array.copy()
+
+        gain = rng.uniform(0.5, 2.0, (1, nants, 1, 2))
+        bandpass = 1 + 0.2*numpy.sin(numpy.linspace(0, 6, nfreqs))[numpy.newaxis, numpy.newaxis, :, numpy.newaxis]
+        power = gain*bandpass*(1.15 if on else 1.0)
+        power = power*(1 + 0.01*rng.standard_normal((ntimes, nants, nfreqs, 2)))
+        # a few RFI channels
+        power[:, :, rng.integers(0, nfreqs, nfreqs//100), :] *= 5
+        self.data_array = power.reshape(ntimes*nants, 1, nfreqs, 2).astype(numpy.complex128)
+        self.flag_array = numpy.zeros(self.data_array.shape, dtype=bool)
+
+
+def make_uvdata(fake):
+    """
+    pyuvdata 3 UVData (no spectral window axis, the antennas in a Telescope,
+    the source in the phase center catalog) with the data of a FakeUVData
+    """
+    nants = len(fake.antenna_numbers)
+    telescope = pyuvdata.Telescope.new(name=ata_constants.ATA_NAME,
+            location=EarthLocation.from_geodetic(ata_constants.ATA_LON, ata_constants.ATA_LAT, ata_constants.ATA_ELEV),
+            antenna_positions={name: [10.0*ant, 0.0, 0.0] for ant, name in zip(fake.antenna_numbers, fake.antenna_names)},
+            antenna_numbers=fake.antenna_numbers, instrument=ata_constants.ATA_NAME)
+    data = fake.data_array[:, 0]
+    uv = pyuvdata.UVData.new(freq_array=fake.freq_array[0], polarization_array=[-5, -6],
+            times=numpy.unique(fake.time_array), telescope=telescope,
+            antpairs=[(ant, ant) for ant in fake.antenna_numbers], do_blt_outer=True,
+            integration_time=1.0, data_array=data, flag_array=numpy.zeros(data.shape, dtype=bool),
+            nsample_array=numpy.ones(data.shape),
+            phase_center_catalog={0: {'cat_name': fake.object_name, 'cat_type': 'sidereal',
+                'cat_lon': 0.0, 'cat_lat': 0.0, 'cat_frame': 'fk5', 'cat_epoch': 2000.0}},
+            phase_center_id_array=numpy.zeros(len(fake.time_array), dtype=int))
+    # same baseline-time order as the stand-in
+    assert numpy.array_equal(uv.time_array, fake.time_array) and numpy.array_equal(uv.ant_1_array, fake.ant_1_array)
+    assert uv.data_array.ndim == 3 and not hasattr(uv, 'object_name') and uv.Nants_data == nants
+    return uv
+
+
+def legacy_calcSEFD(onArrayM, offArrayM, srcFlux, method):
+    """
+    calcSEFD and calcOnOffParamMat as they were before the array engine
+    """
+    maskedMat = OnOffCalc.filterArray.filterFun(onArrayM, offArrayM, method)
+    onMat = onArrayM
+    offMat = offArrayM
+    unq = numpy.unique(maskedMat)
+    assert len(unq) == 2, "mask vector should be a binary"
+    assert numpy.all(unq == numpy.array([0, 1])), "mask vector should be a binary"
+    onMat[maskedMat == 1] = numpy.nan
+    offMat[maskedMat == 1] = numpy.nan
+    maskedArrOkNsamps = maskedMat.shape[1] - maskedMat.sum(axis=1)
+    tmpMat = numpy.divide(offMat, (onMat - offMat))
+    SEFDs = bn.nanmedian(tmpMat, axis=1)
+    powOn = numpy.sqrt(bn.nansum(onMat*onMat, axis=1))/maskedArrOkNsamps
+    powOff = numpy.sqrt(bn.nansum(offMat*offMat, axis=1))/maskedArrOkNsamps
+    mean_off = numpy.mean(powOff)
+    powOn = powOn - mean_off
+    powOff = powOff - mean_off
+    SEFD = srcFlux * bn.nanmedian(SEFDs)
+    SEFD_var = srcFlux * bn.nanstd(SEFDs)
+    return SEFD, SEFD_var, powOn, powOff, maskedMat, (srcFlux*SEFDs)
+
+
+def per_antenna(onUV, offUV, method, calcSEFD=legacy_calcSEFD):
+    """
+    the previous way, calcSEFD per antenna and per polarization
+    """
+    flx = None
+    ret = {'sefd_x': [], 'sefd_y': [], 'sefd_vec_x': [], 'sefd_vec_y': [], 'power_x': [], 'power_y': []}
+    for ant in getattr(onUV, 'telescope', onUV).antenna_numbers:
+        onSel = numpy.nonzero(onUV.ant_1_array == ant)[0]
+        offSel = numpy.nonzero(offUV.ant_1_array == ant)[0]
+        if flx is None:
+            import datetime
+            datetime_stamp = datetime.datetime.utcfromtimestamp(Time(onUV.time_array[0], format='jd').unix)
+            flx = OnOffCalc.flux.sourceFlux(OnOffCalc.misc.getUVObjectName(onUV),
+                    OnOffCalc.misc.getUVFreqs(onUV)[onUV.Nfreqs//2]/1e6, datetime_stamp)
+        for pol, name in enumerate(['x', 'y']):
+            on = OnOffCalc.misc.getUVBlock(onUV.data_array)[onSel, :, pol].real.copy()
+            off = OnOffCalc.misc.getUVBlock(offUV.data_array)[offSel, :, pol].real.copy()
+            SEFD, SEFD_var, powOn, powOff, indexes, sefdv = calcSEFD(on, off, flx, method)
+            ret['sefd_' + name].append(SEFD)
+            ret['sefd_vec_' + name].append(sefdv)
+            ret['power_' + name].append(numpy.concatenate((powOn, powOff)))
+    return {k: numpy.array(v) for k, v in ret.items()}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('-a', '--nants', type=int, default=42)
+    parser.add_argument('-t', '--ntimes', type=int, default=16)
+    parser.add_argument('-f', '--nfreqs', type=int, default=4096)
+    parser.add_argument('-m', '--methods', nargs='+', default=['simple', 'MADall', 'MAD'])
+    args = parser.parse_args()
+
+    fakeOn = FakeUVData(args.nants, args.ntimes, args.nfreqs, True, 1)
+    fakeOff = FakeUVData(args.nants, args.ntimes, args.nfreqs, False, 2)
+    print('{} antennas x {} integrations x {} channels x 2 pols'.format(args.nants, args.ntimes, args.nfreqs))
+
+    for layout, onUV, offUV in [('pyuvdata 2', fakeOn, fakeOff),
+            ('pyuvdata 3', make_uvdata(fakeOn), make_uvdata(fakeOff))]:
+        print(layout)
+        for method in args.methods:
+            t = time.time()
+            ref = per_antenna(onUV, offUV, method)
+            t_loop = time.time() - t
+
+            t = time.time()
+            cur = per_antenna(onUV, offUV, method, OnOffCalc.misc.calcSEFD)
+            t_cur = time.time() - t
+
+            t = time.time()
+            ret = OnOffCalc.calcSEFDpyuvBlock(onUV, offUV, method, updateFlags=True)
+            t_block = time.time() - t
+
+            for key, value in ref.items():
+                assert numpy.array_equal(value, cur[key], equal_nan=True), '{} calcSEFD {} differs'.format(method, key)
+                assert numpy.array_equal(value, ret[key], equal_nan=True), '{} array engine {} differs'.format(method, key)
+            assert ret['ant_names'] == fakeOn.antenna_names and ret['source'] == fakeOn.object_name
+            assert OnOffCalc.misc.getUVBlock(onUV.flag_array)[..., 0:2].any()
+            print('{:>8s} {:>8.3f} s previous loop {:>8.3f} s calcSEFD loop {:>8.3f} s array engine (x{:.1f}, bit-for-bit equal)'.format(
+                method, t_loop, t_cur, t_block, t_loop/t_block))
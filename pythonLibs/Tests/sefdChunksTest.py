@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+test of the SEFD calculation on time chunks (OnOffCalc.calcSEFDpyuvChunks)
+against calcSEFDpyuv on whole measurements, on synthetic single antenna
+On/Off waterfalls. The results must be bit-for-bit equal for the filters
+of OnOffCalc.rowFilterTypes. The chunks are generated when needed, as
+partial uvh5 reads would be, and the peak of the traced memory is reported
+"""
+
+import sys
+
+sys.path.append("..")
+
+import argparse
+import time
+import tracemalloc
+
+import numpy
+from astropy.time import Time
+
+import OnOffCalc
+
+
+class FakeUVData(object):
+    """
+    the parts of a pyuvdata UVData used by the SEFD calculations, for
+    integrations [tstart, tstop) of a single antenna waterfall
+    """
+    def __init__(self, ntimes, nfreqs, on, seed, tstart=0, tstop=None):
+        if tstop is None:
+            tstop = ntimes
+        rng = numpy.random.default_rng(seed)
+        self.Nfreqs = nfreqs
+        self.freq_array = numpy.linspace(1.4e9, 1.5e9, nfreqs)[numpy.newaxis, :]
+        self.object_name = 'casa'
+        t0 = Time('2026-01-01T00:00:00').jd + (0.01 if not on else 0)
+        self.time_array = t0 + numpy.arange(tstart, tstop)/86400.0
+
+        bandpass = 1 + 0.2*numpy.sin(numpy.linspace(0, 6, nfreqs))
+        rfi = rng.integers(0, nfreqs, nfreqs//100)
+        data = numpy.empty((tstop - tstart, 1, nfreqs, 2), dtype=numpy.complex128)
+        for ii in range(tstart, tstop):
+            # same values whatever the chunking
+            trng = numpy.random.default_rng((seed, ii))
+            power = bandpass[:, numpy.newaxis]*(1.15 if on else 1.0)*(1 + 0.01*trng.standard_normal((nfreqs, 2)))
+            power[rfi] *= 5
+            data[ii - tstart, 0] = power
+        self.data_array = data
+        self.flag_array = numpy.zeros(data.shape, dtype=bool)
+
+
+def chunks(ntimes, nfreqs, on, seed, chunk):
+    for tstart in range(0, ntimes, chunk):
+        yield FakeUVData(ntimes, nfreqs, on, seed, tstart, min(ntimes, tstart + chunk))
+
+
+def run_full(ntries, ntimes, nfreqs, method):
+    onList = [FakeUVData(ntimes, nfreqs, True, 2*ii) for ii in range(ntries)]
+    offList = [FakeUVData(ntimes, nfreqs, False, 2*ii + 1) for ii in range(ntries)]
+    return OnOffCalc.calcSEFDpyuv(onList, offList, method)
+
+
+def run_chunks(ntries, ntimes, nfreqs, method, chunk):
+    onList = [chunks(ntimes, nfreqs, True, 2*ii, chunk) for ii in range(ntries)]
+    offList = [chunks(ntimes, nfreqs, False, 2*ii + 1, chunk) for ii in range(ntries)]
+    return OnOffCalc.calcSEFDpyuvChunks(onList, offList, method)
+
+
+def traced(func, *args):
+    tracemalloc.start()
+    t = time.time()
+    ret = func(*args)
+    t = time.time() - t
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return ret, t, peak
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('-n', '--ntries', type=int, default=3)
+    parser.add_argument('-t', '--ntimes', type=int, default=128)
+    parser.add_argument('-f', '--nfreqs', type=int, default=4096)
+    parser.add_argument('-c', '--chunk', type=int, default=16)
+    parser.add_argument('-m', '--methods', nargs='+', default=OnOffCalc.rowFilterTypes)
+    args = parser.parse_args()
+
+    print('{} tries x {} integrations x {} channels x 2 pols, chunks of {} integrations'.format(
+        args.ntries, args.ntimes, args.nfreqs, args.chunk))
+    for method in args.methods:
+        ref, t_full, peak_full = traced(run_full, args.ntries, args.ntimes, args.nfreqs, method)
+        ret, t_chunk, peak_chunk = traced(run_chunks, args.ntries, args.ntimes, args.nfreqs, method, args.chunk)
+
+        assert ref.keys() == ret.keys(), 'result keys differ'
+        for key, value in ref.items():
+            if isinstance(value, numpy.ndarray):
+                assert numpy.array_equal(value, ret[key], equal_nan=True), '{} {} differs'.format(method, key)
+            else:
+                assert value == ret[key], '{} {} differs'.format(method, key)
+        print('{:>8s} whole: {:>7.2f} s {:>8.1f} MB peak   chunks: {:>7.2f} s {:>8.1f} MB peak (bit-for-bit equal)'.format(
+            method, t_full, peak_full/1024**2, t_chunk, peak_chunk/1024**2))
+
+    # On and Off with different integration counts are rejected
+    try:
+        OnOffCalc.calcSEFDpyuvChunks([chunks(32, 256, True, 0, 8)], [chunks(24, 256, False, 1, 8)], 'simple')
+    except AssertionError:
+        pass
+    else:
+        raise AssertionError('integrations count mismatch not detected')
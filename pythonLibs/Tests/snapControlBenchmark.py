@@ -0,0 +1,194 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+benchmark of the concurrent board initialisation and configuration of
+snap_control against mock F-engines with injected latencies (no board
+needed, but casperfpga and ata_snap must be importable and $ATASHAREDIR
+set, as for any SNAPobs import). The previous serial loops are timed on
+healthy boards, then the concurrent functions with one slow board, one
+board failing to load its system information and one board hanging on
+set_acc_len. Reports the wall time of each step and the slowest boards,
+and checks that the faulty boards are left out without stopping the
+others, and that arming fails when no board is left
+"""
+
+import sys
+
+sys.path.append("..")
+
+import argparse
+import logging
+import threading
+import time
+
+from SNAPobs import snap_control
+
+
+class MockFpga(object):
+    def __init__(self, feng):
+        self.feng = feng
+
+    def get_system_information(self, fpg_file):
+        self.feng.wait('sysinfo')
+
+    def disconnect(self):
+        self.feng.wait('call')
+
+
+class MockFeng(object):
+    """
+    the parts of AtaSnapFengine/AtaRfsocFengine used by snap_control,
+    each call taking LATENCIES[call] times the slowness of the board
+    """
+    LATENCIES = {'connect': 0.1, 'sysinfo': 0.3, 'call': 0.02}
+    slow = {}
+    dead = {}
+    hung = set()
+    hang = threading.Event()
+
+    def __init__(self, host):
+        self.host = host
+        self.fpga = MockFpga(self)
+        self.wait('connect')
+
+    def wait(self, call):
+        time.sleep(self.LATENCIES[call]*self.slow.get(self.host, 1))
+        if self.dead.get(self.host) == call:
+            raise ConnectionError("%s does not answer" %self.host)
+
+    def set_accumulation_length(self, acclen):
+        if self.host in self.hung:
+            self.hang.wait()
+        self.wait('call')
+
+    def sync_get_ext_count(self):
+        return int(time.time())
+
+    def sync_arm(self):
+        self.wait('call')
+        # armed on the next sync pulse
+        return int(time.time()) + 1
+
+    def eth_reset(self):
+        self.wait('call')
+
+    def eth_enable_output(self, enable=True):
+        self.wait('call')
+
+
+def serial_run(hosts, acclen):
+    """
+    the previous serial loops
+    """
+    times = {}
+    t = time.time()
+    snaps = [MockFeng(host) for host in hosts]
+    for snap in snaps:
+        snap.fpga.get_system_information('fpg')
+    times['init_snaps'] = time.time() - t
+
+    t = time.time()
+    for snap in snaps:
+        snap.set_accumulation_length(acclen)
+    times['set_acc_len'] = time.time() - t
+
+    t = time.time()
+    for snap in snaps:
+        snap.eth_reset()
+    current_sync = snaps[0].sync_get_ext_count()
+    while snaps[0].sync_get_ext_count() == current_sync:
+        time.sleep(0.05)
+    sync_times = [snap.sync_arm() for snap in snaps]
+    for snap in snaps:
+        snap.eth_enable_output(enable=True)
+    times['arm_snaps'] = time.time() - t
+    times['sync times'] = len(set(sync_times))
+    return times
+
+
+def concurrent_run(hosts, acclen):
+    times = {}
+    t = time.time()
+    snaps = snap_control.init_snaps(hosts, True, skip_failed=True)
+    times['init_snaps'] = time.time() - t
+
+    t = time.time()
+    armed = snap_control.set_acc_len(snaps, acclen, skip_failed=True)
+    times['set_acc_len'] = time.time() - t
+    assert [snap.host for snap in armed] == [snap.host for snap in snaps
+            if snap.host not in MockFeng.hung]
+
+    t = time.time()
+    times['sync time'] = snap_control.arm_snaps(armed, skip_failed=True)
+    times['arm_snaps'] = time.time() - t
+    return snaps, times
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('-n', '--nboards', type=int, default=32)
+    parser.add_argument('-t', '--timeout', type=float, default=2.,
+            help='board timeout [s]')
+    parser.add_argument('-v', '--verbose', action='store_true')
+    args = parser.parse_args()
+    if args.verbose:
+        logging.basicConfig(level=logging.INFO)
+
+    hosts = ['frb-snap%i-pi' %(ii + 1) for ii in range(args.nboards//4)] + \
+            ['rfsoc%i-ctrl-%i' %(ii//4 + 1, ii%4 + 1) for ii in range(args.nboards - args.nboards//4)]
+    snap_control.get_ata_cfg = lambda: {'SNAPFPG': 'snap.fpg', 'RFSOCFPG': 'rfsoc.fpg'}
+    snap_control._new_feng = MockFeng
+    snap_control.BOARD_TIMEOUT = args.timeout
+
+    print('{} boards, latencies: {}'.format(len(hosts), MockFeng.LATENCIES))
+    times = serial_run(hosts, 1024)
+    print('serial:     init {init_snaps:.2f} s, set_acc_len {set_acc_len:.2f} s, '
+            'arm {arm_snaps:.2f} s, {sync times} distinct sync time(s)'.format(**times))
+
+    times = concurrent_run(hosts, 1024)[1]
+    print('concurrent: init {init_snaps:.2f} s, set_acc_len {set_acc_len:.2f} s, '
+            'arm {arm_snaps:.2f} s, 1 distinct sync time'.format(**times))
+
+    # faulty boards
+    slow, dead, hung = hosts[1], hosts[2], hosts[3]
+    MockFeng.slow = {slow: 5}
+    MockFeng.dead = {dead: 'sysinfo'}
+    MockFeng.hung = {hung}
+    snaps, times = concurrent_run(hosts, 1024)
+    MockFeng.hang.set()
+    print('faulty:     init {init_snaps:.2f} s, set_acc_len {set_acc_len:.2f} s, '
+            'arm {arm_snaps:.2f} s'.format(**times))
+    for action, timings in snap_control.last_timings.items():
+        done = sorted([(t, host) for host, t in timings.items() if t is not None])
+        print('{:>24s}: {} boards, slowest {} {:.2f} s, not done: {}'.format(action,
+            len(timings), done[-1][1], done[-1][0],
+            [host for host, t in timings.items() if t is None]))
+
+    assert [snap.host for snap in snaps] == [host for host in hosts if host != dead]
+    assert snap_control.last_timings['set_acc_len'][hung] is None
+    assert snap_control.last_timings['init_snaps'][slow] > 4*MockFeng.LATENCIES['connect']
+
+    # without skip_failed, the error lists the failed boards after the others are done
+    try:
+        snap_control.init_snaps(hosts, True)
+    except snap_control.SnapControlError as e:
+        assert list(e.failed) == [dead]
+        assert len(e.results) == len(hosts) - 1
+    else:
+        raise AssertionError('failed board not reported')
+    print('faulty boards isolated')
+
+    # a dead board is left out of the boards stopped, and arming without
+    # any board left raises instead of indexing an empty list
+    MockFeng.dead = {slow: 'call'}
+    stopped = snap_control.stop_snaps(snaps, skip_failed=True)
+    assert [snap.host for snap in stopped] == [snap.host for snap in snaps if snap.host != slow]
+    MockFeng.dead = {snap.host: 'call' for snap in snaps[:4]}
+    try:
+        snap_control.arm_snaps(snaps[:4], skip_failed=True)
+    except snap_control.SnapControlError as e:
+        assert sorted(e.failed) == sorted(snap.host for snap in snaps[:4])
+        assert e.results == []
+    else:
+        raise AssertionError('arming without boards not reported')
+    print('no board left to arm reported')
@@ -0,0 +1,210 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+benchmark of the snap_recorder spectra capture against a fake
+F-engine (no SNAP board needed, but casperfpga and adc5g must be
+importable and $ATASHAREDIR set, as for any SNAPobs import).
+Compares the previous struct.unpack loop with captureSpectra,
+both in memory and streaming blocks to a writer, and reports
+the sustained spectra/s. Then checks that a recording streamed
+to a uvh5 file with snap_h5.SnapH5Writer reads back (with
+pyuvdata's UVData.read_uvh5) the same as the file written from
+memory with snap_h5.create_snap_uvdata
+"""
+
+import sys
+
+sys.path.append("..")
+
+import os
+import struct
+import tempfile
+import time
+
+import numpy as np
+
+from pyuvdata import UVData
+
+from ATATools import ata_constants, ata_control
+from SNAPobs import snap_recorder, snap_defaults, snap_h5
+
+NCHANS = snap_defaults.nchan
+NCAPTURES = 2000
+ACC_LEN = 1.0e4
+# uvh5 round trip, several blocks and a partial one
+H5_CAPTURES = 2*snap_defaults.capture_block + 10
+H5_TINT = 0.5
+H5_START = 1588818872.0
+
+
+class FakeSnapshot(object):
+    """
+    timestamps from the clock, or every tint seconds from start (with
+    some jitter) if given
+    """
+    def __init__(self, nchans, npayloads=16, start=None, tint=None):
+        rng = np.random.default_rng(0)
+        self.payloads = [rng.integers(0, 2**32, 2*nchans, dtype=np.uint64).astype('>u4').tobytes()
+                for i in range(npayloads)]
+        self.count = 0
+        self.start = start
+        self.tint = tint
+
+    def read_raw(self):
+        data = self.payloads[self.count % len(self.payloads)]
+        if self.tint is None:
+            t = time.time()
+        else:
+            t = self.start + self.count*self.tint + 1e-3*(self.count % 7)
+        self.count += 1
+        return {'data': data, 'length': len(data)}, t
+
+
+class FakeSnap(object):
+    """
+    the parts of a casperfpga.CasperFpga used by the capture
+    """
+    def __init__(self, nchans, start=None, tint=None):
+        self.snapshots = type('Snapshots', (), {})()
+        self.snapshots.vacc_ss_ss = FakeSnapshot(nchans, start=start, tint=tint)
+
+    def read_int(self, name):
+        # overflow counters that change along the recording
+        return self.snapshots.vacc_ss_ss.count % 3
+
+    def write_int(self, name, value):
+        pass
+
+
+class RawBlockWriter(object):
+    """
+    stand-in for snap_h5.SnapH5Writer, appends the blocks to a raw file
+    """
+    def __init__(self, filename):
+        self.f = open(filename, 'wb')
+
+    def write(self, start, auto0, auto1, snapdict):
+        self.f.write(auto0.tobytes())
+        self.f.write(auto1.tobytes())
+
+    def close(self):
+        self.f.close()
+
+
+def struct_capture(snap, ncaptures, acc_len):
+    """
+    the capture loop as previously done in gatherData
+    """
+    for ii in range(ncaptures):
+        x, t = snap.snapshots.vacc_ss_ss.read_raw()
+        d = np.array(struct.unpack('>%dL' % (x['length']/4), x['data'])) / acc_len
+        if ii == 0:
+            data0 = np.zeros((ncaptures, d.shape[0]//2))
+            data1 = np.zeros((ncaptures, d.shape[0]//2))
+            data0cnt = np.zeros(ncaptures)
+            fft0cnt = np.zeros(ncaptures)
+            data1cnt = np.zeros(ncaptures)
+            fft1cnt = np.zeros(ncaptures)
+        data0[ii, :] = d[0::2]
+        data1[ii, :] = d[1::2]
+        data0cnt[ii] = snap.read_int('power_vacc0_of_count')
+        fft0cnt[ii] = snap.read_int('fft_of')
+        data1cnt[ii] = snap.read_int('power_vacc1_of_count')
+        fft1cnt[ii] = snap.read_int('fft_of')
+    return data0, data1
+
+
+def new_out():
+    return {'ant': 'fake', 'rfc': 1400.0}
+
+
+def h5_info():
+    """
+    what gatherData and getData add to the capture
+    """
+    adc = np.arange(40, dtype=float).reshape(10, 4)
+    return {'ant': ata_constants.ant_names[0], 'rfc': 1400.0, 'ifc': snap_defaults.ifc,
+            'tint': H5_TINT, 'srate': snap_defaults.srate, 'fpga_clk': 250.0,
+            'fpgfile': 'fake.fpg', 'host': 'fake-snap', 'fft_shift': 0,
+            'adc0_bitsnaps': adc, 'adc1_bitsnaps': -adc,
+            'adc0_stats': {'mean': adc.mean(), 'dev': adc.std()},
+            'adc1_stats': {'mean': -adc.mean(), 'dev': adc.std()},
+            'source': 'casa', 'ra': 23.39, 'dec': 58.8, 'az': 10.0, 'el': 20.0}
+
+
+def h5_roundtrip(d):
+    """
+    writes the same recording from memory and streaming with SnapH5Writer,
+    returns both read back with UVData.read_uvh5
+    """
+    # the antenna positions come from the ATA REST service
+    ata_control.get_ant_pos = lambda ants: {ant: [10.0*ii, -5.0*ii, 0.1*ii]
+            for ii, ant in enumerate(ants)}
+    snap = FakeSnap(NCHANS, H5_START, H5_TINT)
+
+    out = h5_info()
+    snap_recorder.captureSpectra(snap, H5_CAPTURES, ACC_LEN, out, snap_defaults.srate, snap_defaults.ifc)
+    memory_file = os.path.join(d, 'memory.h5')
+    snap_h5.create_snap_uvdata(out, 0, 0, 5).write_uvh5(memory_file)
+
+    snap.snapshots.vacc_ss_ss.count = 0
+    stream_file = os.path.join(d, 'stream.h5')
+    info = h5_info()
+    writer = snap_h5.SnapH5Writer(stream_file, 0, 0, 5, snapdict=info)
+    out = {key: info[key] for key in ['ant', 'rfc', 'ifc', 'tint']}
+    snap_recorder.captureSpectra(snap, H5_CAPTURES, ACC_LEN, out, snap_defaults.srate, snap_defaults.ifc, writer)
+    writer.close(out)
+
+    uvdata = []
+    for filename in [memory_file, stream_file]:
+        uv = UVData()
+        uv.read_uvh5(filename)
+        uvdata.append(uv)
+    return uvdata
+
+
+if __name__ == '__main__':
+    snap = FakeSnap(NCHANS)
+
+    t = time.time()
+    ref0, ref1 = struct_capture(snap, NCAPTURES, ACC_LEN)
+    t_struct = time.time() - t
+
+    snap.snapshots.vacc_ss_ss.count = 0
+    out = new_out()
+    t = time.time()
+    snap_recorder.captureSpectra(snap, NCAPTURES, ACC_LEN, out, snap_defaults.srate, snap_defaults.ifc)
+    t_memory = time.time() - t
+    agree = np.array_equal(ref0, out['auto0']) and np.array_equal(ref1, out['auto1'])
+
+    snap.snapshots.vacc_ss_ss.count = 0
+    with tempfile.TemporaryDirectory() as d:
+        writer = RawBlockWriter(os.path.join(d, 'capture.raw'))
+        t = time.time()
+        snap_recorder.captureSpectra(snap, NCAPTURES, ACC_LEN, new_out(), snap_defaults.srate, snap_defaults.ifc, writer)
+        writer.close()
+        t_stream = time.time() - t
+
+    print('{} captures of {} channels x 2 pols'.format(NCAPTURES, NCHANS))
+    print('{:>24s} {:>12.1f} spectra/s'.format('struct.unpack loop', NCAPTURES/t_struct))
+    print('{:>24s} {:>12.1f} spectra/s  (same data: {})'.format('frombuffer, in memory', NCAPTURES/t_memory, agree))
+    print('{:>24s} {:>12.1f} spectra/s  ({} captures per block)'.format('frombuffer, streaming', NCAPTURES/t_stream,
+        snap_defaults.capture_block))
+
+    with tempfile.TemporaryDirectory() as d:
+        memory, stream = h5_roundtrip(d)
+    print('uvh5 round trip of {} captures, {} per block'.format(H5_CAPTURES, snap_defaults.capture_block))
+    assert memory.data_array.shape[0] == H5_CAPTURES
+    assert np.array_equal(memory.data_array, stream.data_array)
+    assert np.array_equal(memory.time_array, stream.time_array)
+    # the recorded timestamps, not those extrapolated at the first block
+    assert not np.allclose(np.diff(stream.time_array)*86400, H5_TINT, rtol=0, atol=1e-4)
+    assert np.array_equal(memory.lst_array, stream.lst_array)
+    # the overflow counters are only known to the writer at close
+    assert memory.extra_keywords.keys() == stream.extra_keywords.keys()
+    for key, value in memory.extra_keywords.items():
+        assert np.array_equal(value, stream.extra_keywords[key]), key
+    # the history records when each object was created
+    stream.history = memory.history
+    assert memory == stream
+    print('SnapH5Writer file equal to the in-memory one')
@@ -0,0 +1,190 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+test and benchmark of the SNAPmon shared memory spectrum bus.
+A producer process publishes frames of all boards as fast as it can
+while several reader processes read the latest frame of every board, as
+the monitor callbacks do. Each frame is filled with its frame number, so
+torn reads are detected. Reports the frame rate of the producer and the
+latency of a read of all boards. Also checks that only one of several
+processes creates the bus, also when they take over concurrently a bus
+left by a dead producer, and that a reader of the dead producer's bus
+reopens the new one
+"""
+
+import sys
+
+sys.path.append("..")
+
+import argparse
+import multiprocessing
+import os
+import time
+
+import numpy as np
+
+from SNAPmon.spectrum_bus import SpectrumBus
+
+
+def producer(args, started, stop, rates):
+    bus = SpectrumBus(args.name, args.nboards, args.nchans, args.nadc, create=True)
+    started.set()
+    rng = np.random.default_rng()
+    adc = rng.integers(-128, 128, args.nadc).astype(float)
+    nframes = 0
+    t = time.time()
+    while not stop.is_set():
+        for iboard in range(args.nboards):
+            frame = int(bus.frames()[iboard]) + 1
+            spec = np.full(args.nchans, float(frame))
+            bus.publish(iboard, spec, -spec, adc + frame % 100, adc - frame % 100)
+            nframes += 1
+        if args.rate:
+            time.sleep(1./args.rate)
+    rates.put(nframes/(time.time() - t)/args.nboards)
+    # wait for the readers to detach before removing the bus
+    stop.wait()
+    time.sleep(0.5)
+    bus.close()
+
+
+def reader(args, stop, results):
+    bus = SpectrumBus(args.name, args.nboards, args.nchans, args.nadc)
+    latencies = []
+    ntorn = 0
+    while not stop.is_set():
+        t = time.time()
+        frames = [bus.read(iboard) for iboard in range(args.nboards)]
+        latencies.append(time.time() - t)
+        for res in frames:
+            if res is None:
+                continue
+            frame, _, xx, yy, adc_x, adc_y = res
+            if not (np.all(xx == frame) and np.all(yy == -frame) and
+                    np.array_equal(adc_x - adc_y, 2*(adc_x - adc_x.astype(int)) + 2*(frame % 100))):
+                ntorn += 1
+    bus.close()
+    results.put((np.array(latencies), ntorn))
+
+
+def open_or_create(args, barrier, created):
+    bus = SpectrumBus.open_or_create(args.name, args.nboards, args.nchans, args.nadc)
+    created.put(bus.created)
+    if bus.created:
+        bus.publish(1, np.ones(args.nchans), np.zeros(args.nchans), np.arange(8), np.arange(8))
+    barrier.wait()
+    res = bus.read(1)
+    assert res[0] == 1 and res[2].sum() == args.nchans and len(res[4]) == 8
+    assert bus.read(0) is None
+    # the creator removes the bus last
+    barrier.wait()
+    if not bus.created:
+        bus.close()
+    barrier.wait()
+    if bus.created:
+        bus.close()
+
+
+def takeover(args, barrier, created):
+    # all processes find the stale bus at the same time
+    barrier.wait()
+    open_or_create(args, barrier, created)
+
+
+def dead_producer(args):
+    SpectrumBus(args.name, args.nboards, args.nchans, args.nadc, create=True)
+    # exit without closing, the block is left behind
+    os._exit(0)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('-b', '--nboards', type=int, default=32)
+    parser.add_argument('-c', '--nchans', type=int, default=4096)
+    parser.add_argument('-a', '--nadc', type=int, default=16384)
+    parser.add_argument('-r', '--readers', type=int, default=4)
+    parser.add_argument('-t', '--time', type=float, default=5.)
+    parser.add_argument('-n', '--trials', type=int, default=20,
+            help='concurrent takeovers of a stale bus')
+    parser.add_argument('--rate', type=float, default=0.,
+            help='frames per board per second, default: as fast as possible')
+    args = parser.parse_args()
+    args.name = '/dev/shm/spectrumBusBenchmark%i' %os.getpid()
+
+    ctx = multiprocessing.get_context('fork')
+    started = ctx.Event()
+    stop = ctx.Event()
+    rates = ctx.Queue()
+    results = ctx.Queue()
+    prod = ctx.Process(target=producer, args=(args, started, stop, rates))
+    prod.start()
+    started.wait()
+    readers = [ctx.Process(target=reader, args=(args, stop, results)) for ii in range(args.readers)]
+    for proc in readers:
+        proc.start()
+    time.sleep(args.time)
+    stop.set()
+
+    frame_rate = rates.get()
+    latencies = []
+    ntorn = 0
+    for proc in readers:
+        lat, torn = results.get()
+        latencies.append(lat)
+        ntorn += torn
+    for proc in readers + [prod]:
+        proc.join()
+    latencies = np.concatenate(latencies)*1e3
+
+    print('{} boards x {} channels, {} ADC samples, {} readers'.format(args.nboards,
+        args.nchans, args.nadc, args.readers))
+    print('producer: {:.1f} frames/s per board'.format(frame_rate))
+    print('readers: {} reads of all boards, latency median {:.2f} ms, p99 {:.2f} ms, max {:.2f} ms'.format(
+        len(latencies), np.median(latencies), np.percentile(latencies, 99), latencies.max()))
+    assert ntorn == 0, '{} torn frames read'.format(ntorn)
+
+    # a single creator among concurrent processes
+    barrier = ctx.Barrier(3)
+    created = ctx.Queue()
+    procs = [ctx.Process(target=open_or_create, args=(args, barrier, created)) for ii in range(3)]
+    for proc in procs:
+        proc.start()
+    for proc in procs:
+        proc.join()
+        assert proc.exitcode == 0
+    assert sorted([created.get() for ii in range(3)]) == [False, False, True]
+
+    # a bus left by a dead producer is taken over
+    proc = ctx.Process(target=dead_producer, args=(args,))
+    proc.start()
+    proc.join()
+    old = SpectrumBus(args.name, args.nboards, args.nchans, args.nadc)
+    assert not old.producer_alive() and not old.reopen_if_replaced()
+    bus = SpectrumBus.open_or_create(args.name, args.nboards, args.nchans, args.nadc)
+    assert bus.created, 'stale bus not created again'
+    bus.publish(0, np.ones(args.nchans), np.zeros(args.nchans), np.arange(8), np.arange(8))
+    assert old.read(0) is None
+    assert old.reopen_if_replaced() and old.producer_alive(), 'reader did not reopen the new bus'
+    assert old.read(0)[0] == 1
+    old.close()
+    bus.close()
+
+    # concurrent takeovers of a stale bus, a single creator each time
+    nprocs = 6
+    for itrial in range(args.trials):
+        proc = ctx.Process(target=dead_producer, args=(args,))
+        proc.start()
+        proc.join()
+        barrier = ctx.Barrier(nprocs)
+        created = ctx.Queue()
+        procs = [ctx.Process(target=takeover, args=(args, barrier, created)) for ii in range(nprocs)]
+        for proc in procs:
+            proc.start()
+        for proc in procs:
+            proc.join(timeout=10)
+            assert proc.exitcode == 0, 'takeover trial {} failed or hung'.format(itrial)
+        ncreated = sum([created.get() for ii in range(nprocs)])
+        assert ncreated == 1, '{} creators in takeover trial {}'.format(ncreated, itrial)
+        assert not os.path.exists(args.name)
+    os.remove(args.name + '.lock')
+    print('bus ok')
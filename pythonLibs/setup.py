@@ -13,7 +13,8 @@ setuptools.setup(
     description='python utility scripts for ATA (private repo)',
     license='MIT',
     packages=['ATAdb', 'ATATools','ATAobs','SNAPobs','SNAPobs.snap_dada', 'SNAPobs.snap_hpguppi', 
-              'OnOffCalc','OnOffCalc.flux','OnOffCalc.yFactor','OnOffCalc.misc','OnOffCalc.filterArray'],
+              'OnOffCalc','OnOffCalc.flux','OnOffCalc.yFactor','OnOffCalc.misc','OnOffCalc.filterArray',
+              'SNAPmon'],
     include_package_data=True,
     author='Dr. Wael Farah',
     author_email='wfarah@seti.org',